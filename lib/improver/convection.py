@@ -34,7 +34,8 @@ import iris
 import numpy as np
 
 from improver.utilities.spatial import DifferenceBetweenAdjacentGridSquares
-from improver.utilities.threshold import BasicThreshold
+from improver.utilities.threshold import (
+    BasicThreshold, create_cube_with_thresholds)
 from improver.nbhood.nbhood import NeighbourhoodProcessing
 
 
@@ -156,41 +157,82 @@ class DiagnoseConvectivePrecipitation(object):
                         are found within the convective ratio.
 
         """
-        neighbourhooded_cube_dict = {}
-        for cube, threshold in zip(cubelist, threshold_list):
-            neighbourhooded_cube = NeighbourhoodProcessing(
-                self.neighbourhood_method, self.radii,
-                lead_times=self.lead_times,
-                unweighted_mode=self.unweighted_mode,
-                ens_factor=self.ens_factor).process(cube)
-            neighbourhooded_cube_dict[threshold] = neighbourhooded_cube
+        # Stack the thresholded cubes, so that the neighbourhood processing
+        # is applied to both thresholds at once.
+        indicator_cube = create_cube_with_thresholds(
+            threshold_list, cubelist[0],
+            np.stack([cube.data for cube in cubelist]))
+        return self._convective_ratio_from_indicators(indicator_cube)
+
+    def _convective_ratio_from_indicators(self, indicator_cube):
+        """
+        Calculate the convective ratio from a cube containing the points
+        exceeding the lower and higher thresholds, with a leading threshold
+        coordinate. The neighbourhood processing is applied to both
+        thresholds at once, so that the padding and the cumulative sums used
+        by the neighbourhood processing are calculated once for both
+        thresholds.
+
+        Args:
+            indicator_cube : Iris.cube.Cube
+                Cube with a leading threshold coordinate, containing the
+                points exceeding the lower threshold and the points
+                exceeding the higher threshold.
+
+        Returns:
+            convective_ratio : Iris.cube.Cube
+                Cube containing the convective ratio.
+
+        Raises:
+            ValueError: If a value of infinity or a value greater than 1.0
+                        are found within the convective ratio.
+
+        """
+        # The relationship to the thresholds is not required for the
+        # convective ratio.
+        indicator_cube.attributes.pop("relative_to_threshold", None)
+        neighbourhooded_cube = NeighbourhoodProcessing(
+            self.neighbourhood_method, self.radii,
+            lead_times=self.lead_times,
+            unweighted_mode=self.unweighted_mode,
+            ens_factor=self.ens_factor).process(indicator_cube)
+        threshold_coord = neighbourhooded_cube.coord("threshold")
+        threshold_axis, = neighbourhooded_cube.coord_dims(threshold_coord)
+        neighbourhooded = np.moveaxis(
+            neighbourhooded_cube.data, threshold_axis, 0)
 
         # Ignore runtime warnings from divide by 0 errors.
         with np.errstate(invalid='ignore', divide='ignore'):
-            convective_ratio = (
-                neighbourhooded_cube_dict[self.higher_threshold] /
-                neighbourhooded_cube_dict[self.lower_threshold])
+            ratio = (
+                neighbourhooded[threshold_coord.nearest_neighbour_index(
+                    self.higher_threshold)] /
+                neighbourhooded[threshold_coord.nearest_neighbour_index(
+                    self.lower_threshold)])
 
-        infinity_condition = np.sum(np.isinf(convective_ratio.data)) > 0.0
+        infinity_condition = np.sum(np.isinf(ratio)) > 0.0
         with np.errstate(invalid='ignore'):
-            greater_than_1_condition = (
-                np.sum(convective_ratio.data > 1.0) > 0.0)
+            greater_than_1_condition = np.sum(ratio > 1.0) > 0.0
 
         if infinity_condition or greater_than_1_condition:
             if infinity_condition:
                 start_msg = ("A value of infinity was found for the "
-                             "convective ratio: {}.").format(
-                                 convective_ratio.data)
+                             "convective ratio: {}.").format(ratio)
             elif greater_than_1_condition:
                 start_msg = ("A value of greater than 1.0 was found for the "
-                             "convective ratio: {}.").format(
-                                 convective_ratio.data)
+                             "convective ratio: {}.").format(ratio)
             msg = ("{}\nThis value is not plausible as the fraction above the "
                    "higher threshold must be less than the fraction "
                    "above the lower threshold.").format(start_msg)
             raise ValueError(msg)
 
+        convective_ratio = next(
+            neighbourhooded_cube.slices_over(threshold_coord))
+        convective_ratio.remove_coord(threshold_coord)
+        convective_ratio.data = ratio
+        convective_ratio.standard_name = None
+        convective_ratio.var_name = None
         convective_ratio.long_name = "convective_ratio"
+        convective_ratio.units = "1"
         return convective_ratio
 
     @staticmethod
@@ -203,8 +245,8 @@ class DiagnoseConvectivePrecipitation(object):
             cube : Iris.cube.Cube
                 The cube from which adjacent grid square differences will be
                 calculated.
-            threshold : float
-                The threshold that will be applied.
+            threshold : float or List
+                The threshold or thresholds that will be applied.
 
         Returns:
             cubelist : Iris.cube.CubeList
@@ -227,21 +269,25 @@ class DiagnoseConvectivePrecipitation(object):
         Args:
             cubelist : Iris.cube.CubeList
                 Cubelist containing cubes to be thresholded.
-            threshold : float
-                The threshold that will be applied.
+            threshold : float or List
+                The threshold that will be applied. If a list of thresholds
+                is supplied, all of the thresholds are applied to each cube
+                at once, and each thresholded cube has a leading threshold
+                coordinate.
 
         Returns:
             cubes : Iris.cube.CubeList
                 Cubelist after thresholding each cube.
         """
+        plugin = BasicThreshold(
+            threshold, fuzzy_factor=self.fuzzy_factor,
+            below_thresh_ok=self.below_thresh_ok)
         cubes = iris.cube.CubeList([])
         for cube in cubelist:
-            threshold_cube = (
-                BasicThreshold(
-                    threshold, fuzzy_factor=self.fuzzy_factor,
-                    below_thresh_ok=self.below_thresh_ok
-                    ).process(cube.copy()))
-            cubes.append(threshold_cube)
+            if np.ndim(threshold) == 0:
+                # Applying a single threshold replaces the data of the cube.
+                cube = cube.copy()
+            cubes.append(plugin.process(cube))
         return cubes
 
     @staticmethod
@@ -267,8 +313,7 @@ class DiagnoseConvectivePrecipitation(object):
                 values have been restricted to be between 0 and 1.
         """
         threshold_cube_x, threshold_cube_y = thresholded_cubes
-        cube_on_orig_grid = cube.copy()
-        cube_on_orig_grid.data = np.zeros(cube_on_orig_grid.shape)
+        cube_on_orig_grid = cube.copy(data=np.zeros(cube.shape))
         cube_on_orig_grid.data[..., :-1, :] += threshold_cube_y.data
         cube_on_orig_grid.data[..., 1:, :] += threshold_cube_y.data
         cube_on_orig_grid.data[..., :, :-1] += threshold_cube_x.data
@@ -299,23 +344,26 @@ class DiagnoseConvectivePrecipitation(object):
                 between a cube with a high threshold applied and a cube with a
                 low threshold applied.
         """
-        cubelist = iris.cube.CubeList([])
         threshold_list = [self.lower_threshold, self.higher_threshold]
+        # Both thresholds are applied at once, so each thresholded cube has
+        # a leading threshold coordinate, and the points exceeding both
+        # thresholds are neighbourhood processed together.
         if self.use_adjacent_grid_square_differences:
-            for threshold in threshold_list:
-                diff_cubelist = (
-                    self.absolute_differences_between_adjacent_grid_squares(
-                        cube, threshold))
-                thresholded_cubes = self.iterate_over_threshold(
-                    diff_cubelist, threshold)
-                cubelist.append(
-                    self.sum_differences_between_adjacent_grid_squares(
-                        cube, thresholded_cubes))
+            diff_cubelist = (
+                self.absolute_differences_between_adjacent_grid_squares(
+                    cube, threshold_list))
+            thresholded_cubes = self.iterate_over_threshold(
+                diff_cubelist, threshold_list)
+            indicator_cube = (
+                self.sum_differences_between_adjacent_grid_squares(
+                    create_cube_with_thresholds(
+                        threshold_list, cube,
+                        np.zeros((len(threshold_list),) + cube.shape)),
+                    thresholded_cubes))
         else:
-            cube = [cube]
-            for threshold in threshold_list:
-                cubelist.extend(self.iterate_over_threshold(cube, threshold))
+            indicator_cube, = self.iterate_over_threshold(
+                [cube], threshold_list)
 
         convective_ratios = (
-            self._calculate_convective_ratio(cubelist, threshold_list))
+            self._convective_ratio_from_indicators(indicator_cube))
         return convective_ratios
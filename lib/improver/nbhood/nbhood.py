@@ -30,21 +30,35 @@
 # POSSIBILITY OF SUCH DAMAGE.
 """Module containing neighbourhood processing utilities."""
 
-import copy
+from collections import namedtuple, OrderedDict
+import itertools
 import math
+from multiprocessing.pool import ThreadPool
+import threading
 
 import iris
 from iris.exceptions import CoordinateNotFoundError
 import numpy as np
 import scipy.ndimage.filters
+import scipy.signal
 
-from improver.utilities.cube_checker import check_for_x_and_y_axes
-from improver.utilities.cube_manipulation import concatenate_cubes
+from improver.nbhood.summed_area_table import SummedAreaTable
 from improver.utilities.spatial import (
-    convert_distance_into_number_of_grid_cells)
+    convert_distance_into_number_of_grid_cells, GridSpec)
 
 # Maximum radius of the neighbourhood width in grid cells.
 MAX_RADIUS_IN_GRID_CELLS = 500
+# Relative cost of each operation of an FFT convolution, compared with
+# each multiplication when applying a kernel directly.
+FFT_COST_FACTOR = 5.
+# Relative cost of summing along each span of an unweighted kernel,
+# compared with each multiplication when applying a kernel directly.
+SPAN_COST_FACTOR = 4.
+# Maximum number of kernels kept within the kernel cache.
+KERNEL_CACHE_SIZE = 32
+
+KernelCacheInfo = namedtuple(
+    "KernelCacheInfo", ["hits", "misses", "maxsize", "currsize"])
 
 
 class Utilities(object):
@@ -147,6 +161,45 @@ class Utilities(object):
                          math.sqrt((width**2.0)/num_ens))
         return new_width
 
+    @staticmethod
+    def group_radii_by_grid_cells(cube, radii):
+        """
+        Group the radii for the points along a coordinate by the number of
+        grid cells that they correspond to, so that all of the points that
+        use the same neighbourhood can be processed at once. Radii that
+        differ in metres often round to the same number of grid cells e.g.
+        the radii interpolated between lead times.
+
+        Parameters
+        ----------
+        cube : iris.cube.Cube
+            Cube to which the neighbourhood processing will be applied.
+        radii : List or Numpy array
+            Radii in metres, one for each point along the coordinate.
+
+        Returns
+        -------
+        groups : list of tuple
+            List containing a tuple for each distinct neighbourhood, in the
+            order in which they first occur. Each tuple contains the number
+            of grid cells along the x and y axes, and the index of the
+            points using that neighbourhood. The index is a slice if the
+            points are contiguous, or a Numpy array otherwise.
+        """
+        points_by_grid_cells = OrderedDict()
+        for point, radius in enumerate(radii):
+            grid_cells = convert_distance_into_number_of_grid_cells(
+                cube, radius, MAX_RADIUS_IN_GRID_CELLS)
+            points_by_grid_cells.setdefault(grid_cells, []).append(point)
+        groups = []
+        for grid_cells, points in points_by_grid_cells.items():
+            if points[-1] - points[0] + 1 == len(points):
+                index = slice(points[0], points[-1] + 1)
+            else:
+                index = np.array(points)
+            groups.append((grid_cells, index))
+        return groups
+
     @staticmethod
     def check_cube_coordinates(cube, new_cube):
         """
@@ -186,7 +239,9 @@ class Utilities(object):
         correct_order = [cube_dimension_order[coord.name()]
                          for coord in new_cube.dim_coords]
         if len(cube_dimension_order) == len(correct_order):
-            new_cube.transpose(correct_order)
+            # The transpose requires the current dimension to be placed at
+            # each position, which is the inverse of the required order.
+            new_cube.transpose(list(np.argsort(correct_order)))
         else:
             msg = ('Returned cube dimension coordinates do not match input '
                    'cube dimension coordinates. \n input cube shape {} '
@@ -221,442 +276,272 @@ class SquareNeighbourhood(object):
         return result.format(self.unweighted_mode)
 
     @staticmethod
-    def cumulate_array(cube):
+    def _as_merged_slices(cube):
         """
-        Method to calculate the cumulative sum of an m x n array, by first
-        cumulating along the y direction so that the largest values
-        are in the nth row, and then cumulating along the x direction,
-        so that the largest values are in the mth column. Each grid point
-        will contain the cumulative sum from the origin to that grid point.
+        Rearrange the dimensions of a cube to match the cube found by merging
+        the y-x slices of the cube, so that the cubes returned by the square
+        neighbourhood methods have the same dimensions as when each slice was
+        processed in turn. Any length-one dimensions other than x and y are
+        demoted to scalar coordinates, and the y and x dimensions become the
+        trailing dimensions.
 
         Parameters
         ----------
         cube : Iris.cube.Cube
-            Cube to which the cumulative summing along the y and x direction
-            will be applied.
+            Cube with x and y coordinates.
 
         Returns
         -------
         cube : Iris.cube.Cube
-            Cube to which the cumulative summing along the y and x direction
-            has been applied.
-        nan_masks : list
-            List of numpy arrays to be used to set the values within the data
-            of the output cube to be NaN.
-        """
-        yname = cube.coord(axis="y").name()
-        xname = cube.coord(axis="x").name()
-        cubelist = iris.cube.CubeList([])
-        nan_masks = []
-        for slice_2d in cube.slices([yname, xname]):
-            data = slice_2d.data
-            nan_mask = np.isnan(data)
-            data[nan_mask] = 0
-            data_summed_along_y = np.cumsum(data, axis=0)
-            data_summed_along_x = (
-                np.cumsum(data_summed_along_y, axis=1))
-            slice_2d.data = data_summed_along_x
-            cubelist.append(slice_2d)
-            nan_masks.append(nan_mask)
-        return cubelist.merge_cube(), nan_masks
+            Cube with the dimensions of the merged y-x slices. The input cube
+            is returned if its dimensions already match.
+        """
+        grid_spec = GridSpec.from_cube(cube)
+        spatial_axes = [grid_spec.y_axis, grid_spec.x_axis]
+        index = tuple(
+            0 if length == 1 and axis not in spatial_axes else slice(None)
+            for axis, length in enumerate(cube.shape))
+        if not all(isinstance(item, slice) for item in index):
+            cube = cube[index]
+            grid_spec = GridSpec.from_cube(cube)
+            spatial_axes = [grid_spec.y_axis, grid_spec.x_axis]
+        if spatial_axes != [cube.ndim - 2, cube.ndim - 1]:
+            leading_axes = [axis for axis in range(cube.ndim)
+                            if axis not in spatial_axes]
+            cube = cube.copy()
+            cube.transpose(leading_axes + spatial_axes)
+        return cube
 
     @staticmethod
-    def pad_coord(coord, width, method):
+    def pad_array_with_halo(data, y_axis, x_axis, width_x, width_y,
+                            mode="mean"):
         """
-        Construct a new coordinate by extending the current coordinate by the
-        padding width.
+        Pad a halo around the y and x axes of a multi-dimensional array in a
+        single call to np.pad. By default, the padding value is the mean
+        within the neighbourhood radius in grid cells i.e. the neighbourhood
+        width at the edge of the data. Any other axes of the array are not
+        padded.
 
         Parameters
         ----------
-        coord : iris.coord
-            Original coordinate which will be used as the basis of the
-            new extended coordinate.
-        width : integer
-            The width of padding in grid cells (the extent of the
-            neighbourhood radius in grid cells in a given direction).
-        method : string
-            A string determining whether the coordinate is being expanded
-            or contracted. Options: 'remove' to remove points from coord;
-            'add' to add points to coord.
+        data : Numpy array
+            The original array prior to applying padding.
+        y_axis, x_axis : integer
+            The indices of the y and x axes within the array.
+        width_x, width_y : integer
+            The width in x and y directions of the neighbourhood radius in
+            grid cells. The halo added to each edge of the array will be
+            twice this width.
+        mode : string
+            Padding mode. Options: 'mean' to pad with the mean within the
+            neighbourhood width at the edge of the data; 'edge' to pad with
+            the value at the edge of the data.
 
         Returns
         -------
-        iris.coord
-            Coordinate with expanded or contracted length, to be added to the
-            padded or unpadded iris cube.
-
-        Raises
-        ------
-        ValueError : Raise an error if non-uniform increments exist between
-                     grid points.
+        padded_data : Numpy array
+            Array containing the original data surrounded by a halo along
+            the y and x axes.
         """
-        orig_points = coord.points
-        increment = orig_points[1:] - orig_points[:-1]
-        if np.isclose(np.sum(np.diff(increment)), 0):
-            increment = increment[0]
-        else:
-            msg = ("Non-uniform increments between grid points: "
-                   "{}.".format(increment))
-            raise ValueError(msg)
-
-        if method == 'add':
-            num_of_new_points = len(orig_points) + 2*width + 2*width
-            new_points = (
-                np.linspace(
-                    orig_points.min() - 2*width*increment,
-                    orig_points.max() + 2*width*increment,
-                    num_of_new_points))
-        elif method == 'remove':
-            end_width = -2*width if width != 0 else None
-            new_points = np.float32(orig_points[2*width:end_width])
-
-        new_points_bounds = np.array([new_points - 0.5*increment,
-                                      new_points + 0.5*increment]).T
-        return coord.copy(points=new_points, bounds=new_points_bounds)
+        if x_axis < y_axis:
+            # np.pad pads each axis in turn, so the y axis must be padded
+            # before the x axis to give consistent values in the corners of
+            # the halo.
+            padded_data = SquareNeighbourhood.pad_array_with_halo(
+                np.swapaxes(data, y_axis, x_axis), x_axis, y_axis,
+                width_x, width_y, mode=mode)
+            return np.swapaxes(padded_data, y_axis, x_axis)
+        pad_width = [(0, 0)] * data.ndim
+        pad_width[y_axis] = (2*width_y, 2*width_y)
+        pad_width[x_axis] = (2*width_x, 2*width_x)
+        if mode == "edge":
+            return np.pad(data, pad_width, "edge")
+        stat_length = [(1, 1)] * data.ndim
+        stat_length[y_axis] = (width_y, width_y)
+        stat_length[x_axis] = (width_x, width_x)
+        return np.pad(data, pad_width, "mean", stat_length=stat_length)
 
     @staticmethod
-    def _create_cube_with_new_data(cube, data, coord_x, coord_y):
+    def remove_halo_from_array(data, y_axis, x_axis, width_x, width_y):
         """
-        Create a cube with newly created data where the metadata is copied from
-        the input cube and the supplied x and y coordinates are added to the
-        cube.
+        Remove the halo added by pad_array_with_halo from the y and x axes of
+        a multi-dimensional array.
 
         Parameters
         ----------
-        cube : Iris.cube.Cube
-            Template cube used for copying metadata and non x and y axes
-            coordinates.
         data : Numpy array
-            Data to be put into the new cube.
-        coord_x : Iris.coords.DimCoord
-            Coordinate to be added to the new cube to represent the x axis.
-        coord_y : Iris.coords.DimCoord
-            Coordinate to be added to the new cube to represent the y axis.
-
-        Returns
-        -------
-        new_cube : Iris.cube.Cube
-            Cube built from the template cube using the requested data and the
-            supplied x and y axis coordinates.
-        """
-        check_for_x_and_y_axes(cube)
-
-        yname = cube.coord(axis='y').name()
-        xname = cube.coord(axis='x').name()
-        ycoord_dim = cube.coord_dims(yname)
-        xcoord_dim = cube.coord_dims(xname)
-        metadata_dict = copy.deepcopy(cube.metadata._asdict())
-        new_cube = iris.cube.Cube(data, **metadata_dict)
-        for coord in cube.coords():
-            if coord.name() not in [yname, xname]:
-                if cube.coords(coord, dim_coords=True):
-                    coord_dim = cube.coord_dims(coord)
-                    new_cube.add_dim_coord(coord, coord_dim)
-                else:
-                    new_cube.add_aux_coord(coord)
-        if len(xcoord_dim) > 0:
-            new_cube.add_dim_coord(coord_x, xcoord_dim)
-        else:
-            new_cube.add_aux_coord(coord_x)
-        if len(ycoord_dim) > 0:
-            new_cube.add_dim_coord(coord_y, ycoord_dim)
-        else:
-            new_cube.add_aux_coord(coord_y)
-        return new_cube
-
-    def pad_cube_with_halo(self, cube, width_x, width_y):
-        """
-        Method to pad a halo around the data in an iris cube. The padding
-        calculates the mean within the neighbourhood radius in grid cells
-        i.e. the neighbourhood width at the edge of the data and uses this
-        mean value as the padding value.
-
-        Parameters
-        ----------
-        cube : iris.cube.Cube
-            The original cube prior to applying padding.
+            The padded array to be trimmed of edge data.
+        y_axis, x_axis : integer
+            The indices of the y and x axes within the array.
         width_x, width_y : integer
             The width in x and y directions of the neighbourhood radius in
-            grid cells. This will be the width of padding to be added to the
-            numpy array.
+            grid cells. The halo removed from each edge of the array will be
+            twice this width.
 
         Returns
         -------
-        iris.cube.Cube
-            Cube containing the new padded cube, with appropriate
-            changes to the cube's dimension coordinates.
-        """
-        check_for_x_and_y_axes(cube)
-
-        yname = cube.coord(axis='y').name()
-        xname = cube.coord(axis='x').name()
-        cubelist = iris.cube.CubeList([])
-        for slice_2d in cube.slices([yname, xname]):
-            # Pad a halo around the original data with the extent of the halo
-            # given by width_y and width_x. Assumption to pad using the mean
-            # value within the neighbourhood width.
-            padded_data = np.pad(
-                slice_2d.data,
-                ((2*width_y, 2*width_y), (2*width_x, 2*width_x)),
-                "mean", stat_length=((width_y, width_y), (width_x, width_x)))
-            coord_x = cube.coord(axis='x')
-            padded_x_coord = (
-                SquareNeighbourhood.pad_coord(coord_x, width_x, 'add'))
-            coord_y = cube.coord(axis='y')
-            padded_y_coord = (
-                SquareNeighbourhood.pad_coord(coord_y, width_y, 'add'))
-            cubelist.append(
-                self._create_cube_with_new_data(
-                    slice_2d, padded_data, padded_x_coord, padded_y_coord))
-        return cubelist.merge_cube()
-
-    def remove_halo_from_cube(self, cube, width_x, width_y):
-        """
-        Method to remove rows/columns from the edge of an iris cube.
-        Used to 'unpad' cubes which have been previously padded by
-        pad_cube_with_halo.
-
-        Parameters
-        ----------
-        cube : iris.cube.Cube
-            The original cube to be trimmed of edge data.
-        width_x, width_y : integer
-            The width in x and y directions of the neighbourhood radius in
-            grid cells. This will be the width removed from the numpy
-            array.
-
-        Returns
-        -------
-        iris.cube.Cube
-            Cube containing the new trimmed cube, with appropriate
-            changes to the cube's dimension coordinates.
-        """
-        check_for_x_and_y_axes(cube)
-
-        yname = cube.coord(axis='y')
-        xname = cube.coord(axis='x')
-        cubelist = iris.cube.CubeList([])
-        for slice_2d in cube.slices([yname, xname]):
-            end_y = -2*width_y if width_y != 0 else None
-            end_x = -2*width_x if width_x != 0 else None
-            trimmed_data = slice_2d.data[2*width_y:end_y,
-                                         2*width_x:end_x]
-            coord_x = slice_2d.coord(axis='x')
-            trimmed_x_coord = (
-                SquareNeighbourhood.pad_coord(coord_x, width_x, 'remove'))
-            coord_y = slice_2d.coord(axis='y')
-            trimmed_y_coord = (
-                SquareNeighbourhood.pad_coord(coord_y, width_y, 'remove'))
-            cubelist.append(
-                self._create_cube_with_new_data(
-                    slice_2d, trimmed_data, trimmed_x_coord, trimmed_y_coord))
-        return cubelist.merge_cube()
+        Numpy array
+            View of the array with the halo removed along the y and x axes.
+        """
+        index = [slice(None)] * data.ndim
+        index[y_axis] = slice(2*width_y, data.shape[y_axis]-2*width_y)
+        index[x_axis] = slice(2*width_x, data.shape[x_axis]-2*width_x)
+        return data[tuple(index)]
 
     @staticmethod
-    def mean_over_neighbourhood(cube, cells_x, cells_y, nan_masks):
-        """
-        Method to calculate the average value in a square neighbourhood using
-        the 4-point algorithm to find the total sum over the neighbourhood.
-
-        The output from the cumulate_array method can be used to
-        calculate the sum over a neighbourhood of size
-        (2*cells_x+1)*(2*cells_y+1). This sum is then divided by the area of
-        the neighbourhood to calculate the mean value in the neighbourhood.
-
-        For all points, a fast vectorised approach is taken:
-        1. The displacements between the four points used to calculate the
-           neighbourhood total sum and the central grid point are calculated.
-        2. Four copies of the cumulate array output are flattened and rolled
-           by these displacements to align the four terms used in the
-           neighbourhood total sum calculation.
-        3. The neighbourhood total at all points can then be calculated
-           simultaneously in a single vector sum.
-
-        Displacements are calculated as follows for the following input array,
-        where the accumulation has occurred from left to right and top to
-        bottom.
-
-        | 2 | 4 | 6 | 7 |
-        | 2 | 4 | 5 | 6 |
-        | 1 | 3 | 4 | 4 |
-        | 1 | 2 | 2 | 2 |
-
-        For a 3x3 neighbourhood centred around the point with a value of 5:
-
-        | 2 (A) | 4 | 6                 | 7 (B) |
-        | 2     | 4 | 5 (Central point) | 6     |
-        | 1     | 3 | 4                 | 4     |
-        | 1 (C) | 2 | 2                 | 2 (D) |
-
-        To calculate the value for the neighbourhood sum at the "Central point"
-        with a value of 5, calculate:
-        Neighbourhood sum = B - A - D + C
-        At the central point, this will yield:
-        Neighbourhood sum = 7 - 2 - 2 +1 => 4
-        Neighbourhood mean = Neighbourhood sum
-                             -----------------
-                             (2 * nb_width +1)
-        where nb_width is the neighbourhood width, which is equal to 1 for a
-        3x3 neighbourhood.
-
-        Neighbourhood mean = 4. / 9.
+    def _valid_points_from_mask_cube(cube, mask_cube):
+        """
+        Find the points that are valid for neighbourhood processing from a
+        mask cube, such as a land-sea mask or a topographic band mask
+        produced by improver.generate_ancillaries. Points where the mask is
+        non-zero and not masked are valid.
 
         Parameters
         ----------
-        cube : iris.cube.Cube
-            Cube to which neighbourhood processing is being applied. Must
-            be passed through cumulate_array method first.
-        cells_x, cells_y : integer
-            The radius of the neighbourhood in grid points, in the x and y
-            directions (excluding the central grid point).
-        nan_masks : list
-            List of numpy arrays to be used to set the values within the data
-            of the output cube to be NaN.
+        cube : Iris.cube.Cube
+            Cube to which the square neighbourhood will be applied. The x
+            and y coordinates of the mask cube must match those of this cube.
+        mask_cube : Iris.cube.Cube
+            Cube with only x and y dimensions, containing the mask.
 
         Returns
         -------
-        cube : iris.cube.Cube
-            Cube to which square neighbourhood has been applied.
-        """
-        check_for_x_and_y_axes(cube)
-
-        yname = cube.coord(axis="y").name()
-        xname = cube.coord(axis="x").name()
-
-        # Calculate displacement factors to find 4-points after flattening the
-        # array.
-        n_rows = len(cube.coord(axis="y").points)
-        n_columns = len(cube.coord(axis="x").points)
-
-        # Displacements from the point at the centre of the neighbourhood.
-        # Equivalent to point B in the docstring example.
-        ymax_xmax_disp = (cells_y*n_columns) + cells_x
-        # Equivalent to point A in the docstring example.
-        ymax_xmin_disp = (cells_y*n_columns) - cells_x - 1
-
-        # Equivalent to point D in the docstring example.
-        ymin_xmax_disp = (-1*(cells_y+1)*n_columns) + cells_x
-        # Equivalent to point C in the docstring example.
-        ymin_xmin_disp = (-1*(cells_y+1)*n_columns) - cells_x - 1
-
-        cubelist = iris.cube.CubeList([])
-        for slice_2d, nan_mask in zip(cube.slices([yname, xname]), nan_masks):
-            # Flatten the 2d slice and create 4 copies of the flattened
-            # array which are rolled to align the 4-points which are needed
-            # for the calculation.
-            flattened = slice_2d.data.flatten()
-            ymax_xmax_array = np.roll(flattened, -ymax_xmax_disp)
-            ymin_xmax_array = np.roll(flattened, -ymin_xmax_disp)
-            ymin_xmin_array = np.roll(flattened, -ymin_xmin_disp)
-            ymax_xmin_array = np.roll(flattened, -ymax_xmin_disp)
-            neighbourhood_total = (ymax_xmax_array - ymin_xmax_array +
-                                   ymin_xmin_array - ymax_xmin_array)
-            neighbourhood_total.resize(n_rows, n_columns)
-            # Initialise and calculate the neighbourhood area.
-            neighbourhood_area = np.zeros(neighbourhood_total.shape)
-            neighbourhood_area.fill((2*cells_x+1) * (2*cells_y+1))
-            with np.errstate(invalid='ignore', divide='ignore'):
-                slice_2d.data = (neighbourhood_total.astype(float) /
-                                 neighbourhood_area.astype(float))
-            slice_2d.data[nan_mask.astype(bool)] = np.NaN
-            cubelist.append(slice_2d)
-        return cubelist.merge_cube()
+        valid_points : Numpy array
+            Boolean array with dimensions of y and x, which is True where
+            points are valid.
 
-    @staticmethod
-    def _set_up_cubes_to_be_neighbourhooded(cube):
+        Raises
+        ------
+        ValueError : If the mask cube does not have only x and y dimensions,
+                     or its x and y coordinates do not match those of the
+                     cube.
         """
-        Set up a cubelist containing either the input cube, or the input cube
-        and a mask cube.
+        mask_grid_spec = GridSpec.from_cube(mask_cube)
+        if mask_cube.ndim != 2:
+            msg = ("The mask cube must only have x and y dimensions, "
+                   "found {} dimensions".format(mask_cube.ndim))
+            raise ValueError(msg)
+        for axis in ["y", "x"]:
+            if mask_cube.coord(axis=axis) != cube.coord(axis=axis):
+                msg = ("The {} coordinate of the mask cube does not match "
+                       "the {} coordinate of the cube".format(axis, axis))
+                raise ValueError(msg)
+        valid_points = np.ma.filled(mask_cube.data, 0) != 0
+        if mask_grid_spec.y_axis == 1:
+            valid_points = valid_points.T
+        return valid_points
+
+    def create_summed_area_tables(self, cube, mask_cube=None):
+        """
+        Calculate the summed-area tables required to apply square
+        neighbourhoods of any size to a cube. If the data is masked, or a
+        mask cube is supplied, a table of the number of valid points is
+        calculated alongside the table of the valid data, so that the
+        neighbourhood mean only includes valid points.
+
+        The tables only need to be calculated once for each field, and can
+        then be used to calculate neighbourhoods for any number of radii
+        using calculate_neighbourhood.
 
         Parameters
         ----------
         cube : Iris.cube.Cube
-            Cube that will be checked for whether the data is masked.
+            Cube containing the array to which square neighbourhoods will be
+            applied.
+        mask_cube : Iris.cube.Cube (optional)
+            Cube with only x and y dimensions containing a mask, such as a
+            land-sea mask or a topographic band mask, where the valid points
+            are non-zero. If the data within the cube is not masked, the
+            table of valid points only has dimensions of y and x, and is
+            shared by every field within the cube.
 
         Returns
         -------
-        cubes_to_sum : Iris.cube.CubeList
-            CubeList containing either the input cube, or the input cube and
-            a mask cube.
-        """
-        # If there is a mask, fill the data array of the mask_cube with a
-        # logical array, logically inverted compared to the integer version of
-        # the mask within the original data array.
-        if isinstance(cube.data, np.ma.MaskedArray):
-            mask_cube = cube.copy()
-            mask_cube.rename('mask_data')
-            mask_cube.data = np.logical_not(cube.data.mask.astype(int))
-            cube.data = cube.data.data * mask_cube.data
-            cubes_to_sum = iris.cube.CubeList([cube, mask_cube])
-        else:
-            cubes_to_sum = iris.cube.CubeList([cube])
-        return cubes_to_sum
+        tables : list of SummedAreaTable
+            List containing either the table for the input cube, or the
+            tables for the valid data and the number of valid points. The y
+            and x axes are the trailing axes of each table.
+        """
+        grid_spec = GridSpec.from_cube(cube)
+        spatial_axes = [grid_spec.y_axis, grid_spec.x_axis]
+        data = np.moveaxis(cube.data, spatial_axes, [-2, -1])
+        valid_points = None
+        if isinstance(data, np.ma.MaskedArray):
+            valid_points = np.logical_not(np.ma.getmaskarray(data))
+            data = np.ma.getdata(data)
+        if mask_cube is not None:
+            mask_valid_points = self._valid_points_from_mask_cube(
+                cube, mask_cube)
+            if valid_points is None:
+                valid_points = mask_valid_points
+            else:
+                valid_points = np.logical_and(valid_points, mask_valid_points)
+        if valid_points is None:
+            return [SummedAreaTable(data)]
+        return [SummedAreaTable(data * valid_points),
+                SummedAreaTable(valid_points)]
 
-    def _pad_and_calculate_neighbourhood(
-            self, cubes_to_sum, grid_cells_x, grid_cells_y):
+    @staticmethod
+    def _mean_from_summed_area_tables(tables, grid_cells_x, grid_cells_y):
         """
-        Apply neighbourhood processing consisting of the following steps:
-        1. Pad a halo around the input cube to allow vectorised
-           neighbourhooding at edgepoints.
-        2. Cumulate the array along the x and y axes.
-        3. Apply neighbourhood processing to the cumulated array.
+        Calculate the mean within a square neighbourhood from the
+        summed-area tables, and correct the mean for masked data if
+        required.
 
         Parameters
         ----------
-        cubes_to_sum : Iris.cube.CubeList
-            CubeList containing either the input cube, or the input cube and
-            a mask cube.
-        grid_cells_x : Float
-            The number of grid cells along the x axis used to create a square
-            neighbourhood.
-        grid_cells_y : Float
-            The number of grid cells along the y axis used to create a square
-            neighbourhood.
+        tables : list of SummedAreaTable
+            List containing the tables returned by create_summed_area_tables,
+            or a subset of those tables along the leading axes. The table of
+            valid points may only have dimensions of y and x.
+        grid_cells_x, grid_cells_y : integer
+            The number of grid cells along the x and y axes used to create a
+            square neighbourhood.
 
         Returns
         -------
-        neighbourhood_averaged_cubes : Iris.cube.CubeList
-            CubeList containing the smoothed field after the square
-            neighbourhood method has been applied to either the input cube, or
-            both the input cube and a mask cube.
+        neighbourhood_mean : Numpy array
+            Array containing the neighbourhood mean, with the y and x axes as
+            the trailing axes. If a mask table is supplied, this is a masked
+            array with a fill value of NaN.
         """
-        neighbourhood_averaged_cubes = iris.cube.CubeList([])
-        for cube_to_process in cubes_to_sum:
-            # Pad the iris cube. This way, the edge effects produced
-            # by the vectorisation of the 4-point method will appear outside
-            # our domain of interest. These unwanted points can be trimmed off
-            # later.
-            cube_to_process = self.pad_cube_with_halo(
-                cube_to_process, grid_cells_x, grid_cells_y)
-            summed_up_cube, nan_masks = self.cumulate_array(
-                cube_to_process)
-            neighbourhood_averaged_cubes.append(
-                self.mean_over_neighbourhood(
-                    summed_up_cube, grid_cells_x, grid_cells_y, nan_masks))
-        return neighbourhood_averaged_cubes
+        neighbourhood_mean = tables[0].neighbourhood_mean(
+            grid_cells_x, grid_cells_y)
+        if len(tables) > 1:
+            # Correct neighbourhood averages for masked data, which may have
+            # been calculated using larger neighbourhood areas than are
+            # present in reality.
+            mask_table = tables[1]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                neighbourhood_mean /= mask_table.neighbourhood_mean(
+                    grid_cells_x, grid_cells_y)
+            # The mask table may only have dimensions of y and x, in which
+            # case it is shared by every field.
+            neighbourhood_mean = np.ma.masked_where(
+                np.broadcast_to(np.logical_not(mask_table.data),
+                                neighbourhood_mean.shape),
+                neighbourhood_mean)
+            # Insert a fill value of NaN.
+            np.ma.set_fill_value(neighbourhood_mean, np.nan)
+        return neighbourhood_mean
 
-    def _remove_padding_and_mask(
-            self, neighbourhood_averaged_cubes, pre_neighbourhood_cubes,
-            cube_name, grid_cells_x, grid_cells_y):
+    def calculate_neighbourhood(
+            self, cube, tables, grid_cells_x, grid_cells_y):
         """
-        Remove the halo from the padded array and apply the mask, if required.
+        Calculate the square neighbourhood of a cube from its summed-area
+        tables.
 
         Parameters
         ----------
-        neighbourhood_averaged_cubes : Iris.cube.CubeList
-            CubeList containing the smoothed field after the square
-            neighbourhood method has been applied to either the input cube, or
-            both the input cube and a mask cube.
-        pre_neighbourhood_cubes : Iris.cube.CubeList
-            CubeList containing the fields prior to applying neighbourhood
-            processing. This is required to be able to know the original mask
-            cube.
-        cube_name : String
-            Name of the variable that has been neighbourhooded.
-        grid_cells_x : Float
+        cube : Iris.cube.Cube
+            Cube used to calculate the tables, which is used as the template
+            for the neighbourhood processed output.
+        tables : list of SummedAreaTable
+            List containing the tables returned by create_summed_area_tables.
+        grid_cells_x : integer
             The number of grid cells along the x axis used to create a square
             neighbourhood.
-        grid_cells_y : Float
+        grid_cells_y : integer
             The number of grid cells along the y axis used to create a square
             neighbourhood.
 
@@ -666,40 +551,25 @@ class SquareNeighbourhood(object):
             Cube containing the smoothed field after the square
             neighbourhood method has been applied.
         """
-        # Correct neighbourhood averages for masked data, which may have been
-        # calculated using larger neighbourhood areas than are present in
-        # reality.
-        neighbourhood_averaged_cube, = neighbourhood_averaged_cubes.extract(
-            cube_name)
-        neighbourhood_averaged_cube = self.remove_halo_from_cube(
-            neighbourhood_averaged_cube, grid_cells_x, grid_cells_y)
-        if len(neighbourhood_averaged_cubes) > 1:
-            mask_cube, = neighbourhood_averaged_cubes.extract('mask_data')
-            mask_cube = self.remove_halo_from_cube(
-                mask_cube, grid_cells_x, grid_cells_y)
-            with np.errstate(invalid='ignore', divide='ignore'):
-                neighbourhood_averaged_cube.data = (
-                    neighbourhood_averaged_cube.data / mask_cube.data)
-            original_mask_cube, = pre_neighbourhood_cubes.extract('mask_data')
-            neighbourhood_averaged_cube.data = (
-                np.ma.masked_where(
-                    np.logical_not(original_mask_cube.data.squeeze()),
-                    neighbourhood_averaged_cube.data))
-            # Insert a fill value of NaN.
-            np.ma.set_fill_value(neighbourhood_averaged_cube.data, np.nan)
-        return neighbourhood_averaged_cube
-
-    def run(self, cube, radius):
+        grid_spec = GridSpec.from_cube(cube)
+        spatial_axes = [grid_spec.y_axis, grid_spec.x_axis]
+        neighbourhood_mean = self._mean_from_summed_area_tables(
+            tables, grid_cells_x, grid_cells_y)
+        return cube.copy(data=np.moveaxis(
+            neighbourhood_mean, [-2, -1], spatial_axes))
+
+    def run(self, cube, radius, mask_cube=None):
         """
         Call the methods required to apply a square neighbourhood
         method to a cube.
 
         The steps undertaken are:
-        1. Set up cubes by determining, if the arrays are masked.
-        2. Pad the input array with a halo and then calculate the neighbourhood
-           of the haloed array.
-        3. Remove the halo from the neighbourhooded array and deal with a mask,
-           if required.
+        1. Determine the valid points from the mask of the data and the
+           mask cube, if required.
+        2. Calculate the summed-area tables for the valid data and the
+           number of valid points, if required.
+        3. Calculate the neighbourhood mean from the tables and deal with a
+           mask, if required.
 
         Parameters
         ----------
@@ -709,36 +579,243 @@ class SquareNeighbourhood(object):
         radius : Float
             Radius in metres for use in specifying the number of
             grid cells used to create a square neighbourhood.
+        mask_cube : Iris.cube.Cube (optional)
+            Cube with only x and y dimensions containing a mask, such as a
+            land-sea mask or a topographic band mask. Only points where the
+            mask is non-zero are included within the neighbourhood, and the
+            output is masked elsewhere.
 
         Returns
         -------
         neighbourhood_averaged_cube : Iris.cube.Cube
             Cube containing the smoothed field after the square neighbourhood
-            method has been applied.
+            method has been applied, with the dimensions of the merged y-x
+            slices of the input cube.
         """
-        # If the data is masked, the mask will be processed as well as the
-        # original_data * mask array.
+        neighbourhood_averaged_cube, = self.run_multiple_radii(
+            cube, [radius], mask_cube=mask_cube)
+        return neighbourhood_averaged_cube
+
+    def run_multiple_radii(self, cube, radii, mask_cube=None):
+        """
+        Apply square neighbourhoods of several sizes to a cube. The
+        summed-area tables are calculated once, and are then used to
+        calculate the neighbourhood for each radius.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube containing the array to which the square neighbourhoods
+            will be applied.
+        radii : List
+            Radii in metres for use in specifying the number of grid cells
+            used to create each square neighbourhood.
+        mask_cube : Iris.cube.Cube (optional)
+            Cube with only x and y dimensions containing a mask. Only points
+            where the mask is non-zero are included within the neighbourhood,
+            and the output is masked elsewhere.
+
+        Returns
+        -------
+        neighbourhood_averaged_cubes : Iris.cube.CubeList
+            CubeList containing a cube for each radius, in the order of the
+            radii, with the smoothed field after the square neighbourhood
+            method has been applied, with the dimensions of the merged y-x
+            slices of the input cube.
+        """
+        cube = self._as_merged_slices(cube)
         original_attributes = cube.attributes
         original_methods = cube.cell_methods
-        grid_cells_x, grid_cells_y = (
-            convert_distance_into_number_of_grid_cells(
-                cube, radius, MAX_RADIUS_IN_GRID_CELLS))
-        cubes_to_sum = (
-            self._set_up_cubes_to_be_neighbourhooded(cube))
-        neighbourhood_averaged_cubes = (
-            self._pad_and_calculate_neighbourhood(
-                cubes_to_sum, grid_cells_x, grid_cells_y))
-        neighbourhood_averaged_cube = (
-            self._remove_padding_and_mask(
-                neighbourhood_averaged_cubes, cubes_to_sum, cube.name(),
-                grid_cells_x, grid_cells_y))
+        grid_cells = [convert_distance_into_number_of_grid_cells(
+                      cube, radius, MAX_RADIUS_IN_GRID_CELLS)
+                      for radius in radii]
+        tables = self.create_summed_area_tables(cube, mask_cube=mask_cube)
+        neighbourhood_averaged_cubes = iris.cube.CubeList([])
+        for grid_cells_x, grid_cells_y in grid_cells:
+            neighbourhood_averaged_cube = self.calculate_neighbourhood(
+                cube, tables, grid_cells_x, grid_cells_y)
+            neighbourhood_averaged_cube.cell_methods = original_methods
+            neighbourhood_averaged_cube.attributes = original_attributes
+            neighbourhood_averaged_cubes.append(neighbourhood_averaged_cube)
+        return neighbourhood_averaged_cubes
+
+    def run_along_coord(self, cube, radii, coord_name, mask_cube=None):
+        """
+        Apply a square neighbourhood with a different radius to each point
+        along a coordinate of a cube e.g. a radius for each lead time. The
+        summed-area tables are calculated once for the whole cube, and the
+        neighbourhood for each point along the coordinate is calculated from
+        the corresponding part of the tables. The points whose radii give
+        the same number of grid cells are calculated together.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube containing the array to which the square neighbourhoods
+            will be applied.
+        radii : List or Numpy array
+            Radii in metres, one for each point along the coordinate.
+        coord_name : String
+            Name of the coordinate along which the radius varies.
+        mask_cube : Iris.cube.Cube (optional)
+            Cube with only x and y dimensions containing a mask. Only points
+            where the mask is non-zero are included within the neighbourhood,
+            and the output is masked elsewhere.
+
+        Returns
+        -------
+        neighbourhood_averaged_cube : Iris.cube.Cube
+            Cube containing the smoothed field after the square neighbourhood
+            method has been applied, with the dimensions of the merged y-x
+            slices of the input cube.
+
+        Raises
+        ------
+        ValueError : If the number of radii does not match the number of
+                     points along the coordinate.
+        """
+        coord_points = cube.coord(coord_name).points
+        if len(radii) != len(coord_points):
+            msg = ("The number of radii ({}) does not match the number of "
+                   "points along the {} coordinate ({})".format(
+                       len(radii), coord_name, len(coord_points)))
+            raise ValueError(msg)
+        cube = self._as_merged_slices(cube)
+        coord_dims = cube.coord_dims(coord_name)
+        if not coord_dims:
+            return self.run(cube, radii[0], mask_cube=mask_cube)
 
+        original_attributes = cube.attributes
+        original_methods = cube.cell_methods
+        tables = self.create_summed_area_tables(cube, mask_cube=mask_cube)
+        # Find the position of the coordinate along the leading axes of the
+        # tables, which exclude the y and x axes.
+        grid_spec = GridSpec.from_cube(cube)
+        spatial_axes = [grid_spec.y_axis, grid_spec.x_axis]
+        leading_axes = [axis for axis in range(cube.ndim)
+                        if axis not in spatial_axes]
+        table_axis = leading_axes.index(coord_dims[0])
+
+        # The points along the coordinate that use the same neighbourhood
+        # are evaluated from the tables together.
+        neighbourhood_mean = None
+        for (grid_cells_x, grid_cells_y), points in (
+                Utilities.group_radii_by_grid_cells(cube, radii)):
+            table_index = (slice(None),) * table_axis + (points,)
+            # A table of valid points with only y and x dimensions is
+            # shared by every point along the coordinate.
+            group_mean = self._mean_from_summed_area_tables(
+                [table[table_index] if table.data.ndim == cube.ndim
+                 else table for table in tables],
+                grid_cells_x, grid_cells_y)
+            if neighbourhood_mean is None:
+                neighbourhood_mean = np.empty(
+                    tables[0].data.shape, dtype=group_mean.dtype)
+                if len(tables) > 1:
+                    neighbourhood_mean = np.ma.masked_array(
+                        neighbourhood_mean,
+                        mask=np.zeros(neighbourhood_mean.shape, dtype=bool),
+                        fill_value=np.nan)
+            neighbourhood_mean[table_index] = group_mean
+
+        neighbourhood_averaged_cube = cube.copy(data=np.moveaxis(
+            neighbourhood_mean, [-2, -1], spatial_axes))
         neighbourhood_averaged_cube.cell_methods = original_methods
         neighbourhood_averaged_cube.attributes = original_attributes
-
         return neighbourhood_averaged_cube
 
 
+class KernelCache(object):
+
+    """
+    A bounded cache of neighbourhood kernels. When the cache is full, the
+    least recently used kernel is discarded.
+
+    Statistics on the use of the cache are available from cache_info.
+    """
+
+    def __init__(self, maxsize=KERNEL_CACHE_SIZE):
+        """
+        Initialise class.
+
+        Parameters
+        ----------
+        maxsize : integer
+            The maximum number of kernels to be kept within the cache.
+        """
+        self.maxsize = int(maxsize)
+        self.kernels = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # The cache may be shared between threads.
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        """Represent the configured plugin instance as a string."""
+        result = ('<KernelCache: maxsize: {}; currsize: {}>')
+        return result.format(self.maxsize, len(self.kernels))
+
+    def get(self, key, create_kernel):
+        """
+        Get a kernel from the cache, creating and storing the kernel if it
+        is not already within the cache.
+
+        Parameters
+        ----------
+        key : hashable
+            Key identifying the kernel.
+        create_kernel : callable
+            Function with no arguments that creates the kernel, which is
+            called if the kernel is not within the cache.
+
+        Returns
+        -------
+        kernel
+            The kernel returned by create_kernel for this key.
+        """
+        with self.lock:
+            try:
+                kernel = self.kernels.pop(key)
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.kernels[key] = kernel
+                return kernel
+        kernel = create_kernel()
+        if self.maxsize > 0:
+            with self.lock:
+                # Another thread may have stored the same kernel whilst this
+                # kernel was being created.
+                self.kernels.pop(key, None)
+                if len(self.kernels) >= self.maxsize:
+                    # Discard the least recently used kernel.
+                    self.kernels.popitem(last=False)
+                self.kernels[key] = kernel
+        return kernel
+
+    def cache_info(self):
+        """
+        Report statistics on the use of the cache.
+
+        Returns
+        -------
+        KernelCacheInfo
+            Named tuple containing the number of hits and misses, the
+            maximum size of the cache and the number of kernels currently
+            within the cache.
+        """
+        return KernelCacheInfo(
+            self.hits, self.misses, self.maxsize, len(self.kernels))
+
+    def cache_clear(self):
+        """Remove all kernels from the cache and reset the statistics."""
+        with self.lock:
+            self.kernels.clear()
+            self.hits = 0
+            self.misses = 0
+
+
 class CircularNeighbourhood(object):
 
     """
@@ -747,9 +824,25 @@ class CircularNeighbourhood(object):
 
     A maximum kernel radius of 500 grid cells is imposed in order to
     avoid computational ineffiency and possible memory errors.
+
+    The kernel can either be applied directly, by correlating the kernel
+    with the data, or by FFT convolution. The cost of applying the kernel
+    directly grows with the number of points in the kernel, whereas the cost
+    of FFT convolution depends only on the size of the grid, so FFT
+    convolution is much faster for large kernels.
+
+    Kernels are kept within a cache that is shared by all instances of this
+    class, so that kernels are not recreated for each slice of a cube.
+
+    Single precision fields give single precision results with every method
+    of applying the kernel. Unlike the square neighbourhood, the FFT and
+    span methods work on double precision copies of the whole field, so
+    single precision fields do not reduce the memory required.
     """
 
-    def __init__(self, unweighted_mode=False):
+    kernel_cache = KernelCache()
+
+    def __init__(self, unweighted_mode=False, convolution="auto"):
         """
         Initialise class.
 
@@ -759,14 +852,297 @@ class CircularNeighbourhood(object):
             If True, use a circle with constant weighting.
             If False, use a circle for neighbourhood kernel with
             weighting decreasing with radius.
+        convolution : string
+            Method used to apply the kernel. Options: 'direct' to correlate
+            the kernel with the data; 'fft' to use FFT convolution; 'spans'
+            to sum the data along the spans of each row of the kernel, which
+            is only available in unweighted mode; 'auto' to choose the
+            method that is expected to be fastest, based on the size of the
+            kernel and the grid.
 
+        Raises
+        ------
+        ValueError : If the convolution method is not supported.
         """
         self.unweighted_mode = unweighted_mode
+        convolution_methods = ["auto", "direct", "fft", "spans"]
+        if convolution not in convolution_methods:
+            msg = ("The convolution method requested: {} is not a "
+                   "supported method. Please choose from: {}".format(
+                       convolution, convolution_methods))
+            raise ValueError(msg)
+        if convolution == "spans" and not unweighted_mode:
+            msg = ("The spans convolution method is only available for "
+                   "an unweighted circular neighbourhood.")
+            raise ValueError(msg)
+        self.convolution = convolution
 
     def __repr__(self):
         """Represent the configured plugin instance as a string."""
-        result = ('<CircularNeighbourhood: unweighted_mode: {}>')
-        return result.format(self.unweighted_mode)
+        result = ('<CircularNeighbourhood: unweighted_mode: {}; '
+                  'convolution: {}>')
+        return result.format(self.unweighted_mode, self.convolution)
+
+    @staticmethod
+    def _find_spans(kernel_row):
+        """
+        Find the spans of consecutive non-zero points along a row of a
+        kernel.
+
+        Parameters
+        ----------
+        kernel_row : Numpy array
+            One-dimensional array containing a row of the kernel.
+
+        Returns
+        -------
+        starts, stops : Numpy array
+            The index of the first point of each span, and one beyond the
+            last point of each span.
+        """
+        edges = np.diff(np.concatenate(
+            [[0], (kernel_row != 0).astype(int), [0]]))
+        starts, = np.nonzero(edges == 1)
+        stops, = np.nonzero(edges == -1)
+        return starts, stops
+
+    def choose_convolution(self, data, kernel):
+        """
+        Choose the method expected to be the fastest way of applying the
+        kernel to the data.
+
+        Applying the kernel directly requires a multiplication for every
+        point in the kernel at every point in the grid. FFT convolution
+        requires of the order of P*log2(P) operations, where P is the number
+        of points in the grid after padding by the kernel radius. Summing
+        the data along the spans of an unweighted kernel requires a
+        subtraction of cumulative sums for each span at every point in the
+        grid. Each operation of the FFT convolution and the span sums is more
+        expensive than each multiplication when applying the kernel
+        directly, which is accounted for by FFT_COST_FACTOR and
+        SPAN_COST_FACTOR.
+
+        FFT convolution and span sums are only used for floating point data
+        that does not contain NaN values, so that the result matches
+        applying the kernel directly. Span sums are only used in unweighted
+        mode.
+
+        Parameters
+        ----------
+        data : Numpy array
+            Array to which the kernel will be applied.
+        kernel : Numpy array
+            Kernel with the same number of dimensions as the data.
+
+        Returns
+        -------
+        string
+            The chosen method: 'direct', 'fft' or 'spans'.
+        """
+        if (not np.issubdtype(data.dtype, np.floating) or
+                np.isnan(data).any()):
+            return "direct"
+        padded_size = np.prod(
+            [num_points + size - 1
+             for num_points, size in zip(data.shape, kernel.shape)])
+        operations = {
+            "direct": data.size * kernel.size,
+            "fft": FFT_COST_FACTOR * padded_size * np.log2(padded_size)}
+        if self.unweighted_mode:
+            num_spans = sum(len(self._find_spans(kernel_row)[0])
+                            for kernel_row in np.squeeze(kernel))
+            operations["spans"] = (
+                SPAN_COST_FACTOR * data.size * (num_spans + 1))
+        return min(operations, key=operations.get)
+
+    @staticmethod
+    def correlate_using_fft(data, kernel):
+        """
+        Correlate the kernel with the data using FFT convolution. Edges are
+        treated in the same way as scipy.ndimage.filters.correlate with
+        mode='nearest', by padding the data with the values at the edge.
+
+        Parameters
+        ----------
+        data : Numpy array
+            Array to which the kernel will be applied.
+        kernel : Numpy array
+            Kernel with the same number of dimensions as the data, with an
+            odd number of points along each axis.
+
+        Returns
+        -------
+        Numpy array
+            Array with the same shape as the data, containing the data
+            correlated with the kernel.
+        """
+        axes = [axis for axis, size in enumerate(kernel.shape) if size > 1]
+        data = np.asarray(data)
+        if not axes:
+            return data * kernel.ravel()[0]
+        pad_width = [((size - 1) // 2, (size - 1) // 2)
+                     for size in kernel.shape]
+        padded_data = np.pad(data, pad_width, mode='edge')
+        # Correlation is equivalent to convolution with a reversed kernel.
+        reversed_kernel = kernel[(slice(None, None, -1),) * kernel.ndim]
+        correlated = scipy.signal.fftconvolve(
+            padded_data, reversed_kernel, mode='valid', axes=axes)
+        # The kernel weights are not negative, so the result must lie within
+        # the range of the data multiplied by the sum of the kernel. Clip to
+        # remove rounding errors from the FFT e.g. small negative values.
+        kernel_sum = np.sum(kernel)
+        return np.clip(correlated, np.min(data) * kernel_sum,
+                       np.max(data) * kernel_sum).astype(data.dtype)
+
+    def correlate_using_spans(self, data, kernel, y_axis, x_axis):
+        """
+        Correlate an unweighted kernel with the data by summing the data
+        along the spans of consecutive non-zero points within each row of
+        the kernel. The sum along each span is found at all points from the
+        difference between two points of the cumulative sum along the x
+        axis, so the cost is proportional to the number of rows of the
+        kernel, rather than the number of points within the kernel.
+
+        The data is padded with a halo using
+        SquareNeighbourhood.pad_array_with_halo, with the value at the edge
+        of the data, which treats the edges in the same way as
+        scipy.ndimage.filters.correlate with mode='nearest'. As for the
+        SquareNeighbourhood, NaN values are treated as zero when summing,
+        and are set to NaN in the result.
+
+        Parameters
+        ----------
+        data : Numpy array
+            Array to which the kernel will be applied.
+        kernel : Numpy array
+            Unweighted kernel with the same number of dimensions as the
+            data, containing ones within the neighbourhood and zeros
+            elsewhere, with an odd number of points along the y and x axes
+            and one point along any other axes.
+        y_axis, x_axis : integer
+            The indices of the y and x axes within the data and kernel.
+
+        Returns
+        -------
+        Numpy array
+            Array with the same shape as the data, containing the data
+            correlated with the kernel.
+        """
+        data = np.asarray(data)
+        kernel = np.moveaxis(kernel, [y_axis, x_axis], [-2, -1])
+        kernel = np.reshape(kernel, kernel.shape[-2:])
+        width_y, width_x = [(size - 1) // 2 for size in kernel.shape]
+        n_rows = data.shape[y_axis]
+        n_columns = data.shape[x_axis]
+        padded_data = np.moveaxis(
+            SquareNeighbourhood.pad_array_with_halo(
+                data, y_axis, x_axis, width_x, width_y, mode="edge"),
+            [y_axis, x_axis], [-2, -1])
+        nan_masks = np.isnan(padded_data)
+        # Cumulative sum along the x axis, with a leading column of zeros.
+        summed_data = np.zeros(
+            padded_data.shape[:-1] + (padded_data.shape[-1] + 1,))
+        np.cumsum(np.where(nan_masks, 0, padded_data), axis=-1,
+                  out=summed_data[..., 1:])
+
+        # The halo is twice the width of the kernel radius, so row i of the
+        # kernel is aligned with the data at an offset of width_y + i rows.
+        correlated = np.zeros(padded_data.shape[:-2] + (n_rows, n_columns))
+        for row_index, kernel_row in enumerate(kernel):
+            rows = summed_data[..., width_y+row_index:
+                               width_y+row_index+n_rows, :]
+            for start, stop in zip(*self._find_spans(kernel_row)):
+                correlated += rows[..., width_x+stop:
+                                   width_x+stop+n_columns]
+                correlated -= rows[..., width_x+start:
+                                   width_x+start+n_columns]
+        correlated[SquareNeighbourhood.remove_halo_from_array(
+            nan_masks, -2, -1, width_x, width_y)] = np.nan
+        correlated = np.moveaxis(correlated, [-2, -1], [y_axis, x_axis])
+        if np.issubdtype(data.dtype, np.floating):
+            correlated = correlated.astype(data.dtype)
+        return correlated
+
+    def create_kernel(self, fullranges, ranges, dtype=np.float64):
+        """
+        Create a circular kernel.
+
+        Parameters
+        ----------
+        fullranges : Numpy array
+            Number of grid cells along each axis of the data used to create
+            the kernel, which is zero for axes other than the x and y axes.
+        ranges : Tuple
+            Number of grid cells in the x and y direction used to create
+            the kernel.
+        dtype : Numpy dtype
+            Data type of the kernel.
+
+        Returns
+        -------
+        kernel : Numpy array
+            Kernel with the same number of dimensions as fullranges.
+        """
+        # Define the size of the kernel based on the number of grid cells
+        # contained within the desired radius.
+        kernel = np.ones([int(1 + x * 2) for x in fullranges], dtype=dtype)
+        # Create an open multi-dimensional meshgrid.
+        open_grid = np.array(np.ogrid[tuple([slice(-x, x+1) for x in ranges])])
+        if self.unweighted_mode:
+            mask = np.reshape(
+                np.sum(open_grid**2) > np.prod(ranges), np.shape(kernel))
+        else:
+            # Create a kernel, such that the central grid point has the
+            # highest weighting, with the weighting decreasing with distance
+            # away from the central grid point.
+            open_grid_summed_squared = np.sum(open_grid**2.).astype(float)
+            kernel[:] = (
+                (np.prod(ranges) - open_grid_summed_squared) / np.prod(ranges))
+            mask = kernel < 0.
+        kernel[mask] = 0.
+        return kernel
+
+    def get_kernel(self, fullranges, ranges, data_dtype):
+        """
+        Get a circular kernel and its normalisation from the kernel cache,
+        creating the kernel if it is not already within the cache.
+
+        The kernel is created with a floating point type that can represent
+        the data, which is at least float64.
+
+        Parameters
+        ----------
+        fullranges : Numpy array
+            Number of grid cells along each axis of the data used to create
+            the kernel, which is zero for axes other than the x and y axes.
+        ranges : Tuple
+            Number of grid cells in the x and y direction used to create
+            the kernel.
+        data_dtype : Numpy dtype
+            Data type of the data to which the kernel will be applied.
+
+        Returns
+        -------
+        kernel : Numpy array
+            Read-only kernel with the same number of dimensions as
+            fullranges.
+        kernel_sum : float
+            Sum of the kernel, used to normalise the result.
+        """
+        dtype = np.promote_types(data_dtype, np.float64)
+        key = (tuple(int(x) for x in fullranges),
+               tuple(int(x) for x in ranges),
+               bool(self.unweighted_mode), dtype)
+
+        def _create_kernel():
+            """Create the kernel and its sum, to be stored in the cache."""
+            kernel = self.create_kernel(fullranges, ranges, dtype=dtype)
+            # The kernel is shared between all users of the cache, so must
+            # not be modified.
+            kernel.flags.writeable = False
+            return kernel, np.sum(kernel)
+
+        return self.kernel_cache.get(key, _create_kernel)
 
     def apply_circular_kernel(self, cube, ranges):
         """
@@ -800,26 +1176,21 @@ class CircularNeighbourhood(object):
             raise ValueError("Invalid grid: projection_x/y coords required")
         for axis_index, axis in enumerate(axes):
             fullranges[axis] = ranges[axis_index]
-        # Define the size of the kernel based on the number of grid cells
-        # contained within the desired radius.
-        kernel = np.ones([int(1 + x * 2) for x in fullranges])
-        # Create an open multi-dimensional meshgrid.
-        open_grid = np.array(np.ogrid[tuple([slice(-x, x+1) for x in ranges])])
-        if self.unweighted_mode:
-            mask = np.reshape(
-                np.sum(open_grid**2) > np.prod(ranges), np.shape(kernel))
-        else:
-            # Create a kernel, such that the central grid point has the
-            # highest weighting, with the weighting decreasing with distance
-            # away from the central grid point.
-            open_grid_summed_squared = np.sum(open_grid**2.).astype(float)
-            kernel[:] = (
-                (np.prod(ranges) - open_grid_summed_squared) / np.prod(ranges))
-            mask = kernel < 0.
-        kernel[mask] = 0.
+        kernel, kernel_sum = self.get_kernel(fullranges, ranges, data.dtype)
         # Smooth the data by applying the kernel.
-        cube.data = scipy.ndimage.filters.correlate(
-            data, kernel, mode='nearest') / np.sum(kernel)
+        if self.convolution == "auto":
+            convolution = self.choose_convolution(data, kernel)
+        else:
+            convolution = self.convolution
+        if convolution == "fft":
+            correlated = self.correlate_using_fft(data, kernel)
+        elif convolution == "spans":
+            correlated = self.correlate_using_spans(
+                data, kernel, axes[1], axes[0])
+        else:
+            correlated = scipy.ndimage.filters.correlate(
+                data, kernel, mode='nearest')
+        cube.data = correlated / kernel_sum
         return cube
 
     def run(self, cube, radius):
@@ -847,6 +1218,58 @@ class CircularNeighbourhood(object):
         cube = self.apply_circular_kernel(cube, ranges)
         return cube
 
+    def run_along_coord(self, cube, radii, coord_name):
+        """
+        Apply a circular neighbourhood with a different radius to each point
+        along a coordinate of a cube e.g. a radius for each lead time. The
+        points whose radii give the same number of grid cells are grouped,
+        and the kernel is applied to each group at once, rather than to
+        each point in turn.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube containing the array to which the circular neighbourhoods
+            will be applied.
+        radii : List or Numpy array
+            Radii in metres, one for each point along the coordinate.
+        coord_name : String
+            Name of the coordinate along which the radius varies.
+
+        Returns
+        -------
+        cube : Iris.cube.Cube
+            Cube containing the smoothed field after the kernels have been
+            applied.
+
+        Raises
+        ------
+        ValueError : If the number of radii does not match the number of
+                     points along the coordinate.
+        """
+        coord_points = cube.coord(coord_name).points
+        if len(radii) != len(coord_points):
+            msg = ("The number of radii ({}) does not match the number of "
+                   "points along the {} coordinate ({})".format(
+                       len(radii), coord_name, len(coord_points)))
+            raise ValueError(msg)
+        coord_dims = cube.coord_dims(coord_name)
+        if not coord_dims:
+            return self.run(cube, radii[0])
+
+        data = None
+        for grid_cells, points in (
+                Utilities.group_radii_by_grid_cells(cube, radii)):
+            index = [slice(None)] * cube.ndim
+            index[coord_dims[0]] = points
+            index = tuple(index)
+            group_data = self.apply_circular_kernel(
+                cube[index], grid_cells).data
+            if data is None:
+                data = np.empty(cube.shape, dtype=group_data.dtype)
+            data[index] = group_data
+        return cube.copy(data=data)
+
 
 class NeighbourhoodProcessing(object):
     """
@@ -862,7 +1285,8 @@ class NeighbourhoodProcessing(object):
     """
 
     def __init__(self, neighbourhood_method, radii, lead_times=None,
-                 unweighted_mode=False, ens_factor=1.0):
+                 unweighted_mode=False, ens_factor=1.0, workers=1,
+                 collapse_realizations=False):
         """
         Create a neighbourhood processing plugin that applies a smoothing
         to points in a cube.
@@ -893,6 +1317,17 @@ class NeighbourhoodProcessing(object):
             members if every grid square is considered to be the
             equivalent of an ensemble member.
             Optional, defaults to 1.0
+        workers : integer
+            The number of threads used to process the realizations and lead
+            times of the cube in parallel. The output is the same as when
+            processing the realizations and lead times one after another.
+            Optional, defaults to 1.
+        collapse_realizations : boolean
+            If True, return the mean of the neighbourhood processed
+            realizations, rather than each neighbourhood processed
+            realization. The radii are adjusted for the number of
+            realizations as usual.
+            Optional, defaults to False.
         """
         self.neighbourhood_method_key = neighbourhood_method
         methods = {
@@ -920,6 +1355,12 @@ class NeighbourhoodProcessing(object):
                 raise ValueError(msg)
         self.unweighted_mode = bool(unweighted_mode)
         self.ens_factor = float(ens_factor)
+        self.workers = int(workers)
+        self.collapse_realizations = bool(collapse_realizations)
+        if self.workers < 1:
+            msg = ("The number of workers must be at least 1. "
+                   "Requested: {}".format(workers))
+            raise ValueError(msg)
 
     def _find_radii(self, num_ens, cube_lead_times=None):
         """Revise radius or radii for found lead times and ensemble members
@@ -958,12 +1399,452 @@ class NeighbourhoodProcessing(object):
         """Represent the configured plugin instance as a string."""
         result = ('<NeighbourhoodProcessing: neighbourhood_method: {}; '
                   'radii: {}; lead_times: {}; '
-                  'unweighted_mode: {}; ens_factor: {}>')
+                  'unweighted_mode: {}; ens_factor: {}; workers: {}; '
+                  'collapse_realizations: {}>')
         return result.format(
             self.neighbourhood_method_key, self.radii, self.lead_times,
-            self.unweighted_mode, self.ens_factor)
+            self.unweighted_mode, self.ens_factor, self.workers,
+            self.collapse_realizations)
+
+    @staticmethod
+    def _find_number_of_realizations(cube):
+        """
+        Find the number of ensemble members used to adjust the radii, from
+        the realization coordinate or the source_realizations attribute.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube to which the neighbourhood processing will be applied.
+
+        Returns
+        -------
+        num_ens : float
+            Number of ensemble members or realizations.
+
+        Raises
+        ------
+        ValueError : If the cube has both a realization coordinate and a
+                     source_realizations attribute.
+        """
+        try:
+            realiz_coord = cube.coord('realization')
+        except iris.exceptions.CoordinateNotFoundError:
+            if 'source_realizations' in cube.attributes:
+                return len(cube.attributes['source_realizations'])
+            return 1.0
+        if 'source_realizations' in cube.attributes:
+            msg = ("Realizations and attribute source_realizations "
+                   "should not both be set in input cube")
+            raise ValueError(msg)
+        return len(realiz_coord.points)
+
+    @staticmethod
+    def _check_for_nans(cube):
+        """
+        Check that the data within a cube does not contain NaN values.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube to check, which is usually a single realization or x-y
+            slice, so that the data is read one part at a time.
+
+        Raises
+        ------
+        ValueError : If the data contains NaN values.
+        """
+        if np.isnan(cube.data).any():
+            raise ValueError("Error: NaN detected in input cube data")
+
+    def _run_jobs(self, jobs):
+        """
+        Run independent jobs, using a pool of threads if more than one
+        worker is requested. The heavy numerical work within each job is
+        carried out by numpy and scipy, which release the GIL, so the jobs
+        can run concurrently.
+
+        Parameters
+        ----------
+        jobs : list of tuple
+            List of jobs, each containing a function and a tuple of the
+            arguments for the function.
+
+        Returns
+        -------
+        list
+            The result of each job, in the same order as the jobs.
+        """
+        def _run_job(job):
+            """Call the function of a job with its arguments."""
+            function, args = job
+            return function(*args)
+
+        if self.workers == 1 or len(jobs) <= 1:
+            return [_run_job(job) for job in jobs]
+        pool = ThreadPool(min(self.workers, len(jobs)))
+        try:
+            # Pool.map returns the results in the order of the jobs.
+            return pool.map(_run_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _jobs_for_realization(self, cube_realization, num_ens,
+                              num_jobs=1, mask_cube=None):
+        """
+        Set up the jobs required to apply the neighbourhood processing
+        method to a single realization. If radii are defined at lead times,
+        the lead times are split into contiguous chunks, each processed by
+        a separate job, so that the lead times of a single realization can
+        be processed in parallel. The jobs are independent.
+
+        Parameters
+        ----------
+        cube_realization : Iris.cube.Cube
+            Cube containing a single realization.
+        num_ens : float
+            Number of ensemble members or realizations, used to adjust the
+            radii.
+        num_jobs : integer
+            The number of jobs to split the lead times into. There are
+            never more jobs than lead times, and there is a single job if
+            the radii are not defined at lead times, or if time is not a
+            dimension coordinate of the cube.
+            Optional, defaults to 1.
+        mask_cube : Iris.cube.Cube (optional)
+            Cube with only x and y dimensions containing a mask, which is
+            passed to the square neighbourhood method.
+
+        Returns
+        -------
+        jobs : list of tuple
+            List of jobs, each containing a function and a tuple of the
+            arguments for the function. The results of the jobs are joined
+            by _join_realization_results.
+        """
+        mask_args = () if mask_cube is None else (mask_cube,)
+        if self.lead_times is None:
+            radius = self._find_radii(num_ens)
+            return [(self.neighbourhood_method.run,
+                     (cube_realization, radius) + mask_args)]
+        cube_lead_times = (
+            Utilities.find_required_lead_times(cube_realization))
+        # Interpolate to find the radius at each required lead time.
+        required_radii = (
+            self._find_radii(num_ens, cube_lead_times=cube_lead_times))
+        # Within each job, the lead times are grouped by the number of grid
+        # cells that their radii correspond to, and each group is processed
+        # at once.
+        time_dims = ()
+        if cube_realization.coords("time", dim_coords=True):
+            time_dims = cube_realization.coord_dims("time")
+        if not time_dims:
+            num_jobs = 1
+        jobs = []
+        for points in np.array_split(np.arange(len(required_radii)),
+                                     min(num_jobs, len(required_radii))):
+            if num_jobs == 1:
+                cube_chunk = cube_realization
+            else:
+                index = [slice(None)] * cube_realization.ndim
+                index[time_dims[0]] = slice(points[0], points[-1] + 1)
+                cube_chunk = cube_realization[tuple(index)]
+            jobs.append((self.neighbourhood_method.run_along_coord,
+                         (cube_chunk, required_radii[points], "time") +
+                         mask_args))
+        return jobs
+
+    @staticmethod
+    def _join_realization_results(results):
+        """
+        Join the results of the jobs for a single realization, which each
+        hold a contiguous chunk of the lead times.
+
+        Parameters
+        ----------
+        results : list of Iris.cube.Cube
+            The results of the jobs from _jobs_for_realization, in order.
+
+        Returns
+        -------
+        Iris.cube.Cube
+            The neighbourhood processed realization.
+        """
+        if len(results) == 1:
+            return results[0]
+        # A chunk with a single lead time has scalar time coordinates, so
+        # the lead times of all the chunks are merged, as the realizations
+        # are.
+        return iris.cube.CubeList(
+            [cube_time for result in results
+             for cube_time in result.slices_over("time")]).merge_cube()
+
+    def _run_realization_jobs(self, realization_jobs):
+        """
+        Run the jobs for each realization together, so that the lead times
+        of different realizations can also be processed in parallel.
+
+        Parameters
+        ----------
+        realization_jobs : list of list of tuple
+            The jobs from _jobs_for_realization for each realization.
+
+        Returns
+        -------
+        list of Iris.cube.Cube
+            The neighbourhood processed realizations, in the same order as
+            the jobs.
+        """
+        results = iter(self._run_jobs(
+            [job for jobs in realization_jobs for job in jobs]))
+        return [self._join_realization_results(
+            list(itertools.islice(results, len(jobs))))
+            for jobs in realization_jobs]
+
+    def _process_collapsing_masked_realizations(self, cube, num_ens,
+                                                mask_cube=None):
+        """
+        Calculate the mean of the neighbourhood processed realizations of a
+        cube containing masked data, processing one realization at a time.
+
+        Masked points are excluded when calculating the neighbourhood, so
+        the neighbourhood processing is not linear and cannot be applied to
+        the realization mean. Instead, the sum and the number of unmasked
+        neighbourhood processed values are accumulated over the
+        realizations, so that only one realization is processed at a time.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube with a realization dimension, containing masked data.
+        num_ens : float
+            Number of ensemble members or realizations, used to adjust the
+            radii.
+        mask_cube : Iris.cube.Cube (optional)
+            Cube with only x and y dimensions containing a mask, which is
+            passed to the square neighbourhood method.
+
+        Returns
+        -------
+        mean_cube : Iris.cube.Cube
+            Cube containing the mean of the neighbourhood processed
+            realizations, which is masked where all realizations are masked.
+        """
+        total = None
+        for cube_realization in cube.slices_over("realization"):
+            self._check_for_nans(cube_realization)
+            result, = self._run_realization_jobs([self._jobs_for_realization(
+                cube_realization, num_ens, num_jobs=self.workers,
+                mask_cube=mask_cube)])
+            data = np.ma.masked_invalid(result.data)
+            if total is None:
+                total = np.zeros(data.shape)
+                count = np.zeros(data.shape)
+            total += data.filled(0)
+            count += np.logical_not(np.ma.getmaskarray(data))
+
+        mean_cube = cube.collapsed("realization", iris.analysis.MEAN)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.ma.masked_where(count == 0, total / count)
+        np.ma.set_fill_value(mean, np.nan)
+        mean_cube.data = np.reshape(mean, mean_cube.shape)
+        return mean_cube
+
+    def _incremental_margins(self, cube):
+        """
+        Find the number of grid cells along x and y over which a change to
+        the input can affect the output, using the largest radius that may
+        be used for the cube.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube to which the neighbourhood processing will be applied.
+
+        Returns
+        -------
+        margin_x, margin_y : integer
+            Number of grid cells along x and y.
+        """
+        # The radius adjusted for the number of realizations is at most the
+        # ens_factor multiplied by the radius, and the radii interpolated
+        # between lead times lie within the range of the radii.
+        max_radius = np.max(self.radii) * max(1., self.ens_factor)
+        return convert_distance_into_number_of_grid_cells(
+            cube, max_radius, MAX_RADIUS_IN_GRID_CELLS)
+
+    @staticmethod
+    def find_changed_regions(changed, margin_x, margin_y):
+        """
+        Find regions of the output containing all of the points affected by
+        changes to the input.
+
+        The domain is divided into blocks with the size of the margins, so
+        that any point within the margins of a changed point lies within
+        the same block or an adjacent block. The blocks containing changed
+        points are expanded by one block, and the bounding box of each
+        connected region of blocks is returned. Working with blocks, rather
+        than individual points, keeps the cost of finding the regions small
+        compared with the neighbourhood processing.
+
+        Parameters
+        ----------
+        changed : Numpy array
+            Boolean array with dimensions of y and x, which is True where
+            the input has changed.
+        margin_x, margin_y : integer
+            Number of grid cells along x and y over which a change to the
+            input can affect the output.
+
+        Returns
+        -------
+        regions : list of tuple
+            List of the y and x slices bounding each affected region.
+        """
+        num_rows, num_columns = changed.shape
+        block_y, block_x = max(margin_y, 1), max(margin_x, 1)
+        num_block_rows = -(-num_rows // block_y)
+        num_block_columns = -(-num_columns // block_x)
+        padded = np.zeros((num_block_rows * block_y,
+                           num_block_columns * block_x), dtype=bool)
+        padded[:num_rows, :num_columns] = changed
+        changed_blocks = np.reshape(
+            padded, (num_block_rows, block_y, num_block_columns, block_x)
+            ).any(axis=(1, 3))
+        affected_blocks = scipy.ndimage.filters.maximum_filter(
+            changed_blocks, size=3, mode="constant")
+        labels, _ = scipy.ndimage.label(affected_blocks)
+        regions = []
+        for y_blocks, x_blocks in scipy.ndimage.find_objects(labels):
+            regions.append((
+                slice(y_blocks.start * block_y,
+                      min(y_blocks.stop * block_y, num_rows)),
+                slice(x_blocks.start * block_x,
+                      min(x_blocks.stop * block_x, num_columns))))
+        return regions
+
+    def process_incremental(self, previous_cube, previous_result, cube,
+                            mask_cube=None):
+        """
+        Update the result of neighbourhood processing for a cube which
+        differs from a previously processed cube in only part of the
+        domain, such as a new radar composite. Only the tiles of the domain
+        affected by the changes are neighbourhood processed, and the rest of
+        the previous result is retained.
+
+        Each affected region is found by expanding the changed points by the
+        largest neighbourhood radius. Each region is then processed together
+        with a surrounding margin of the same width, so that the edges of
+        the tile do not affect the region. The result is the same as
+        processing the whole cube, within the rounding of the sums used by
+        the neighbourhood processing.
+
+        Parameters
+        ----------
+        previous_cube : Iris.cube.Cube
+            The cube that was neighbourhood processed to give the previous
+            result.
+        previous_result : Iris.cube.Cube
+            The result of neighbourhood processing the previous cube, using
+            the same plugin configuration and mask cube.
+        cube : Iris.cube.Cube
+            Cube to apply a neighbourhood processing method to, with the
+            same coordinates as the previous cube.
+        mask_cube : Iris.cube.Cube (optional)
+            Cube with only x and y dimensions containing a mask, which was
+            also used to process the previous cube. Only available for the
+            square neighbourhood method.
+
+        Returns
+        -------
+        result : Iris.cube.Cube
+            Cube after applying a neighbourhood processing method, with the
+            metadata of the previous result.
+
+        Raises
+        ------
+        ValueError : If the cube does not have the same shape and
+                     coordinates as the previous cube, or the previous result
+                     is not on the same grid.
+        """
+        if (cube.shape != previous_cube.shape or
+                cube.coords() != previous_cube.coords()):
+            msg = ("The cube must have the same shape and coordinates as "
+                   "the previous cube.")
+            raise ValueError(msg)
+        grid_spec = GridSpec.from_cube(cube)
+        result_grid_spec = GridSpec.from_cube(previous_result)
+        if (previous_result.coord(axis="x") != cube.coord(axis="x") or
+                previous_result.coord(axis="y") != cube.coord(axis="y")):
+            msg = ("The previous result must be on the same grid as the "
+                   "cube.")
+            raise ValueError(msg)
+
+        spatial_axes = [grid_spec.y_axis, grid_spec.x_axis]
+        previous_data = np.moveaxis(previous_cube.data, spatial_axes,
+                                    [-2, -1])
+        data = np.moveaxis(cube.data, spatial_axes, [-2, -1])
+        changed = (np.ma.getdata(previous_data) != np.ma.getdata(data))
+        changed |= (np.ma.getmaskarray(previous_data) !=
+                    np.ma.getmaskarray(data))
+        changed = np.any(
+            np.reshape(changed, (-1,) + changed.shape[-2:]), axis=0)
+
+        result = previous_result.copy()
+        if not changed.any():
+            return result
+        try:
+            margin_x, margin_y = self._incremental_margins(cube)
+        except ValueError:
+            # The neighbourhood is too large to be applied to part of the
+            # domain, so the whole cube is processed.
+            return self.process(cube, mask_cube=mask_cube)
+
+        num_rows, num_columns = changed.shape
+        result_data = result.data
+        for y_region, x_region in self.find_changed_regions(
+                changed, margin_x, margin_y):
+            # Extend the region by the margins to give the tile that is
+            # processed, so that the region is unaffected by the edges of
+            # the tile.
+            y_tile = slice(max(y_region.start - margin_y, 0),
+                           min(y_region.stop + margin_y, num_rows))
+            x_tile = slice(max(x_region.start - margin_x, 0),
+                           min(x_region.stop + margin_x, num_columns))
+            tile_index = [slice(None)] * cube.ndim
+            tile_index[grid_spec.y_axis] = y_tile
+            tile_index[grid_spec.x_axis] = x_tile
+            tile_mask_cube = None
+            if mask_cube is not None:
+                mask_grid_spec = GridSpec.from_cube(mask_cube)
+                mask_index = [slice(None)] * 2
+                mask_index[mask_grid_spec.y_axis] = y_tile
+                mask_index[mask_grid_spec.x_axis] = x_tile
+                tile_mask_cube = mask_cube[tuple(mask_index)]
+            tile_result = self.process(
+                cube[tuple(tile_index)], mask_cube=tile_mask_cube)
+
+            # Copy the region from the processed tile into the result.
+            region_in_tile = [slice(None)] * tile_result.ndim
+            region_in_result = [slice(None)] * result.ndim
+            for axis_name, region, tile in [("y", y_region, y_tile),
+                                            ("x", x_region, x_tile)]:
+                axis = getattr(result_grid_spec, axis_name + "_axis")
+                region_in_result[axis] = region
+                region_in_tile[axis] = slice(region.start - tile.start,
+                                             region.stop - tile.start)
+            tile_data = tile_result.data[tuple(region_in_tile)]
+            if (isinstance(tile_data, np.ma.MaskedArray) and
+                    not isinstance(result_data, np.ma.MaskedArray)):
+                result_data = np.ma.MaskedArray(
+                    result_data, mask=np.zeros(result_data.shape, bool))
+                np.ma.set_fill_value(result_data, np.nan)
+            result_data[tuple(region_in_result)] = tile_data
+        result.data = result_data
+        return result
 
-    def process(self, cube):
+    def process(self, cube, mask_cube=None):
         """
         Supply neighbourhood processing method, in order to smooth the
         input cube.
@@ -973,6 +1854,13 @@ class NeighbourhoodProcessing(object):
         cube : Iris.cube.Cube
             Cube to apply a neighbourhood processing method to, in order to
             generate a smoother field.
+        mask_cube : Iris.cube.Cube (optional)
+            Cube with only x and y dimensions containing a mask, such as a
+            land-sea mask or a topographic band mask generated by
+            improver.generate_ancillaries. Only points where the mask is
+            non-zero are included within the neighbourhood, and the output is
+            masked elsewhere. Only available for the square neighbourhood
+            method.
 
         Returns
         -------
@@ -980,61 +1868,245 @@ class NeighbourhoodProcessing(object):
             Cube after applying a neighbourhood processing method, so that the
             resulting field is smoothed.
 
+        Raises
+        ------
+        ValueError : If a mask cube is supplied for a neighbourhood method
+                     other than the square neighbourhood method.
+
         """
-        # Check if the realization coordinate exists. If there are multiple
-        # values for the realization, then an exception is raised. Otherwise,
-        # the cube is sliced, so that the realization becomes a scalar
-        # coordinate.
-        try:
-            realiz_coord = cube.coord('realization')
-        except iris.exceptions.CoordinateNotFoundError:
-            if 'source_realizations' in cube.attributes:
-                num_ens = len(cube.attributes['source_realizations'])
-            else:
-                num_ens = 1.0
-            slices_over_realization = [cube]
-        else:
-            num_ens = len(realiz_coord.points)
+        if (mask_cube is not None and
+                self.neighbourhood_method_key != "square"):
+            msg = ("A mask cube can only be used with the square "
+                   "neighbourhood method. Requested: {}".format(
+                       self.neighbourhood_method_key))
+            raise ValueError(msg)
+
+        # If the realization coordinate exists, the cube is sliced, so that
+        # the realization becomes a scalar coordinate.
+        num_ens = self._find_number_of_realizations(cube)
+        if cube.coords('realization'):
             slices_over_realization = cube.slices_over("realization")
-            if 'source_realizations' in cube.attributes:
-                msg = ("Realizations and attribute source_realizations "
-                       "should not both be set in input cube")
-                raise ValueError(msg)
+        else:
+            slices_over_realization = [cube]
 
-        if np.isnan(cube.data).any():
-            raise ValueError("Error: NaN detected in input cube data")
+        if (self.collapse_realizations and
+                cube.coords("realization", dim_coords=True)):
+            if isinstance(cube.data, np.ma.MaskedArray):
+                return self._process_collapsing_masked_realizations(
+                    cube, num_ens, mask_cube=mask_cube)
+            # Neighbourhood processing is linear, so the mean of the
+            # neighbourhood processed realizations is equal to the
+            # neighbourhood processed realization mean. This also holds when
+            # using a mask cube, as the mask is the same for every
+            # realization. The radii are still adjusted for the original
+            # number of realizations.
+            cube = cube.collapsed("realization", iris.analysis.MEAN)
+            cube.data = np.ma.getdata(cube.data)
+            slices_over_realization = [cube]
 
-        cubelist = iris.cube.CubeList([])
+        # Set up the independent jobs required to process each realization.
+        # Each job is a function and its arguments. The lead times of each
+        # realization are split between enough jobs to use all the workers.
+        # The data is checked one realization at a time.
+        slices_over_realization = list(slices_over_realization)
+        num_jobs = -(-self.workers // len(slices_over_realization))
+        realization_jobs = []
         for cube_realization in slices_over_realization:
-            if self.lead_times is None:
-                radius = self._find_radii(num_ens)
-                cube_new = self.neighbourhood_method.run(cube_realization,
-                                                         radius)
-            else:
-                cube_lead_times = (
-                    Utilities.find_required_lead_times(cube_realization))
-                # Interpolate to find the radius at each required lead time.
-                required_radii = (
-                    self._find_radii(num_ens,
-                                     cube_lead_times=cube_lead_times))
-
-                cubes = iris.cube.CubeList([])
-                # Find the number of grid cells required for creating the
-                # neighbourhood, and then apply the neighbourhood
-                # processing method to smooth the field.
-                for cube_slice, radius in (
-                        zip(cube_realization.slices_over("time"),
-                            required_radii)):
-                    cube_slice = self.neighbourhood_method.run(
-                        cube_slice, radius)
-                    cube_slice = iris.util.new_axis(cube_slice, "time")
-                    cubes.append(cube_slice)
-                cube_new = concatenate_cubes(cubes,
-                                             coords_to_slice_over=["time"])
-
-            cubelist.append(cube_new)
+            self._check_for_nans(cube_realization)
+            realization_jobs.append(self._jobs_for_realization(
+                cube_realization, num_ens, num_jobs=num_jobs,
+                mask_cube=mask_cube))
+        # The results are in the original order of the realizations.
+        cubelist = iris.cube.CubeList(
+            self._run_realization_jobs(realization_jobs))
         merged_cube = cubelist.merge_cube()
         # Promote dimensional coordinates that have been demoted to scalars.
         merged_cube = Utilities.check_cube_coordinates(cube, merged_cube)
 
         return merged_cube
+
+    def _process_slice(self, cube_slice, num_ens, mask_cube=None):
+        """
+        Apply the neighbourhood processing method to a cube containing a
+        single x-y slice, reading only that slice of the data. If the cube
+        also has a realization dimension, the realizations are processed
+        one at a time, and the mean of the neighbourhood processed
+        realizations is accumulated.
+
+        Parameters
+        ----------
+        cube_slice : Iris.cube.Cube
+            Cube with x and y dimensions, and optionally a realization
+            dimension.
+        num_ens : float
+            Number of ensemble members or realizations, used to adjust the
+            radii.
+        mask_cube : Iris.cube.Cube (optional)
+            Cube with only x and y dimensions containing a mask, which is
+            passed to the square neighbourhood method.
+
+        Returns
+        -------
+        data : Numpy array
+            The neighbourhood processed slice, with the x and y axes in the
+            order of the cube. If the output is masked, this is a masked
+            array with a fill value of NaN.
+
+        Raises
+        ------
+        ValueError : If the slice contains NaN values.
+        """
+        if cube_slice.coords("realization", dim_coords=True):
+            realizations = cube_slice.slices_over("realization")
+        else:
+            realizations = [cube_slice]
+
+        total = None
+        for realization in realizations:
+            self._check_for_nans(realization)
+            if self.lead_times is None:
+                radius = self._find_radii(num_ens)
+            else:
+                radius, = self._find_radii(
+                    num_ens, cube_lead_times=(
+                        Utilities.find_required_lead_times(realization)))
+            if mask_cube is not None:
+                result = self.neighbourhood_method.run(
+                    realization, radius, mask_cube=mask_cube)
+            else:
+                result = self.neighbourhood_method.run(realization, radius)
+            data = result.data
+            # The x and y axes of the result may not be in the order of the
+            # cube.
+            if (GridSpec.from_cube(result).x_axis !=
+                    GridSpec.from_cube(realization).x_axis):
+                data = data.T
+            if cube_slice is realization:
+                return data
+
+            # Find the mean of the unmasked neighbourhood processed values
+            # over the realizations, as for
+            # _process_collapsing_masked_realizations.
+            if total is None:
+                dtype = data.dtype
+                total = np.zeros(data.shape)
+                count = np.zeros(data.shape)
+                masked = False
+            data = np.ma.masked_invalid(data)
+            masked |= np.ma.is_masked(data)
+            total += data.filled(0)
+            count += np.logical_not(np.ma.getmaskarray(data))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (total / count).astype(dtype)
+        if not masked:
+            return mean
+        mean = np.ma.masked_where(count == 0, mean)
+        np.ma.set_fill_value(mean, np.nan)
+        return mean
+
+    def process_streaming(self, cube, mask_cube=None,
+                          allocate_output=np.empty):
+        """
+        Supply neighbourhood processing method, reading, processing and
+        writing one x-y slice of the cube at a time.
+
+        The slices are taken using slices_over, so a slice of a cube with
+        lazy data, such as a cube loaded from a NetCDF file, is only read
+        when it is processed, and each slice is checked for NaN values in
+        turn. Each processed slice is written to the output array straight
+        away, so the input and the calculation only require memory for a
+        few slices, however many realizations and lead times the cube
+        contains. The number of slices processed at once is the number of
+        workers. If the output array is a numpy.memmap, the output is held
+        on disk rather than in memory.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube to apply a neighbourhood processing method to, which may
+            have lazy data.
+        mask_cube : Iris.cube.Cube (optional)
+            Cube with only x and y dimensions containing a mask. Only
+            available for the square neighbourhood method.
+        allocate_output : callable (optional)
+            Function called with the keyword arguments shape and dtype to
+            create the array to which the output is written, such as
+            functools.partial(numpy.memmap, filename, mode="w+").
+            Optional, defaults to numpy.empty.
+
+        Returns
+        -------
+        cube : Iris.cube.Cube
+            Cube containing the result of applying the neighbourhood
+            processing method, which is the same as the output of process.
+            The data is the array created by allocate_output or, if the
+            output is masked, a masked array with that array as its data
+            and a mask held in memory.
+
+        Raises
+        ------
+        ValueError : If a mask cube is supplied for a neighbourhood method
+                     other than the square neighbourhood method.
+        ValueError : If a slice of the cube contains NaN values.
+        """
+        if (mask_cube is not None and
+                self.neighbourhood_method_key != "square"):
+            msg = ("A mask cube can only be used with the square "
+                   "neighbourhood method. Requested: {}".format(
+                       self.neighbourhood_method_key))
+            raise ValueError(msg)
+        num_ens = self._find_number_of_realizations(cube)
+
+        # The template for the output is found without reading the data.
+        template = cube
+        keep_axes = []
+        if (self.collapse_realizations and
+                cube.coords("realization", dim_coords=True)):
+            keep_axes = list(cube.coord_dims("realization"))
+            template = next(cube.slices_over("realization"))
+            template.replace_coord(cube.coord("realization").collapsed())
+            template.add_cell_method(
+                iris.coords.CellMethod("mean", coords="realization"))
+        grid_spec = GridSpec.from_cube(cube)
+        keep_axes += [grid_spec.y_axis, grid_spec.x_axis]
+        slice_axes = [axis for axis in range(cube.ndim)
+                      if axis not in keep_axes]
+        template_grid_spec = GridSpec.from_cube(template)
+        template_slice_axes = [
+            axis for axis in range(template.ndim)
+            if axis not in [template_grid_spec.y_axis,
+                            template_grid_spec.x_axis]]
+
+        def _output_indices():
+            """Generate the index of each slice within the output, in the
+            order in which slices_over returns the slices."""
+            for slice_point in np.ndindex(
+                    *[template.shape[axis] for axis in template_slice_axes]):
+                index = [slice(None)] * template.ndim
+                for axis, point in zip(template_slice_axes, slice_point):
+                    index[axis] = point
+                yield tuple(index)
+
+        slices = cube.slices_over(slice_axes)
+        output_indices = _output_indices()
+        output = None
+        while True:
+            cube_slices = list(itertools.islice(slices, self.workers))
+            if not cube_slices:
+                break
+            results = self._run_jobs(
+                [(self._process_slice, (cube_slice, num_ens, mask_cube))
+                 for cube_slice in cube_slices])
+            for data in results:
+                if output is None:
+                    output = allocate_output(
+                        shape=template.shape, dtype=data.dtype)
+                if (isinstance(data, np.ma.MaskedArray) and
+                        not isinstance(output, np.ma.MaskedArray)):
+                    # The array created for the output is kept as the data
+                    # of the masked array.
+                    output = np.ma.masked_array(
+                        output, mask=np.zeros(output.shape, dtype=bool),
+                        fill_value=np.nan)
+                output[next(output_indices)] = data
+        return template.copy(data=output)
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Module containing the neighbourhood percentiles plugin."""
+
+import iris
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from improver.nbhood.nbhood import MAX_RADIUS_IN_GRID_CELLS
+from improver.utilities.spatial import (
+    convert_distance_into_number_of_grid_cells, GridSpec)
+
+# Maximum number of neighbourhood values held in memory at once. The
+# sorted neighbourhoods of a field are held for a block of rows at a time, so
+# that the memory required does not depend upon the size of the field.
+MAX_WINDOW_ELEMENTS = 2 ** 22
+
+
+class NeighbourhoodPercentiles(object):
+
+    """
+    Calculate percentiles of the values within a square or circular
+    neighbourhood of each grid point.
+
+    The values within the neighbourhood of each grid point are kept in a
+    sorted window, which is slid along each row of the field, and all of
+    the requested percentiles are read from the sorted window. This avoids
+    thresholding the field and neighbourhood processing each threshold in
+    order to construct a neighbourhood distribution.
+
+    Points beyond the edge of the domain are filled with the value at the
+    nearest edge point, in the same way as for the circular neighbourhood
+    method.
+    """
+
+    # Default percentile boundaries to calculate at.
+    DEFAULT_PERCENTILES = [0, 5, 10, 20, 25, 30, 40, 50,
+                           60, 70, 75, 80, 90, 95, 100]
+
+    def __init__(self, neighbourhood_method, radius, percentiles=None):
+        """
+        Create a neighbourhood percentiles plugin.
+
+        Parameters
+        ----------
+        neighbourhood_method : str
+            Name of the neighbourhood method to use. Options: 'circular',
+            'square'.
+        radius : float
+            The radius in metres of the neighbourhood to apply.
+            Rounded up to convert into integer number of grid
+            points east and north, based on the characteristic spacing
+            at the zero indices of the cube projection-x and y coords.
+        percentiles : list (optional)
+            Percentile values at which to calculate; if not provided uses
+            DEFAULT_PERCENTILES.
+
+        Raises
+        ------
+        KeyError : If the neighbourhood method is not supported.
+        ValueError : If a percentile is outside the range 0 to 100.
+        """
+        methods = ["circular", "square"]
+        if neighbourhood_method not in methods:
+            msg = ("The neighbourhood_method requested: {} is not a "
+                   "supported method. Please choose from: {}".format(
+                       neighbourhood_method, methods))
+            raise KeyError(msg)
+        self.neighbourhood_method = neighbourhood_method
+        self.radius = float(radius)
+        if percentiles is not None:
+            self.percentiles = [float(value) for value in percentiles]
+        else:
+            self.percentiles = self.DEFAULT_PERCENTILES
+        if any(value < 0 or value > 100 for value in self.percentiles):
+            msg = ("The percentiles must be within the range 0 to 100. "
+                   "Requested: {}".format(self.percentiles))
+            raise ValueError(msg)
+
+    def __repr__(self):
+        """Represent the configured plugin instance as a string."""
+        result = ('<NeighbourhoodPercentiles: neighbourhood_method: {}; '
+                  'radius: {}; percentiles: {}>')
+        return result.format(
+            self.neighbourhood_method, self.radius, self.percentiles)
+
+    def make_footprint(self, grid_cells_x, grid_cells_y):
+        """
+        Create the footprint of the neighbourhood, which defines the points
+        within the neighbourhood of the central point.
+
+        The circular footprint contains the same points as the kernel used
+        by the unweighted circular neighbourhood method.
+
+        Parameters
+        ----------
+        grid_cells_x : integer
+            The number of grid cells along the x axis from the central point
+            to the edge of the neighbourhood.
+        grid_cells_y : integer
+            The number of grid cells along the y axis from the central point
+            to the edge of the neighbourhood.
+
+        Returns
+        -------
+        footprint : Numpy array
+            Boolean array with dimensions of y and x, which is True for the
+            points within the neighbourhood.
+        """
+        if self.neighbourhood_method == "square":
+            return np.ones(
+                (2 * grid_cells_y + 1, 2 * grid_cells_x + 1), dtype=bool)
+        y_offsets, x_offsets = np.ogrid[-grid_cells_y:grid_cells_y + 1,
+                                        -grid_cells_x:grid_cells_x + 1]
+        return x_offsets**2 + y_offsets**2 <= grid_cells_x * grid_cells_y
+
+    def percentiles_over_footprint(self, data, footprint):
+        """
+        Calculate the percentiles of the values within the footprint
+        centred on each point of the data.
+
+        The values within the footprint are held in a sorted window, which
+        is slid along each row of the data. At each step, the values leaving
+        and entering the footprint, of which there is one for each row of
+        the footprint, are found in the sorted window using binary searches
+        and removed or inserted. The windows for a block of rows of the data
+        are updated together, and removing and inserting the values copies
+        the sorted windows of the whole block, so each step still copies a
+        number of values proportional to the area of the neighbourhood.
+        This copy is a single pass over the sorted windows, which is much
+        cheaper than sorting every window, as that would also cost a factor
+        of the logarithm of the area at every point.
+
+        Each value is represented by its rank within the field, so that the
+        values are unique and the windows for the block of rows can be held
+        in a single sorted array by offsetting the ranks for each row.
+
+        The percentiles are linearly interpolated between the sorted values
+        within the footprint, in the same way as numpy.percentile.
+
+        Parameters
+        ----------
+        data : Numpy array
+            Array with the y and x axes as the trailing axes.
+        footprint : Numpy array
+            Boolean array with dimensions of y and x and an odd length
+            along each dimension, as returned by make_footprint. The points
+            within each row of the footprint must be contiguous.
+
+        Returns
+        -------
+        result : Numpy array
+            Array containing the percentiles, with the percentiles as the
+            leading axis followed by the axes of the data.
+        """
+        half_y, half_x = [(size - 1) // 2 for size in footprint.shape]
+        num_points = np.count_nonzero(footprint)
+        # Find the sorted positions of the values either side of each
+        # percentile.
+        positions = (
+            np.array(self.percentiles, dtype=np.float64) / 100. *
+            (num_points - 1))
+        lower = np.floor(positions).astype(int)
+        upper = np.ceil(positions).astype(int)
+        fraction = positions - lower
+        # Find the first and last columns of the points within each row of
+        # the footprint.
+        footprint_rows = np.flatnonzero(footprint.any(axis=1))
+        first_columns = np.argmax(footprint[footprint_rows], axis=1)
+        last_columns = (footprint.shape[1] - 1 -
+                        np.argmax(footprint[footprint_rows, ::-1], axis=1))
+
+        fields = np.reshape(data, (-1,) + data.shape[-2:])
+        num_rows, num_columns = fields.shape[-2:]
+        result = np.empty(
+            (len(self.percentiles),) + fields.shape, dtype=np.float64)
+        rows_per_block = max(1, MAX_WINDOW_ELEMENTS // num_points)
+        for index, field in enumerate(fields):
+            padded = np.pad(
+                field, ((half_y, half_y), (half_x, half_x)), mode="edge")
+            order = np.argsort(padded, axis=None, kind="mergesort")
+            sorted_values = np.ravel(padded)[order]
+            ranks = np.empty(padded.size, dtype=np.int64)
+            ranks[order] = np.arange(padded.size)
+            ranks = np.reshape(ranks, padded.shape)
+            for start in range(0, num_rows, rows_per_block):
+                stop = min(num_rows, start + rows_per_block)
+                rows = np.arange(start, stop)[:, np.newaxis]
+                window_rows = rows + footprint_rows
+                offsets = (rows - start) * padded.size
+                # Sort the windows at the start of each row, using a
+                # read-only view of the rectangular window around each
+                # point, from which the points within the footprint are
+                # selected.
+                windows = as_strided(
+                    ranks[start:], shape=(stop - start,) + footprint.shape,
+                    strides=ranks.strides[:1] + ranks.strides,
+                    writeable=False)
+                sorted_windows = np.ravel(
+                    np.sort(windows[..., footprint], axis=-1) + offsets)
+                for column in range(num_columns):
+                    if column > 0:
+                        leaving = np.ravel(
+                            ranks[window_rows, column - 1 + first_columns] +
+                            offsets)
+                        sorted_windows = np.delete(
+                            sorted_windows,
+                            np.searchsorted(sorted_windows, leaving))
+                        entering = np.ravel(np.sort(
+                            ranks[window_rows, column + last_columns],
+                            axis=-1) + offsets)
+                        sorted_windows = np.insert(
+                            sorted_windows,
+                            np.searchsorted(sorted_windows, entering),
+                            entering)
+                    window_ranks = np.reshape(
+                        sorted_windows, (stop - start, num_points)) - offsets
+                    lower_values = sorted_values[window_ranks[:, lower]]
+                    upper_values = sorted_values[window_ranks[:, upper]]
+                    result[:, index, start:stop, column] = (
+                        lower_values + fraction *
+                        (upper_values - lower_values)).T
+        return np.reshape(result, (len(self.percentiles),) + data.shape)
+
+    def process(self, cube):
+        """
+        Calculate the percentiles of the values within the neighbourhood of
+        each point of the cube.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube containing the field from which the neighbourhood
+            percentiles are calculated.
+
+        Returns
+        -------
+        result : Iris.cube.Cube
+            Cube containing a percentile_over_neighbourhood coordinate as
+            the zeroth dimension coordinate in addition to the coordinates
+            and metadata from the input cube. The data type of the input
+            cube is preserved for floating point data, and the output is
+            single precision for integer data.
+
+        Raises
+        ------
+        ValueError : If the cube contains masked points or NaNs.
+        """
+        if np.ma.is_masked(cube.data):
+            msg = ("Masked data is not supported when calculating "
+                   "neighbourhood percentiles")
+            raise ValueError(msg)
+        if np.isnan(cube.data).any():
+            raise ValueError("Error: NaN detected in input cube data")
+        grid_spec = GridSpec.from_cube(cube)
+        spatial_axes = [grid_spec.y_axis, grid_spec.x_axis]
+        grid_cells_x, grid_cells_y = (
+            convert_distance_into_number_of_grid_cells(
+                cube, self.radius, MAX_RADIUS_IN_GRID_CELLS))
+        footprint = self.make_footprint(grid_cells_x, grid_cells_y)
+        percentile_data = self.percentiles_over_footprint(
+            np.moveaxis(np.ma.getdata(cube.data), spatial_axes, [-2, -1]),
+            footprint)
+
+        # Interpolated percentiles of integer data are not integers.
+        if np.issubdtype(cube.dtype, np.floating):
+            dtype = cube.dtype
+        else:
+            dtype = np.float32
+        cubes = iris.cube.CubeList([])
+        for percentile, data in zip(self.percentiles, percentile_data):
+            percentile_cube = cube.copy(data=np.moveaxis(
+                data, [-2, -1], spatial_axes).astype(dtype))
+            percentile_cube.add_aux_coord(iris.coords.AuxCoord(
+                np.float32(percentile),
+                long_name="percentile_over_neighbourhood", units="1",
+                var_name="percentile_over_neighbourhood"))
+            cubes.append(percentile_cube)
+        result = cubes.merge_cube()
+        if len(self.percentiles) == 1:
+            result = iris.util.new_axis(
+                result, "percentile_over_neighbourhood")
+        return result
@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Module containing a summed-area table for square neighbourhood
+processing."""
+
+import numpy as np
+
+# Number of grid points along each side of the blocks within which the
+# summed-area table of a single precision field is cumulated.
+BLOCK_SIZE = 16
+
+# Maximum number of elements within each of the double precision arrays used
+# to calculate the neighbourhood total for a block of rows.
+MAX_BLOCK_ELEMENTS = 2**16
+
+
+class SummedAreaTable(object):
+
+    """
+    A summed-area table, from which the total or mean within a square
+    neighbourhood of any size can be calculated at every grid point.
+
+    The table is calculated once for a field, by cumulating the field along
+    the y and x axes, which must be the trailing two axes of the array. The
+    neighbourhood total for any number of radii can then be calculated from
+    the same table using the 4-point algorithm, so that neighbourhoods of
+    several sizes can be calculated for the cost of a single cumulative sum.
+
+    Neighbourhoods extending beyond the edge of the field are calculated as
+    if the field had been padded using
+    SquareNeighbourhood.pad_array_with_halo, i.e. with the mean within the
+    neighbourhood width at the edge of the field. The contribution of this
+    halo is calculated from the table and the edges of the field, rather
+    than by padding the field for each radius.
+
+    NaN values within the field are treated as zero, and the corresponding
+    points are set to NaN in the neighbourhood mean.
+
+    Fields of double precision or integer data are cumulated into a single
+    double precision table. Fields of single precision data are cumulated
+    within blocks of BLOCK_SIZE x BLOCK_SIZE points, so that the table can
+    be stored at single precision without the rounding error growing with
+    the size of the field. The totals of the preceding blocks are held
+    separately at double precision, on grids that are a factor of
+    BLOCK_SIZE smaller than the field along one or both axes. The rounding
+    error of each table value is then bounded by the total of at most
+    BLOCK_SIZE**2 points, and the neighbourhood mean is returned with the
+    same single precision data type as the field. The neighbourhood is
+    calculated at double precision one block of rows at a time, so no
+    double precision array with the full shape of the field is required.
+    """
+
+    def __init__(self, data):
+        """
+        Calculate the summed-area table for a field.
+
+        Parameters
+        ----------
+        data : Numpy array
+            Array containing the field, with the y and x axes as the trailing
+            two axes. Any leading axes are treated as independent fields.
+
+        Raises
+        ------
+        ValueError : If the array has fewer than two dimensions.
+        """
+        data = np.asarray(data)
+        if data.ndim < 2:
+            msg = ("The summed-area table requires an array with y and x "
+                   "axes. Array shape: {}".format(data.shape))
+            raise ValueError(msg)
+        self.data = data
+        self.nan_mask = np.isnan(data)
+        if (np.issubdtype(data.dtype, np.floating) and
+                data.dtype.itemsize < np.dtype(np.float64).itemsize):
+            self._cumulate_within_blocks(BLOCK_SIZE)
+            return
+        self.block_size = None
+        self.row_offsets = None
+        self.column_offsets = None
+        self.block_totals = None
+        # The table has a leading row and column of zeros, so that element
+        # [..., i, j] is the sum of data[..., :i, :j].
+        table_shape = data.shape[:-2] + (
+            data.shape[-2] + 1, data.shape[-1] + 1)
+        self.table = np.zeros(table_shape)
+        summed_data = self.table[..., 1:, 1:]
+        np.cumsum(np.where(self.nan_mask, 0, data), axis=-2, out=summed_data)
+        np.cumsum(summed_data, axis=-1, out=summed_data)
+
+    def _cumulate_within_blocks(self, block_size):
+        """
+        Calculate the summed-area table of a single precision field as the
+        sum of four parts, so that element [..., i, j] of the complete table,
+        i.e. the sum of data[..., :i, :j], is given by:
+
+            table[..., i, j] +
+            row_offsets[..., i, J] +
+            column_offsets[..., I, j] +
+            block_totals[..., I, J]
+
+        where I = i // block_size and J = j // block_size are the indices of
+        the block containing the element, and k = I*block_size and
+        l = J*block_size are the first row and column of that block:
+
+            table: The single precision sum of data[..., k:i, l:j], which
+                is within a single block.
+            row_offsets: The sum of data[..., k:i, :l].
+            column_offsets: The sum of data[..., :k, l:j].
+            block_totals: The sum of data[..., :k, :l].
+
+        The field is cumulated one row of blocks at a time at double
+        precision, so that only the final table is held at single precision.
+
+        Parameters
+        ----------
+        block_size : integer
+            The number of grid points along each side of a block.
+        """
+        data = self.data
+        leading_shape = data.shape[:-2]
+        n_rows, n_columns = data.shape[-2:]
+        n_block_rows = -(-n_rows // block_size)
+        n_block_columns = -(-n_columns // block_size)
+        padded_columns = n_block_columns * block_size
+        blocked_shape = leading_shape + (n_block_columns, block_size)
+
+        self.block_size = block_size
+        self.table = np.zeros(
+            leading_shape + (n_rows + 1, n_columns + 1), dtype=data.dtype)
+        self.row_offsets = np.zeros(
+            leading_shape + (n_rows + 1, n_block_columns + 1))
+        self.column_offsets = np.zeros(
+            leading_shape + (n_block_rows + 1, n_columns + 1))
+        self.block_totals = np.zeros(
+            leading_shape + (n_block_rows + 1, n_block_columns + 1))
+
+        # Sum of each column over the rows of the preceding blocks.
+        column_totals = np.zeros(leading_shape + (padded_columns,))
+        for block_row in range(n_block_rows + 1):
+            # Offsets from the blocks above this row of blocks.
+            summed_columns = np.cumsum(
+                column_totals.reshape(blocked_shape), axis=-1)
+            self.column_offsets[..., block_row, 1:] = (
+                summed_columns.reshape(column_totals.shape)[..., :n_columns])
+            np.cumsum(summed_columns[..., -1], axis=-1,
+                      out=self.block_totals[..., block_row, 1:])
+            if block_row == n_block_rows:
+                break
+
+            first_row = block_row * block_size
+            last_row = min(first_row + block_size, n_rows)
+            rows = np.zeros(
+                leading_shape + (last_row - first_row, padded_columns))
+            block_data = data[..., first_row:last_row, :]
+            rows[..., :n_columns] = np.where(
+                self.nan_mask[..., first_row:last_row, :], 0, block_data)
+            blocked_rows = rows.reshape(
+                rows.shape[:-1] + (n_block_columns, block_size))
+
+            # Offsets from the blocks to the left within this row of blocks.
+            np.cumsum(
+                np.cumsum(blocked_rows.sum(axis=-1), axis=-2), axis=-1,
+                out=self.row_offsets[..., first_row+1:last_row+1, 1:])
+
+            # Cumulative sums within each block.
+            summed_rows = np.cumsum(
+                np.cumsum(blocked_rows, axis=-3), axis=-1)
+            self.table[..., first_row+1:last_row+1, 1:] = (
+                summed_rows.reshape(rows.shape)[..., :n_columns])
+            column_totals += rows.sum(axis=-2)
+
+        # The first row and column of each block contain the sums over the
+        # preceding blocks, which are held within the offsets instead.
+        self.table[..., block_size::block_size, :] = 0.
+        self.table[..., block_size::block_size] = 0.
+        self.row_offsets[..., block_size::block_size, :] = 0.
+        self.column_offsets[..., block_size::block_size] = 0.
+
+    def __repr__(self):
+        """Represent the configured plugin instance as a string."""
+        result = ('<{}: shape: {}>')
+        return result.format(type(self).__name__, self.shape)
+
+    @property
+    def shape(self):
+        """The shape of the field from which the table was calculated."""
+        return self.table.shape[:-2] + tuple(
+            length - 1 for length in self.table.shape[-2:])
+
+    def __getitem__(self, index):
+        """
+        Select a subset of the leading (non-spatial) axes of the table,
+        without recalculating the table.
+
+        Parameters
+        ----------
+        index : integer, slice, array or tuple
+            Index into the leading axes of the array used to calculate the
+            table. The y and x axes are always retained in full.
+
+        Returns
+        -------
+        SummedAreaTable
+            Summed-area table for the selected subset of the field.
+
+        Raises
+        ------
+        IndexError : If the index attempts to select from the y or x axes.
+        """
+        if not isinstance(index, tuple):
+            index = (index,)
+        if len(index) > len(self.shape) - 2:
+            msg = ("Only the leading axes of a summed-area table can be "
+                   "indexed. Index {} given for array shape {}".format(
+                       index, self.shape))
+            raise IndexError(msg)
+        subset = object.__new__(type(self))
+        subset.block_size = self.block_size
+        for name in ['data', 'nan_mask', 'table', 'row_offsets',
+                     'column_offsets', 'block_totals']:
+            values = getattr(self, name)
+            setattr(subset, name, None if values is None else values[index])
+        return subset
+
+    def table_values(self, rows, columns):
+        """
+        Find the values of the complete summed-area table at the
+        intersections of the given rows and columns.
+
+        Parameters
+        ----------
+        rows, columns : Numpy array
+            Indices of the rows and columns of the table. Element [..., i, j]
+            of the table is the sum of data[..., :i, :j].
+
+        Returns
+        -------
+        values : Numpy array
+            Double precision array with the leading shape of the field,
+            and trailing axes corresponding to the rows and columns.
+        """
+        values = self.table[..., rows, :][..., columns].astype(np.float64)
+        if self.block_size is not None:
+            block_rows = rows // self.block_size
+            block_columns = columns // self.block_size
+            values += self.row_offsets[..., rows, :][..., block_columns]
+            values += self.column_offsets[..., block_rows, :][..., columns]
+            values += self.block_totals[..., block_rows, :][..., block_columns]
+        return values
+
+    def _halo_values(self, cells_x, cells_y):
+        """
+        Calculate the values that would be used to pad each edge of the
+        field by SquareNeighbourhood.pad_array_with_halo. The y axis is
+        padded before the x axis, so the corners of the halo contain the
+        mean of the padding along the top and bottom edges.
+
+        Parameters
+        ----------
+        cells_x, cells_y : integer
+            The radius of the neighbourhood in grid points, in the x and y
+            directions (excluding the central grid point).
+
+        Returns
+        -------
+        halo_values : dict
+            Dictionary containing the padding values along the 'top' and
+            'bottom' edges (varying along x), along the 'left' and 'right'
+            edges (varying along y), and within each of the corners e.g.
+            'top_left'. NaN values have been replaced with zero.
+        """
+        dtype = self.data.dtype
+        n_rows, n_columns = self.data.shape[-2:]
+        stat_y = min(cells_y, n_rows)
+        stat_x = min(cells_x, n_columns)
+
+        def _edge_mean(values, axis, start, stop):
+            """Find the mean within a band along the edge of the field, and
+            convert it into the data type of the field, as np.pad does."""
+            index = [slice(None)] * values.ndim
+            index[axis] = slice(start, stop)
+            mean = np.mean(values[tuple(index)], axis=axis)
+            if np.issubdtype(dtype, np.integer):
+                mean = np.around(mean)
+            return np.asarray(mean).astype(dtype)
+
+        halo_values = {
+            'top': _edge_mean(self.data, -2, 0, stat_y),
+            'bottom': _edge_mean(self.data, -2, n_rows - stat_y, n_rows),
+            'left': _edge_mean(self.data, -1, 0, stat_x),
+            'right': _edge_mean(self.data, -1, n_columns - stat_x, n_columns)}
+        for edge in ['top', 'bottom']:
+            halo_values[edge + '_left'] = _edge_mean(
+                halo_values[edge], -1, 0, stat_x)
+            halo_values[edge + '_right'] = _edge_mean(
+                halo_values[edge], -1, n_columns - stat_x, n_columns)
+        for key, values in halo_values.items():
+            values = values.astype(np.float64)
+            values[np.isnan(values)] = 0.
+            halo_values[key] = values
+        return halo_values
+
+    @staticmethod
+    def _neighbourhood_extent(num_points, cells):
+        """
+        Find the extent of the neighbourhood around each point along an axis.
+
+        Parameters
+        ----------
+        num_points : integer
+            The number of points along the axis.
+        cells : integer
+            The radius of the neighbourhood in grid points along the axis.
+
+        Returns
+        -------
+        start, stop : Numpy array
+            The indices of the first point within the field, and one beyond
+            the last point within the field, within the neighbourhood.
+        before, after : Numpy array
+            The number of points within the neighbourhood that lie in the
+            halo before the start and after the end of the axis.
+        """
+        points = np.arange(num_points)
+        start = np.clip(points - cells, 0, num_points)
+        stop = np.clip(points + cells + 1, 0, num_points)
+        before = np.clip(cells - points, 0, None)
+        after = np.clip(points + cells + 1 - num_points, 0, None)
+        return start, stop, before, after
+
+    def _totals_by_row_block(self, cells_x, cells_y):
+        """
+        Calculate the total within a square neighbourhood of size
+        (2*cells_x+1)*(2*cells_y+1) around each point of the field, for one
+        block of rows at a time.
+
+        The total within the field is found using the 4-point algorithm.
+        The total within any part of the neighbourhood that extends beyond
+        the edge of the field is found from the halo values along each edge,
+        multiplied by the number of rows or columns of the neighbourhood
+        that lie within the halo. The totals are calculated at double
+        precision, so each block contains enough rows for its double
+        precision arrays to hold at most MAX_BLOCK_ELEMENTS elements.
+
+        Parameters
+        ----------
+        cells_x, cells_y : integer
+            The radius of the neighbourhood in grid points, in the x and y
+            directions (excluding the central grid point).
+
+        Yields
+        ------
+        rows : slice
+            The rows of the field within the block.
+        total : Numpy array
+            Double precision array with the leading shape of the field and
+            the rows of the block, containing the total within the
+            neighbourhood around each point.
+        """
+        n_rows, n_columns = self.shape[-2:]
+        row_start, row_stop, rows_before, rows_after = (
+            self._neighbourhood_extent(n_rows, cells_y))
+        col_start, col_stop, cols_before, cols_after = (
+            self._neighbourhood_extent(n_columns, cells_x))
+
+        halo_values = self._halo_values(cells_x, cells_y)
+
+        def _sum_along_axis(values, start, stop):
+            """Sum the values between start and stop for each point."""
+            summed = np.zeros(values.shape[:-1] + (values.shape[-1] + 1,))
+            np.cumsum(values, axis=-1, out=summed[..., 1:])
+            return summed[..., stop] - summed[..., start]
+
+        # Totals of the halo along each edge within the neighbourhood
+        # width of each point.
+        edge_totals = {}
+        for edge in ['top', 'bottom']:
+            edge_totals[edge] = _sum_along_axis(
+                halo_values[edge], col_start, col_stop)
+        for edge in ['left', 'right']:
+            edge_totals[edge] = _sum_along_axis(
+                halo_values[edge], row_start, row_stop)
+
+        num_fields = int(np.prod(self.shape[:-2]))
+        rows_per_block = max(
+            1, MAX_BLOCK_ELEMENTS // (num_fields * n_columns))
+        for first_row in range(0, n_rows, rows_per_block):
+            block = slice(first_row, min(first_row + rows_per_block, n_rows))
+
+            # Total within the field using the 4-point algorithm.
+            total = self.table_values(row_stop[block], col_stop)
+            total -= self.table_values(row_stop[block], col_start)
+            total -= self.table_values(row_start[block], col_stop)
+            total += self.table_values(row_start[block], col_start)
+
+            # Halo above and below the field.
+            for edge, counts in [('top', rows_before[block]),
+                                 ('bottom', rows_after[block])]:
+                rows, = np.nonzero(counts)
+                if rows.size:
+                    total[..., rows, :] += (
+                        counts[rows, np.newaxis] *
+                        edge_totals[edge][..., np.newaxis, :])
+            # Halo to the left and right of the field.
+            for edge, counts in [('left', cols_before),
+                                 ('right', cols_after)]:
+                columns, = np.nonzero(counts)
+                if columns.size:
+                    total[..., columns] += (
+                        counts[columns] *
+                        edge_totals[edge][..., block, np.newaxis])
+            # Corners of the halo.
+            for row_edge, row_counts in [('top', rows_before[block]),
+                                         ('bottom', rows_after[block])]:
+                rows, = np.nonzero(row_counts)
+                for col_edge, col_counts in [('left', cols_before),
+                                             ('right', cols_after)]:
+                    columns, = np.nonzero(col_counts)
+                    if rows.size and columns.size:
+                        corner = halo_values[row_edge + '_' + col_edge]
+                        total[..., rows[:, np.newaxis], columns] += (
+                            np.outer(row_counts[rows], col_counts[columns]) *
+                            corner[..., np.newaxis, np.newaxis])
+            yield block, total
+
+    def neighbourhood_total(self, cells_x, cells_y):
+        """
+        Calculate the total within a square neighbourhood of size
+        (2*cells_x+1)*(2*cells_y+1) around each point of the field.
+
+        Parameters
+        ----------
+        cells_x, cells_y : integer
+            The radius of the neighbourhood in grid points, in the x and y
+            directions (excluding the central grid point).
+
+        Returns
+        -------
+        total : Numpy array
+            Double precision array with the same shape as the field,
+            containing the total within the neighbourhood around each point.
+        """
+        total = np.empty(self.shape)
+        for rows, block_total in self._totals_by_row_block(cells_x, cells_y):
+            total[..., rows, :] = block_total
+        return total
+
+    def neighbourhood_mean(self, cells_x, cells_y):
+        """
+        Calculate the mean within a square neighbourhood of size
+        (2*cells_x+1)*(2*cells_y+1) around each point of the field.
+
+        The mean is calculated at double precision one block of rows at a
+        time, and each block is stored in the output as it is calculated,
+        so the only array with the full shape of the field is the output.
+
+        Parameters
+        ----------
+        cells_x, cells_y : integer
+            The radius of the neighbourhood in grid points, in the x and y
+            directions (excluding the central grid point).
+
+        Returns
+        -------
+        mean : Numpy array
+            Array with the same shape as the field, containing the mean
+            within the neighbourhood around each point. Points that were NaN
+            within the field are set to NaN. Single precision fields give a
+            single precision mean, and all other fields give a double
+            precision mean.
+        """
+        if self.block_size is not None:
+            mean = np.empty(self.shape, dtype=self.data.dtype)
+        else:
+            mean = np.empty(self.shape)
+        area = float((2*cells_x+1) * (2*cells_y+1))
+        for rows, block_total in self._totals_by_row_block(cells_x, cells_y):
+            block_total /= area
+            mean[..., rows, :] = block_total
+        if self.nan_mask is not None:
+            mean[self.nan_mask] = np.nan
+        return mean
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Module containing a plugin to calculate neighbourhood probabilities of
+exceeding many thresholds."""
+
+import numpy as np
+
+from improver.nbhood.nbhood import (
+    MAX_RADIUS_IN_GRID_CELLS, NeighbourhoodProcessing, SquareNeighbourhood,
+    Utilities)
+from improver.nbhood.summed_area_table import SummedAreaTable
+from improver.utilities.spatial import (
+    convert_distance_into_number_of_grid_cells, GridSpec)
+from improver.utilities.threshold import create_cube_with_thresholds
+
+
+class ThresholdCountTable(SummedAreaTable):
+
+    """
+    A summed-area table of the number of points exceeding each of a list of
+    thresholds, or below each threshold, calculated from the bin of each
+    point.
+
+    The bins are a single integer field, giving the number of thresholds
+    below the value at each point. The table for every threshold is
+    cumulated from the bins in a single pass over the rows of the field,
+    holding only the counts for the current row, so that the truth values
+    for each threshold are never stored. The counts are integers, so the
+    table is exact.
+
+    The neighbourhood total and mean are calculated in the same way as for a
+    SummedAreaTable of the truth values, including the halo beyond the edge
+    of the field, which is calculated from the counts within the table.
+    """
+
+    def __init__(self, bins, num_thresholds, below_thresh_ok=False,
+                 valid_points=None):
+        """
+        Calculate the summed-area table for each threshold from the bins.
+
+        Parameters
+        ----------
+        bins : Numpy array
+            Integer array containing the bin of each point, with the y and x
+            axes as the trailing two axes. A point exceeds the threshold
+            with index i if its bin is greater than i.
+        num_thresholds : integer
+            The number of thresholds.
+        below_thresh_ok : boolean
+            True to count points below each threshold, False to count points
+            above each threshold.
+        valid_points : Numpy array (optional)
+            Boolean array with the same shape as the bins, which is True
+            where points are valid. Only valid points are counted.
+        """
+        n_rows, n_columns = bins.shape[-2:]
+        threshold_indices = np.reshape(
+            np.arange(num_thresholds), (-1,) + (1,) * (bins.ndim - 1))
+        self.data = None
+        self.nan_mask = None
+        self.block_size = None
+        self.row_offsets = None
+        self.column_offsets = None
+        self.block_totals = None
+        # The table has a leading row and column of zeros, so that element
+        # [i, ..., j, k] is the number of points within bins[..., :j, :k]
+        # counted for the threshold with index i.
+        self.table = np.zeros(
+            (num_thresholds,) + bins.shape[:-2] + (n_rows + 1, n_columns + 1),
+            dtype=np.int32)
+        column_counts = np.zeros(
+            (num_thresholds,) + bins.shape[:-2] + (n_columns,),
+            dtype=np.int32)
+        for row in range(n_rows):
+            if below_thresh_ok:
+                counted = bins[..., row, :] <= threshold_indices
+            else:
+                counted = bins[..., row, :] > threshold_indices
+            if valid_points is not None:
+                counted &= valid_points[..., row, :]
+            column_counts += counted
+            np.cumsum(column_counts, axis=-1,
+                      out=self.table[..., row + 1, 1:])
+
+    def _halo_values(self, cells_x, cells_y):
+        """
+        Calculate the values that SummedAreaTable would use to pad each
+        edge of the field of truth values, from the counts within the
+        table.
+
+        Parameters
+        ----------
+        cells_x, cells_y : integer
+            The radius of the neighbourhood in grid points, in the x and y
+            directions (excluding the central grid point).
+
+        Returns
+        -------
+        halo_values : dict
+            Dictionary containing the padding values along the 'top' and
+            'bottom' edges (varying along x), along the 'left' and 'right'
+            edges (varying along y), and within each of the corners e.g.
+            'top_left'.
+        """
+        table = self.table.astype(np.float64)
+        n_rows, n_columns = self.shape[-2:]
+        stat_y = min(cells_y, n_rows)
+        stat_x = min(cells_x, n_columns)
+        # Counts within the bands of rows and columns along each edge, with
+        # the cumulative counts along the edge retained.
+        top = table[..., stat_y, :]
+        bottom = table[..., n_rows, :] - table[..., n_rows - stat_y, :]
+        left = table[..., stat_x]
+        right = table[..., n_columns] - table[..., n_columns - stat_x]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            halo_values = {
+                'top': np.diff(top, axis=-1) / stat_y,
+                'bottom': np.diff(bottom, axis=-1) / stat_y,
+                'left': np.diff(left, axis=-1) / stat_x,
+                'right': np.diff(right, axis=-1) / stat_x}
+            for edge, counts in [('top', top), ('bottom', bottom)]:
+                halo_values[edge + '_left'] = (
+                    counts[..., stat_x] / float(stat_y * stat_x))
+                halo_values[edge + '_right'] = (
+                    (counts[..., n_columns] -
+                     counts[..., n_columns - stat_x]) /
+                    float(stat_y * stat_x))
+        for values in halo_values.values():
+            values[np.isnan(values)] = 0.
+        return halo_values
+
+
+class NeighbourhoodThresholdProbabilities(object):
+
+    """
+    Calculate the neighbourhood probability of exceeding each of a list of
+    thresholds, using the square neighbourhood method.
+
+    This gives the same result as applying BasicThreshold and then
+    NeighbourhoodProcessing for each threshold in turn. Instead, each point
+    is binned once, by finding the number of thresholds that are below its
+    value. The summed-area tables of the number of points exceeding every
+    threshold are then cumulated from the bins in a single pass, and the
+    neighbourhood probabilities for every threshold are calculated from
+    those tables.
+    """
+    def __init__(self, thresholds, radii, lead_times=None,
+                 below_thresh_ok=False, ens_factor=1.0):
+        """
+        Create a plugin to calculate neighbourhood threshold probabilities.
+
+        Parameters
+        ----------
+        thresholds : List
+            The thresholds at which to calculate the probabilities, which
+            must be unique.
+        radii : float or List (if defining lead times)
+            The radii in metres of the neighbourhood to apply.
+        lead_times : None or List
+            List of lead times or forecast periods, at which the radii
+            within 'radii' are defined. The lead times are expected
+            in hours.
+        below_thresh_ok : boolean
+            True to count points as significant if *below* the threshold,
+            False to count points as significant if *above* the threshold.
+        ens_factor : float
+            The factor with which to adjust the neighbourhood size
+            for more than one ensemble member.
+            Optional, defaults to 1.0
+
+        Raises
+        ------
+        ValueError : If no thresholds are supplied, or the thresholds are
+                     not unique.
+        """
+        self.thresholds = np.sort(np.array(thresholds, dtype=np.float64))
+        if self.thresholds.size == 0:
+            raise ValueError("At least one threshold must be supplied")
+        if np.any(np.diff(self.thresholds) == 0):
+            msg = ("The thresholds must be unique. "
+                   "Requested: {}".format(thresholds))
+            raise ValueError(msg)
+        self.below_thresh_ok = bool(below_thresh_ok)
+        self.neighbourhood = NeighbourhoodProcessing(
+            "square", radii, lead_times=lead_times, ens_factor=ens_factor)
+
+    def __repr__(self):
+        """Represent the configured plugin instance as a string."""
+        result = ('<NeighbourhoodThresholdProbabilities: thresholds: {}; '
+                  'below_thresh_ok: {}; neighbourhood: {}>')
+        return result.format(
+            list(self.thresholds), self.below_thresh_ok, self.neighbourhood)
+
+    def bin_data(self, data):
+        """
+        Find the bin of each point, which is the number of thresholds that
+        are below the value of the point.
+
+        Parameters
+        ----------
+        data : Numpy array
+            Array of values to be binned.
+
+        Returns
+        -------
+        bins : Numpy array
+            Array of the smallest integer type that can hold the number of
+            thresholds, with the same shape as the data. A point exceeds
+            the threshold with index i if its bin is greater than i.
+        """
+        bins = np.searchsorted(self.thresholds, data, side="left")
+        return bins.astype(np.min_scalar_type(self.thresholds.size))
+
+    def _radii_along_time(self, cube):
+        """
+        Find the radius for each time of the cube, adjusted for the number
+        of realizations, as used by NeighbourhoodProcessing.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube containing the field to be thresholded.
+
+        Returns
+        -------
+        radii : float or Numpy array
+            The radius, if the radii do not vary with lead time, or an array
+            containing the radius for each point of the time coordinate.
+        """
+        num_ens = self.neighbourhood._find_number_of_realizations(cube)
+        if self.neighbourhood.lead_times is None:
+            return self.neighbourhood._find_radii(num_ens)
+        return self.neighbourhood._find_radii(
+            num_ens, cube_lead_times=Utilities.find_required_lead_times(cube))
+
+    def process(self, cube):
+        """
+        Calculate the neighbourhood probability of exceeding each threshold.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube containing the field to be thresholded.
+
+        Returns
+        -------
+        cube : Iris.cube.Cube
+            Cube with a leading threshold coordinate, containing the
+            neighbourhood probabilities, created using
+            create_cube_with_thresholds. If the input cube is masked, the
+            probabilities are calculated from the unmasked points, and are
+            masked at the same points for every threshold.
+
+        Raises
+        ------
+        ValueError : If the cube contains NaNs.
+        """
+        if np.isnan(cube.data).any():
+            raise ValueError("Error: NaN detected in input cube data")
+        grid_spec = GridSpec.from_cube(cube)
+        spatial_axes = [grid_spec.y_axis, grid_spec.x_axis]
+        data = np.moveaxis(cube.data, spatial_axes, [-2, -1])
+        valid_points = None
+        if isinstance(data, np.ma.MaskedArray):
+            valid_points = np.logical_not(np.ma.getmaskarray(data))
+        tables = [ThresholdCountTable(
+            self.bin_data(np.ma.getdata(data)), self.thresholds.size,
+            below_thresh_ok=self.below_thresh_ok,
+            valid_points=valid_points)]
+        if valid_points is not None:
+            tables.append(SummedAreaTable(valid_points))
+
+        radii = self._radii_along_time(cube)
+        time_dims = cube.coord_dims("time") if cube.coords("time") else ()
+        if np.ndim(radii) == 0 or not time_dims:
+            grid_cells_x, grid_cells_y = (
+                convert_distance_into_number_of_grid_cells(
+                    cube, np.ravel(radii)[0], MAX_RADIUS_IN_GRID_CELLS))
+            probabilities = SquareNeighbourhood._mean_from_summed_area_tables(
+                tables, grid_cells_x, grid_cells_y)
+        else:
+            # The times that use the same neighbourhood are calculated from
+            # the corresponding part of the tables together.
+            leading_axes = [axis for axis in range(cube.ndim)
+                            if axis not in spatial_axes]
+            time_axis = leading_axes.index(time_dims[0])
+            probabilities = None
+            for (grid_cells_x, grid_cells_y), points in (
+                    Utilities.group_radii_by_grid_cells(cube, radii)):
+                mask_index = (slice(None),) * time_axis + (points,)
+                table_index = (slice(None),) + mask_index
+                group_probabilities = (
+                    SquareNeighbourhood._mean_from_summed_area_tables(
+                        [tables[0][table_index]] +
+                        [table[mask_index] for table in tables[1:]],
+                        grid_cells_x, grid_cells_y))
+                if probabilities is None:
+                    probabilities = np.empty(tables[0].shape)
+                    if valid_points is not None:
+                        probabilities = np.ma.masked_array(
+                            probabilities,
+                            mask=np.zeros(probabilities.shape, dtype=bool),
+                            fill_value=np.nan)
+                probabilities[table_index] = group_probabilities
+
+        threshold_spatial_axes = [axis + 1 for axis in spatial_axes]
+        return create_cube_with_thresholds(
+            self.thresholds, cube,
+            np.moveaxis(probabilities, [-2, -1], threshold_spatial_axes),
+            below_thresh_ok=self.below_thresh_ok)
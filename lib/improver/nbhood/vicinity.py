@@ -31,9 +31,12 @@
 """Module to determine the occurrence of a phenomenon within a vicinity and
 apply neighbourhood processing."""
 
-import iris
+from iris.coords import CellMethod
+import numpy as np
 
-from improver.utilities.spatial import OccurrenceWithinVicinity
+from improver.utilities.spatial import (
+    OccurrenceWithinVicinity, convert_distance_into_number_of_grid_cells,
+    GridSpec, MAX_DISTANCE_IN_GRID_CELLS)
 from improver.nbhood.nbhood import NeighbourhoodProcessing
 
 
@@ -45,7 +48,7 @@ class ProbabilityOfOccurrence(object):
     """
 
     def __init__(self, distance, neighbourhood_method, radii, lead_times=None,
-                 unweighted_mode=False, ens_factor=1.0):
+                 unweighted_mode=False, ens_factor=1.0, workers=1):
         """
         Initialise the class.
 
@@ -76,10 +79,18 @@ class ProbabilityOfOccurrence(object):
                 members if every grid square is considered to be the
                 equivalent of an ensemble member.
                 Optional, defaults to 1.0
+            workers : integer
+                Number of threads used to find the occurrences within the
+                vicinity for the realizations of the cube. The realizations
+                are divided between the threads, which each accumulate the
+                sum of their own realizations.
+                Optional, defaults to 1.
 
         Raises:
             ValueError : Raise error if non-square neighbourhood method
                 is requested.
+            ValueError : Raise error if the number of workers is less than
+                one.
 
         """
         self.distance = distance
@@ -95,16 +106,73 @@ class ProbabilityOfOccurrence(object):
         self.lead_times = lead_times
         self.unweighted_mode = unweighted_mode
         self.ens_factor = ens_factor
+        self.workers = int(workers)
+        if self.workers < 1:
+            msg = ("The number of workers must be at least 1. "
+                   "Requested: {}".format(workers))
+            raise ValueError(msg)
 
     def __repr__(self):
         """Represent the configured plugin instance as a string."""
         result = ('<ProbabilityOfOccurrence: distance: {}; '
                   'neighbourhood_method: {}; radii: {}; '
                   'lead_times: {}; unweighted_mode: {}; '
-                  'ens_factor: {}>')
+                  'ens_factor: {}; workers: {}>')
         return result.format(
             self.distance, self.neighbourhood_method, self.radii,
-            self.lead_times, self.unweighted_mode, self.ens_factor)
+            self.lead_times, self.unweighted_mode, self.ens_factor,
+            self.workers)
+
+    def _sum_within_vicinity(self, cube, indices, grid_cells):
+        """
+        Sum the occurrences within the vicinity for the x-y slices of a cube
+        with the given indices, reading one slice at a time, so that only
+        the sum and the occurrences within the vicinity for the current
+        slice are held in memory. Masked points are excluded from the sum,
+        and masked points are excluded from the vicinity of other points.
+
+        Args:
+            cube : Iris.cube.Cube
+                A cube that has been thresholded.
+            indices : list of tuple
+                The indices of the x-y slices of the cube to sum.
+            grid_cells : integer
+                Number of grid cells from each point to the edge of its
+                vicinity.
+
+        Returns:
+            (tuple) : tuple containing
+                **total** (numpy.ndarray):
+                    The sum of the occurrences within the vicinity over the
+                    slices in which each point is unmasked.
+                **count** (numpy.ndarray or integer):
+                    The number of slices in which each point is unmasked.
+                    This is an integer if none of the slices are masked.
+
+        """
+        vicinity_plugin = OccurrenceWithinVicinity(self.distance)
+        total = None
+        count = 0
+        for index in indices:
+            cube_slice = cube[index]
+            grid_spec = GridSpec.from_cube(cube_slice)
+            data = cube_slice.data
+            valid_points = None
+            if np.ma.is_masked(data):
+                valid_points = np.logical_not(np.ma.getmaskarray(data))
+                data = np.ma.filled(data, np.ma.maximum_fill_value(data))
+            occurrences = vicinity_plugin.vicinity_maximum(
+                np.ma.getdata(data), grid_spec.y_axis, grid_spec.x_axis,
+                grid_cells)
+            if valid_points is not None:
+                occurrences[np.logical_not(valid_points)] = 0
+                count = count + valid_points
+            else:
+                count += 1
+            if total is None:
+                total = np.zeros(occurrences.shape)
+            total += occurrences
+        return total, count
 
     def process(self, cube):
         """
@@ -116,6 +184,17 @@ class ProbabilityOfOccurrence(object):
            mean.
         3. Compute neighbourhood processing.
 
+        These steps are applied to one x-y slice of the output at a time.
+        The realizations of the slice are read one at a time, and their
+        occurrences within the vicinity are added to a running sum, so the
+        occurrences within the vicinity are never held for more than one
+        realization. If more than one worker is requested, the realizations
+        are divided between a pool of threads, each with its own sum. The
+        realization mean is then neighbourhood processed and written to the
+        output. Masked points are excluded from the vicinity, from the
+        realization mean and from the neighbourhood, and points which are
+        masked in every realization are masked in the output.
+
         Args:
             cube : Iris.cube.Cube
                 A cube that has been thresholded.
@@ -126,11 +205,81 @@ class ProbabilityOfOccurrence(object):
                 probability of an occurrence within the vicinity given a
                 pre-defined spatial uncertainty.
 
+        Raises:
+            ValueError : If the realization mean contains NaN values.
+
         """
-        cube = OccurrenceWithinVicinity(self.distance).process(cube)
-        if cube.coord_dims('realization'):
-            cube = cube.collapsed('realization', iris.analysis.MEAN)
-        cube = NeighbourhoodProcessing(
+        neighbourhood_plugin = NeighbourhoodProcessing(
             self.neighbourhood_method, self.radii, self.lead_times,
-            self.unweighted_mode, self.ens_factor).process(cube)
-        return cube
+            self.unweighted_mode, self.ens_factor, workers=self.workers)
+        # The number of grid cells returned along the x and y axis will be
+        # the same.
+        _, grid_cells = convert_distance_into_number_of_grid_cells(
+            cube, self.distance, MAX_DISTANCE_IN_GRID_CELLS)
+        grid_spec = GridSpec.from_cube(cube)
+        keep_axes = [grid_spec.y_axis, grid_spec.x_axis]
+
+        # The template for the output is found without reading the data.
+        template = cube
+        if cube.coords("realization", dim_coords=True):
+            keep_axes += list(cube.coord_dims("realization"))
+            template = next(cube.slices_over("realization"))
+            if len(cube.coord("realization").points) > 1:
+                template.replace_coord(
+                    cube.coord("realization").collapsed())
+                template.add_cell_method(
+                    CellMethod("mean", coords="realization"))
+        num_ens = neighbourhood_plugin._find_number_of_realizations(
+            template)
+        template_grid_spec = GridSpec.from_cube(template)
+        template_slice_axes = [
+            axis for axis in range(template.ndim)
+            if axis not in [template_grid_spec.y_axis,
+                            template_grid_spec.x_axis]]
+        output_indices = np.ndindex(
+            *[template.shape[axis] for axis in template_slice_axes])
+
+        output = None
+        for cube_slice in cube.slices_over(
+                [axis for axis in range(cube.ndim) if axis not in keep_axes]):
+            # Divide the realizations of the slice between the workers.
+            if cube_slice.coords("realization", dim_coords=True):
+                realization_axis, = cube_slice.coord_dims("realization")
+                indices = []
+                for realization in range(cube_slice.shape[realization_axis]):
+                    index = [slice(None)] * cube_slice.ndim
+                    index[realization_axis] = realization
+                    indices.append(tuple(index))
+            else:
+                indices = [(slice(None),) * cube_slice.ndim]
+            chunks = np.array_split(
+                np.arange(len(indices)), min(self.workers, len(indices)))
+            totals_and_counts = neighbourhood_plugin._run_jobs(
+                [(self._sum_within_vicinity,
+                  (cube_slice, [indices[i] for i in chunk], grid_cells))
+                 for chunk in chunks])
+            total = sum(total for total, _ in totals_and_counts)
+            count = sum(count for _, count in totals_and_counts)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = total / count
+            if np.issubdtype(cube.dtype, np.floating):
+                mean = mean.astype(cube.dtype)
+            if np.ndim(count) > 0 and not np.all(count):
+                mean = np.ma.masked_where(count == 0, mean)
+
+            mean_cube = cube_slice[indices[0]].copy(data=mean)
+            data = neighbourhood_plugin._process_slice(mean_cube, num_ens)
+            if output is None:
+                output = np.empty(template.shape, dtype=data.dtype)
+            if (isinstance(data, np.ma.MaskedArray) and
+                    not isinstance(output, np.ma.MaskedArray)):
+                output = np.ma.masked_array(
+                    output, mask=np.zeros(output.shape, dtype=bool),
+                    fill_value=np.nan)
+            index = [slice(None)] * template.ndim
+            for axis, point in zip(template_slice_axes, next(output_indices)):
+                index[axis] = point
+            output[tuple(index)] = data
+
+        result = template.copy(data=output)
+        return OccurrenceWithinVicinity.demote_length_one_dimensions(result)
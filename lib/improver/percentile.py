@@ -31,12 +31,61 @@
 """Module containing percentiling classes."""
 
 
-import iris
+from iris.analysis import PercentileAggregator
+from iris.cube import CubeList
 from iris.exceptions import CoordinateNotFoundError
 from iris import FUTURE
+import numpy as np
 
 FUTURE.netcdf_promote = True
 
+# Number of values read and partitioned at once when calculating
+# percentiles, which limits the memory used for each chunk of the grid
+# points.
+PERCENTILE_CHUNK_SIZE = 2 ** 20
+
+
+class PartitionPercentileAggregator(PercentileAggregator):
+
+    """Percentile aggregator that calculates the percentiles using
+    np.partition, rather than fully sorting the data.
+
+    The percentiles are the same as those from iris.analysis.PERCENTILE,
+    which is used instead for data that is masked or contains NaNs, as
+    masked values are left out of the percentiles and NaNs do not sort.
+
+    """
+
+    def aggregate(self, data, axis, **kwargs):
+        """
+        Calculate the percentiles along an axis of the data.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            Array of values.
+
+        axis : int
+            The axis along which to calculate the percentiles.
+
+        kwargs : dict
+            Keyword arguments of the aggregator, which must include the
+            percentiles as "percent".
+
+        Returns
+        -------
+        result : numpy.ndarray
+            Array of percentiles, with the axis removed and the percentiles
+            as the last dimension. If there is only one percentile, there
+            is no percentile dimension.
+
+        """
+        if np.ma.is_masked(data) or np.isnan(data).any():
+            return super(PartitionPercentileAggregator, self).aggregate(
+                data, axis, **kwargs)
+        return PercentileConverter.partition_percentiles(
+            np.ma.getdata(data), axis, kwargs['percent'])
+
 
 class PercentileConverter(object):
 
@@ -90,6 +139,89 @@ class PercentileConverter(object):
                 .format(self.collapse_coord, self.percentiles))
         return desc
 
+    @staticmethod
+    def partition_percentiles(data, axis, percent):
+        """
+        Calculate percentiles along an axis of the data, using linear
+        interpolation between the nearest ranks as iris.analysis.PERCENTILE
+        does.
+
+        The grid points are processed in chunks of at most
+        PERCENTILE_CHUNK_SIZE values. Each chunk is partitioned once with
+        np.partition, so that all the values needed for the requested
+        percentiles are found without fully sorting the data.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            Array of values, which must not be masked.
+
+        axis : int
+            The axis along which to calculate the percentiles.
+
+        percent : list or numpy.ndarray
+            The percentiles to calculate.
+
+        Returns
+        -------
+        result : numpy.ndarray
+            Array of percentiles, with the axis removed and the percentiles
+            as the last dimension. If there is only one percentile, there
+            is no percentile dimension.
+
+        """
+        percent = np.atleast_1d(np.asarray(percent, dtype=np.float64))
+        data = np.moveaxis(data, axis, -1)
+        shape = data.shape[:-1]
+        num_values = data.shape[-1]
+        data = data.reshape(-1, num_values)
+
+        # The percentiles are interpolated between the values at these
+        # ranks.
+        positions = percent / 100. * (num_values - 1)
+        lower = np.floor(positions).astype(int)
+        upper = np.minimum(lower + 1, num_values - 1)
+        fraction = positions - lower
+        ranks = np.unique(np.concatenate((lower, upper)))
+
+        result = np.empty((data.shape[0], len(percent)))
+        chunk_size = max(PERCENTILE_CHUNK_SIZE // num_values, 1)
+        for start in range(0, data.shape[0], chunk_size):
+            chunk = np.partition(data[start:start + chunk_size], ranks,
+                                 axis=-1)
+            lower_values = chunk[:, lower]
+            result[start:start + chunk_size] = (
+                lower_values + (chunk[:, upper] - lower_values) * fraction)
+
+        result = result.reshape(shape + (len(percent),))
+        if len(percent) == 1:
+            result = result[..., 0]
+        return result
+
+    def _collapse(self, cube, data_type):
+        """
+        Collapse the cube to its percentiles.
+
+        Parameters
+        ----------
+        cube : iris.cube.Cube instance
+            Cube to collapse over the collapse coordinates.
+
+        data_type : numpy.dtype
+            The data type of the percentiles.
+
+        Returns
+        -------
+        result : iris.cube.Cube instance
+            Cube of the percentiles.
+
+        """
+        result = cube.collapsed(self.collapse_coord,
+                                PartitionPercentileAggregator(),
+                                percent=self.percentiles)
+        result.data = result.data.astype(data_type)
+        return result
+
     def process(self, cube):
         """
         Create a cube containing the percentiles as a new dimension.
@@ -120,11 +252,31 @@ class PercentileConverter(object):
                               for test_coord in self.collapse_coord])
 
         if n_valid_coords == n_collapse_coords:
-            result = cube.collapsed(self.collapse_coord,
-                                    iris.analysis.PERCENTILE,
-                                    percent=self.percentiles)
-            result.data = result.data.astype(data_type)
-            return result
+            # The cube is collapsed in chunks of at most
+            # PERCENTILE_CHUNK_SIZE values, split along the longest
+            # dimension that is not collapsed and has a dimension
+            # coordinate, so that the chunks can be concatenated. Without
+            # such a dimension, the whole cube is collapsed at once.
+            collapse_dims = set(
+                dim for test_coord in self.collapse_coord
+                for dim in cube.coord_dims(test_coord))
+            chunk_dims = [
+                dim for dim in range(cube.ndim)
+                if dim not in collapse_dims and
+                cube.coords(dimensions=dim, dim_coords=True)]
+            if not chunk_dims:
+                return self._collapse(cube, data_type)
+            chunk_dim = max(chunk_dims, key=lambda dim: cube.shape[dim])
+            values_per_index = (
+                np.prod(cube.shape, dtype=int) // cube.shape[chunk_dim])
+            chunk_length = max(
+                PERCENTILE_CHUNK_SIZE // max(values_per_index, 1), 1)
+            chunks = CubeList()
+            for start in range(0, cube.shape[chunk_dim], chunk_length):
+                keys = [slice(None)] * cube.ndim
+                keys[chunk_dim] = slice(start, start + chunk_length)
+                chunks.append(self._collapse(cube[tuple(keys)], data_type))
+            return chunks.concatenate_cube()
 
         raise CoordinateNotFoundError(
             "Coordinate '{}' not found in cube passed to {}.".format(
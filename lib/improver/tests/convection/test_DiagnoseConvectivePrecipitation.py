@@ -42,6 +42,7 @@ from iris.tests import IrisTest
 import numpy as np
 
 from improver.convection import DiagnoseConvectivePrecipitation
+from improver.utilities.threshold import create_cube_with_thresholds
 
 # Fraction to convert from mm/hr to m/s.
 # m/s are SI units, however, mm/hr values are easier to handle.
@@ -346,6 +347,54 @@ class Test__calculate_convective_ratio(IrisTest):
         self.assertArrayAlmostEqual(result.data, expected)
 
 
+class Test__convective_ratio_from_indicators(IrisTest):
+
+    """Test the _convective_ratio_from_indicators method."""
+
+    def setUp(self):
+        """Set up a cube containing the points exceeding the lower and
+        higher thresholds, with a leading threshold coordinate."""
+        self.lower_threshold = 0.001 * mm_hr_to_m_s
+        self.higher_threshold = 5 * mm_hr_to_m_s
+        self.threshold_list = [self.lower_threshold, self.higher_threshold]
+        cube = set_up_precipitation_rate_cube()
+        data = np.stack(
+            [cube.data > threshold
+             for threshold in self.threshold_list]).astype(int)
+        self.indicator_cube = create_cube_with_thresholds(
+            self.threshold_list, cube, data)
+
+    def test_basic(self):
+        """Test that the convective ratio is calculated from the stacked
+        thresholds, and the threshold coordinate is removed."""
+        expected = np.array(
+            [[[[0., 0., 0., 0.],
+               [0.25, 0.28571429, 0.28571429, 0.375],
+               [0.5, 0.57142857, 0.625, 0.66666667],
+               [1., 1., 1., 1.]]]])
+        result = DiagnoseConvectivePrecipitation(
+            self.lower_threshold, self.higher_threshold, "square",
+            2000.0)._convective_ratio_from_indicators(self.indicator_cube)
+        self.assertIsInstance(result, iris.cube.Cube)
+        self.assertArrayAlmostEqual(result.data, expected)
+        self.assertEqual(result.name(), "convective_ratio")
+        self.assertEqual(result.units, "1")
+        self.assertFalse(result.coords("threshold"))
+        self.assertNotIn("relative_to_threshold", result.attributes)
+
+    def test_threshold_not_leading(self):
+        """Test that the result is the same if the threshold coordinate is
+        not the leading dimension."""
+        plugin = DiagnoseConvectivePrecipitation(
+            self.lower_threshold, self.higher_threshold, "square", 2000.0)
+        expected = plugin._convective_ratio_from_indicators(
+            self.indicator_cube.copy())
+        self.indicator_cube.transpose([1, 2, 0, 3, 4])
+        result = plugin._convective_ratio_from_indicators(
+            self.indicator_cube)
+        self.assertEqual(result, expected)
+
+
 class Test_absolute_differences_between_adjacent_grid_squares(IrisTest):
 
     """Test the absolute_differences_between_adjacent_grid_squares method."""
@@ -446,6 +495,31 @@ class Test_iterate_over_threshold(IrisTest):
         self.assertArrayAlmostEqual(result[0].data, expected)
         self.assertArrayAlmostEqual(result[1].data, expected)
 
+    def test_multiple_thresholds(self):
+        """Test that a list of thresholds is applied to each cube at once,
+        giving cubes with a leading threshold coordinate."""
+        expected_lower = np.array(
+            [[[[1., 1., 0., 1.],
+               [1., 1., 1., 1.],
+               [1., 0., 1., 1.],
+               [0., 1., 1., 1.]]]])
+        expected_higher = np.array(
+            [[[[0., 0., 0., 0.],
+               [0., 0., 0., 0.],
+               [1., 0., 1., 1.],
+               [0., 1., 1., 1.]]]])
+        cubelist = iris.cube.CubeList([self.cube, self.cube])
+        result = DiagnoseConvectivePrecipitation(
+            self.lower_threshold, self.higher_threshold,
+            self.neighbourhood_method,
+            self.radii).iterate_over_threshold(
+                cubelist, [self.lower_threshold, self.higher_threshold])
+        self.assertIsInstance(result, iris.cube.CubeList)
+        for cube in result:
+            self.assertEqual(cube.coord_dims("threshold"), (0,))
+            self.assertArrayAlmostEqual(cube.data[0], expected_lower)
+            self.assertArrayAlmostEqual(cube.data[1], expected_higher)
+
 
 class Test_sum_differences_between_adjacent_grid_squares(IrisTest):
 
@@ -575,6 +649,29 @@ class Test_process(IrisTest):
         self.assertIsInstance(result, iris.cube.Cube)
         self.assertArrayAlmostEqual(result.data, expected)
 
+    def test_multiple_realizations_and_times(self):
+        """Test that a cube with multiple realizations and times gives the
+        same result as processing each time separately."""
+        np.random.seed(0)
+        data = (np.random.random((2, 3, 8, 8)) *
+                10.0 * mm_hr_to_m_s)
+        coord_values = np.arange(0.0, 16000.0, 2000.0)
+        cube = set_up_cube(data, "lwe_precipitation_rate", "m s-1",
+                           realizations=np.array([0, 1]),
+                           timesteps=np.array([402192.5, 402193.5,
+                                               402194.5]),
+                           y_dimension_values=coord_values,
+                           x_dimension_values=coord_values)
+        plugin = DiagnoseConvectivePrecipitation(
+            self.lower_threshold, self.higher_threshold,
+            self.neighbourhood_method, 4000.0)
+        result = plugin.process(cube)
+        self.assertEqual(result.shape, cube.shape)
+        for index in range(3):
+            expected = plugin.process(cube[:, index])
+            self.assertArrayAlmostEqual(
+                result[:, index].data, expected.data)
+
 
 if __name__ == '__main__':
     unittest.main()
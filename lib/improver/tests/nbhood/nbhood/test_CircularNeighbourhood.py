@@ -36,6 +36,7 @@ import unittest
 from iris.cube import Cube
 from iris.tests import IrisTest
 import numpy as np
+import scipy.ndimage.filters
 
 from improver.nbhood.nbhood import CircularNeighbourhood
 from improver.tests.nbhood.nbhood.test_NeighbourhoodProcessing import (
@@ -43,6 +44,30 @@ from improver.tests.nbhood.nbhood.test_NeighbourhoodProcessing import (
     SINGLE_POINT_RANGE_5_CENTROID, set_up_cube, set_up_cube_lat_long)
 
 
+class Test__init__(IrisTest):
+
+    """Test the init method."""
+
+    def test_convolution(self):
+        """Test that the convolution method is set."""
+        result = CircularNeighbourhood(convolution="fft")
+        self.assertEqual(result.convolution, "fft")
+
+    def test_invalid_convolution(self):
+        """Test that an error is raised for an unsupported convolution
+        method."""
+        msg = "The convolution method requested: nonsense"
+        with self.assertRaisesRegexp(ValueError, msg):
+            CircularNeighbourhood(convolution="nonsense")
+
+    def test_weighted_spans(self):
+        """Test that an error is raised if span sums are requested for a
+        weighted kernel."""
+        msg = "only available for an unweighted circular neighbourhood"
+        with self.assertRaisesRegexp(ValueError, msg):
+            CircularNeighbourhood(unweighted_mode=False, convolution="spans")
+
+
 class Test__repr__(IrisTest):
 
     """Test the repr method."""
@@ -50,10 +75,201 @@ class Test__repr__(IrisTest):
     def test_basic(self):
         """Test that the __repr__ returns the expected string."""
         result = str(CircularNeighbourhood())
-        msg = '<CircularNeighbourhood: unweighted_mode: False>'
+        msg = ('<CircularNeighbourhood: unweighted_mode: False; '
+               'convolution: auto>')
         self.assertEqual(str(result), msg)
 
 
+class Test_choose_convolution(IrisTest):
+
+    """Test the choice of method used to apply the kernel."""
+
+    def test_small_kernel(self):
+        """Test that a small kernel is applied directly."""
+        data = np.ones((100, 100))
+        kernel = np.ones((3, 3))
+        result = CircularNeighbourhood().choose_convolution(data, kernel)
+        self.assertEqual(result, "direct")
+
+    def test_large_kernel(self):
+        """Test that FFT convolution is used for a large weighted kernel."""
+        data = np.ones((100, 100))
+        kernel = np.ones((41, 41))
+        result = CircularNeighbourhood().choose_convolution(data, kernel)
+        self.assertEqual(result, "fft")
+
+    def test_unweighted_kernel(self):
+        """Test that span sums are used for an unweighted kernel that is
+        too large to apply directly."""
+        data = np.ones((100, 100))
+        kernel = np.ones((1, 17, 17))
+        result = CircularNeighbourhood(
+            unweighted_mode=True).choose_convolution(data[np.newaxis], kernel)
+        self.assertEqual(result, "spans")
+
+    def test_nan_data(self):
+        """Test that a kernel is applied directly if the data contains NaN
+        values."""
+        data = np.ones((100, 100))
+        data[0, 0] = np.nan
+        kernel = np.ones((41, 41))
+        result = CircularNeighbourhood(
+            unweighted_mode=True).choose_convolution(data, kernel)
+        self.assertEqual(result, "direct")
+
+    def test_integer_data(self):
+        """Test that a kernel is applied directly to integer data."""
+        data = np.ones((100, 100), dtype=np.int32)
+        kernel = np.ones((41, 41))
+        result = CircularNeighbourhood(
+            unweighted_mode=True).choose_convolution(data, kernel)
+        self.assertEqual(result, "direct")
+
+
+class Test_correlate_using_fft(IrisTest):
+
+    """Test the correlation of a kernel with data using FFT convolution."""
+
+    def test_basic(self):
+        """Test that the result matches correlating the kernel directly
+        using the nearest value beyond the edges, for an asymmetric
+        kernel."""
+        data = np.random.RandomState(0).rand(2, 9, 12)
+        kernel = np.random.RandomState(1).rand(1, 5, 3)
+        expected = scipy.ndimage.filters.correlate(
+            data, kernel, mode='nearest')
+        result = CircularNeighbourhood.correlate_using_fft(data, kernel)
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_kernel_larger_than_data(self):
+        """Test a kernel that extends beyond the data in both directions."""
+        data = np.random.RandomState(0).rand(4, 5)
+        kernel = np.ones((11, 13))
+        expected = scipy.ndimage.filters.correlate(
+            data, kernel, mode='nearest')
+        result = CircularNeighbourhood.correlate_using_fft(data, kernel)
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_within_data_range(self):
+        """Test that rounding errors do not take the result outside the
+        range of the data."""
+        data = np.zeros((20, 20), dtype=np.float32)
+        data[10, 10] = 1.
+        kernel = np.ones((9, 9))
+        result = CircularNeighbourhood.correlate_using_fft(data, kernel)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertTrue(np.all(result >= 0.))
+        self.assertTrue(np.all(result <= 1.))
+
+
+class Test_get_kernel(IrisTest):
+
+    """Test getting kernels from the kernel cache."""
+
+    def setUp(self):
+        """Clear the kernel cache."""
+        CircularNeighbourhood.kernel_cache.cache_clear()
+        self.fullranges = np.array([0, 3, 3])
+        self.ranges = (3, 3)
+
+    def tearDown(self):
+        """Clear the kernel cache."""
+        CircularNeighbourhood.kernel_cache.cache_clear()
+
+    def test_basic(self):
+        """Test that the kernel and its sum match a newly created kernel,
+        and that the kernel cannot be modified."""
+        plugin = CircularNeighbourhood()
+        expected = plugin.create_kernel(self.fullranges, self.ranges)
+        kernel, kernel_sum = plugin.get_kernel(
+            self.fullranges, self.ranges, np.float32)
+        self.assertArrayAlmostEqual(kernel, expected)
+        self.assertEqual(kernel.dtype, np.float64)
+        self.assertAlmostEqual(kernel_sum, np.sum(expected))
+        self.assertFalse(kernel.flags.writeable)
+
+    def test_reused(self):
+        """Test that the kernel is reused by other instances of the
+        plugin."""
+        kernel, _ = CircularNeighbourhood().get_kernel(
+            self.fullranges, self.ranges, np.float32)
+        result, _ = CircularNeighbourhood().get_kernel(
+            self.fullranges, self.ranges, np.float32)
+        self.assertIs(result, kernel)
+        info = CircularNeighbourhood.kernel_cache.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+
+    def test_unweighted_mode(self):
+        """Test that weighted and unweighted kernels are cached
+        separately."""
+        weighted, _ = CircularNeighbourhood().get_kernel(
+            self.fullranges, self.ranges, np.float32)
+        unweighted, _ = CircularNeighbourhood(
+            unweighted_mode=True).get_kernel(
+                self.fullranges, self.ranges, np.float32)
+        self.assertFalse(np.allclose(weighted, unweighted))
+        self.assertEqual(
+            CircularNeighbourhood.kernel_cache.cache_info().misses, 2)
+
+
+class Test_correlate_using_spans(IrisTest):
+
+    """Test the correlation of an unweighted kernel with data using span
+    sums."""
+
+    def setUp(self):
+        """Set up random data and an unweighted circular kernel."""
+        self.data = np.random.RandomState(0).rand(2, 9, 12)
+        y_offsets, x_offsets = np.ogrid[-3:4, -3:4]
+        self.kernel = (
+            x_offsets**2 + y_offsets**2 <= 9).astype(float)[np.newaxis]
+
+    def test_basic(self):
+        """Test that the result matches correlating the kernel directly
+        using the nearest value beyond the edges."""
+        expected = scipy.ndimage.filters.correlate(
+            self.data, self.kernel, mode='nearest')
+        result = CircularNeighbourhood(
+            unweighted_mode=True).correlate_using_spans(
+                self.data, self.kernel, 1, 2)
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_x_axis_before_y_axis(self):
+        """Test the result when the x axis is before the y axis, for a
+        kernel with a row that contains more than one span."""
+        self.kernel[0, 3, 3] = 0.
+        data = np.swapaxes(self.data, 1, 2)
+        kernel = np.swapaxes(self.kernel, 1, 2)
+        expected = scipy.ndimage.filters.correlate(
+            data, kernel, mode='nearest')
+        result = CircularNeighbourhood(
+            unweighted_mode=True).correlate_using_spans(data, kernel, 2, 1)
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_kernel_larger_than_data(self):
+        """Test a kernel that extends beyond the data in both directions."""
+        data = self.data[:, :2, :3]
+        expected = scipy.ndimage.filters.correlate(
+            data, self.kernel, mode='nearest')
+        result = CircularNeighbourhood(
+            unweighted_mode=True).correlate_using_spans(
+                data, self.kernel, 1, 2)
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_nan(self):
+        """Test that NaN values are treated as zero, and set to NaN in the
+        result, as for the square neighbourhood."""
+        self.data[0, 4, 5] = np.nan
+        expected = scipy.ndimage.filters.correlate(
+            np.where(np.isnan(self.data), 0, self.data), self.kernel,
+            mode='nearest')
+        expected[0, 4, 5] = np.nan
+        result = CircularNeighbourhood(
+            unweighted_mode=True).correlate_using_spans(
+                self.data, self.kernel, 1, 2)
+        self.assertArrayAlmostEqual(result, expected)
+
+
 class Test_apply_circular_kernel(IrisTest):
 
     """Test neighbourhood processing plugin on the OS National Grid."""
@@ -336,6 +552,38 @@ class Test_apply_circular_kernel(IrisTest):
                 unweighted_mode=False).apply_circular_kernel(cube, ranges))
         self.assertArrayAlmostEqual(result.data, expected)
 
+    def test_fft_matches_direct(self):
+        """Test that FFT convolution gives the same result as applying the
+        kernel directly, for weighted and unweighted kernels."""
+        cube = set_up_cube(
+            zero_point_indices=[(0, 0, 10, 10), (0, 1, 0, 3)],
+            num_time_points=2)
+        ranges = (4, 4)
+        for unweighted_mode in [True, False]:
+            expected = CircularNeighbourhood(
+                unweighted_mode=unweighted_mode,
+                convolution="direct").apply_circular_kernel(
+                    cube.copy(), ranges)
+            result = CircularNeighbourhood(
+                unweighted_mode=unweighted_mode,
+                convolution="fft").apply_circular_kernel(cube.copy(), ranges)
+            self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_spans_matches_direct(self):
+        """Test that span sums give the same result as applying an
+        unweighted kernel directly."""
+        cube = set_up_cube(
+            zero_point_indices=[(0, 0, 10, 10), (0, 1, 0, 3)],
+            num_time_points=2)
+        ranges = (4, 4)
+        expected = CircularNeighbourhood(
+            unweighted_mode=True, convolution="direct").apply_circular_kernel(
+                cube.copy(), ranges)
+        result = CircularNeighbourhood(
+            unweighted_mode=True, convolution="spans").apply_circular_kernel(
+                cube.copy(), ranges)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
 
 class Test_run(IrisTest):
 
@@ -358,5 +606,66 @@ class Test_run(IrisTest):
         self.assertArrayAlmostEqual(result.data, data)
 
 
+class Test_run_along_coord(IrisTest):
+
+    """Test the run_along_coord method on the CircularNeighbourhood
+    class."""
+
+    def setUp(self):
+        """Set up a cube with a zero point at each time."""
+        self.cube = set_up_cube(
+            zero_point_indices=((0, 0, 7, 7), (0, 1, 7, 7), (0, 2, 7, 7),
+                                (0, 3, 7, 7)),
+            num_time_points=4)
+
+    def test_basic(self):
+        """Test that each time is neighbourhood processed using the
+        corresponding radius, when several times share a radius."""
+        radii = [6100, 6100, 10000, 6100]
+        plugin = CircularNeighbourhood()
+        result = plugin.run_along_coord(self.cube.copy(), radii, "time")
+        self.assertIsInstance(result, Cube)
+        self.assertEqual(result.shape, self.cube.shape)
+        for index, radius in enumerate(radii):
+            expected = plugin.run(self.cube[:, index].copy(), radius)
+            self.assertArrayAlmostEqual(result.data[:, index], expected.data)
+
+    def test_kernel_applied_per_group(self):
+        """Test that the kernel is applied once for each distinct number of
+        grid cells, rather than for each time."""
+        plugin = CircularNeighbourhood()
+        radii = [6100, 6100, 10000, 6100]
+        calls = []
+        apply_circular_kernel = plugin.apply_circular_kernel
+
+        def _apply_circular_kernel(cube, ranges):
+            """Record the shape of each cube to which a kernel is
+            applied."""
+            calls.append((cube.shape, ranges))
+            return apply_circular_kernel(cube, ranges)
+
+        plugin.apply_circular_kernel = _apply_circular_kernel
+        plugin.run_along_coord(self.cube.copy(), radii, "time")
+        self.assertEqual(calls, [((1, 3, 16, 16), (3, 3)),
+                                 ((1, 1, 16, 16), (4, 4))])
+
+    def test_scalar_coord(self):
+        """Test that a cube with a scalar coordinate is processed using the
+        single radius supplied."""
+        cube = self.cube[:, 0]
+        result = CircularNeighbourhood().run_along_coord(
+            cube.copy(), [6100], "time")
+        expected = CircularNeighbourhood().run(cube.copy(), 6100)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_mismatched_radii(self):
+        """Test that an error is raised if the number of radii does not
+        match the number of points along the coordinate."""
+        msg = "The number of radii"
+        with self.assertRaisesRegexp(ValueError, msg):
+            CircularNeighbourhood().run_along_coord(
+                self.cube, [6100], "time")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Unit tests for the nbhood.KernelCache plugin."""
+
+
+import unittest
+
+from iris.tests import IrisTest
+
+from improver.nbhood.nbhood import KernelCache
+
+
+class Test__init__(IrisTest):
+
+    """Test the init method."""
+
+    def test_basic(self):
+        """Test that the cache is initially empty."""
+        result = KernelCache(maxsize=4)
+        self.assertEqual(result.maxsize, 4)
+        self.assertEqual(len(result.kernels), 0)
+        self.assertEqual(result.hits, 0)
+        self.assertEqual(result.misses, 0)
+
+
+class Test__repr__(IrisTest):
+
+    """Test the repr method."""
+
+    def test_basic(self):
+        """Test that the __repr__ returns the expected string."""
+        result = str(KernelCache(maxsize=4))
+        msg = '<KernelCache: maxsize: 4; currsize: 0>'
+        self.assertEqual(result, msg)
+
+
+class Test_get(IrisTest):
+
+    """Test getting kernels from the cache."""
+
+    def setUp(self):
+        """Set up a cache and a function that counts the kernels created."""
+        self.cache = KernelCache(maxsize=2)
+        self.created = []
+
+    def create_kernel(self, value):
+        """Return a function that creates a kernel with the given value."""
+        def _create_kernel():
+            """Create the kernel."""
+            self.created.append(value)
+            return value
+        return _create_kernel
+
+    def test_miss_then_hit(self):
+        """Test that a kernel is only created on the first request."""
+        self.assertEqual(self.cache.get("a", self.create_kernel(1)), 1)
+        self.assertEqual(self.cache.get("a", self.create_kernel(2)), 1)
+        self.assertEqual(self.created, [1])
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_least_recently_used_discarded(self):
+        """Test that the least recently used kernel is discarded when the
+        cache is full."""
+        self.cache.get("a", self.create_kernel(1))
+        self.cache.get("b", self.create_kernel(2))
+        # Use "a", so that "b" is the least recently used.
+        self.cache.get("a", self.create_kernel(1))
+        self.cache.get("c", self.create_kernel(3))
+        self.assertEqual(list(self.cache.kernels.keys()), ["a", "c"])
+        self.cache.get("b", self.create_kernel(2))
+        self.assertEqual(self.created, [1, 2, 3, 2])
+
+    def test_zero_size(self):
+        """Test that no kernels are stored if the maximum size is zero."""
+        cache = KernelCache(maxsize=0)
+        cache.get("a", self.create_kernel(1))
+        cache.get("a", self.create_kernel(1))
+        self.assertEqual(self.created, [1, 1])
+        self.assertEqual(len(cache.kernels), 0)
+
+
+class Test_cache_info(IrisTest):
+
+    """Test the statistics on the use of the cache."""
+
+    def test_basic(self):
+        """Test the hits, misses, maximum size and current size."""
+        cache = KernelCache(maxsize=3)
+        cache.get("a", lambda: 1)
+        cache.get("a", lambda: 1)
+        cache.get("b", lambda: 2)
+        result = cache.cache_info()
+        self.assertEqual(result, (1, 2, 3, 2))
+        self.assertEqual(result.hits, 1)
+        self.assertEqual(result.currsize, 2)
+
+
+class Test_cache_clear(IrisTest):
+
+    """Test clearing the cache."""
+
+    def test_basic(self):
+        """Test that the kernels and statistics are cleared."""
+        cache = KernelCache(maxsize=3)
+        cache.get("a", lambda: 1)
+        cache.get("a", lambda: 1)
+        cache.cache_clear()
+        self.assertEqual(cache.cache_info(), (0, 0, 3, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
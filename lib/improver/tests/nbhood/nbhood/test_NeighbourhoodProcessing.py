@@ -31,6 +31,10 @@
 """Unit tests for the nbhood.NeighbourhoodProcessing plugin."""
 
 
+import functools
+import os
+import shutil
+from tempfile import mkdtemp
 import unittest
 
 from cf_units import Unit
@@ -43,6 +47,7 @@ import numpy as np
 
 
 from improver.grids.osgb import OSGBGRID
+from improver.nbhood.nbhood import CircularNeighbourhood
 from improver.nbhood.nbhood import NeighbourhoodProcessing as NBHood
 from improver.tests.ensemble_calibration.ensemble_calibration.helper_functions\
     import add_forecast_reference_time_and_forecast_period
@@ -263,6 +268,15 @@ class Test__init__(IrisTest):
         with self.assertRaisesRegexp(KeyError, msg):
             NBHood(neighbourhood_method, radii)
 
+    def test_invalid_workers(self):
+        """
+        Test that desired error message is raised, if fewer than one worker
+        is requested.
+        """
+        msg = 'The number of workers must be at least 1'
+        with self.assertRaisesRegexp(ValueError, msg):
+            NBHood('circular', 10000, workers=0)
+
 
 class Test__repr__(IrisTest):
 
@@ -273,7 +287,8 @@ class Test__repr__(IrisTest):
         result = str(NBHood("circular", 10000))
         msg = ('<NeighbourhoodProcessing: neighbourhood_method: circular; '
                'radii: 10000.0; lead_times: None; '
-               'unweighted_mode: False; ens_factor: 1.0>')
+               'unweighted_mode: False; ens_factor: 1.0; workers: 1; '
+               'collapse_realizations: False>')
         self.assertEqual(result, msg)
 
 
@@ -332,6 +347,56 @@ class Test__find_radii(IrisTest):
         self.assertArrayAlmostEqual(result, expected_result)
 
 
+class Test__jobs_for_realization(IrisTest):
+
+    """Test the _jobs_for_realization method."""
+
+    def setUp(self):
+        """Set up a cube with a single realization and three lead times."""
+        cube = set_up_cube(num_time_points=3)
+        iris.util.promote_aux_coord_to_dim_coord(cube, "time")
+        cube = add_forecast_reference_time_and_forecast_period(
+            cube, time_point=cube.coord("time").points, fp_point=[2, 3, 4])
+        self.cube = next(cube.slices_over("realization"))
+
+    def test_no_lead_times(self):
+        """Test that there is a single job for the whole realization when
+        the radii are not defined at lead times."""
+        plugin = NBHood("square", 4000)
+        jobs = plugin._jobs_for_realization(self.cube, 1, num_jobs=3)
+        self.assertEqual(len(jobs), 1)
+        function, args = jobs[0]
+        self.assertEqual(function, plugin.neighbourhood_method.run)
+        self.assertIs(args[0], self.cube)
+
+    def test_lead_times_split(self):
+        """Test that the lead times are split into contiguous chunks, each
+        with the radii of its lead times."""
+        plugin = NBHood("square", [4000, 8000], lead_times=[2, 4])
+        jobs = plugin._jobs_for_realization(self.cube, 1, num_jobs=2)
+        self.assertEqual(len(jobs), 2)
+        self.assertArrayEqual(jobs[0][1][0].coord("forecast_period").points,
+                              [2, 3])
+        self.assertArrayEqual(jobs[0][1][1], [4000, 6000])
+        self.assertArrayEqual(jobs[1][1][0].coord("forecast_period").points,
+                              [4])
+        self.assertArrayEqual(jobs[1][1][1], [8000])
+
+    def test_more_jobs_than_lead_times(self):
+        """Test that there are never more jobs than lead times."""
+        plugin = NBHood("square", [4000, 8000], lead_times=[2, 4])
+        jobs = plugin._jobs_for_realization(self.cube, 1, num_jobs=5)
+        self.assertEqual(len(jobs), 3)
+
+    def test_scalar_time(self):
+        """Test that there is a single job if time is not a dimension."""
+        plugin = NBHood("square", [4000, 8000], lead_times=[2, 4])
+        cube = self.cube[0]
+        jobs = plugin._jobs_for_realization(cube, 1, num_jobs=2)
+        self.assertEqual(len(jobs), 1)
+        self.assertIs(jobs[0][1][0], cube)
+
+
 class Test_process(IrisTest):
 
     """Tests for the process method of NeighbourhoodProcessing."""
@@ -404,6 +469,133 @@ class Test_process(IrisTest):
             [0.91666667, 0.875, 0.91666667])
         self.assertArrayAlmostEqual(result.data, expected)
 
+    def test_kernel_reused(self):
+        """Test that the circular kernel is created once, and reused for
+        each realization. The times use the same radius, so they are
+        processed together using a single kernel."""
+        cube = set_up_cube(num_time_points=3,
+                           num_realization_points=4)
+        iris.util.promote_aux_coord_to_dim_coord(cube, "time")
+        cube = add_forecast_reference_time_and_forecast_period(
+            cube, time_point=cube.coord("time").points, fp_point=[2, 3, 4])
+        kernel_cache = CircularNeighbourhood.kernel_cache
+        kernel_cache.cache_clear()
+        NBHood("circular", [15000, 15000, 15000],
+               lead_times=[2, 3, 4], ens_factor=0.8).process(cube)
+        self.assertEqual(kernel_cache.cache_info().misses, 1)
+        self.assertEqual(kernel_cache.cache_info().hits, 3)
+        kernel_cache.cache_clear()
+
+    def test_workers(self):
+        """Test that processing the realizations and times in parallel gives
+        the same result as processing them one after another, for both the
+        circular and square methods."""
+        cube = set_up_cube(
+            zero_point_indices=[(0, 0, 7, 7), (1, 1, 4, 9), (2, 2, 10, 3)],
+            num_time_points=3, num_realization_points=3)
+        iris.util.promote_aux_coord_to_dim_coord(cube, "time")
+        cube = add_forecast_reference_time_and_forecast_period(
+            cube, time_point=cube.coord("time").points, fp_point=[2, 3, 4])
+        for neighbourhood_method in ["circular", "square"]:
+            expected = NBHood(neighbourhood_method, [10000, 20000],
+                              lead_times=[2, 4]).process(cube.copy())
+            result = NBHood(neighbourhood_method, [10000, 20000],
+                            lead_times=[2, 4], workers=4).process(cube.copy())
+            self.assertEqual(result, expected)
+
+    def test_workers_single_realization(self):
+        """Test that the lead times of a single realization are processed
+        in parallel, giving the same result as processing them one after
+        another."""
+        cube = set_up_cube(
+            zero_point_indices=[(0, 0, 7, 7), (0, 1, 4, 9), (0, 2, 10, 3)],
+            num_time_points=3)
+        iris.util.promote_aux_coord_to_dim_coord(cube, "time")
+        cube = add_forecast_reference_time_and_forecast_period(
+            cube, time_point=cube.coord("time").points, fp_point=[2, 3, 4])
+        for neighbourhood_method in ["circular", "square"]:
+            expected = NBHood(neighbourhood_method, [10000, 20000],
+                              lead_times=[2, 4]).process(cube.copy())
+            result = NBHood(neighbourhood_method, [10000, 20000],
+                            lead_times=[2, 4], workers=3).process(cube.copy())
+            self.assertEqual(result, expected)
+
+    def test_collapse_realizations(self):
+        """Test that the collapsed result matches the mean of the
+        neighbourhood processed realizations, for both the circular and
+        square methods, and with radii varying with lead time."""
+        cube = set_up_cube(
+            zero_point_indices=[(0, 0, 7, 7), (1, 1, 4, 9), (2, 2, 10, 3)],
+            num_time_points=3, num_realization_points=3)
+        iris.util.promote_aux_coord_to_dim_coord(cube, "time")
+        cube = add_forecast_reference_time_and_forecast_period(
+            cube, time_point=cube.coord("time").points, fp_point=[2, 3, 4])
+        for neighbourhood_method in ["circular", "square"]:
+            for radii, lead_times in [(20000, None),
+                                      ([15000, 20000], [2, 4])]:
+                expected = NBHood(
+                    neighbourhood_method, radii, lead_times=lead_times,
+                    ens_factor=0.8).process(cube.copy()).collapsed(
+                        "realization", iris.analysis.MEAN)
+                result = NBHood(
+                    neighbourhood_method, radii, lead_times=lead_times,
+                    ens_factor=0.8, collapse_realizations=True).process(
+                        cube.copy())
+                self.assertArrayAlmostEqual(result.data, expected.data)
+                self.assertEqual(result.coord("realization"),
+                                 expected.coord("realization"))
+                self.assertEqual(result.cell_methods, expected.cell_methods)
+
+    def test_collapse_realizations_masked(self):
+        """Test that the collapsed result matches the mean of the
+        neighbourhood processed realizations for masked data, and is only
+        masked where all realizations are masked."""
+        cube = set_up_cube(
+            zero_point_indices=[(0, 0, 7, 7), (1, 0, 4, 9), (2, 0, 10, 3)],
+            num_time_points=1, num_realization_points=3)
+        mask = np.zeros(cube.shape, dtype=bool)
+        mask[:, 0, 2, 2] = True
+        mask[0, 0, 5, 5] = True
+        cube.data = np.ma.masked_where(mask, cube.data)
+        expected = NBHood("square", 20000).process(cube.copy()).collapsed(
+            "realization", iris.analysis.MEAN)
+        result = NBHood("square", 20000, collapse_realizations=True).process(
+            cube.copy())
+        self.assertArrayAlmostEqual(result.data, expected.data)
+        self.assertArrayEqual(result.data.mask, expected.data.mask)
+        self.assertTrue(result.data.mask[0, 2, 2])
+        self.assertFalse(result.data.mask[0, 5, 5])
+
+    def test_mask_cube(self):
+        """Test that using a mask cube matches masking every realization of
+        the input cube with the same mask, including when collapsing the
+        realizations."""
+        cube = set_up_cube(
+            zero_point_indices=[(0, 0, 7, 7), (1, 0, 4, 9), (2, 0, 10, 3)],
+            num_time_points=1, num_realization_points=3)
+        landmask = np.ones((16, 16), dtype=bool)
+        landmask[:, :5] = False
+        mask_cube = cube[0, 0].copy(data=landmask)
+        masked_cube = cube.copy(data=np.ma.masked_where(
+            np.broadcast_to(np.logical_not(landmask), cube.shape),
+            cube.data))
+        for collapse_realizations in [False, True]:
+            plugin = NBHood(
+                "square", 20000, collapse_realizations=collapse_realizations)
+            expected = plugin.process(masked_cube.copy())
+            result = plugin.process(cube.copy(), mask_cube=mask_cube)
+            self.assertArrayAlmostEqual(result.data, expected.data)
+            self.assertArrayEqual(result.data.mask, expected.data.mask)
+
+    def test_mask_cube_circular(self):
+        """Test that an error is raised if a mask cube is supplied for the
+        circular neighbourhood method."""
+        cube = set_up_cube()
+        mask_cube = cube[0, 0].copy(data=np.ones((16, 16)))
+        msg = "A mask cube can only be used with the square"
+        with self.assertRaisesRegexp(ValueError, msg):
+            NBHood("circular", 6000).process(cube, mask_cube=mask_cube)
+
     def test_no_realizations(self):
         """Test when the array has no realization coord."""
         cube = set_up_cube_with_no_realizations()
@@ -547,5 +739,269 @@ class Test_process(IrisTest):
         self.assertArrayAlmostEqual(result.data, expected)
 
 
+class Test_find_changed_regions(IrisTest):
+
+    """Test the find_changed_regions method."""
+
+    def test_basic(self):
+        """Test that the regions contain every point within the margins of
+        the changed points, and separate changes give separate regions."""
+        changed = np.zeros((20, 30), dtype=bool)
+        changed[2, 3] = True
+        changed[15, 25] = True
+        result = NBHood.find_changed_regions(changed, 2, 3)
+        self.assertEqual(len(result), 2)
+        covered = np.zeros(changed.shape, dtype=bool)
+        for y_slice, x_slice in result:
+            covered[y_slice, x_slice] = True
+        expected = np.zeros(changed.shape, dtype=bool)
+        expected[0:6, 1:6] = True
+        expected[12:19, 23:28] = True
+        self.assertTrue(np.all(covered[expected]))
+
+    def test_no_changes(self):
+        """Test that no regions are returned if there are no changes."""
+        changed = np.zeros((20, 30), dtype=bool)
+        self.assertEqual(NBHood.find_changed_regions(changed, 2, 2), [])
+
+
+class Test_process_incremental(IrisTest):
+
+    """Test the process_incremental method."""
+
+    def setUp(self):
+        """Set up a previous cube, and a cube in which part of the domain
+        has changed."""
+        self.previous_cube = set_up_cube(
+            zero_point_indices=((0, 0, 2, 2), (1, 0, 12, 3), (0, 1, 8, 8)),
+            num_time_points=2, num_grid_points=16, num_realization_points=2)
+        self.cube = self.previous_cube.copy()
+        self.cube.data[0, 0, 10:13, 9:12] = 0.
+        self.cube.data[1, 1, 15, 0] = 0.
+
+    def test_square(self):
+        """Test that the result matches processing the whole cube using the
+        square neighbourhood method."""
+        plugin = NBHood("square", 6000)
+        previous_result = plugin.process(self.previous_cube)
+        expected = plugin.process(self.cube)
+        result = plugin.process_incremental(
+            self.previous_cube, previous_result, self.cube)
+        self.assertIsInstance(result, Cube)
+        self.assertEqual(result.coords(), expected.coords())
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_circular(self):
+        """Test that the result matches processing the whole cube using the
+        circular neighbourhood method."""
+        plugin = NBHood("circular", 6000)
+        previous_result = plugin.process(self.previous_cube)
+        expected = plugin.process(self.cube)
+        result = plugin.process_incremental(
+            self.previous_cube, previous_result, self.cube)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_lead_times(self):
+        """Test that the result matches processing the whole cube, when the
+        radii depend on the lead time."""
+        cubes = []
+        for cube in [self.previous_cube, self.cube]:
+            iris.util.promote_aux_coord_to_dim_coord(cube, "time")
+            cubes.append(add_forecast_reference_time_and_forecast_period(
+                cube, time_point=cube.coord("time").points,
+                fp_point=[2, 3]))
+        previous_cube, cube = cubes
+        plugin = NBHood("square", [4000, 8000], lead_times=[2, 3])
+        previous_result = plugin.process(previous_cube)
+        expected = plugin.process(cube)
+        result = plugin.process_incremental(
+            previous_cube, previous_result, cube)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_mask_cube(self):
+        """Test that the result matches processing the whole cube using a
+        mask cube, including the masked points."""
+        mask_cube = self.cube[0, 0].copy(
+            data=np.ones((16, 16), dtype=int))
+        mask_cube.remove_coord("realization")
+        mask_cube.remove_coord("time")
+        mask_cube.data[4:8, :] = 0
+        plugin = NBHood("square", 6000)
+        previous_result = plugin.process(
+            self.previous_cube, mask_cube=mask_cube)
+        expected = plugin.process(self.cube, mask_cube=mask_cube)
+        result = plugin.process_incremental(
+            self.previous_cube, previous_result, self.cube,
+            mask_cube=mask_cube)
+        self.assertArrayEqual(result.data.mask, expected.data.mask)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_no_changes(self):
+        """Test that the previous result is returned if the cube has not
+        changed."""
+        plugin = NBHood("square", 6000)
+        previous_result = plugin.process(self.previous_cube)
+        result = plugin.process_incremental(
+            self.previous_cube, previous_result, self.previous_cube.copy())
+        self.assertEqual(result, previous_result)
+        self.assertIsNot(result, previous_result)
+
+    def test_different_coordinates(self):
+        """Test that an exception is raised if the cube does not have the
+        same coordinates as the previous cube."""
+        plugin = NBHood("square", 6000)
+        previous_result = plugin.process(self.previous_cube)
+        self.cube.coord("time").points = (
+            self.cube.coord("time").points + 1)
+        msg = "The cube must have the same shape and coordinates"
+        with self.assertRaisesRegexp(ValueError, msg):
+            plugin.process_incremental(
+                self.previous_cube, previous_result, self.cube)
+
+    def test_different_grid(self):
+        """Test that an exception is raised if the previous result is not on
+        the same grid as the cube."""
+        plugin = NBHood("square", 6000)
+        previous_result = plugin.process(self.previous_cube[:, :, :8])
+        msg = "The previous result must be on the same grid"
+        with self.assertRaisesRegexp(ValueError, msg):
+            plugin.process_incremental(
+                self.previous_cube, previous_result, self.cube)
+
+
+class Test_process_streaming(IrisTest):
+
+    """Test the process_streaming method."""
+
+    def setUp(self):
+        """Set up a cube with lazy data, loaded from a NetCDF file, with
+        several realizations and times."""
+        self.data_directory = mkdtemp()
+        self.cube_file = os.path.join(self.data_directory, "cube.nc")
+        cube = set_up_cube(
+            zero_point_indices=((0, 0, 2, 2), (1, 0, 12, 3), (0, 1, 8, 8)),
+            num_time_points=2, num_grid_points=16, num_realization_points=3)
+        iris.save(cube, self.cube_file)
+        self.cube = iris.load_cube(self.cube_file)
+
+    def tearDown(self):
+        """Remove the temporary files created for testing."""
+        shutil.rmtree(self.data_directory)
+
+    def test_basic(self):
+        """Test that the result matches the result of processing the whole
+        cube using each neighbourhood method, and that the input data is
+        not read into the cube."""
+        for method in ["square", "circular"]:
+            plugin = NBHood(method, 6000)
+            expected = plugin.process(self.cube.copy())
+            result = plugin.process_streaming(self.cube)
+            self.assertIsInstance(result, Cube)
+            self.assertEqual(result.coords(), expected.coords())
+            self.assertArrayAlmostEqual(result.data, expected.data)
+            self.assertTrue(self.cube.has_lazy_data())
+
+    def test_memmap(self):
+        """Test that the output is written to the array created by the
+        function supplied. Data loaded from a NetCDF file may be masked, in
+        which case this array is the data of the masked output."""
+        output_file = os.path.join(self.data_directory, "output.dat")
+        plugin = NBHood("square", 6000)
+        expected = plugin.process(self.cube.copy())
+        result = plugin.process_streaming(
+            self.cube, allocate_output=functools.partial(
+                np.memmap, output_file, mode="w+"))
+        self.assertIsInstance(np.ma.getdata(result.data), np.memmap)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_workers(self):
+        """Test that processing several slices at once gives the same
+        result."""
+        expected = NBHood("square", 6000).process_streaming(self.cube)
+        result = NBHood("square", 6000, workers=4).process_streaming(
+            self.cube)
+        self.assertArrayEqual(result.data, expected.data)
+
+    def test_single_precision(self):
+        """Test that the data type of the output is retained."""
+        cube = self.cube.copy(data=self.cube.data.astype(np.float32))
+        result = NBHood("square", 6000).process_streaming(cube)
+        self.assertEqual(result.dtype, np.float32)
+
+    def test_x_axis_before_y_axis(self):
+        """Test that the x and y axes of the output are in the order of the
+        input."""
+        cube = self.cube.copy()
+        cube.transpose([0, 1, 3, 2])
+        plugin = NBHood("square", 6000)
+        expected = plugin.process(cube.copy())
+        result = plugin.process_streaming(cube)
+        self.assertEqual(result.coords(), expected.coords())
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_lead_times(self):
+        """Test that the radius used for each slice depends on its lead
+        time."""
+        cube = set_up_cube(
+            zero_point_indices=((0, 0, 2, 2), (1, 0, 12, 3), (0, 1, 8, 8)),
+            num_time_points=2, num_grid_points=16, num_realization_points=3)
+        cube = add_forecast_reference_time_and_forecast_period(
+            cube, time_point=cube.coord("time").points, fp_point=[2, 3])
+        for method in ["square", "circular"]:
+            plugin = NBHood(method, [4000, 8000], lead_times=[2, 3])
+            expected = plugin.process(cube.copy())
+            result = plugin.process_streaming(cube)
+            self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_collapse_realizations(self):
+        """Test that the realizations are collapsed, one slice at a time."""
+        plugin = NBHood("square", 6000, collapse_realizations=True)
+        expected = plugin.process(self.cube.copy())
+        result = plugin.process_streaming(self.cube)
+        self.assertEqual(result.shape, expected.shape)
+        self.assertEqual(result.coords(), expected.coords())
+        self.assertEqual(result.cell_methods, expected.cell_methods)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_masked_data_and_mask_cube(self):
+        """Test that masked data and a mask cube give the same masked output
+        as processing the whole cube."""
+        mask = np.zeros(self.cube.shape, dtype=bool)
+        mask[:, 0, 2, 2] = True
+        mask[0, 1, 5, 5] = True
+        cube = self.cube.copy(
+            data=np.ma.masked_where(mask, self.cube.data))
+        mask_cube = cube[0, 0].copy(data=np.ones((16, 16), dtype=int))
+        mask_cube.remove_coord("realization")
+        mask_cube.remove_coord("time")
+        mask_cube.data[4:8, :] = 0
+        for collapse_realizations in [False, True]:
+            plugin = NBHood(
+                "square", 6000, collapse_realizations=collapse_realizations)
+            expected = plugin.process(cube.copy(), mask_cube=mask_cube)
+            result = plugin.process_streaming(cube, mask_cube=mask_cube)
+            self.assertArrayAlmostEqual(result.data, expected.data)
+            self.assertArrayEqual(result.data.mask, expected.data.mask)
+
+    def test_mask_cube_circular(self):
+        """Test that an error is raised if a mask cube is supplied for the
+        circular neighbourhood method."""
+        mask_cube = self.cube[0, 0].copy(data=np.ones((16, 16)))
+        msg = "A mask cube can only be used with the square"
+        with self.assertRaisesRegexp(ValueError, msg):
+            NBHood("circular", 6000).process_streaming(
+                self.cube, mask_cube=mask_cube)
+
+    def test_nan(self):
+        """Test that an error is raised when a slice contains NaN
+        values."""
+        data = self.cube.data
+        data[2, 1, 6, 6] = np.nan
+        msg = "NaN detected in input cube data"
+        with self.assertRaisesRegexp(ValueError, msg):
+            NBHood("square", 6000).process_streaming(
+                self.cube.copy(data=data))
+
+
 if __name__ == '__main__':
     unittest.main()
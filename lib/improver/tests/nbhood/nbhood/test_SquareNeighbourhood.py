@@ -33,15 +33,14 @@
 
 import unittest
 
-import copy
-
-from iris.coords import CellMethod, DimCoord
+from iris.coords import CellMethod
 from iris.cube import Cube, CubeList
 from iris.tests import IrisTest
 
 import numpy as np
 
 from improver.nbhood.nbhood import SquareNeighbourhood
+from improver.nbhood.summed_area_table import SummedAreaTable
 from improver.tests.nbhood.nbhood.test_NeighbourhoodProcessing import (
     set_up_cube)
 
@@ -57,786 +56,264 @@ class Test__repr__(IrisTest):
         self.assertEqual(result, msg)
 
 
-class Test_cumulate_array(IrisTest):
-
-    """Test for cumulating an array in the y and x dimension."""
-
-    def test_basic(self):
-        """
-        Test that the y-dimension and x-dimension accumulation produces the
-        intended result. A 2d cube is passed in.
-        """
-        data = np.array([[1., 2., 3., 4., 5.],
-                         [2., 4., 6., 8., 10.],
-                         [3., 6., 8., 11., 14.],
-                         [4., 8., 11., 15., 19.],
-                         [5., 10., 14., 19., 24.]])
-        cube = set_up_cube(
-            zero_point_indices=((0, 0, 2, 2),), num_time_points=1,
-            num_grid_points=5)
-        nan_mask = np.zeros(cube.data.shape, dtype=int).flatten()
-        result = SquareNeighbourhood().cumulate_array(cube)
-        self.assertIsInstance(result[0], Cube)
-        self.assertArrayAlmostEqual(result[0].data, data)
-        self.assertArrayAlmostEqual(result[1][0].data, nan_mask)
-
-    def test_for_multiple_times(self):
-        """
-        Test that the y-dimension and x-dimension accumulation produces the
-        intended result when the input cube has multiple times. The input
-        cube has an extra time dimension to ensure that a 3d cube is correctly
-        handled.
-        """
-        data = np.array([[[1., 2., 3., 4., 5.],
-                          [2., 4., 6., 8., 10.],
-                          [3., 6., 8., 11., 14.],
-                          [4., 8., 11., 15., 19.],
-                          [5., 10., 14., 19., 24.]],
-                         [[1., 2., 3., 4., 5.],
-                          [2., 4., 6., 8., 10.],
-                          [3., 6., 9., 12., 15.],
-                          [4., 8., 12., 15., 19.],
-                          [5., 10., 15., 19., 24.]],
-                         [[0., 1., 2., 3., 4.],
-                          [1., 3., 5., 7., 9.],
-                          [2., 5., 8., 11., 14.],
-                          [3., 7., 11., 15., 19.],
-                          [4., 9., 14., 19., 24.]]])
-        cube = set_up_cube(
-            zero_point_indices=((0, 0, 2, 2), (0, 1, 3, 3), (0, 2, 0, 0)),
-            num_time_points=3, num_grid_points=5)
-        nan_mask = np.zeros(cube[0, 0, :, :].data.shape, dtype=int).flatten()
-        result = SquareNeighbourhood().cumulate_array(cube)
-        self.assertIsInstance(result[0], Cube)
-        self.assertArrayAlmostEqual(result[0].data, data)
-        self.assertArrayAlmostEqual(result[1][0].data, nan_mask)
-
-    def test_for_multiple_times_nans(self):
-        """
-        Test that the y-dimension and x-dimension accumulation produces the
-        intended result when the input cube has multiple times. The input
-        cube has an extra time dimension to ensure that a 3d cube is correctly
-        handled.
-        """
-        data = np.array(
-            [[[0., 1., 2., 3., 4.],
-              [1., 3., 5., 7., 9.],
-              [2., 5., 7., 10., 13.],
-              [3., 7., 10., 14., 18.],
-              [4., 9., 13., 18., 23.]],
-             [[1., 2., 3., 4., 5.],
-              [2., 3., 5., 7., 9.],
-              [3., 5., 8., 11., 14.],
-              [4., 7., 11., 14., 18.],
-              [5., 9., 14., 18., 23.]],
-             [[0., 1., 2., 3., 4.],
-              [1., 3., 5., 7., 9.],
-              [2., 5., 8., 10., 13.],
-              [3., 7., 11., 14., 18.],
-              [4., 9., 14., 18., 23.]]])
-
-        cube = set_up_cube(
-            zero_point_indices=((0, 0, 2, 2), (0, 1, 3, 3), (0, 2, 0, 0)),
-            num_time_points=3, num_grid_points=5)
-        cube.data[0, 0, 0, 0] = np.nan
-        cube.data[0, 1, 1, 1] = np.nan
-        cube.data[0, 2, 2, 3] = np.nan
-        nan_mask = np.zeros(cube[0, 0, :, :].data.shape, dtype=int).flatten()
-        nan_mask_1 = copy.copy(nan_mask)
-        nan_mask_2 = copy.copy(nan_mask)
-        nan_mask_3 = copy.copy(nan_mask)
-        nan_mask_1[0] = 1
-        nan_mask_2[6] = 1
-        nan_mask_3[13] = 1
-        result = SquareNeighbourhood().cumulate_array(cube)
-        self.assertIsInstance(result[0], Cube)
-        self.assertArrayAlmostEqual(result[0].data, data)
-        self.assertArrayAlmostEqual(result[1][0].data, nan_mask_1)
-        self.assertArrayAlmostEqual(result[1][1].data, nan_mask_2)
-        self.assertArrayAlmostEqual(result[1][2].data, nan_mask_3)
-
-    def test_for_multiple_realizations_and_times(self):
-        """
-        Test that the y-dimension and x-dimension accumulation produces the
-        intended result when the input cube has multiple realizations and
-        times. The input cube has extra time and realization dimensions to
-        ensure that a 4d cube is correctly handled.
-        """
-        data = np.array([[[[1., 2., 3., 4., 5.],
-                           [2., 4., 6., 8., 10.],
-                           [3., 6., 8., 11., 14.],
-                           [4., 8., 11., 15., 19.],
-                           [5., 10., 14., 19., 24.]],
-                          [[0., 1., 2., 3., 4.],
-                           [1., 3., 5., 7., 9.],
-                           [2., 5., 8., 11., 14.],
-                           [3., 7., 11., 15., 19.],
-                           [4., 9., 14., 19., 24.]]],
-                         [[[1., 2., 3., 4., 5.],
-                           [2., 4., 6., 8., 10.],
-                           [3., 6., 9., 12., 15.],
-                           [4., 8., 12., 15., 19.],
-                           [5., 10., 15., 19., 24.]],
-                          [[1., 2., 3., 4., 5.],
-                           [2., 4., 6., 8., 10.],
-                           [3., 5., 8., 11., 14.],
-                           [4., 7., 11., 15., 19.],
-                           [5., 9., 14., 19., 24.]]]])
-        cube = set_up_cube(
-            zero_point_indices=(
-                (0, 0, 2, 2), (1, 0, 3, 3), (0, 1, 0, 0), (1, 1, 2, 1)),
-            num_time_points=2, num_grid_points=5, num_realization_points=2)
-        nan_mask = np.zeros(cube[0, 0, :, :].data.shape, dtype=int).flatten()
-        result = SquareNeighbourhood().cumulate_array(cube)
-        self.assertIsInstance(result[0], Cube)
-        self.assertArrayAlmostEqual(result[0].data, data)
-        self.assertArrayAlmostEqual(result[1][0].data, nan_mask)
-
-    def test_nan_array(self):
-        """Test correct nanmask is returned when array containing nan data
-           is input."""
-        data = np.array([[0., 1., 2., 3., 4.],
-                         [1., 3., 5., 7., 9.],
-                         [2., 5., 7., 10., 13.],
-                         [3., 7., 10., 14., 18.],
-                         [4., 9., 13., 18., 23.]])
-        nanmask = np.zeros([5, 5]).astype(bool)
-        nanmask[0, 0] = True
-        cube = set_up_cube(
-            zero_point_indices=((0, 0, 2, 2),), num_time_points=1,
-            num_grid_points=5)
-        cube.data[0, 0, 0, 0] = np.nan
-        result, nan_masks = SquareNeighbourhood().cumulate_array(cube)
-        self.assertIsInstance(result, Cube)
-        self.assertArrayAlmostEqual(result.data, data)
-        self.assertArrayAlmostEqual(nan_masks[0], nanmask)
-
-
-class Test_pad_coord(IrisTest):
-
-    """Test the padding of a coordinate."""
-
-    def setUp(self):
-        """Set up a cube."""
-        self.cube = set_up_cube(
-            zero_point_indices=((0, 0, 2, 2),), num_time_points=1,
-            num_grid_points=5)
-        coord_points_x = np.arange(10., 60., 10.)
-        x_bounds = np.array([coord_points_x - 5, coord_points_x + 5]).T
-        coord_points_y = np.arange(5., 105., 20.)
-        y_bounds = np.array([coord_points_y - 10, coord_points_y + 10]).T
-
-        self.cube.coord("projection_x_coordinate").points = coord_points_x
-        self.cube.coord("projection_x_coordinate").bounds = x_bounds
-        self.cube.coord("projection_y_coordinate").points = coord_points_y
-        self.cube.coord("projection_y_coordinate").bounds = y_bounds
-
-    def test_add(self):
-        """Test the functionality to add padding to the chosen coordinate.
-        Includes a test that the coordinate bounds array is modified to reflect
-        the new values."""
-        expected = np.array(
-            [-10., 0., 10., 20., 30., 40., 50., 60., 70.])
-        coord = self.cube.coord("projection_x_coordinate")
-        expected_bounds = np.array([expected - 5, expected + 5]).T
-        width = 1
-        method = "add"
-        new_coord = SquareNeighbourhood.pad_coord(coord, width, method)
-        self.assertIsInstance(new_coord, DimCoord)
-        self.assertArrayAlmostEqual(new_coord.points, expected)
-        self.assertArrayEqual(new_coord.bounds, expected_bounds)
-
-    def test_exception(self):
-        """Test an exception is raised if the chosen coordinate is
-        non-uniform."""
-        coord_points = np.arange(10., 60., 10.)
-        coord_points[0] = -200.
-        self.cube.coord("projection_x_coordinate").points = coord_points
-        coord = self.cube.coord("projection_x_coordinate")
-        width = 1
-        method = "add"
-        msg = "Non-uniform increments between grid points"
-        with self.assertRaisesRegexp(ValueError, msg):
-            SquareNeighbourhood.pad_coord(coord, width, method)
-
-    def test_remove(self):
-        """Test the functionality to remove padding from the chosen
-        coordinate. Includes a test that the coordinate bounds array is
-        modified to reflect the new values."""
-        expected = np.array([30.])
-        expected_bounds = np.array([expected - 5, expected + 5]).T
-        coord = self.cube.coord("projection_x_coordinate")
-        width = 1
-        method = "remove"
-        new_coord = SquareNeighbourhood.pad_coord(coord, width, method)
-        self.assertIsInstance(new_coord, DimCoord)
-        self.assertArrayAlmostEqual(new_coord.points, expected)
-        self.assertArrayEqual(new_coord.bounds, expected_bounds)
-
-
-class Test__create_cube_with_new_data(IrisTest):
-
-    """Test creating a new cube using a template cube."""
-
-    def setUp(self):
-        """Set up a cube."""
-        self.cube = set_up_cube(
-            zero_point_indices=((0, 0, 2, 2),), num_time_points=1,
-            num_grid_points=5)
-
-    def test_yx_order(self):
-        """Test that a cube is created with the expected order for the y and x
-        coordinates within the output cube, if the input cube has dimensions
-        of projection_y_coordinate and projection_x_coordinate."""
-        for sliced_cube in self.cube.slices(
-                ["projection_y_coordinate", "projection_x_coordinate"]):
-            break
-        data = sliced_cube.data
-        coord_x = sliced_cube.coord("projection_x_coordinate")
-        coord_y = sliced_cube.coord("projection_y_coordinate")
-
-        new_cube = SquareNeighbourhood()._create_cube_with_new_data(
-            sliced_cube, data, coord_x, coord_y)
-        self.assertIsInstance(new_cube, Cube)
-        self.assertArrayAlmostEqual(new_cube.data, data)
-        self.assertEqual(new_cube.coord_dims("projection_y_coordinate")[0], 0)
-        self.assertEqual(new_cube.coord_dims("projection_x_coordinate")[0], 1)
-
-    def test_xy_order(self):
-        """Test that a cube is created with the expected order for the y and x
-        coordinates within the output cube, if the input cube has dimensions
-        of projection_x_coordinate and projection_y_coordinate."""
-        for sliced_cube in self.cube.slices(
-                ["projection_x_coordinate", "projection_y_coordinate"]):
-            break
-        data = sliced_cube.data
-        coord_x = sliced_cube.coord("projection_x_coordinate")
-        coord_y = sliced_cube.coord("projection_y_coordinate")
-
-        new_cube = SquareNeighbourhood()._create_cube_with_new_data(
-            sliced_cube, data, coord_x, coord_y)
-        self.assertIsInstance(new_cube, Cube)
-        self.assertArrayAlmostEqual(new_cube.data, data)
-        self.assertEqual(new_cube.coord_dims("projection_y_coordinate")[0], 1)
-        self.assertEqual(new_cube.coord_dims("projection_x_coordinate")[0], 0)
-
-    def test_realization(self):
-        """Test that a cube is created with the expected order for coordinates
-        within the output cube, if the input cube has dimensions of
-        realization, projection_y_coordinate and projection_x_coordinate."""
-        for sliced_cube in self.cube.slices(
-            ["realization", "projection_y_coordinate",
-             "projection_x_coordinate"]):
-            break
-        data = sliced_cube.data
-        coord_x = sliced_cube.coord("projection_x_coordinate")
-        coord_y = sliced_cube.coord("projection_y_coordinate")
-
-        new_cube = SquareNeighbourhood()._create_cube_with_new_data(
-            sliced_cube, data, coord_x, coord_y)
-        self.assertIsInstance(new_cube, Cube)
-        self.assertArrayAlmostEqual(new_cube.data, data)
-        self.assertEqual(new_cube.coord_dims("realization")[0], 0)
-        self.assertEqual(new_cube.coord_dims("projection_y_coordinate")[0], 1)
-        self.assertEqual(new_cube.coord_dims("projection_x_coordinate")[0], 2)
-
-    def test_forecast_period(self):
-        """Test that a cube is created with the expected order for coordinates
-        within the output cube, if the input cube has dimensions of
-        projection_y_coordinate and projection_x_coordinate, and where the
-        input cube also has a forecast_period coordinate."""
-        for sliced_cube in self.cube.slices(
-            ["projection_y_coordinate",
-             "projection_x_coordinate"]):
-            break
-        fp_coord = DimCoord(np.array([10]), standard_name="forecast_period")
-        sliced_cube.add_aux_coord(fp_coord)
-        data = sliced_cube.data
-        coord_x = sliced_cube.coord("projection_x_coordinate")
-        coord_y = sliced_cube.coord("projection_y_coordinate")
-
-        new_cube = SquareNeighbourhood()._create_cube_with_new_data(
-            sliced_cube, data, coord_x, coord_y)
-        self.assertIsInstance(new_cube, Cube)
-        self.assertArrayAlmostEqual(new_cube.data, data)
-        self.assertEqual(new_cube.coord("forecast_period").points, 10)
-        self.assertEqual(new_cube.coord_dims("projection_y_coordinate")[0], 0)
-        self.assertEqual(new_cube.coord_dims("projection_x_coordinate")[0], 1)
-
-    def test_no_y_dimension_coordinate(self):
-        """Test that a cube is created with the expected y and x coordinates
-        within the output cube, if the input cube only has a
-        projection_y_coordinate dimension coordinate."""
-        for sliced_cube in self.cube.slices(
-                ["projection_x_coordinate"]):
-            break
-        data = sliced_cube.data
-        coord_x = sliced_cube.coord("projection_x_coordinate")
-        coord_y = sliced_cube.coord("projection_y_coordinate")
-        new_cube = SquareNeighbourhood()._create_cube_with_new_data(
-            sliced_cube, data, coord_x, coord_y)
-        self.assertIsInstance(new_cube, Cube)
-        self.assertArrayAlmostEqual(new_cube.data, data)
-        self.assertEqual(new_cube.coord_dims("projection_x_coordinate")[0], 0)
-        self.assertTrue(
-            new_cube.coords("projection_y_coordinate", dim_coords=False))
-
-
-class Test_pad_cube_with_halo(IrisTest):
-
-    """Test for padding a cube with a halo."""
-
-    def setUp(self):
-        """Set up a cube."""
-        self.cube = set_up_cube(
-            zero_point_indices=((0, 0, 2, 2),), num_time_points=1,
-            num_grid_points=5)
-
-    def test_basic(self):
-        """Test that padding the data in a cube with a halo has worked as
-        intended."""
-        for sliced_cube in self.cube.slices(
-            ["projection_y_coordinate",
-             "projection_x_coordinate"]):
-            break
-        expected = np.array(
-            [[1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 0., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.]])
-        width_x = width_y = 1
-        padded_cube = SquareNeighbourhood().pad_cube_with_halo(
-                          sliced_cube, width_x, width_y)
-        self.assertIsInstance(padded_cube, Cube)
-        self.assertArrayAlmostEqual(padded_cube.data, expected)
-
-    def test_different_widths(self):
-        """Test that padding the data in a cube with different widths has
-        worked as intended."""
-        for sliced_cube in self.cube.slices(
-            ["projection_y_coordinate",
-             "projection_x_coordinate"]):
-            break
-        expected = np.array(
-            [[1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 0., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 1., 1., 1., 1.]])
-        width_x = 1
-        width_y = 2
-        padded_cube = SquareNeighbourhood().pad_cube_with_halo(
-                          sliced_cube, width_x, width_y)
-        self.assertIsInstance(padded_cube, Cube)
-        self.assertArrayAlmostEqual(padded_cube.data, expected)
-
-    def test_zero_width(self):
-        """Test that padding the data in a cube with a width of zero has
-        worked as intended."""
-        for sliced_cube in self.cube.slices(
-            ["projection_y_coordinate",
-             "projection_x_coordinate"]):
-            break
-        expected = np.array(
-            [[1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1.],
-             [1., 1., 0., 1., 1.],
-             [1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1.]])
-        width_x = 0
-        width_y = 2
-        padded_cube = SquareNeighbourhood().pad_cube_with_halo(
-                          sliced_cube, width_x, width_y)
-        self.assertIsInstance(padded_cube, Cube)
-        self.assertArrayAlmostEqual(padded_cube.data, expected)
-
-
-class Test_remove_halo_from_cube(IrisTest):
+class Test_pad_array_with_halo(IrisTest):
 
-    """Test a halo is removed from the cube data."""
+    """Test for padding an array with a halo."""
 
     def setUp(self):
-        """Set up a cube."""
-        self.cube = set_up_cube(
-            zero_point_indices=((0, 0, 2, 2),), num_time_points=1,
-            num_grid_points=5)
+        """Set up an array."""
+        self.data = np.ones((5, 5))
+        self.data[2, 2] = 0.
+        self.data[0, 4] = 0.5
 
     def test_basic(self):
-        """Test that removing a halo of points from the data on a cube
-        has worked as intended."""
-        for sliced_cube in self.cube.slices(
-            ["projection_y_coordinate",
-             "projection_x_coordinate"]):
-            break
-        expected = np.array([[0.]])
-        width_x = width_y = 1
-        padded_cube = SquareNeighbourhood().remove_halo_from_cube(
-                          sliced_cube, width_x, width_y)
-        self.assertIsInstance(padded_cube, Cube)
-        self.assertArrayAlmostEqual(padded_cube.data, expected)
-
-    def test_different_widths(self):
-        """Test that removing a halo of points from the data on a cube
-        has worked as intended for different x and y widths."""
-        self.cube = set_up_cube(
-            zero_point_indices=((0, 0, 5, 5),), num_time_points=1,
-            num_grid_points=10)
-        for sliced_cube in self.cube.slices(
-            ["projection_y_coordinate",
-             "projection_x_coordinate"]):
-            break
+        """Test that padding a 2d array with a halo has worked as intended,
+        using the mean along the edge of the array as the padding value."""
         expected = np.array(
-            [[1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 0., 1., 1.]])
+            [[1., 1., 1., 1., 0.75, 0.75, 0.75],
+             [1., 1., 1., 1., 0.75, 0.75, 0.75],
+             [1., 1., 1., 1., 0.75, 0.75, 0.75],
+             [1., 1., 1., 1., 0.75, 0.75, 0.75],
+             [1., 1., 1., 1., 0.5, 0.5, 0.5],
+             [1., 1., 1., 1., 1., 1., 1.],
+             [0., 0., 0., 1., 1., 1., 1.],
+             [1., 1., 1., 1., 1., 1., 1.],
+             [1., 1., 1., 1., 1., 1., 1.],
+             [1., 1., 1., 1., 1., 1., 1.],
+             [1., 1., 1., 1., 1., 1., 1.],
+             [1., 1., 1., 1., 1., 1., 1.],
+             [1., 1., 1., 1., 1., 1., 1.]])
+        data = self.data[:, 2:]
         width_x = 1
         width_y = 2
-        padded_cube = SquareNeighbourhood().remove_halo_from_cube(
-                          sliced_cube, width_x, width_y)
-        self.assertIsInstance(padded_cube, Cube)
-        self.assertArrayAlmostEqual(padded_cube.data, expected)
-
-    def test_zero_width(self):
-        """Test that removing a halo of points from the data on a cube
-        has worked as intended, if a width of zero is specified."""
-        self.cube = set_up_cube(
-            zero_point_indices=((0, 0, 5, 5),), num_time_points=1,
-            num_grid_points=10)
-        for sliced_cube in self.cube.slices(
-            ["projection_y_coordinate",
-             "projection_x_coordinate"]):
-            break
+        result = SquareNeighbourhood.pad_array_with_halo(
+            data, 0, 1, width_x, width_y)
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_multi_dimensional(self):
+        """Test that only the y and x axes of a multi-dimensional array are
+        padded, and that each x-y slice is padded independently."""
+        data = np.array([self.data, 1. - self.data])
+        result = SquareNeighbourhood.pad_array_with_halo(data, 1, 2, 1, 1)
+        self.assertEqual(result.shape, (2, 9, 9))
+        for index, data_slice in enumerate(data):
+            expected = SquareNeighbourhood.pad_array_with_halo(
+                data_slice, 0, 1, 1, 1)
+            self.assertArrayAlmostEqual(result[index], expected)
+
+    def test_x_axis_before_y_axis(self):
+        """Test that the padding is consistent with a y-x ordered array when
+        the x axis precedes the y axis."""
+        expected = SquareNeighbourhood.pad_array_with_halo(
+            self.data, 0, 1, 1, 2)
+        result = SquareNeighbourhood.pad_array_with_halo(
+            self.data.T, 1, 0, 1, 2)
+        self.assertArrayAlmostEqual(result, expected.T)
+
+    def test_edge_mode(self):
+        """Test padding with the values at the edge of the array."""
+        data = np.arange(6.).reshape(2, 3)
         expected = np.array(
-            [[1., 1., 1., 1., 1., 1., 1., 1., 1., 1.],
-             [1., 1., 1., 1., 1., 0., 1., 1., 1., 1.]])
-        width_x = 0
-        width_y = 2
-        padded_cube = SquareNeighbourhood().remove_halo_from_cube(
-                          sliced_cube, width_x, width_y)
-        self.assertIsInstance(padded_cube, Cube)
-        self.assertArrayAlmostEqual(padded_cube.data, expected)
+            [[0., 0., 0., 1., 2., 2., 2.],
+             [0., 0., 0., 1., 2., 2., 2.],
+             [0., 0., 0., 1., 2., 2., 2.],
+             [3., 3., 3., 4., 5., 5., 5.],
+             [3., 3., 3., 4., 5., 5., 5.],
+             [3., 3., 3., 4., 5., 5., 5.]])
+        result = SquareNeighbourhood.pad_array_with_halo(
+            data, 0, 1, 1, 1, mode="edge")
+        self.assertArrayAlmostEqual(result, expected)
 
 
-class Test_mean_over_neighbourhood(IrisTest):
+class Test_remove_halo_from_array(IrisTest):
 
-    """Test for calculating mean value in neighbourhood."""
-
-    def setUp(self):
-        """Set up cube and expected results for tests."""
-
-        # This array is the output from cumulate_array when a 5x5 array of 1's
-        # with a 0 at the centre point (2,2) is passed in.
-        # Note that edge points are not handled correctly by default as no
-        # padding is applied.
-        self.data = np.array(
-            [[1., 2., 3., 4., 5.],
-             [2., 4., 6., 8., 10.],
-             [3., 6., 8., 11., 14.],
-             [4., 8., 11., 15., 19.],
-             [5., 10., 14., 19., 24.]])
-        self.cube = Cube(self.data, long_name='test')
-        self.x_coord = DimCoord([0, 1, 2, 3, 4], standard_name='longitude')
-        self.y_coord = DimCoord([0, 1, 2, 3, 4], standard_name='latitude')
-        self.cube.add_dim_coord(self.x_coord, 0)
-        self.cube.add_dim_coord(self.y_coord, 1)
-        self.result = np.array(
-            [[0.33333333, 0.44444444, -0.55555556, -0.55555556, 0.33333333],
-             [0.33333333, 0.33333333, -0.66666667, -0.66666667, 1.],
-             [1.55555556, 2., 0.88888889, 0.88888889, -0.55555556],
-             [-0.55555556, -0.66666667, 0.88888889, 0.88888889, -1.11111111],
-             [-1.66666667, -2.11111111, -0.55555556, -0.55555556, 0.33333333]])
-        self.width = 1
-        # Set up padded dataset to simulate padding.
-        self.padded_data = np.array(
-            [[1., 2., 3., 4., 5., 6., 7., 8., 9.],
-             [2., 4., 6., 8., 10., 12., 14., 16., 18.],
-             [3., 6., 9., 12., 15., 18., 21., 24., 27.],
-             [4., 8., 12., 16., 20., 24., 28., 32., 36.],
-             [5., 10., 15., 20., 24., 29., 34., 39., 44.],
-             [6., 12., 18., 24., 29., 35., 41., 47., 53.],
-             [7., 14., 21., 28., 34., 41., 48., 55., 62.],
-             [8., 16., 24., 32., 39., 47., 55., 63., 71.],
-             [9., 18., 27., 36., 44., 53., 62., 71., 80.]])
-        self.padded_cube = Cube(self.padded_data, long_name='test')
-        self.padded_x_coord = DimCoord(range(0, 9), standard_name='longitude')
-        self.padded_y_coord = DimCoord(range(0, 9), standard_name='latitude')
-        self.padded_cube.add_dim_coord(self.padded_x_coord, 0)
-        self.padded_cube.add_dim_coord(self.padded_y_coord, 1)
-        self.padded_result = np.array(
-            [[1., 1., 1., 1., 1.],
-             [1., 0.88888889, 0.88888889, 0.88888889, 1.],
-             [1., 0.88888889, 0.88888889, 0.88888889, 1.],
-             [1., 0.88888889, 0.88888889, 0.88888889, 1.],
-             [1., 1., 1., 1., 1.]])
+    """Test a halo is removed from an array."""
 
     def test_basic(self):
-        """Test cube with correct data is produced when mean over
-           neighbourhood is calculated."""
-        nan_masks = [np.zeros(self.cube.data.shape, dtype=int)]
-        result = SquareNeighbourhood().mean_over_neighbourhood(
-            self.cube, self.width, self.width, nan_masks)
-        self.assertIsInstance(result, Cube)
-        self.assertArrayAlmostEqual(result.data, self.result)
-
-    def test_basic_padded(self):
-        """Test cube with correct data is produced when mean over
-           neighbourhood is calculated."""
-        nan_masks = [np.zeros(self.padded_cube.data.shape, dtype=int)]
-        result = SquareNeighbourhood().mean_over_neighbourhood(
-            self.padded_cube, self.width, self.width, nan_masks)
-        self.assertIsInstance(result, Cube)
-        self.assertArrayAlmostEqual(
-            result.data[2:-2, 2:-2], self.padded_result)
+        """Test that removing a halo from a 2d array has worked as
+        intended."""
+        data = np.arange(63.).reshape(7, 9)
+        result = SquareNeighbourhood.remove_halo_from_array(data, 0, 1, 2, 1)
+        self.assertArrayAlmostEqual(result, data[2:5, 4:5])
 
-    def test_multiple_times(self):
-        """Test mean over neighbourhood with more than two dimensions."""
-        data = np.array([self.padded_data, self.padded_data])
-        cube = Cube(data, long_name='two times test')
-        cube.add_dim_coord(self.padded_x_coord, 1)
-        cube.add_dim_coord(self.padded_y_coord, 2)
-        t_coord = DimCoord([0, 1], standard_name='time')
-        cube.add_dim_coord(t_coord, 0)
-        nan_masks = [np.zeros(cube.data[0].shape, dtype=int)] * 2
-        result = SquareNeighbourhood().mean_over_neighbourhood(
-            cube, self.width, self.width, nan_masks)
-        self.assertArrayAlmostEqual(
-            result.data[0, 2:-2, 2:-2], self.padded_result)
-        self.assertArrayAlmostEqual(
-            result.data[1, 2:-2, 2:-2], self.padded_result)
+    def test_multi_dimensional(self):
+        """Test that only the y and x axes of a multi-dimensional array are
+        trimmed."""
+        data = np.arange(126.).reshape(7, 2, 9)
+        result = SquareNeighbourhood.remove_halo_from_array(data, 0, 2, 1, 1)
+        self.assertArrayAlmostEqual(result, data[2:5, :, 2:7])
 
-    def test_nan_mask(self):
-        """Test the correct result is returned when a nan must be substituted
-           into the final array. Note: this type of data should also be masked,
-           so the expected_data array looks strange because there is further
-           processing to be done on it."""
-        cube = self.padded_cube
-        nan_masks = [np.zeros([9, 9]).astype(bool)]
-        nan_masks[0][2, 2] = True
-        expected_data = self.padded_result
-        expected_data[0, 0] = np.nan
-        result = SquareNeighbourhood().mean_over_neighbourhood(
-            cube, self.width, self.width, nan_masks)
-        self.assertArrayAlmostEqual(result.data[2:-2, 2:-2], expected_data)
+    def test_round_trip(self):
+        """Test that removing the halo recovers the array prior to
+        padding."""
+        data = np.random.random((2, 5, 6))
+        padded_data = SquareNeighbourhood.pad_array_with_halo(
+            data, 1, 2, 2, 1)
+        result = SquareNeighbourhood.remove_halo_from_array(
+            padded_data, 1, 2, 2, 1)
+        self.assertArrayAlmostEqual(result, data)
 
 
-class Test__set_up_cubes_to_be_neighbourhooded(IrisTest):
+class Test__valid_points_from_mask_cube(IrisTest):
 
-    """Test the set up of cubes prior to neighbourhooding."""
+    """Test finding the valid points from a mask cube."""
 
     def setUp(self):
-        """Set up a cube."""
+        """Set up a cube and a land-sea mask cube."""
         self.cube = set_up_cube(
             zero_point_indices=((0, 0, 2, 2),), num_time_points=1,
             num_grid_points=5)
+        self.landmask = np.ones((5, 5), dtype=bool)
+        self.landmask[:, 0] = False
+        self.mask_cube = self.cube[0, 0].copy(data=self.landmask)
+
+    def test_land_sea_mask(self):
+        """Test that the land points of a land-sea mask are valid."""
+        result = SquareNeighbourhood._valid_points_from_mask_cube(
+            self.cube, self.mask_cube)
+        self.assertArrayEqual(result, self.landmask)
+
+    def test_topographic_band_mask(self):
+        """Test that only unmasked points within the band are valid for a
+        masked topographic band mask."""
+        band = np.ma.masked_array(
+            self.landmask.astype(int), mask=np.logical_not(self.landmask))
+        band[0, 1] = 0
+        self.mask_cube.data = band
+        expected = self.landmask.copy()
+        expected[0, 1] = False
+        result = SquareNeighbourhood._valid_points_from_mask_cube(
+            self.cube, self.mask_cube)
+        self.assertArrayEqual(result, expected)
+
+    def test_x_axis_before_y_axis(self):
+        """Test that the valid points have dimensions of y and x, if the
+        mask cube has the x axis before the y axis."""
+        self.mask_cube.transpose()
+        result = SquareNeighbourhood._valid_points_from_mask_cube(
+            self.cube, self.mask_cube)
+        self.assertArrayEqual(result, self.landmask)
+
+    def test_mismatched_coordinates(self):
+        """Test that an error is raised if the coordinates of the mask cube
+        do not match those of the cube."""
+        mask_cube = set_up_cube(
+            zero_point_indices=((0, 0, 3, 3),), num_grid_points=7)[0, 0]
+        msg = "coordinate of the mask cube does not match"
+        with self.assertRaisesRegexp(ValueError, msg):
+            SquareNeighbourhood._valid_points_from_mask_cube(
+                self.cube, mask_cube)
 
-    def test_without_masked_data(self):
-        """Test setting up cubes to be neighbourhooded when the input cube
-        does not contain masked arrays."""
-        cubes = (
-            SquareNeighbourhood._set_up_cubes_to_be_neighbourhooded(self.cube))
-        self.assertIsInstance(cubes, CubeList)
-        self.assertEqual(len(cubes), 1)
-        self.assertEqual(cubes[0], self.cube)
+    def test_too_many_dimensions(self):
+        """Test that an error is raised if the mask cube has dimensions
+        other than x and y."""
+        msg = "The mask cube must only have x and y dimensions"
+        with self.assertRaisesRegexp(ValueError, msg):
+            SquareNeighbourhood._valid_points_from_mask_cube(
+                self.cube, self.cube)
 
-    def test_with_masked_data(self):
-        """Test setting up cubes to be neighbourhooded when the input cube
-        contains masked arrays."""
-        cube = self.cube
-        data = cube.data
-        cube.data[0, 0, 1, 3] = 0.5
-        cube.data[0, 0, 3, 3] = 0.5
-        cube.data = np.ma.masked_equal(data, 0.5)
-        mask = np.logical_not(cube.data.mask.astype(int))
-        data = cube.data.data * mask
-        cubes = (
-            SquareNeighbourhood._set_up_cubes_to_be_neighbourhooded(
-                cube.copy()))
-        self.assertIsInstance(cubes, CubeList)
-        self.assertEqual(len(cubes), 2)
-        self.assertArrayAlmostEqual(cubes[0].data, data)
-        self.assertArrayAlmostEqual(cubes[1].data, mask)
-
-
-class Test__pad_and_calculate_neighbourhood(IrisTest):
-
-    """Test the padding and calculation of neighbourhood processing."""
+
+class Test_create_summed_area_tables(IrisTest):
+
+    """Test the creation of summed-area tables for a cube."""
 
     def setUp(self):
         """Set up a cube."""
         self.cube = set_up_cube(
-            zero_point_indices=((0, 0, 1, 1),), num_time_points=1,
-            num_grid_points=3)
-        for sliced_cube in self.cube.slices(
-            ["projection_y_coordinate",
-             "projection_x_coordinate"]):
-            break
-        sliced_cube.remove_coord("realization")
-        sliced_cube.remove_coord("time")
-        self.cube = sliced_cube
+            zero_point_indices=((0, 0, 2, 2),), num_time_points=2,
+            num_grid_points=5)
 
     def test_without_masked_data(self):
-        """Test setting up cubes to be padded and then passed into
-        neighbourhood processing when the input cubes do not contain masked
-        arrays."""
-        expected = np.array(
-            [[1.66666667, 1.66666667, -1.22222222, -1.22222222, -1.22222222,
-              -1.33333333, 1.66666667],
-             [1.66666667, 1.66666667, -1.22222222, -1.22222222, -1.22222222,
-              -1.33333333, 2.44444444],
-             [3.22222222, 4., 0.88888889, 0.88888889, 0.88888889,
-              1., -1.22222222],
-             [-1.22222222, -1.22222222, 0.88888889, 0.88888889, 0.88888889,
-              1., -1.22222222],
-             [-1.22222222, -1.22222222, 0.88888889, 0.88888889, 0.88888889,
-              1., -1.22222222],
-             [-1.22222222, -1.22222222, 1., 1., 1.,
-              1., -2.11111111],
-             [-2.88888889, -3.66666667, -1.22222222, -1.22222222, -1.22222222,
-              -1.33333333,  1.66666667]])
-        grid_cells_x = grid_cells_y = 1
-        cubes = CubeList([self.cube])
-        nbcubes = (
-            SquareNeighbourhood()._pad_and_calculate_neighbourhood(
-                cubes, grid_cells_x, grid_cells_y))
-        self.assertIsInstance(nbcubes, CubeList)
-        self.assertEqual(len(nbcubes), 1)
-        self.assertArrayAlmostEqual(nbcubes[0].data, expected)
+        """Test that a single table is created, with the y and x axes as the
+        trailing axes, when the input cube does not contain masked data."""
+        tables = SquareNeighbourhood().create_summed_area_tables(self.cube)
+        self.assertEqual(len(tables), 1)
+        self.assertIsInstance(tables[0], SummedAreaTable)
+        self.assertArrayAlmostEqual(tables[0].data, self.cube.data)
 
     def test_with_masked_data(self):
-        """Test setting up cubes to be padded and then passed into
-        neighbourhood processing when the input cubes contain masked
-        arrays."""
-        expected_data = np.array(
-            [[1.66666667, 1.66666667, -1.22222222, -1.22222222, -1.22222222,
-              -1.33333333, 1.66666667],
-             [1.66666667, 1.66666667, -1.22222222, -1.22222222, -1.22222222,
-              -1.33333333, 2.44444444],
-             [3.22222222, 4., 0.88888889, 0.88888889, 0.88888889,
-              1., -1.22222222],
-             [-1.22222222, -1.22222222, 0.88888889, 0.88888889, 0.88888889,
-              1., -1.22222222],
-             [-1.22222222, -1.22222222, 0.88888889, 0.88888889, 0.88888889,
-              1., -1.22222222],
-             [-1.22222222, -1.22222222, 1., 1., 1.,
-              1., -2.11111111],
-             [-2.88888889, -3.66666667, -1.22222222, -1.22222222, -1.22222222,
-              -1.33333333,  1.66666667]])
-        expected_mask = np.array(
-            [[0.55555556, 0.77777778, -0.11111111, -0.44444444, -0.77777778,
-              -1., 0.44444444],
-             [0.77777778, 1.11111111, -0.11111111, -0.55555556, -1.,
-              -1.33333333, 0.55555556],
-             [1., 1.44444444, 0.11111111, 0.22222222, 0.33333333,
-              0.33333333, -0.22222222],
-             [-0.33333333, -0.44444444, 0.11111111, 0.33333333, 0.55555556,
-              0.66666667, -0.33333333],
-             [-0.55555556, -0.77777778, 0.11111111, 0.44444444, 0.77777778,
-              1., -0.44444444],
-             [-0.77777778, -1.11111111, 0., 0.33333333, 0.66666667,
-              1., -0.33333333],
-             [-0.66666667, -1., -0.11111111, -0.33333333, -0.55555556,
-              -0.66666667, 0.33333333]])
-
-        grid_cells_x = grid_cells_y = 1
-        cube = self.cube
-        mask_cube = cube.copy()
-        mask_cube.data[1, 2] = 0.5
-        mask_cube.data[2, 2] = 0.5
-        mask_cube.data = np.ma.masked_equal(mask_cube.data, 0.5)
-        mask_cube.rename('mask_data')
-        mask_cube.data = np.logical_not(mask_cube.data.astype(int))
-        cubes = CubeList([cube, mask_cube])
-        nbcubes = (
-            SquareNeighbourhood()._pad_and_calculate_neighbourhood(
-                cubes, grid_cells_x, grid_cells_y))
-        self.assertIsInstance(nbcubes, CubeList)
-        self.assertEqual(len(nbcubes), 2)
-        self.assertArrayAlmostEqual(nbcubes[0].data, expected_data)
-        self.assertArrayAlmostEqual(nbcubes[1].data, expected_mask)
-
-
-class Test__remove_padding_and_mask(IrisTest):
-
-    """Test the removal of padding and dealing with masked data."""
+        """Test that tables are created for both the data and the mask when
+        the input cube contains masked data."""
+        self.cube.data = np.ma.masked_equal(self.cube.data, 0)
+        tables = SquareNeighbourhood().create_summed_area_tables(self.cube)
+        expected_mask = np.ones(self.cube.shape, dtype=bool)
+        expected_mask[0, 0, 2, 2] = False
+        self.assertEqual(len(tables), 2)
+        self.assertArrayEqual(tables[1].data, expected_mask)
+
+    def test_with_mask_cube(self):
+        """Test that the table of valid points only has dimensions of y and
+        x when a mask cube is supplied for unmasked data."""
+        landmask = np.ones((5, 5), dtype=bool)
+        landmask[:, 0] = False
+        mask_cube = self.cube[0, 0].copy(data=landmask)
+        tables = SquareNeighbourhood().create_summed_area_tables(
+            self.cube, mask_cube=mask_cube)
+        self.assertEqual(len(tables), 2)
+        self.assertArrayAlmostEqual(
+            tables[0].data, self.cube.data * landmask)
+        self.assertArrayEqual(tables[1].data, landmask)
+
+    def test_with_masked_data_and_mask_cube(self):
+        """Test that the valid points combine the mask of the data and the
+        mask cube."""
+        landmask = np.ones((5, 5), dtype=bool)
+        landmask[:, 0] = False
+        mask_cube = self.cube[0, 0].copy(data=landmask)
+        self.cube.data = np.ma.masked_equal(self.cube.data, 0)
+        tables = SquareNeighbourhood().create_summed_area_tables(
+            self.cube, mask_cube=mask_cube)
+        expected_mask = np.ones(self.cube.shape, dtype=bool)
+        expected_mask[0, 0, 2, 2] = False
+        expected_mask[..., 0] = False
+        self.assertArrayEqual(tables[1].data, expected_mask)
+
+    def test_x_axis_before_y_axis(self):
+        """Test that the y and x axes are moved to be the trailing axes of
+        the table."""
+        self.cube.transpose([0, 1, 3, 2])
+        self.cube.data[0, 0, 0, 1] = 0.5
+        tables = SquareNeighbourhood().create_summed_area_tables(self.cube)
+        self.assertEqual(tables[0].data[0, 0, 1, 0], 0.5)
+
+
+class Test_calculate_neighbourhood(IrisTest):
+
+    """Test the calculation of a neighbourhood from summed-area tables."""
 
     def setUp(self):
         """Set up a cube."""
-        self.padded_cube = set_up_cube(
-            zero_point_indices=((0, 0, 3, 3),), num_time_points=1,
-            num_grid_points=7)
         self.cube = set_up_cube(
             zero_point_indices=((0, 0, 1, 1),), num_time_points=1,
             num_grid_points=3)
 
     def test_without_masked_data(self):
-        """Test that removing a halo of points from the data on a cube
-        has worked as intended when the input data is not masked."""
+        """Test the neighbourhood calculation when the input cube does not
+        contain masked data."""
         expected = np.array(
-            [[1., 1., 1.],
-             [1., 0., 1.],
-             [1., 1., 1.]])
-        grid_cells_x = grid_cells_y = 1
-        padded_cubes = CubeList([self.padded_cube])
-        cubes = CubeList([self.cube])
-        nbcube = (
-            SquareNeighbourhood()._remove_padding_and_mask(
-                padded_cubes, cubes, self.padded_cube.name(),
-                grid_cells_x, grid_cells_y))
-        self.assertIsInstance(nbcube, Cube)
-        self.assertArrayAlmostEqual(nbcube.data, expected)
+            [[0.88888889, 0.88888889, 0.88888889],
+             [0.88888889, 0.88888889, 0.88888889],
+             [0.88888889, 0.88888889, 0.88888889]])
+        plugin = SquareNeighbourhood()
+        tables = plugin.create_summed_area_tables(self.cube)
+        result = plugin.calculate_neighbourhood(self.cube, tables, 1, 1)
+        self.assertIsInstance(result, Cube)
+        self.assertArrayAlmostEqual(result.data[0, 0], expected)
 
     def test_with_masked_data(self):
-        """Test that removing a halo of points from the data on a cube
-        has worked as intended when the input data is masked."""
+        """Test that the neighbourhood mean is corrected for the masked
+        points, and the output is masked where the input was masked."""
         expected = np.array(
-            [[1., np.nan, 1.],
-             [1., np.nan, 1.],
-             [1., 1., 1.]])
-        grid_cells_x = grid_cells_y = 1
-        padded_cube = self.padded_cube
-        # Set up padded cube and associated mask.
-        mask_cube = padded_cube.copy()
-        masked_array = np.ones(mask_cube.data.shape)
-        masked_array[0, 0, 3, 3] = 0
-        masked_array[0, 0, 2, 3] = 0
-        mask_cube.rename('mask_data')
-        mask_cube.data = masked_array.astype(bool)
-        padded_cubes = CubeList([padded_cube, mask_cube])
-        # Set up cube without padding and associated mask.
-        cube = self.cube
-        mask_cube = cube.copy()
-        masked_array = np.ones(mask_cube.data.shape)
-        masked_array[0, 0, 1, 1] = 0
-        masked_array[0, 0, 0, 1] = 0
-        mask_cube.rename('mask_data')
-        mask_cube.data = masked_array.astype(bool)
-        cubes = CubeList([cube, mask_cube])
-        nbcube = (
-            SquareNeighbourhood()._remove_padding_and_mask(
-                padded_cubes, cubes, padded_cube.name(),
-                grid_cells_x, grid_cells_y))
-        self.assertIsInstance(nbcube, Cube)
-        self.assertArrayAlmostEqual(nbcube.data.filled(), expected)
+            [[0.85714286, np.nan, 0.85714286],
+             [0.875, 0.875, 0.875],
+             [0.88888889, 0.88888889, 0.88888889]])
+        self.cube.data[0, 0, 0, 1] = 0.5
+        self.cube.data = np.ma.masked_equal(self.cube.data, 0.5)
+        plugin = SquareNeighbourhood()
+        tables = plugin.create_summed_area_tables(self.cube)
+        result = plugin.calculate_neighbourhood(self.cube, tables, 1, 1)
+        self.assertIsInstance(result.data, np.ma.MaskedArray)
+        self.assertArrayAlmostEqual(result.data.filled()[0, 0], expected)
 
 
 class Test_run(IrisTest):
@@ -886,6 +363,33 @@ class Test_run(IrisTest):
         result = SquareNeighbourhood().run(cube, self.RADIUS)
         self.assertArrayAlmostEqual(result.data.filled(), expected_array)
 
+    def test_mask_cube(self):
+        """Test that the run method produces a cube with correct data when a
+           mask cube, such as a land-sea mask, is passed in."""
+        cube = set_up_cube(
+            zero_point_indices=((0, 0, 2, 2),), num_time_points=1,
+            num_grid_points=5)
+        cube.data = np.array([[[[1., 1., 0., 1., 1.],
+                                [1., 1., 1., 0., 0.],
+                                [1., 0., 1., 0., 0.],
+                                [0., 0., 1., 1., 0.],
+                                [0., 1., 1., 0., 1.]]]])
+        mask_cube = cube[0, 0].copy(data=np.array([[0, 0, 1, 1, 0],
+                                                   [0, 1, 1, 1, 0],
+                                                   [0, 0, 1, 1, 1],
+                                                   [0, 0, 1, 1, 0],
+                                                   [0, 0, 1, 1, 0]]))
+        expected_array = np.array(
+            [[np.nan, np.nan, 0.57142857, 0.5, np.nan],
+             [np.nan, 0.75, 0.57142857, 0.42857143, np.nan],
+             [np.nan, np.nan, 0.71428571, 0.57142857, 0.2],
+             [np.nan, np.nan, 0.66666667, 0.57142857, np.nan],
+             [np.nan, np.nan, 0.66666667, 0.66666667, np.nan]])
+        result = SquareNeighbourhood().run(
+            cube, self.RADIUS, mask_cube=mask_cube)
+        self.assertIsInstance(result.data, np.ma.MaskedArray)
+        self.assertArrayAlmostEqual(result.data.filled(), expected_array)
+
     def test_nan_array(self):
         """Test that the an array containing nans is handled correctly."""
         data = np.array(
@@ -1039,5 +543,163 @@ class Test_run(IrisTest):
         self.assertDictEqual(result.attributes, cube.attributes)
 
 
+if __name__ == '__main__':
+    unittest.main()
+
+    def test_single_precision(self):
+        """Test that a single precision cube gives a single precision result,
+        which matches the result for the same cube at double precision."""
+        cube = set_up_cube(
+            zero_point_indices=((0, 0, 2, 2),), num_time_points=2,
+            num_grid_points=40)
+        cube.data = np.random.RandomState(0).rand(
+            *cube.shape).astype(np.float32)
+        reference_cube = cube.copy(data=cube.data.astype(np.float64))
+        result = SquareNeighbourhood().run(cube, 3*self.RADIUS)
+        expected = SquareNeighbourhood().run(reference_cube, 3*self.RADIUS)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertTrue(np.allclose(
+            result.data, expected.data, rtol=1e-5, atol=0.))
+
+    def test_single_precision_masked_array(self):
+        """Test that a masked single precision cube gives a single precision
+        result, which matches the result at double precision."""
+        cube = set_up_cube(
+            zero_point_indices=((0, 0, 2, 2),), num_time_points=1,
+            num_grid_points=40)
+        random_state = np.random.RandomState(0)
+        cube.data = np.ma.masked_array(
+            random_state.rand(*cube.shape).astype(np.float32),
+            mask=random_state.rand(*cube.shape) > 0.7)
+        reference_cube = cube.copy(data=cube.data.astype(np.float64))
+        result = SquareNeighbourhood().run(cube, 3*self.RADIUS)
+        expected = SquareNeighbourhood().run(reference_cube, 3*self.RADIUS)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertArrayEqual(result.data.mask, expected.data.mask)
+        self.assertTrue(np.ma.allclose(
+            result.data, expected.data, rtol=1e-5, atol=0.))
+
+
+class Test_run_multiple_radii(IrisTest):
+
+    """Test the run_multiple_radii method on the SquareNeighbourhood class."""
+
+    def setUp(self):
+        """Set up a cube."""
+        self.cube = set_up_cube(
+            zero_point_indices=((0, 0, 3, 3),), num_time_points=1,
+            num_grid_points=7)
+
+    def test_basic(self):
+        """Test that a cube is returned for each radius, matching the output
+        of the run method for the same radius."""
+        radii = [2500, 4500]
+        plugin = SquareNeighbourhood()
+        result = plugin.run_multiple_radii(self.cube.copy(), radii)
+        self.assertIsInstance(result, CubeList)
+        self.assertEqual(len(result), 2)
+        for radius, result_cube in zip(radii, result):
+            expected = plugin.run(self.cube.copy(), radius)
+            self.assertArrayAlmostEqual(result_cube.data, expected.data)
+
+    def test_masked_array(self):
+        """Test that each cube is masked where the input cube is masked."""
+        self.cube.data = np.ma.masked_equal(self.cube.data, 0)
+        mask = self.cube.data.mask[0, 0]
+        result = SquareNeighbourhood().run_multiple_radii(
+            self.cube, [2500, 4500])
+        for result_cube in result:
+            self.assertArrayEqual(result_cube.data.mask, mask)
+
+    def test_metadata(self):
+        """Test that the metadata of each cube matches the input cube."""
+        self.cube.attributes = {"Conventions": "CF-1.5"}
+        self.cube.add_cell_method(CellMethod("mean", coords="time"))
+        result = SquareNeighbourhood().run_multiple_radii(
+            self.cube, [2500, 4500])
+        for result_cube in result:
+            self.assertTupleEqual(
+                result_cube.cell_methods, self.cube.cell_methods)
+            self.assertDictEqual(result_cube.attributes, self.cube.attributes)
+
+
+class Test_run_along_coord(IrisTest):
+
+    """Test the run_along_coord method on the SquareNeighbourhood class."""
+
+    def setUp(self):
+        """Set up a cube."""
+        self.cube = set_up_cube(
+            zero_point_indices=((0, 0, 3, 3), (0, 1, 3, 3)),
+            num_time_points=2, num_grid_points=7)
+
+    def test_basic(self):
+        """Test that each time is neighbourhood processed using the
+        corresponding radius."""
+        radii = [2500, 4500]
+        plugin = SquareNeighbourhood()
+        result = plugin.run_along_coord(self.cube.copy(), radii, "time")
+        self.assertIsInstance(result, Cube)
+        self.assertEqual(result.shape, self.cube.shape[1:])
+        for index, radius in enumerate(radii):
+            expected = plugin.run(self.cube[:, index].copy(), radius)
+            self.assertArrayAlmostEqual(result.data[index], expected.data)
+
+    def test_shared_radii(self):
+        """Test that times whose radii give the same number of grid cells,
+        including times that are not adjacent, are processed using the
+        corresponding radius."""
+        cube = set_up_cube(
+            zero_point_indices=((0, 0, 3, 3), (0, 1, 3, 3), (0, 2, 1, 1)),
+            num_time_points=3, num_grid_points=7)
+        radii = [2500, 4500, 2600]
+        plugin = SquareNeighbourhood()
+        result = plugin.run_along_coord(cube.copy(), radii, "time")
+        for index, radius in enumerate(radii):
+            expected = plugin.run(cube[:, index].copy(), radius)
+            self.assertArrayAlmostEqual(result.data[index], expected.data)
+
+    def test_masked_array(self):
+        """Test that the output is masked where the input cube is masked."""
+        self.cube.data = np.ma.masked_equal(self.cube.data, 0)
+        mask = self.cube.data.mask[0]
+        result = SquareNeighbourhood().run_along_coord(
+            self.cube, [2500, 4500], "time")
+        self.assertIsInstance(result.data, np.ma.MaskedArray)
+        self.assertArrayEqual(result.data.mask, mask)
+
+    def test_scalar_coord(self):
+        """Test that a cube with a scalar coordinate is processed using the
+        single radius supplied."""
+        cube = self.cube[:, 0]
+        result = SquareNeighbourhood().run_along_coord(
+            cube.copy(), [2500], "time")
+        expected = SquareNeighbourhood().run(cube.copy(), 2500)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_mask_cube(self):
+        """Test that using a mask cube matches masking the input cube with
+        the same mask, for each time."""
+        landmask = np.ones((7, 7), dtype=bool)
+        landmask[:, :2] = False
+        mask_cube = self.cube[0, 0].copy(data=landmask)
+        masked_cube = self.cube.copy(data=np.ma.masked_where(
+            np.broadcast_to(np.logical_not(landmask), self.cube.shape),
+            self.cube.data))
+        plugin = SquareNeighbourhood()
+        result = plugin.run_along_coord(
+            self.cube, [2500, 4500], "time", mask_cube=mask_cube)
+        expected = plugin.run_along_coord(masked_cube, [2500, 4500], "time")
+        self.assertArrayEqual(result.data.mask, expected.data.mask)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_mismatched_radii(self):
+        """Test that an error is raised if the number of radii does not
+        match the number of points along the coordinate."""
+        msg = "The number of radii"
+        with self.assertRaisesRegexp(ValueError, msg):
+            SquareNeighbourhood().run_along_coord(self.cube, [2500], "time")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -174,6 +174,34 @@ class Test_adjust_nsize_for_ens(IrisTest):
         self.assertAlmostEqual(result, 9.2376043070399998)
 
 
+class Test_group_radii_by_grid_cells(IrisTest):
+
+    """Test grouping radii by the number of grid cells."""
+
+    def setUp(self):
+        """Set up a cube with a grid spacing of about 2000 metres."""
+        self.cube = set_up_cube()
+
+    def test_contiguous(self):
+        """Test that contiguous points with radii giving the same number of
+        grid cells are grouped into slices, in order of occurrence."""
+        result = Utilities.group_radii_by_grid_cells(
+            self.cube, [4500., 5000., 5500., 8100., 10000.])
+        self.assertEqual(result, [((2, 2), slice(0, 3)),
+                                  ((4, 4), slice(3, 5))])
+
+    def test_non_contiguous(self):
+        """Test that points that are not contiguous are grouped into an
+        array of indices."""
+        result = Utilities.group_radii_by_grid_cells(
+            self.cube, [4500., 8100., 5000.])
+        self.assertEqual(len(result), 2)
+        grid_cells, points = result[0]
+        self.assertEqual(grid_cells, (2, 2))
+        self.assertArrayEqual(points, [0, 2])
+        self.assertEqual(result[1], ((4, 4), slice(1, 2)))
+
+
 class Test_check_cube_coordinates(IrisTest):
 
     """Test check_cube_coordinates successfully promotes scalar coordinates to
@@ -214,6 +242,17 @@ class Test_check_cube_coordinates(IrisTest):
         result = Utilities.check_cube_coordinates(cube, new_cube)
         self.assertEqual(result.dim_coords, cube.dim_coords)
 
+    def test_reordering_of_three_dimensions(self):
+        """Test case in which the order of three dimensions must be corrected
+        to match the progenitor cube, so that the required transpose is not
+        its own inverse."""
+        cube = set_up_cube(num_realization_points=2, num_time_points=3)
+        new_cube = cube.copy()
+        cube.transpose(new_order=[1, 2, 0, 3])
+        result = Utilities.check_cube_coordinates(cube, new_cube)
+        self.assertEqual(result.dim_coords, cube.dim_coords)
+        self.assertArrayEqual(result.data, cube.data)
+
     def test_coord_promotion_missing_scalar(self):
         """Test case in which a scalar coordinate has been lost from new_cube,
         meaning the cube undergoing checking ends up with different dimension
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Unit tests for the nbhood.percentiles.NeighbourhoodPercentiles plugin."""
+
+
+import unittest
+
+from iris.cube import Cube
+from iris.tests import IrisTest
+
+import numpy as np
+
+from improver.nbhood.percentiles import NeighbourhoodPercentiles
+from improver.tests.nbhood.nbhood.test_NeighbourhoodProcessing import (
+    set_up_cube)
+
+
+class Test__init__(IrisTest):
+
+    """Test the __init__ method of NeighbourhoodPercentiles."""
+
+    def test_default_percentiles(self):
+        """Test that the default percentiles are used if none are
+        requested."""
+        plugin = NeighbourhoodPercentiles("square", 2000)
+        self.assertEqual(
+            plugin.percentiles, NeighbourhoodPercentiles.DEFAULT_PERCENTILES)
+
+    def test_invalid_method(self):
+        """Test that an error is raised for an unsupported neighbourhood
+        method."""
+        msg = "The neighbourhood_method requested: nonsense"
+        with self.assertRaisesRegexp(KeyError, msg):
+            NeighbourhoodPercentiles("nonsense", 2000)
+
+    def test_invalid_percentiles(self):
+        """Test that an error is raised for percentiles outside the range
+        0 to 100."""
+        msg = "The percentiles must be within the range 0 to 100"
+        with self.assertRaisesRegexp(ValueError, msg):
+            NeighbourhoodPercentiles("square", 2000, percentiles=[50, 101])
+
+
+class Test__repr__(IrisTest):
+
+    """Test the repr method."""
+
+    def test_basic(self):
+        """Test that the __repr__ returns the expected string."""
+        result = str(NeighbourhoodPercentiles(
+            "circular", 2000, percentiles=[25, 50]))
+        msg = ('<NeighbourhoodPercentiles: neighbourhood_method: circular; '
+               'radius: 2000.0; percentiles: [25.0, 50.0]>')
+        self.assertEqual(result, msg)
+
+
+class Test_make_footprint(IrisTest):
+
+    """Test the make_footprint method."""
+
+    def test_square(self):
+        """Test that a square footprint contains every point."""
+        result = NeighbourhoodPercentiles("square", 2000).make_footprint(2, 1)
+        self.assertArrayEqual(result, np.ones((3, 5), dtype=bool))
+
+    def test_circular(self):
+        """Test that a circular footprint matches the points used by the
+        unweighted circular neighbourhood kernel."""
+        expected = np.array([[0, 0, 1, 0, 0],
+                             [0, 1, 1, 1, 0],
+                             [1, 1, 1, 1, 1],
+                             [0, 1, 1, 1, 0],
+                             [0, 0, 1, 0, 0]], dtype=bool)
+        result = NeighbourhoodPercentiles(
+            "circular", 2000).make_footprint(2, 2)
+        self.assertArrayEqual(result, expected)
+
+
+class Test_percentiles_over_footprint(IrisTest):
+
+    """Test the percentiles_over_footprint method."""
+
+    def setUp(self):
+        """Set up some random data."""
+        self.data = np.random.RandomState(0).rand(2, 7, 9)
+
+    def expected_percentiles(self, footprint, percentiles):
+        """Calculate the expected percentiles by taking the percentiles of
+        the neighbourhood of each point in turn."""
+        half_y, half_x = [(size - 1) // 2 for size in footprint.shape]
+        expected = np.empty((len(percentiles),) + self.data.shape)
+        for index, field in enumerate(self.data):
+            padded = np.pad(
+                field, ((half_y, half_y), (half_x, half_x)), mode="edge")
+            for y_index in range(field.shape[0]):
+                for x_index in range(field.shape[1]):
+                    window = padded[y_index:y_index + footprint.shape[0],
+                                    x_index:x_index + footprint.shape[1]]
+                    expected[:, index, y_index, x_index] = np.percentile(
+                        window[footprint], percentiles)
+        return expected
+
+    def test_square(self):
+        """Test that the percentiles within a square neighbourhood match
+        those found from each neighbourhood in turn."""
+        percentiles = [0, 10, 25, 50, 90, 100]
+        plugin = NeighbourhoodPercentiles(
+            "square", 2000, percentiles=percentiles)
+        footprint = plugin.make_footprint(2, 1)
+        result = plugin.percentiles_over_footprint(self.data, footprint)
+        self.assertArrayAlmostEqual(
+            result, self.expected_percentiles(footprint, percentiles))
+
+    def test_circular(self):
+        """Test that the percentiles within a circular neighbourhood match
+        those found from each neighbourhood in turn."""
+        percentiles = [5, 50, 95]
+        plugin = NeighbourhoodPercentiles(
+            "circular", 2000, percentiles=percentiles)
+        footprint = plugin.make_footprint(2, 2)
+        result = plugin.percentiles_over_footprint(self.data, footprint)
+        self.assertArrayAlmostEqual(
+            result, self.expected_percentiles(footprint, percentiles))
+
+    def test_repeated_values(self):
+        """Test that the percentiles match those found from each
+        neighbourhood in turn when the data contains repeated values."""
+        self.data = np.round(self.data * 3.)
+        percentiles = [0, 20, 50, 80, 100]
+        plugin = NeighbourhoodPercentiles(
+            "circular", 2000, percentiles=percentiles)
+        footprint = plugin.make_footprint(3, 2)
+        result = plugin.percentiles_over_footprint(self.data, footprint)
+        self.assertArrayAlmostEqual(
+            result, self.expected_percentiles(footprint, percentiles))
+
+    def test_blocks_of_rows(self):
+        """Test that the result is the same when the field is processed in
+        blocks of rows."""
+        import improver.nbhood.percentiles as percentiles_module
+        plugin = NeighbourhoodPercentiles(
+            "square", 2000, percentiles=[25, 75])
+        footprint = plugin.make_footprint(1, 1)
+        expected = plugin.percentiles_over_footprint(self.data, footprint)
+        original = percentiles_module.MAX_WINDOW_ELEMENTS
+        percentiles_module.MAX_WINDOW_ELEMENTS = 20
+        try:
+            result = plugin.percentiles_over_footprint(self.data, footprint)
+        finally:
+            percentiles_module.MAX_WINDOW_ELEMENTS = original
+        self.assertArrayAlmostEqual(result, expected)
+
+
+class Test_process(IrisTest):
+
+    """Test the process method."""
+
+    def setUp(self):
+        """Set up a cube."""
+        self.cube = set_up_cube(
+            zero_point_indices=((0, 0, 2, 2), (0, 1, 3, 3)),
+            num_time_points=2, num_grid_points=5)
+
+    def test_basic(self):
+        """Test that a cube with a leading percentile coordinate is
+        returned, with the expected data."""
+        result = NeighbourhoodPercentiles(
+            "square", 2500, percentiles=[0, 50]).process(self.cube)
+        self.assertIsInstance(result, Cube)
+        self.assertEqual(result.shape, (2,) + self.cube.shape)
+        self.assertEqual(
+            result.coord_dims("percentile_over_neighbourhood"), (0,))
+        self.assertArrayAlmostEqual(
+            result.coord("percentile_over_neighbourhood").points, [0, 50])
+        expected_minimum = np.ones((5, 5))
+        expected_minimum[1:4, 1:4] = 0.
+        self.assertArrayAlmostEqual(result.data[0, 0, 0], expected_minimum)
+        self.assertArrayAlmostEqual(result.data[1], np.ones(self.cube.shape))
+
+    def test_single_percentile(self):
+        """Test that the percentile coordinate is a dimension coordinate
+        when a single percentile is requested."""
+        result = NeighbourhoodPercentiles(
+            "circular", 2500, percentiles=[50]).process(self.cube)
+        self.assertEqual(result.shape, (1,) + self.cube.shape)
+        self.assertEqual(
+            result.coord_dims("percentile_over_neighbourhood"), (0,))
+
+    def test_x_axis_before_y_axis(self):
+        """Test that the neighbourhood is applied along the x and y axes
+        when the x axis is before the y axis."""
+        self.cube.data[0, 0, 0, 1] = 0.5
+        expected = NeighbourhoodPercentiles(
+            "square", 2500, percentiles=[10, 50]).process(self.cube.copy())
+        self.cube.transpose([0, 1, 3, 2])
+        result = NeighbourhoodPercentiles(
+            "square", 2500, percentiles=[10, 50]).process(self.cube)
+        self.assertArrayAlmostEqual(
+            result.data, np.swapaxes(expected.data, 3, 4))
+
+    def test_preserves_dtype(self):
+        """Test that the data type of the input cube is preserved."""
+        self.cube.data = self.cube.data.astype(np.float32)
+        result = NeighbourhoodPercentiles(
+            "square", 2500, percentiles=[50]).process(self.cube)
+        self.assertEqual(result.dtype, np.float32)
+
+    def test_integer_data(self):
+        """Test that single precision percentiles are returned for integer
+        data, rather than truncating the interpolated percentiles."""
+        self.cube.data = self.cube.data.astype(np.int32)
+        result = NeighbourhoodPercentiles(
+            "square", 2500, percentiles=[10]).process(self.cube)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertAlmostEqual(result.data[0, 0, 0, 2, 2], 0.8)
+
+    def test_masked_data(self):
+        """Test that an error is raised for masked data."""
+        self.cube.data = np.ma.masked_equal(self.cube.data, 0)
+        msg = "Masked data is not supported"
+        with self.assertRaisesRegexp(ValueError, msg):
+            NeighbourhoodPercentiles("square", 2500).process(self.cube)
+
+    def test_nan_data(self):
+        """Test that an error is raised for data containing NaNs."""
+        self.cube.data[0, 0, 1, 1] = np.nan
+        msg = "NaN detected in input cube data"
+        with self.assertRaisesRegexp(ValueError, msg):
+            NeighbourhoodPercentiles("square", 2500).process(self.cube)
+
+
+if __name__ == '__main__':
+    unittest.main()
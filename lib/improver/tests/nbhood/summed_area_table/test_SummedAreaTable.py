@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Unit tests for the nbhood.summed_area_table.SummedAreaTable plugin."""
+
+
+import unittest
+
+from iris.tests import IrisTest
+
+import numpy as np
+
+from improver.nbhood.nbhood import SquareNeighbourhood
+from improver.nbhood import summed_area_table
+from improver.nbhood.summed_area_table import BLOCK_SIZE, SummedAreaTable
+
+try:
+    import tracemalloc
+except ImportError:
+    # tracemalloc is only available from Python 3.4.
+    tracemalloc = None
+
+
+def padded_neighbourhood_mean(data, cells_x, cells_y):
+    """Calculate the neighbourhood mean by explicitly padding the data with
+    a halo, to compare with the mean calculated from the table."""
+    padded = SquareNeighbourhood.pad_array_with_halo(
+        data, data.ndim-2, data.ndim-1, cells_x, cells_y)
+    n_rows, n_columns = padded.shape[-2:]
+    padded = np.where(np.isnan(padded), 0, padded)
+    mean = np.full(data.shape, np.nan)
+    for row in range(data.shape[-2]):
+        for column in range(data.shape[-1]):
+            row_start = row + 2*cells_y - cells_y
+            column_start = column + 2*cells_x - cells_x
+            mean[..., row, column] = np.mean(
+                padded[..., row_start:row_start+2*cells_y+1,
+                       column_start:column_start+2*cells_x+1],
+                axis=(-2, -1))
+    mean[np.isnan(data)] = np.nan
+    return mean
+
+
+class Test__init__(IrisTest):
+
+    """Test the init method."""
+
+    def test_basic(self):
+        """Test the table contains the cumulative sum of the data, with a
+        leading row and column of zeros."""
+        data = np.array([[1., 2.],
+                         [3., 4.]])
+        expected = np.array([[0., 0., 0.],
+                             [0., 1., 3.],
+                             [0., 4., 10.]])
+        result = SummedAreaTable(data)
+        self.assertArrayAlmostEqual(result.table, expected)
+        self.assertArrayEqual(result.data, data)
+
+    def test_nan(self):
+        """Test that NaN values are treated as zero within the table."""
+        data = np.array([[np.nan, 2.],
+                         [3., 4.]])
+        expected = np.array([[0., 0., 0.],
+                             [0., 0., 2.],
+                             [0., 3., 9.]])
+        result = SummedAreaTable(data)
+        self.assertArrayAlmostEqual(result.table, expected)
+        self.assertArrayEqual(result.nan_mask, np.isnan(data))
+
+    def test_multi_dimensional(self):
+        """Test that the leading axes are treated as independent fields."""
+        data = np.ones((2, 3, 4))
+        data[1] = 2.
+        result = SummedAreaTable(data)
+        self.assertEqual(result.table.shape, (2, 4, 5))
+        self.assertAlmostEqual(result.table[0, -1, -1], 12.)
+        self.assertAlmostEqual(result.table[1, -1, -1], 24.)
+
+    def test_single_precision(self):
+        """Test that a single precision field is cumulated within blocks,
+        and that the complete table is recovered from the blocks and the
+        offsets."""
+        shape = (2, 2*BLOCK_SIZE+3, BLOCK_SIZE+5)
+        data = np.random.RandomState(0).rand(*shape).astype(np.float32)
+        expected = np.zeros((2, shape[1]+1, shape[2]+1))
+        expected[:, 1:, 1:] = np.cumsum(
+            np.cumsum(data.astype(np.float64), axis=-2), axis=-1)
+        result = SummedAreaTable(data)
+        self.assertEqual(result.block_size, BLOCK_SIZE)
+        self.assertEqual(result.table.dtype, np.float32)
+        self.assertEqual(result.table.shape, expected.shape)
+        self.assertEqual(result.row_offsets.shape, (2, shape[1]+1, 3))
+        self.assertEqual(result.column_offsets.shape, (2, 4, shape[2]+1))
+        self.assertEqual(result.block_totals.shape, (2, 4, 3))
+        self.assertTrue(np.all(
+            np.abs(result.table) <= BLOCK_SIZE*BLOCK_SIZE))
+        rows = np.arange(shape[1]+1)
+        columns = np.arange(shape[2]+1)
+        self.assertArrayAlmostEqual(
+            result.table_values(rows, columns), expected, decimal=4)
+
+    def test_double_precision(self):
+        """Test that a double precision field is cumulated into a single
+        table without offsets."""
+        result = SummedAreaTable(np.ones((3, 4)))
+        self.assertIsNone(result.block_size)
+        self.assertIsNone(result.row_offsets)
+        self.assertEqual(result.table.dtype, np.float64)
+
+    def test_exception(self):
+        """Test that an error is raised for an array without y and x
+        axes."""
+        msg = "requires an array with y and x axes"
+        with self.assertRaisesRegexp(ValueError, msg):
+            SummedAreaTable(np.ones(3))
+
+
+class Test__repr__(IrisTest):
+
+    """Test the repr method."""
+
+    def test_basic(self):
+        """Test that the __repr__ returns the expected string."""
+        result = str(SummedAreaTable(np.ones((2, 3, 4))))
+        msg = '<SummedAreaTable: shape: (2, 3, 4)>'
+        self.assertEqual(result, msg)
+
+
+class Test___getitem__(IrisTest):
+
+    """Test the selection of a subset of the table."""
+
+    def test_basic(self):
+        """Test that the subset matches a table calculated from the
+        corresponding subset of the data."""
+        data = np.random.RandomState(0).rand(2, 3, 5, 5)
+        result = SummedAreaTable(data)[:, 1]
+        expected = SummedAreaTable(data[:, 1])
+        self.assertIsInstance(result, SummedAreaTable)
+        self.assertArrayAlmostEqual(result.table, expected.table)
+        self.assertArrayAlmostEqual(
+            result.neighbourhood_mean(1, 2),
+            expected.neighbourhood_mean(1, 2))
+
+    def test_single_precision(self):
+        """Test that the offsets of a single precision table are subset
+        alongside the table."""
+        data = np.random.RandomState(0).rand(
+            2, 3, BLOCK_SIZE+2, BLOCK_SIZE+3).astype(np.float32)
+        result = SummedAreaTable(data)[:, 1]
+        expected = SummedAreaTable(data[:, 1])
+        self.assertEqual(result.block_size, BLOCK_SIZE)
+        for name in ['table', 'row_offsets', 'column_offsets',
+                     'block_totals']:
+            self.assertArrayEqual(
+                getattr(result, name), getattr(expected, name))
+
+    def test_exception(self):
+        """Test that an error is raised if the index selects from the y or x
+        axes."""
+        msg = "Only the leading axes"
+        with self.assertRaisesRegexp(IndexError, msg):
+            SummedAreaTable(np.ones((2, 3, 4)))[0, 1]
+
+
+class Test_table_values(IrisTest):
+
+    """Test the values of the complete table."""
+
+    def test_basic(self):
+        """Test the values at a subset of rows and columns."""
+        data = np.array([[1., 2.],
+                         [3., 4.]])
+        result = SummedAreaTable(data).table_values(
+            np.array([2, 1]), np.array([0, 2]))
+        expected = np.array([[0., 10.],
+                             [0., 3.]])
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_single_precision(self):
+        """Test that the values across several blocks of a single precision
+        table match a double precision table."""
+        data = np.random.RandomState(0).rand(
+            3*BLOCK_SIZE+1, 2*BLOCK_SIZE).astype(np.float32)
+        rows = np.array([0, 1, BLOCK_SIZE, BLOCK_SIZE+1, 3*BLOCK_SIZE+1])
+        columns = np.array([2*BLOCK_SIZE, BLOCK_SIZE-1, BLOCK_SIZE, 0])
+        result = SummedAreaTable(data).table_values(rows, columns)
+        expected = SummedAreaTable(data.astype(np.float64)).table_values(
+            rows, columns)
+        self.assertEqual(result.dtype, np.float64)
+        self.assertArrayAlmostEqual(result, expected, decimal=4)
+
+
+class Test_neighbourhood_total(IrisTest):
+
+    """Test the calculation of the neighbourhood total."""
+
+    def test_basic(self):
+        """Test the total for a neighbourhood that lies within the field,
+        and for neighbourhoods that extend over the edge of the field."""
+        data = np.ones((5, 5))
+        data[2, 2] = 0.
+        expected = np.array(
+            [[9., 9., 9., 9., 9.],
+             [9., 8., 8., 8., 9.],
+             [9., 8., 8., 8., 9.],
+             [9., 8., 8., 8., 9.],
+             [9., 9., 9., 9., 9.]])
+        result = SummedAreaTable(data).neighbourhood_total(1, 1)
+        self.assertArrayAlmostEqual(result, expected)
+
+
+class Test_neighbourhood_mean(IrisTest):
+
+    """Test the calculation of the neighbourhood mean."""
+
+    def setUp(self):
+        """Set up random data."""
+        self.data = np.random.RandomState(0).rand(2, 6, 8)
+
+    def test_multiple_radii(self):
+        """Test that the mean for several neighbourhood sizes, calculated
+        from the same table, matches the mean calculated using a padded
+        array."""
+        table = SummedAreaTable(self.data)
+        for cells_x, cells_y in [(1, 1), (2, 1), (1, 3), (4, 4)]:
+            result = table.neighbourhood_mean(cells_x, cells_y)
+            expected = padded_neighbourhood_mean(self.data, cells_x, cells_y)
+            self.assertArrayAlmostEqual(result, expected)
+
+    def test_larger_than_field(self):
+        """Test a neighbourhood that is larger than the field."""
+        result = SummedAreaTable(self.data).neighbourhood_mean(10, 7)
+        expected = padded_neighbourhood_mean(self.data, 10, 7)
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_nan(self):
+        """Test that NaN values are set to NaN in the output, and are
+        treated as zero when calculating the mean at other points."""
+        self.data[0, 2, 3] = np.nan
+        self.data[1, 0, 0] = np.nan
+        result = SummedAreaTable(self.data).neighbourhood_mean(2, 2)
+        expected = padded_neighbourhood_mean(self.data, 2, 2)
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_integer_data(self):
+        """Test that the halo is calculated in the same way as when padding
+        integer data, for which the padding value is rounded."""
+        data = np.random.RandomState(0).randint(0, 5, (6, 8))
+        result = SummedAreaTable(data).neighbourhood_mean(2, 2)
+        expected = padded_neighbourhood_mean(data, 2, 2)
+        self.assertArrayAlmostEqual(result, expected)
+
+
+class Test_row_blocks(IrisTest):
+
+    """Test that calculating the neighbourhood one block of rows at a time
+    gives the same result as calculating every row at once."""
+
+    def setUp(self):
+        """Set up a field with leading axes, and reduce the number of
+        elements within each block, so that each block contains a single
+        row."""
+        self.data = np.random.RandomState(0).rand(2, 3, 11, 9)
+        self.data[1, 2, 4, 5] = np.nan
+        self.max_block_elements = summed_area_table.MAX_BLOCK_ELEMENTS
+
+    def tearDown(self):
+        """Restore the number of elements within each block."""
+        summed_area_table.MAX_BLOCK_ELEMENTS = self.max_block_elements
+
+    def test_basic(self):
+        """Test neighbourhoods within the field and extending beyond the
+        edges of the field, at single and double precision."""
+        for dtype in [np.float32, np.float64]:
+            table = SummedAreaTable(self.data.astype(dtype))
+            for cells_x, cells_y in [(1, 2), (4, 12), (10, 0)]:
+                expected = table.neighbourhood_mean(cells_x, cells_y)
+                summed_area_table.MAX_BLOCK_ELEMENTS = 1
+                result = table.neighbourhood_mean(cells_x, cells_y)
+                summed_area_table.MAX_BLOCK_ELEMENTS = (
+                    self.max_block_elements)
+                self.assertEqual(result.dtype, dtype)
+                self.assertArrayEqual(result, expected)
+
+
+class Test_neighbourhood_mean_single_precision(IrisTest):
+
+    """Test the neighbourhood mean of single precision fields against a
+    double precision reference."""
+
+    def setUp(self):
+        """Set up a single precision field spanning several blocks, which
+        does not divide into a whole number of blocks."""
+        self.data = np.random.RandomState(0).rand(
+            2, 5*BLOCK_SIZE+3, 7*BLOCK_SIZE-2).astype(np.float32)
+
+    def assert_matches_reference(self, data, cells_x, cells_y, rtol):
+        """Check the single precision mean against the mean of the same
+        field calculated at double precision."""
+        result = SummedAreaTable(data).neighbourhood_mean(cells_x, cells_y)
+        expected = SummedAreaTable(
+            data.astype(np.float64)).neighbourhood_mean(cells_x, cells_y)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertArrayEqual(np.isnan(result), np.isnan(expected))
+        valid = ~np.isnan(expected)
+        self.assertTrue(np.allclose(
+            result[valid], expected[valid], rtol=rtol, atol=0.))
+
+    def test_multiple_radii(self):
+        """Test neighbourhoods that are smaller than, similar to and larger
+        than a block."""
+        for cells_x, cells_y in [(1, 1), (3, 2), (BLOCK_SIZE, 1),
+                                 (2*BLOCK_SIZE, 3*BLOCK_SIZE)]:
+            self.assert_matches_reference(self.data, cells_x, cells_y, 1e-5)
+
+    def test_large_offset(self):
+        """Test that the error does not grow with the size of the field for
+        a field with a large offset, for which cumulating the whole field
+        at single precision would lose most of the precision of the
+        neighbourhood total."""
+        data = np.random.RandomState(0).rand(
+            8*BLOCK_SIZE, 8*BLOCK_SIZE).astype(np.float32) + 1000.
+        self.assert_matches_reference(data, 1, 1, 1e-5)
+
+    def test_nan(self):
+        """Test that NaN values are set to NaN in the output."""
+        self.data[0, BLOCK_SIZE, BLOCK_SIZE-1] = np.nan
+        self.data[1, -1, 0] = np.nan
+        self.assert_matches_reference(self.data, 2, 2, 1e-5)
+
+    @unittest.skipIf(tracemalloc is None, "tracemalloc is not available")
+    def test_peak_memory(self):
+        """Test that calculating the table and neighbourhood mean of a
+        single precision field uses less memory than for the same field at
+        double precision, as the neighbourhood is not calculated for the
+        whole field at double precision."""
+        data = np.random.RandomState(0).rand(1000, 1000)
+        peak_memory = {}
+        for dtype in [np.float32, np.float64]:
+            field = data.astype(dtype)
+            tracemalloc.start()
+            try:
+                result = SummedAreaTable(field).neighbourhood_mean(5, 5)
+                _, peak_memory[dtype] = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            self.assertEqual(result.dtype, dtype)
+            del result
+        self.assertLess(peak_memory[np.float32],
+                        0.75 * peak_memory[np.float64])
+
+    def test_padded_reference(self):
+        """Test that the halo matches padding a single precision field."""
+        data = self.data[:, :BLOCK_SIZE+2, :BLOCK_SIZE+3]
+        result = SummedAreaTable(data).neighbourhood_mean(2, 3)
+        expected = padded_neighbourhood_mean(data, 2, 3)
+        self.assertArrayAlmostEqual(result, expected, decimal=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
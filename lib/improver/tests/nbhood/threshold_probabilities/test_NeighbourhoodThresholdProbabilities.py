@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Unit tests for the
+nbhood.threshold_probabilities.NeighbourhoodThresholdProbabilities plugin."""
+
+
+import unittest
+
+import iris
+from iris.cube import Cube
+from iris.tests import IrisTest
+import numpy as np
+
+from improver.nbhood.nbhood import NeighbourhoodProcessing
+from improver.nbhood.threshold_probabilities import (
+    NeighbourhoodThresholdProbabilities)
+from improver.tests.ensemble_calibration.ensemble_calibration.helper_functions\
+    import add_forecast_reference_time_and_forecast_period
+from improver.tests.nbhood.nbhood.test_NeighbourhoodProcessing import (
+    set_up_cube)
+from improver.utilities.threshold import BasicThreshold
+
+
+def set_up_random_cube(num_time_points=1):
+    """Set up a cube with three realizations containing random values."""
+    cube = set_up_cube(
+        zero_point_indices=((0, 0, 7, 7),), num_time_points=num_time_points,
+        num_realization_points=3)
+    cube.data = np.random.RandomState(0).rand(*cube.shape) * 10.
+    return cube
+
+
+class Test__init__(IrisTest):
+
+    """Test the __init__ method of NeighbourhoodThresholdProbabilities."""
+
+    def test_sorted_thresholds(self):
+        """Test that the thresholds are sorted."""
+        plugin = NeighbourhoodThresholdProbabilities([2, 0.5, 1], 10000)
+        self.assertArrayAlmostEqual(plugin.thresholds, [0.5, 1., 2.])
+
+    def test_no_thresholds(self):
+        """Test that an error is raised if no thresholds are supplied."""
+        msg = "At least one threshold must be supplied"
+        with self.assertRaisesRegexp(ValueError, msg):
+            NeighbourhoodThresholdProbabilities([], 10000)
+
+    def test_repeated_thresholds(self):
+        """Test that an error is raised if the thresholds are not unique."""
+        msg = "The thresholds must be unique"
+        with self.assertRaisesRegexp(ValueError, msg):
+            NeighbourhoodThresholdProbabilities([1, 2, 1], 10000)
+
+
+class Test__repr__(IrisTest):
+
+    """Test the repr method."""
+
+    def test_basic(self):
+        """Test that the __repr__ returns the expected string."""
+        result = str(NeighbourhoodThresholdProbabilities([1, 2], 10000))
+        msg = ('<NeighbourhoodThresholdProbabilities: thresholds: [1.0, 2.0]; '
+               'below_thresh_ok: False; neighbourhood: '
+               '<NeighbourhoodProcessing: neighbourhood_method: square; '
+               'radii: 10000.0; lead_times: None; unweighted_mode: False; '
+               'ens_factor: 1.0; workers: 1; collapse_realizations: False>>')
+        self.assertEqual(result, msg)
+
+
+class Test_bin_data(IrisTest):
+
+    """Test the bin_data method."""
+
+    def test_basic(self):
+        """Test that the bin is the number of thresholds below each value,
+        with values equal to a threshold not exceeding it."""
+        data = np.array([[0., 1., 1.5], [2., 2.5, 10.]])
+        expected = np.array([[0, 0, 1], [1, 2, 3]])
+        result = NeighbourhoodThresholdProbabilities(
+            [1, 2, 5], 10000).bin_data(data)
+        self.assertArrayEqual(result, expected)
+        self.assertEqual(result.dtype, np.uint8)
+
+
+class Test_process(IrisTest):
+
+    """Test the process method."""
+
+    def expected_probabilities(self, cube, thresholds, radii, **kwargs):
+        """Calculate the expected probabilities by thresholding and
+        neighbourhood processing the cube for each threshold in turn."""
+        below_thresh_ok = kwargs.pop("below_thresh_ok", False)
+        return [NeighbourhoodProcessing("square", radii, **kwargs).process(
+                    BasicThreshold(
+                        threshold, below_thresh_ok=below_thresh_ok).process(
+                            cube.copy())).data
+                for threshold in thresholds]
+
+    def test_basic(self):
+        """Test that the probabilities match thresholding and neighbourhood
+        processing each threshold in turn."""
+        cube = set_up_random_cube()
+        thresholds = [0.5, 2., 5., 8.]
+        result = NeighbourhoodThresholdProbabilities(
+            thresholds, 6000).process(cube.copy())
+        self.assertIsInstance(result, Cube)
+        self.assertEqual(result.coord_dims("threshold"), (0,))
+        for result_data, expected in zip(
+                result.data, self.expected_probabilities(
+                    cube, thresholds, 6000)):
+            self.assertArrayAlmostEqual(result_data, expected)
+
+    def test_metadata(self):
+        """Test that the cube has a leading threshold coordinate and the
+        expected metadata."""
+        cube = set_up_random_cube()
+        result = NeighbourhoodThresholdProbabilities(
+            [2, 5], 10000).process(cube)
+        self.assertEqual(result.shape, (2,) + cube.shape)
+        self.assertArrayAlmostEqual(result.coord("threshold").points, [2, 5])
+        self.assertEqual(result.coord("threshold").units, cube.units)
+        self.assertEqual(result.name(), "probability_of_precipitation_amount")
+        self.assertEqual(result.units, "1")
+        self.assertEqual(result.attributes["relative_to_threshold"], "above")
+
+    def test_single_threshold(self):
+        """Test that the threshold coordinate is a dimension coordinate when
+        a single threshold is requested."""
+        cube = set_up_random_cube()
+        result = NeighbourhoodThresholdProbabilities(
+            [2], 10000, below_thresh_ok=True).process(cube)
+        self.assertEqual(result.shape, (1,) + cube.shape)
+        self.assertEqual(result.coord_dims("threshold"), (0,))
+        self.assertEqual(result.attributes["relative_to_threshold"], "below")
+
+    def test_below_threshold(self):
+        """Test that the probabilities of being below each threshold match
+        thresholding and neighbourhood processing each threshold in
+        turn."""
+        cube = set_up_random_cube()
+        thresholds = [2., 5.]
+        result = NeighbourhoodThresholdProbabilities(
+            thresholds, 6000, below_thresh_ok=True).process(cube.copy())
+        for result_data, expected in zip(
+                result.data, self.expected_probabilities(
+                    cube, thresholds, 6000, below_thresh_ok=True)):
+            self.assertArrayAlmostEqual(result_data, expected)
+
+    def test_lead_times(self):
+        """Test that the probabilities match thresholding and neighbourhood
+        processing each threshold in turn, when the radius varies with lead
+        time."""
+        cube = set_up_random_cube(num_time_points=2)
+        iris.util.promote_aux_coord_to_dim_coord(cube, "time")
+        cube = add_forecast_reference_time_and_forecast_period(
+            cube, time_point=cube.coord("time").points, fp_point=[2, 3])
+        thresholds = [2., 5.]
+        result = NeighbourhoodThresholdProbabilities(
+            thresholds, [6000, 10000], lead_times=[2, 3]).process(
+                cube.copy())
+        for result_data, expected in zip(
+                result.data, self.expected_probabilities(
+                    cube, thresholds, [6000, 10000], lead_times=[2, 3])):
+            self.assertArrayAlmostEqual(result_data, expected)
+
+    def test_masked_data(self):
+        """Test that the probabilities match thresholding and neighbourhood
+        processing each threshold in turn when the data is masked, and that
+        the probabilities are masked where the data is masked."""
+        cube = set_up_random_cube()
+        cube.data = np.ma.masked_less(cube.data, 1.)
+        thresholds = [2., 5.]
+        result = NeighbourhoodThresholdProbabilities(
+            thresholds, 6000).process(cube.copy())
+        for result_data, expected in zip(
+                result.data, self.expected_probabilities(
+                    cube, thresholds, 6000)):
+            self.assertArrayEqual(result_data.mask, cube.data.mask)
+            self.assertArrayAlmostEqual(result_data, expected)
+
+    def test_x_axis_before_y_axis(self):
+        """Test that the probabilities are calculated along the x and y
+        axes when the x axis is before the y axis."""
+        cube = set_up_random_cube()
+        expected = NeighbourhoodThresholdProbabilities(
+            [2., 5.], 6000).process(cube.copy())
+        cube.transpose([0, 1, 3, 2])
+        result = NeighbourhoodThresholdProbabilities(
+            [2., 5.], 6000).process(cube)
+        self.assertArrayAlmostEqual(
+            result.data, np.swapaxes(expected.data, 3, 4))
+
+    def test_nan_data(self):
+        """Test that an error is raised for data containing NaNs."""
+        cube = set_up_random_cube()
+        cube.data[0, 0, 1, 1] = np.nan
+        msg = "NaN detected in input cube data"
+        with self.assertRaisesRegexp(ValueError, msg):
+            NeighbourhoodThresholdProbabilities([1.], 6000).process(cube)
+
+
+if __name__ == '__main__':
+    unittest.main()
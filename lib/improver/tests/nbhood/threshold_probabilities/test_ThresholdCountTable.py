@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Unit tests for the
+nbhood.threshold_probabilities.ThresholdCountTable plugin."""
+
+
+import unittest
+
+from iris.tests import IrisTest
+
+import numpy as np
+
+from improver.nbhood.summed_area_table import SummedAreaTable
+from improver.nbhood.threshold_probabilities import ThresholdCountTable
+
+
+class Test__init__(IrisTest):
+
+    """Test the calculation of the table from the bins."""
+
+    def setUp(self):
+        """Set up some random bins for three thresholds."""
+        self.bins = np.random.RandomState(0).randint(0, 4, size=(2, 6, 7))
+        self.threshold_indices = np.reshape(np.arange(3), (3, 1, 1, 1))
+
+    def test_above(self):
+        """Test that the table matches the summed-area table of the truth
+        values for exceeding each threshold."""
+        truth_values = (self.bins > self.threshold_indices).astype(float)
+        result = ThresholdCountTable(self.bins, 3)
+        self.assertEqual(result.table.dtype, np.int32)
+        self.assertEqual(result.shape, (3, 2, 6, 7))
+        self.assertArrayEqual(
+            result.table, SummedAreaTable(truth_values).table)
+
+    def test_below(self):
+        """Test that the table matches the summed-area table of the truth
+        values for being below each threshold."""
+        truth_values = (self.bins <= self.threshold_indices).astype(float)
+        result = ThresholdCountTable(self.bins, 3, below_thresh_ok=True)
+        self.assertArrayEqual(
+            result.table, SummedAreaTable(truth_values).table)
+
+    def test_valid_points(self):
+        """Test that only the valid points are counted."""
+        valid_points = np.random.RandomState(1).rand(2, 6, 7) > 0.3
+        truth_values = (
+            (self.bins > self.threshold_indices) & valid_points).astype(float)
+        result = ThresholdCountTable(self.bins, 3, valid_points=valid_points)
+        self.assertArrayEqual(
+            result.table, SummedAreaTable(truth_values).table)
+
+
+class Test___getitem__(IrisTest):
+
+    """Test selecting a subset of the table."""
+
+    def test_basic(self):
+        """Test that a subset of the leading axes is a ThresholdCountTable
+        matching the table of that subset of the bins."""
+        bins = np.random.RandomState(0).randint(0, 3, size=(4, 5, 6))
+        result = ThresholdCountTable(bins, 2)[:, 1:3]
+        self.assertIsInstance(result, ThresholdCountTable)
+        self.assertArrayEqual(
+            result.table, ThresholdCountTable(bins[1:3], 2).table)
+
+
+class Test_neighbourhood_mean(IrisTest):
+
+    """Test the neighbourhood mean calculated from the table."""
+
+    def test_halo(self):
+        """Test that the neighbourhood mean, including the halo beyond the
+        edge of the field, matches the summed-area table of the truth
+        values for several sizes of neighbourhood."""
+        bins = np.random.RandomState(0).randint(0, 5, size=(2, 9, 8))
+        truth_values = (
+            bins > np.reshape(np.arange(4), (4, 1, 1, 1))).astype(float)
+        result = ThresholdCountTable(bins, 4)
+        expected = SummedAreaTable(truth_values)
+        for cells_x, cells_y in [(0, 0), (1, 2), (3, 1), (10, 12)]:
+            self.assertArrayAlmostEqual(
+                result.neighbourhood_mean(cells_x, cells_y),
+                expected.neighbourhood_mean(cells_x, cells_y))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,12 +32,15 @@
 
 import unittest
 
+import iris
 from iris.coords import AuxCoord
 from iris.cube import Cube
 from iris.tests import IrisTest
 import numpy as np
 
+from improver.nbhood.nbhood import NeighbourhoodProcessing
 from improver.nbhood.vicinity import ProbabilityOfOccurrence
+from improver.utilities.spatial import OccurrenceWithinVicinity
 from improver.tests.utilities.test_OccurrenceWithinVicinity import (
     set_up_cube)
 
@@ -54,6 +57,13 @@ class Test__init__(IrisTest):
         with self.assertRaisesRegexp(ValueError, msg):
             ProbabilityOfOccurrence(distance, "circular", radius)
 
+    def test_invalid_workers(self):
+        """Test that an exception is raised if fewer than one worker is
+        requested."""
+        msg = "The number of workers must be at least 1"
+        with self.assertRaisesRegexp(ValueError, msg):
+            ProbabilityOfOccurrence(2000, "square", 2000, workers=0)
+
 
 class Test__repr__(IrisTest):
 
@@ -65,10 +75,65 @@ class Test__repr__(IrisTest):
         msg = ('<ProbabilityOfOccurrence: distance: 2000; '
                'neighbourhood_method: square; radii: 2000; '
                'lead_times: None; unweighted_mode: False; '
-               'ens_factor: 1.0>')
+               'ens_factor: 1.0; workers: 1>')
         self.assertEqual(result, msg)
 
 
+def set_up_ensemble_cube():
+    """Set up a thresholded cube with multiple realizations and times."""
+    np.random.seed(0)
+    data = (np.random.random((4, 2, 10, 10)) > 0.9).astype(np.float32)
+    y_dimension_values = np.arange(0.0, 20000.0, 2000.0)
+    return set_up_cube(data, "lwe_precipitation_rate", "m s-1",
+                       realizations=np.arange(4),
+                       timesteps=np.array([402192.5, 402193.5]),
+                       y_dimension_values=y_dimension_values,
+                       x_dimension_values=y_dimension_values)
+
+
+class Test__sum_within_vicinity(IrisTest):
+
+    """Test the _sum_within_vicinity method."""
+
+    def setUp(self):
+        """Set up a cube, and the indices of some of its realizations."""
+        self.cube = set_up_ensemble_cube()
+        self.indices = [(0, slice(None), slice(None), slice(None)),
+                        (2, slice(None), slice(None), slice(None))]
+
+    def test_basic(self):
+        """Test that the sum matches the sum of the occurrences within the
+        vicinity of the slices."""
+        occurrences = OccurrenceWithinVicinity(4000).process(self.cube).data
+        total, count = ProbabilityOfOccurrence(
+            4000, "square", 2000)._sum_within_vicinity(
+                self.cube, self.indices, 2)
+        self.assertArrayAlmostEqual(total, occurrences[0] + occurrences[2])
+        self.assertEqual(count, 2)
+
+    def test_masked_data(self):
+        """Test that masked points are excluded from the sum and from the
+        vicinity of other points, and are not counted."""
+        data = np.zeros((3, 3))
+        data[0, 0] = 1.
+        data[2, 2] = 1.
+        cube = set_up_cube(
+            np.ma.masked_array(data.reshape(1, 1, 3, 3), mask=data == 1),
+            "lwe_precipitation_rate", "m s-1",
+            y_dimension_values=np.array([0., 2000., 4000.]),
+            x_dimension_values=np.array([0., 2000., 4000.]))
+        cube.data[..., 2, 2] = 1.
+        total, count = ProbabilityOfOccurrence(
+            2000, "square", 2000)._sum_within_vicinity(
+                cube, [(0, 0, slice(None), slice(None))], 1)
+        expected_total = np.zeros((3, 3))
+        expected_total[1:, 1:] = 1.
+        expected_count = np.ones((3, 3), dtype=int)
+        expected_count[0, 0] = 0
+        self.assertArrayEqual(total, expected_total)
+        self.assertArrayEqual(count, expected_count)
+
+
 class Test_process(IrisTest):
 
     """Test the process method."""
@@ -156,6 +221,79 @@ class Test_process(IrisTest):
         self.assertIsInstance(result, Cube)
         self.assertArrayAlmostEqual(result.data, expected)
 
+    def test_multiple_realizations(self):
+        """Test that the result for multiple realizations matches applying
+        each step of the calculation to the whole cube in turn."""
+        cube = set_up_ensemble_cube()
+        expected = OccurrenceWithinVicinity(2000).process(cube)
+        expected = expected.collapsed("realization", iris.analysis.MEAN)
+        expected = NeighbourhoodProcessing("square", 4000).process(expected)
+        result = ProbabilityOfOccurrence(
+            2000, "square", 4000, workers=2).process(cube)
+        self.assertEqual(result, expected)
+
+    def test_multiple_workers(self):
+        """Test that the same result is given when the realizations are
+        divided between threads, including more threads than
+        realizations."""
+        cube = set_up_ensemble_cube()
+        expected = ProbabilityOfOccurrence(2000, "square", 4000).process(cube)
+        for workers in [2, 3, 8]:
+            result = ProbabilityOfOccurrence(
+                2000, "square", 4000, workers=workers).process(cube)
+            self.assertEqual(result, expected)
+
+    def test_realization_not_leading(self):
+        """Test when the realization dimension is not the leading
+        dimension."""
+        cube = set_up_ensemble_cube()
+        expected = ProbabilityOfOccurrence(2000, "square", 4000).process(cube)
+        cube.transpose([1, 0, 2, 3])
+        result = ProbabilityOfOccurrence(2000, "square", 4000).process(cube)
+        self.assertEqual(result, expected)
+
+    def test_x_axis_before_y_axis(self):
+        """Test that the result matches applying each step of the
+        calculation to the whole cube when the x axis is before the y
+        axis."""
+        cube = set_up_ensemble_cube()
+        cube.transpose([0, 1, 3, 2])
+        expected = OccurrenceWithinVicinity(2000).process(cube)
+        expected = expected.collapsed("realization", iris.analysis.MEAN)
+        expected = NeighbourhoodProcessing("square", 4000).process(expected)
+        result = ProbabilityOfOccurrence(2000, "square", 4000).process(cube)
+        self.assertEqual(result, expected)
+
+    def test_masked_data(self):
+        """Test that the mask is carried through the calculation. Points
+        masked in every realization are masked in the output, and other
+        masked points are excluded from the vicinity, the realization mean
+        and the neighbourhood."""
+        cube = set_up_ensemble_cube()
+        mask = np.zeros(cube.shape, dtype=bool)
+        mask[:, :, 4, 4] = True
+        mask[1, 0, 2:4, 6] = True
+        cube.data = np.ma.masked_array(cube.data, mask=mask)
+        result = ProbabilityOfOccurrence(2000, "square", 4000).process(cube)
+        # The expected realization mean of the occurrences within the
+        # vicinity is found one realization at a time.
+        vicinity_plugin = OccurrenceWithinVicinity(2000)
+        total = np.zeros(cube.shape[1:])
+        count = np.zeros(cube.shape[1:])
+        for realization in range(4):
+            data = cube.data[realization]
+            occurrences = vicinity_plugin.vicinity_maximum(
+                data.filled(0), 1, 2, 1)
+            total += np.where(data.mask, 0, occurrences)
+            count += np.logical_not(data.mask)
+        expected = cube.collapsed("realization", iris.analysis.MEAN)
+        expected.data = np.ma.masked_where(count == 0, total / count)
+        expected = NeighbourhoodProcessing("square", 4000).process(expected)
+        self.assertIsInstance(result.data, np.ma.MaskedArray)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+        self.assertArrayEqual(result.data.mask, expected.data.mask)
+        self.assertTrue(result.data.mask[:, 4, 4].all())
+
 
 if __name__ == '__main__':
     unittest.main()
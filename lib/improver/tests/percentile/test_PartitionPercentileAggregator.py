@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Unit tests for the percentile.PartitionPercentileAggregator class."""
+
+
+import unittest
+
+import iris
+from iris.tests import IrisTest
+import numpy as np
+
+from improver.percentile import PartitionPercentileAggregator
+
+
+class Test_aggregate(IrisTest):
+
+    """Test the calculation of percentiles by the aggregator."""
+
+    def setUp(self):
+        """Create random data to calculate percentiles from."""
+        self.data = np.random.RandomState(0).rand(4, 6, 44)
+        self.percent = [0, 25, 50, 75, 100]
+
+    def test_basic(self):
+        """Test that the percentiles match iris.analysis.PERCENTILE."""
+        result = PartitionPercentileAggregator().aggregate(
+            self.data, 2, percent=self.percent)
+        expected = iris.analysis.PERCENTILE.aggregate(
+            self.data, 2, percent=self.percent)
+        self.assertEqual(result.shape, (4, 6, 5))
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_masked_data(self):
+        """Test that masked values are left out of the percentiles."""
+        data = np.ma.masked_greater(self.data, 0.5)
+        result = PartitionPercentileAggregator().aggregate(
+            data, 2, percent=self.percent)
+        expected = iris.analysis.PERCENTILE.aggregate(
+            data, 2, percent=self.percent)
+        self.assertArrayAlmostEqual(result, expected)
+        self.assertTrue((result <= 0.5).all())
+
+    def test_nan(self):
+        """Test that NaNs give the same result as
+        iris.analysis.PERCENTILE."""
+        data = self.data.copy()
+        data[0, 0, 0] = np.nan
+        result = PartitionPercentileAggregator().aggregate(
+            data, 2, percent=self.percent)
+        expected = iris.analysis.PERCENTILE.aggregate(
+            data, 2, percent=self.percent)
+        self.assertArrayAlmostEqual(result, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
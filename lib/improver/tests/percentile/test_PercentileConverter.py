@@ -34,15 +34,71 @@
 import unittest
 
 from cf_units import Unit
+import iris
 from iris.cube import Cube
 from iris.coords import DimCoord
 from iris.tests import IrisTest
 from iris.exceptions import CoordinateNotFoundError
 import numpy as np
 
+import improver.percentile
 from improver.percentile import PercentileConverter
 
 
+class Test_partition_percentiles(IrisTest):
+
+    """Test the calculation of percentiles using np.partition."""
+
+    def setUp(self):
+        """Create random data to calculate percentiles from."""
+        self.data = np.random.RandomState(0).rand(4, 6, 44)
+        self.percentiles = PercentileConverter.DEFAULT_PERCENTILES
+
+    def test_basic(self):
+        """Test that the percentiles match np.percentile, with the
+        percentiles as the last dimension."""
+        result = PercentileConverter.partition_percentiles(
+            self.data, 2, self.percentiles)
+        expected = np.moveaxis(
+            np.percentile(self.data, self.percentiles, axis=2), 0, -1)
+        self.assertEqual(result.shape, (4, 6, 15))
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_leading_axis(self):
+        """Test that the percentiles are calculated along the leading
+        axis."""
+        data = np.moveaxis(self.data, 2, 0)
+        result = PercentileConverter.partition_percentiles(
+            data, 0, self.percentiles)
+        expected = np.moveaxis(
+            np.percentile(data, self.percentiles, axis=0), 0, -1)
+        self.assertEqual(result.shape, (4, 6, 15))
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_single_percentile(self):
+        """Test that there is no percentile dimension when only one
+        percentile is requested."""
+        result = PercentileConverter.partition_percentiles(
+            self.data, -1, [50])
+        expected = np.median(self.data, axis=-1)
+        self.assertEqual(result.shape, (4, 6))
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_chunks(self):
+        """Test that the result is the same when the points are split into
+        several chunks."""
+        chunk_size = improver.percentile.PERCENTILE_CHUNK_SIZE
+        improver.percentile.PERCENTILE_CHUNK_SIZE = 100
+        try:
+            result = PercentileConverter.partition_percentiles(
+                self.data, 2, self.percentiles)
+        finally:
+            improver.percentile.PERCENTILE_CHUNK_SIZE = chunk_size
+        expected = np.moveaxis(
+            np.percentile(self.data, self.percentiles, axis=2), 0, -1)
+        self.assertArrayAlmostEqual(result, expected)
+
+
 class Test_process(IrisTest):
 
     """Test the creation of percentiles by the plugin."""
@@ -140,6 +196,61 @@ class Test_process(IrisTest):
                               [[-180., 180.]])
         self.assertArrayEqual(result.coord('latitude').bounds, [[-90., 90.]])
 
+    def test_masked_data(self):
+        """
+        Test that masked values are left out of the percentiles.
+
+        """
+        collapse_coord = 'longitude'
+        cube = self.cube.copy()
+        cube.data = np.ma.masked_greater(cube.data, 5.)
+
+        plugin = PercentileConverter(collapse_coord)
+        result = plugin.process(cube)
+
+        # Check percentile values.
+        self.assertArrayAlmostEqual(result.data[:, 0, 0, 0],
+                                    self.default_percentiles*0.05)
+        # Check resulting data shape.
+        self.assertEqual(result.data.shape, (15, 3, 1, 11))
+
+    def test_chunks(self):
+        """
+        Test that the result is the same when the cube is collapsed in
+        chunks, which are split along the longest dimension that is not
+        collapsed.
+
+        """
+        cube = self.cube.copy()
+        cube.data = np.random.RandomState(0).rand(3, 1, 11, 11).astype(
+            np.float32)
+        plugin = PercentileConverter('realization')
+        expected = cube.collapsed('realization', iris.analysis.PERCENTILE,
+                                  percent=plugin.percentiles)
+        chunk_size = improver.percentile.PERCENTILE_CHUNK_SIZE
+        improver.percentile.PERCENTILE_CHUNK_SIZE = 100
+        try:
+            result = plugin.process(cube)
+        finally:
+            improver.percentile.PERCENTILE_CHUNK_SIZE = chunk_size
+        self.assertEqual(result.shape, (15, 1, 11, 11))
+        self.assertEqual(result.coord('latitude'), cube.coord('latitude'))
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_nan(self):
+        """
+        Test that the percentiles match iris.analysis.PERCENTILE when the
+        data contains NaNs.
+
+        """
+        cube = self.cube.copy()
+        cube.data[0, 0, 0, 0] = np.nan
+        plugin = PercentileConverter('realization')
+        expected = cube.collapsed('realization', iris.analysis.PERCENTILE,
+                                  percent=plugin.percentiles)
+        result = plugin.process(cube)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
     def test_unavailable_collapse_coord(self):
         """
         Test that the plugin handles a collapse_coord that is not
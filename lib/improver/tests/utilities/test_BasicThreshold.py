@@ -156,6 +156,58 @@ class Test_process(IrisTest):
         expected_result_array = np.ones_like(self.cube.data)
         self.assertArrayAlmostEqual(result.data, expected_result_array)
 
+    def test_multiple_thresholds(self):
+        """Test that a list of thresholds gives a cube with a leading
+        threshold coordinate, with the thresholds in ascending order."""
+        plugin = Threshold([0.6, 0.1])
+        result = plugin.process(self.cube.copy())
+        expected_result_array = np.zeros((2,) + self.cube.shape)
+        expected_result_array[0][0][2][2] = 1.0
+        self.assertEqual(result.coord_dims("threshold"), (0,))
+        self.assertArrayAlmostEqual(
+            result.coord("threshold").points, [0.1, 0.6])
+        self.assertEqual(result.name(), "probability_of_precipitation_amount")
+        self.assertArrayAlmostEqual(result.data, expected_result_array)
+
+    def test_multiple_thresholds_match_single(self):
+        """Test that applying a list of fuzzy thresholds in below-threshold
+        mode matches applying each threshold in turn."""
+        thresholds = [0.1, 0.6, 2.0]
+        plugin = Threshold(
+            thresholds, fuzzy_factor=self.fuzzy_factor, below_thresh_ok=True)
+        result = plugin.process(self.cube.copy())
+        for index, threshold in enumerate(thresholds):
+            expected = Threshold(
+                threshold, fuzzy_factor=self.fuzzy_factor,
+                below_thresh_ok=True).process(self.cube.copy())
+            self.assertArrayAlmostEqual(result.data[index], expected.data)
+
+    def test_compact_dtype(self):
+        """Test that the truth values are uint8 when no fuzzy_factor is
+        applied and the compact_dtype option is used."""
+        plugin = Threshold(0.1, compact_dtype=True)
+        result = plugin.process(self.cube.copy())
+        expected_result_array = np.zeros(self.cube.shape, dtype=np.uint8)
+        expected_result_array[0][2][2] = 1
+        self.assertEqual(result.dtype, np.uint8)
+        self.assertArrayEqual(result.data, expected_result_array)
+
+    def test_compact_dtype_fuzzy(self):
+        """Test that the truth values are float32 when a fuzzy_factor is
+        applied and the compact_dtype option is used."""
+        plugin = Threshold(
+            [0.6, 2.0], fuzzy_factor=self.fuzzy_factor, compact_dtype=True)
+        result = plugin.process(self.cube)
+        self.assertEqual(result.dtype, np.float32)
+        self.assertAlmostEqual(result.data[0][0][2][2], 1.0/3.0, places=6)
+
+    def test_repeated_thresholds(self):
+        """Test when a list of thresholds contains a repeated threshold
+        (invalid)."""
+        msg = "Invalid threshold list: thresholds must be unique"
+        with self.assertRaisesRegexp(ValueError, msg):
+            Threshold([0.1, 0.6, 0.1])
+
     def test_threshold_point_nan(self):
         """Test behaviour for a single NaN grid cell."""
         # Need to copy the cube as we're adjusting the data.
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Unit tests for the utilities.spatial.GridSpec class."""
+
+import unittest
+
+from iris.tests import IrisTest
+import numpy as np
+
+from improver.tests.nbhood.nbhood.test_NeighbourhoodProcessing import (
+    set_up_cube_lat_long)
+from improver.tests.utilities.test_OccurrenceWithinVicinity import (
+    set_up_cube)
+from improver.utilities.spatial import GridSpec
+
+
+def set_up_grid_cube():
+    """Set up a cube with x and y coordinates with different spacings."""
+    data = np.zeros((2, 1, 3, 4))
+    return set_up_cube(
+        data, "lwe_precipitation_rate", "m s-1",
+        realizations=np.array([0, 1]),
+        y_dimension_values=np.array([0., 1000., 2000.]),
+        x_dimension_values=np.array([0., 2000., 4000., 6000.]))
+
+
+class Test_from_cube(IrisTest):
+
+    """Test the from_cube method."""
+
+    def setUp(self):
+        """Set up a cube and clear the cache."""
+        GridSpec.cache_clear()
+        self.cube = set_up_grid_cube()
+
+    def test_basic(self):
+        """Test that the properties of the grid are found."""
+        result = GridSpec.from_cube(self.cube)
+        self.assertIsInstance(result, GridSpec)
+        self.assertEqual(result.x_coord_name, "projection_x_coordinate")
+        self.assertEqual(result.y_coord_name, "projection_y_coordinate")
+        self.assertEqual((result.x_axis, result.y_axis), (3, 2))
+        self.assertEqual((result.x_units, result.y_units), ("m", "m"))
+        self.assertEqual(
+            (result.x_increment, result.y_increment), (2000., 1000.))
+        self.assertTrue(result.x_uniform)
+        self.assertTrue(result.y_uniform)
+        self.assertEqual(
+            (result.x_mean_resolution, result.y_mean_resolution),
+            (2000., 1000.))
+        self.assertEqual((result.x_extent, result.y_extent), (6000., 2000.))
+        self.assertFalse(result.x_circular)
+        self.assertFalse(result.y_circular)
+
+    def test_cached(self):
+        """Test that the same GridSpec is returned for a cube on the same
+        grid, including a copy of the cube and a slice of the cube which
+        retains the dimensions, but not for a slice which removes a leading
+        dimension, as the x and y axes differ."""
+        result = GridSpec.from_cube(self.cube)
+        self.assertIs(GridSpec.from_cube(self.cube.copy()), result)
+        self.assertIs(GridSpec.from_cube(self.cube[:1]), result)
+        sliced_result = GridSpec.from_cube(self.cube[0])
+        self.assertEqual(
+            (sliced_result.x_axis, sliced_result.y_axis), (2, 1))
+
+    def test_immutable_and_hashable(self):
+        """Test that the GridSpec cannot be modified and can be used as a
+        dictionary key."""
+        result = GridSpec.from_cube(self.cube)
+        with self.assertRaises(AttributeError):
+            result.x_increment = 1.
+        self.assertEqual({result: 1}[GridSpec.from_cube(self.cube)], 1)
+
+    def test_different_grid(self):
+        """Test that a different GridSpec is returned if the points of a
+        coordinate differ."""
+        result = GridSpec.from_cube(self.cube)
+        cube = self.cube.copy()
+        cube.coord("projection_x_coordinate").points = np.array(
+            [0., 4000., 8000., 12000.])
+        new_result = GridSpec.from_cube(cube)
+        self.assertNotEqual(new_result, result)
+        self.assertEqual(new_result.x_increment, 4000.)
+
+    def test_transposed(self):
+        """Test that the axes are found if the dimensions are reordered."""
+        self.cube.transpose([3, 2, 1, 0])
+        result = GridSpec.from_cube(self.cube)
+        self.assertEqual((result.x_axis, result.y_axis), (0, 1))
+
+    def test_non_uniform(self):
+        """Test that a coordinate with non-uniform increments is
+        identified."""
+        self.cube.coord("projection_x_coordinate").points = np.array(
+            [0., 2000., 4000., 9000.])
+        result = GridSpec.from_cube(self.cube)
+        self.assertFalse(result.x_uniform)
+        self.assertTrue(result.y_uniform)
+
+    def test_bounds(self):
+        """Test that the mean resolution is found from the bounds if they
+        are available."""
+        x_coord = self.cube.coord("projection_x_coordinate")
+        x_coord.bounds = np.array(
+            [x_coord.points - 500., x_coord.points + 500.]).T
+        result = GridSpec.from_cube(self.cube)
+        self.assertEqual(result.x_mean_resolution, 1000.)
+        self.assertEqual(result.y_mean_resolution, 1000.)
+
+    def test_circular(self):
+        """Test that the circularity of a coordinate is found."""
+        cube = set_up_cube_lat_long()
+        cube.coord("longitude").circular = True
+        result = GridSpec.from_cube(cube)
+        self.assertEqual(result.x_coord_name, "longitude")
+        self.assertTrue(result.x_circular)
+        self.assertFalse(result.y_circular)
+
+    def test_missing_axis(self):
+        """Test that an exception is raised if the cube does not have x and
+        y coordinates."""
+        self.cube.remove_coord("projection_x_coordinate")
+        msg = "The cube does not contain the expected"
+        with self.assertRaisesRegexp(ValueError, msg):
+            GridSpec.from_cube(self.cube)
+
+
+class Test_uniform_increment(IrisTest):
+
+    """Test the uniform_increment method."""
+
+    def test_basic(self):
+        """Test that the increment is returned for uniform increments, and
+        None is returned otherwise."""
+        cube = set_up_grid_cube()
+        cube.coord("projection_x_coordinate").points = np.array(
+            [0., 2000., 4000., 9000.])
+        result = GridSpec.from_cube(cube)
+        self.assertIsNone(result.uniform_increment("x"))
+        self.assertEqual(result.uniform_increment("y"), 1000.)
+
+
+class Test_in_metres(IrisTest):
+
+    """Test the in_metres method."""
+
+    def test_basic(self):
+        """Test that a spacing in kilometres is converted to metres."""
+        cube = set_up_grid_cube()
+        cube.coord("projection_x_coordinate").convert_units("km")
+        result = GridSpec.from_cube(cube)
+        self.assertEqual(result.x_increment, 2.)
+        self.assertAlmostEqual(
+            result.in_metres(result.x_increment, "x"), 2000.)
+        self.assertAlmostEqual(
+            result.in_metres(result.y_increment, "y"), 1000.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -76,6 +76,23 @@ def set_up_cube(data, phenomenon_standard_name, phenomenon_units,
     return cube
 
 
+class Test__init__(IrisTest):
+
+    """Test the __init__ method."""
+
+    def test_basic(self):
+        """Test that the default vicinity shape is square."""
+        plugin = OccurrenceWithinVicinity(2000)
+        self.assertEqual(plugin.distance, 2000)
+        self.assertEqual(plugin.vicinity_shape, "square")
+
+    def test_invalid_vicinity_shape(self):
+        """Test that an unsupported vicinity shape raises an error."""
+        msg = "The vicinity_shape requested: triangle is not a supported"
+        with self.assertRaisesRegexp(ValueError, msg):
+            OccurrenceWithinVicinity(2000, vicinity_shape="triangle")
+
+
 class Test__repr__(IrisTest):
 
     """Test the repr method."""
@@ -110,6 +127,106 @@ class Test_find_slices_over_coordinate(IrisTest):
         self.assertIsInstance(result, CubeList)
 
 
+class Test_running_maximum(IrisTest):
+
+    """Test the running_maximum method."""
+
+    def setUp(self):
+        """Set up random data."""
+        np.random.seed(0)
+        self.data = np.random.random((3, 4, 11))
+
+    def brute_force(self, data, axis, half_width):
+        """Find the running maximum by looping over each window."""
+        data = np.moveaxis(data, axis, -1)
+        result = np.empty_like(data)
+        for index in range(data.shape[-1]):
+            start = max(index - half_width, 0)
+            result[..., index] = data[..., start:index + half_width + 1].max(
+                axis=-1)
+        return np.moveaxis(result, -1, axis)
+
+    def test_basic(self):
+        """Test that the running maximum matches a brute force calculation
+        for a range of window sizes, including windows larger than the
+        axis."""
+        for half_width in [1, 2, 3, 5, 12]:
+            result = OccurrenceWithinVicinity.running_maximum(
+                self.data, -1, half_width)
+            expected = self.brute_force(self.data, -1, half_width)
+            self.assertArrayEqual(result, expected)
+
+    def test_other_axis(self):
+        """Test the running maximum along an axis other than the last."""
+        result = OccurrenceWithinVicinity.running_maximum(self.data, 1, 2)
+        expected = self.brute_force(self.data, 1, 2)
+        self.assertEqual(result.shape, self.data.shape)
+        self.assertArrayEqual(result, expected)
+
+    def test_zero_half_width(self):
+        """Test that the data are unchanged for a half width of zero."""
+        result = OccurrenceWithinVicinity.running_maximum(self.data, 0, 0)
+        self.assertArrayEqual(result, self.data)
+
+    def test_integer_and_boolean(self):
+        """Test that integer and boolean data, including negative values,
+        are supported and retain their type."""
+        data = np.array([[-5, -3, -9, -1, -7]], dtype=np.int32)
+        result = OccurrenceWithinVicinity.running_maximum(data, 1, 1)
+        self.assertEqual(result.dtype, np.int32)
+        self.assertArrayEqual(result, [[-3, -3, -1, -1, -1]])
+        data = np.array([False, True, False, False, False])
+        result = OccurrenceWithinVicinity.running_maximum(data, 0, 1)
+        self.assertEqual(result.dtype, np.bool_)
+        self.assertArrayEqual(result, [True, True, True, False, False])
+
+
+class Test_vicinity_maximum(IrisTest):
+
+    """Test the vicinity_maximum method."""
+
+    def setUp(self):
+        """Set up random data with more than two dimensions."""
+        np.random.seed(0)
+        self.data = np.random.random((2, 9, 3, 8))
+
+    def brute_force(self, data, footprint):
+        """Find the vicinity maximum over the second and last axes by
+        looping over each point and applying the footprint."""
+        radius = footprint.shape[0] // 2
+        result = np.empty_like(data)
+        for j in range(data.shape[1]):
+            for i in range(data.shape[-1]):
+                values = []
+                for dj in range(-radius, radius + 1):
+                    for di in range(-radius, radius + 1):
+                        if (footprint[dj + radius, di + radius] and
+                                0 <= j + dj < data.shape[1] and
+                                0 <= i + di < data.shape[-1]):
+                            values.append(data[:, j + dj, :, i + di])
+                result[:, j, :, i] = np.max(values, axis=0)
+        return result
+
+    def test_square(self):
+        """Test the square vicinity maximum."""
+        footprint = np.ones((5, 5), dtype=bool)
+        result = OccurrenceWithinVicinity(2000).vicinity_maximum(
+            self.data, 1, 3, 2)
+        self.assertArrayEqual(result, self.brute_force(self.data, footprint))
+
+    def test_circular(self):
+        """Test that the circular vicinity maximum includes the points
+        within the radius of each point."""
+        for radius in [1, 2, 3, 4]:
+            y, x = np.ogrid[-radius:radius + 1, -radius:radius + 1]
+            footprint = x**2 + y**2 <= radius**2
+            result = OccurrenceWithinVicinity(
+                2000, vicinity_shape="circular").vicinity_maximum(
+                    self.data, 1, 3, radius)
+            self.assertArrayEqual(
+                result, self.brute_force(self.data, footprint))
+
+
 class Test_maximum_within_vicinity(IrisTest):
 
     """Test the maximum_within_vicinity method."""
@@ -185,6 +302,73 @@ class Test_maximum_within_vicinity(IrisTest):
         self.assertIsInstance(result, Cube)
         self.assertArrayAlmostEqual(result.data, expected)
 
+    def test_circular(self):
+        """Test for binary events to determine where there is an occurrence
+        within a circular vicinity."""
+        expected = np.array(
+            [[0., 1., 1., 1., 0.],
+             [0., 1., 1., 0., 0.],
+             [1., 1., 1., 1., 0.],
+             [0., 1., 1., 1., 1.],
+             [0., 0., 0., 1., 0.]])
+        data = np.zeros((1, 1, 5, 5))
+        data[0, 0, 0, 2] = 1.0
+        data[0, 0, 2, 1] = 1.0
+        data[0, 0, 3, 3] = 1.0
+        y_dimension_values = np.arange(0.0, 10000.0, 2000.0)
+        cube = set_up_cube(data, "lwe_precipitation_rate", "m s-1",
+                           y_dimension_values=y_dimension_values,
+                           x_dimension_values=y_dimension_values)
+        cube = cube[0, 0, :, :]
+        result = OccurrenceWithinVicinity(
+            self.distance, vicinity_shape="circular").maximum_within_vicinity(
+                cube)
+        self.assertIsInstance(result, Cube)
+        self.assertArrayAlmostEqual(result.data, expected)
+
+    def test_multiple_realizations_and_times(self):
+        """Test that a cube with realization and time dimensions is
+        processed at once, giving the same result as processing each
+        x-y slice separately."""
+        np.random.seed(0)
+        data = np.random.random((2, 3, 5, 5))
+        y_dimension_values = np.arange(0.0, 10000.0, 2000.0)
+        cube = set_up_cube(data, "lwe_precipitation_rate", "m s-1",
+                           realizations=np.array([0, 1]),
+                           timesteps=np.array([402192.5, 402193.5,
+                                               402194.5]),
+                           y_dimension_values=y_dimension_values,
+                           x_dimension_values=y_dimension_values)
+        plugin = OccurrenceWithinVicinity(self.distance)
+        result = plugin.maximum_within_vicinity(cube)
+        self.assertEqual(result.shape, cube.shape)
+        for index in np.ndindex(2, 3):
+            expected = plugin.maximum_within_vicinity(cube[index])
+            self.assertArrayEqual(result[index].data, expected.data)
+
+
+class Test_demote_length_one_dimensions(IrisTest):
+
+    """Test the demote_length_one_dimensions method."""
+
+    def test_basic(self):
+        """Test that realization and time dimensions of length one are
+        demoted to scalar coordinates."""
+        cube = set_up_thresholded_cube()
+        result = OccurrenceWithinVicinity.demote_length_one_dimensions(cube)
+        self.assertEqual(result.shape, (4, 4))
+        self.assertFalse(result.coord_dims("realization"))
+        self.assertFalse(result.coord_dims("time"))
+
+    def test_longer_dimensions(self):
+        """Test that dimensions longer than one are retained."""
+        data = np.zeros((2, 1, 4, 4))
+        cube = set_up_cube(data, "lwe_precipitation_rate", "m s-1",
+                           realizations=np.array([0, 1]))
+        result = OccurrenceWithinVicinity.demote_length_one_dimensions(cube)
+        self.assertEqual(result.shape, (2, 4, 4))
+        self.assertEqual(result.coord_dims("realization"), (0,))
+
 
 class Test_process(IrisTest):
 
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Unit tests for the create_cube_with_thresholds function from
+threshold.py."""
+
+import unittest
+
+from cf_units import Unit
+from iris.coords import AuxCoord, DimCoord
+from iris.cube import Cube
+from iris.tests import IrisTest
+import numpy as np
+
+from improver.utilities.threshold import create_cube_with_thresholds
+
+
+class Test_create_cube_with_thresholds(IrisTest):
+
+    """Test the creation of a cube with a threshold coordinate."""
+
+    def setUp(self):
+        """Create a template cube."""
+        cube = Cube(np.zeros((1, 3, 3)), standard_name="precipitation_amount",
+                    units="kg m^-2 s^-1")
+        cube.add_dim_coord(DimCoord(np.linspace(-45.0, 45.0, 3), 'latitude',
+                                    units='degrees'), 1)
+        cube.add_dim_coord(DimCoord(np.linspace(120, 180, 3), 'longitude',
+                                    units='degrees'), 2)
+        tunit = Unit("hours since 1970-01-01 00:00:00", "gregorian")
+        cube.add_aux_coord(AuxCoord([402192.5], "time", units=tunit), 0)
+        self.cube = cube
+        self.data = np.ones((2, 1, 3, 3))
+
+    def test_basic(self):
+        """Test that the threshold coordinate is the zeroth dimension, and
+        the other coordinates are on the following dimensions."""
+        result = create_cube_with_thresholds([0.1, 0.5], self.cube, self.data)
+        self.assertIsInstance(result, Cube)
+        self.assertArrayAlmostEqual(result.data, self.data)
+        self.assertEqual(result.coord_dims("threshold"), (0,))
+        self.assertEqual(result.coord_dims("latitude"), (2,))
+        self.assertEqual(result.coord_dims("longitude"), (3,))
+        self.assertEqual(result.coord_dims("time"), (1,))
+
+    def test_metadata(self):
+        """Test that the cube is renamed to be a probability, and that the
+        threshold coordinate has the units of the template cube."""
+        result = create_cube_with_thresholds([0.1, 0.5], self.cube, self.data)
+        self.assertEqual(result.name(), "probability_of_precipitation_amount")
+        self.assertEqual(result.units, "1")
+        self.assertEqual(result.coord("threshold").units, self.cube.units)
+        self.assertEqual(result.attributes["relative_to_threshold"], "above")
+
+    def test_below_threshold(self):
+        """Test the attribute for probabilities of being below the
+        thresholds."""
+        result = create_cube_with_thresholds(
+            [0.1, 0.5], self.cube, self.data, below_thresh_ok=True)
+        self.assertEqual(result.attributes["relative_to_threshold"], "below")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Unit tests for the weighted_blend.IncrementalWeightedBlend plugin."""
+
+
+import itertools
+import unittest
+
+from cf_units import Unit
+from iris.coords import DimCoord
+from iris.cube import Cube
+from iris.tests import IrisTest
+import numpy as np
+
+from improver.weighted_blend import IncrementalWeightedBlend, WeightedBlend
+from improver.weights import WeightsUtilities
+from improver.tests.weighted_blend.test_PercentileBlendingAggregator import (
+    percentile_cube, BLENDED_PERCENTILE_DATA2)
+from improver.tests.weighted_blend.test_WeightedBlend import (
+    example_coord_adjust)
+
+
+def set_up_cube():
+    """Create a cube with three times, each with different data."""
+    data = np.zeros((3, 2, 2))
+    data[0][:][:] = 1.0
+    data[1][:][:] = 2.0
+    data[2][:][:] = 4.0
+    data[2][0][0] = 8.0
+    cube = Cube(data, standard_name="precipitation_amount",
+                units="kg m^-2 s^-1")
+    cube.add_dim_coord(DimCoord(np.linspace(-45.0, 45.0, 2), 'latitude',
+                                units='degrees'), 1)
+    cube.add_dim_coord(DimCoord(np.linspace(120, 180, 2), 'longitude',
+                                units='degrees'), 2)
+    tunit = Unit("hours since 1970-01-01 00:00:00", "gregorian")
+    cube.add_dim_coord(DimCoord([402192.5, 402193.5, 402194.5],
+                                "time", units=tunit), 0)
+    return cube
+
+
+class Test__repr__(IrisTest):
+
+    """Test the repr method."""
+
+    def test_basic(self):
+        """Test that the __repr__ returns the expected string."""
+        result = str(IncrementalWeightedBlend('time'))
+        msg = ('<IncrementalWeightedBlend: coord = time, '
+               'wts_redistrib_method = evenly, number of inputs = 0>')
+        self.assertEqual(result, msg)
+
+
+class Test_add(IrisTest):
+
+    """Test the add method."""
+
+    def setUp(self):
+        """Create a cube to add."""
+        self.cube = set_up_cube()
+
+    def test_basic(self):
+        """Test that the running sums are updated."""
+        plugin = IncrementalWeightedBlend('time')
+        plugin.add(self.cube[0], 0.25)
+        plugin.add(self.cube[1], 0.5)
+        self.assertEqual(plugin.weights, [0.25, 0.5])
+        self.assertArrayAlmostEqual(plugin.weighted_sum,
+                                    np.ones((2, 2))*1.25)
+        self.assertArrayAlmostEqual(plugin.unweighted_sum,
+                                    np.ones((2, 2))*3.0)
+
+    def test_length_one_dimension(self):
+        """Test that an input with the coord as a dimension of length one
+           is accepted."""
+        plugin = IncrementalWeightedBlend('time')
+        plugin.add(self.cube[0:1], 1.0)
+        self.assertEqual(plugin.template.shape, (2, 2))
+
+    def test_fails_input_not_a_cube(self):
+        """Test it raises a Value Error if not supplied with a cube."""
+        plugin = IncrementalWeightedBlend('time')
+        msg = 'The first argument must be an instance of iris.cube.Cube'
+        with self.assertRaisesRegexp(ValueError, msg):
+            plugin.add(self.cube.data[0], 1.0)
+
+    def test_fails_more_than_one_point(self):
+        """Test it raises a Value Error if the input has more than one point
+           of the coord."""
+        plugin = IncrementalWeightedBlend('time')
+        msg = 'Each input must have a single point of the coord time'
+        with self.assertRaisesRegexp(ValueError, msg):
+            plugin.add(self.cube, 1.0)
+
+    def test_fails_negative_weight(self):
+        """Test it raises a Value Error if the weight is negative."""
+        plugin = IncrementalWeightedBlend('time')
+        msg = 'Weights must be positive'
+        with self.assertRaisesRegexp(ValueError, msg):
+            plugin.add(self.cube[0], -0.5)
+
+    def test_fails_mismatched_input(self):
+        """Test it raises a Value Error if an input does not match the
+           inputs already added."""
+        plugin = IncrementalWeightedBlend('time')
+        plugin.add(self.cube[0], 0.5)
+        msg = 'The input does not match the inputs already added'
+        with self.assertRaisesRegexp(ValueError, msg):
+            plugin.add(self.cube[1, 0], 0.5)
+
+
+class Test_process(IrisTest):
+
+    """Test the process method."""
+
+    def setUp(self):
+        """Create the cubes to blend."""
+        self.cube = set_up_cube()
+        self.weights = np.array([0.2, 0.3, 0.5])
+
+    def test_basic(self):
+        """Test that the result matches blending all the inputs at once."""
+        plugin = IncrementalWeightedBlend('time')
+        for index, weight in enumerate(self.weights):
+            plugin.add(self.cube[index], weight)
+        result = plugin.process()
+        expected = WeightedBlend('time').process(self.cube, self.weights)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+        self.assertEqual(result.coord('time'), expected.coord('time'))
+        self.assertEqual(result.cell_methods, expected.cell_methods)
+
+    def test_missing_input_evenly(self):
+        """Test that the weight of an input that is not added is
+           redistributed evenly."""
+        plugin = IncrementalWeightedBlend('time')
+        plugin.add(self.cube[0], self.weights[0])
+        plugin.add(self.cube[2], self.weights[2])
+        result = plugin.process()
+        weights = WeightsUtilities.redistribute_weights(
+            self.weights, np.array([1.0, 0.0, 1.0]), method='evenly')
+        expected = WeightedBlend('time').process(self.cube[0::2], weights)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+        self.assertEqual(result.coord('time'), expected.coord('time'))
+
+    def test_missing_input_proportional(self):
+        """Test that the weight of an input that is not added is
+           redistributed in proportion to the weights of the others."""
+        plugin = IncrementalWeightedBlend(
+            'time', wts_redistrib_method='proportional')
+        plugin.add(self.cube[1], self.weights[1])
+        plugin.add(self.cube[2], self.weights[2])
+        result = plugin.process()
+        weights = WeightsUtilities.redistribute_weights(
+            self.weights, np.array([0.0, 1.0, 1.0]), method='proportional')
+        expected = WeightedBlend('time').process(self.cube[1:], weights)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_coord_adjust_set(self):
+        """Test it works with coord adjust set."""
+        plugin = IncrementalWeightedBlend('time', example_coord_adjust)
+        for index, weight in enumerate(self.weights):
+            plugin.add(self.cube[index], weight)
+        result = plugin.process()
+        self.assertAlmostEquals(result.coord('time').points, [402194.5])
+
+    def test_percentiles(self):
+        """Test that percentile data is blended in the same way as by the
+           PercentileBlendingAggregator."""
+        perc_cube = percentile_cube()
+        plugin = IncrementalWeightedBlend('time')
+        plugin.add(perc_cube[:, 0], 0.8)
+        plugin.add(perc_cube[:, 1], 0.2)
+        result = plugin.process()
+        expected_result_array = np.reshape(BLENDED_PERCENTILE_DATA2,
+                                           (6, 2, 2))
+        self.assertArrayAlmostEqual(result.data, expected_result_array)
+        self.assertEqual(result.cell_methods[0].method, 'percentile_blend')
+
+    def test_percentiles_many_inputs(self):
+        """Test that percentile data from several inputs, with a missing
+           input, is blended in the same way as by WeightedBlend."""
+        data = np.sort(
+            np.random.RandomState(0).rand(5, 4, 2, 3)*10.0, axis=0)
+        cube = Cube(data, long_name="air_temperature", units="K")
+        cube.add_dim_coord(DimCoord([0.0, 25.0, 50.0, 75.0, 100.0],
+                                    long_name="percentile_over_realization"),
+                           0)
+        cube.add_dim_coord(DimCoord([1.0, 2.0, 3.0, 4.0], "time",
+                                    units="hours since 1970-01-01"), 1)
+        weights = np.array([0.1, 0.4, 0.3, 0.2])
+        plugin = IncrementalWeightedBlend('time')
+        for index in [3, 0, 1]:
+            plugin.add(cube[:, index], weights[index])
+        result = plugin.process()
+        blend_weights = WeightsUtilities.redistribute_weights(
+            weights, np.array([1.0, 1.0, 0.0, 1.0]), method='evenly')
+        expected = WeightedBlend('time').process(
+            cube[:, [0, 1, 3]], blend_weights)
+        self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_percentiles_tied_values(self):
+        """Test that percentile data with values shared between the inputs
+           is blended in the same way as by WeightedBlend, whatever order
+           the inputs are added in."""
+        data = np.round(np.sort(
+            np.random.RandomState(0).rand(5, 3, 4, 4)*4.0, axis=0))
+        cube = Cube(data, long_name="air_temperature", units="K")
+        cube.add_dim_coord(DimCoord([0.0, 25.0, 50.0, 75.0, 100.0],
+                                    long_name="percentile_over_realization"),
+                           0)
+        cube.add_dim_coord(DimCoord([1.0, 2.0, 3.0], long_name="model"), 1)
+        weights = np.array([0.5, 0.3, 0.2])
+        expected = WeightedBlend('model').process(cube, weights)
+        for order in itertools.permutations(range(3)):
+            plugin = IncrementalWeightedBlend('model')
+            for index in order:
+                plugin.add(cube[:, index], weights[index])
+            result = plugin.process()
+            self.assertArrayAlmostEqual(result.data, expected.data)
+
+    def test_fails_no_inputs(self):
+        """Test it raises a Value Error if no inputs have been added."""
+        plugin = IncrementalWeightedBlend('time')
+        msg = 'No inputs have been added to the blend'
+        with self.assertRaisesRegexp(ValueError, msg):
+            plugin.process()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,7 +39,9 @@ from iris.cube import Cube
 from iris.tests import IrisTest
 import numpy as np
 
-from improver.weighted_blend import PercentileBlendingAggregator
+import improver.weighted_blend
+from improver.weighted_blend import (
+    PercentileBlendingAggregator, PercentileBlendingPool)
 
 PERCENTILE_DATA = np.array([
     15.3077946, 14.65380361, 15.91478244, 15.10887522,
@@ -124,6 +126,23 @@ class Test__repr__(IrisTest):
         msg = '<PercentileBlendingAggregator>'
         self.assertEqual(result, msg)
 
+    def test_spatially_varying_weights(self):
+        """Test blend_percentile_aggregate works with weights that vary at
+           each point, given with the same number of dimensions as data."""
+        weights = np.array([0.8, 0.2, 0.5, 0.5])
+        weights = np.stack([weights, 1.0 - weights]).reshape(1, 2, 2, 2)
+        percentiles = np.array([0, 20, 40, 60, 80, 100])
+        perc_data = np.reshape(PERCENTILE_DATA, (6, 2, 2, 2))
+        result = PercentileBlendingAggregator.aggregate(
+            perc_data, 1, percentiles, weights, 0)
+        self.assertEqual(result.shape, (6, 2, 2))
+        for index in np.ndindex(2, 2):
+            expected = PercentileBlendingAggregator.blend_percentiles(
+                perc_data[(slice(None), slice(None)) + index].T,
+                percentiles, weights[(0, slice(None)) + index])
+            self.assertArrayAlmostEqual(
+                result[(slice(None),) + index], expected)
+
 
 class Test_aggregate(IrisTest):
     """Test the aggregate method"""
@@ -216,6 +235,112 @@ class Test_aggregate(IrisTest):
         self.assertEqual(result.shape, expected_result_shape)
 
 
+class Test_aggregate_chunks(IrisTest):
+    """Test the aggregate method when the points are blended in chunks"""
+    def setUp(self):
+        """Use a small chunk size, so that the data spans several chunks."""
+        self.chunk_size = improver.weighted_blend.PERCENTILE_BLEND_CHUNK_SIZE
+        improver.weighted_blend.PERCENTILE_BLEND_CHUNK_SIZE = 3
+
+    def tearDown(self):
+        """Restore the chunk size."""
+        improver.weighted_blend.PERCENTILE_BLEND_CHUNK_SIZE = self.chunk_size
+
+    def test_matches_blend_percentiles(self):
+        """Test that the result at every point exactly matches blending that
+           point on its own, including points with repeated values."""
+        weights = np.array([0.5, 0.3, 0.2])
+        percentiles = np.array([0., 25., 50., 75., 100.])
+        perc_data = np.sort(
+            np.random.RandomState(0).randint(0, 4, (3, 4, 2, 5)), axis=-1)
+        perc_data = perc_data.astype(np.float32)
+        result = PercentileBlendingAggregator.aggregate(
+            perc_data, 0, percentiles, weights, 3)
+        self.assertEqual(result.shape, (4, 2, 5))
+        for index in np.ndindex(4, 2):
+            expected = PercentileBlendingAggregator.blend_percentiles(
+                perc_data[(slice(None),) + index], percentiles, weights)
+            self.assertArrayEqual(result[index], expected)
+
+    def test_blend_pool(self):
+        """Test that the result is the same when the chunks are blended in
+           parallel by a pool, with weights that vary at each point."""
+        percentiles = np.array([0., 25., 50., 75., 100.])
+        random_state = np.random.RandomState(0)
+        perc_data = np.sort(random_state.rand(3, 4, 2, 5), axis=-1)
+        weights = random_state.rand(3, 4, 2, 1)
+        blend_pool = PercentileBlendingPool(2)
+        try:
+            result = PercentileBlendingAggregator.aggregate(
+                perc_data, 0, percentiles, weights, 3,
+                blend_pool=blend_pool)
+        finally:
+            blend_pool.close()
+        expected = PercentileBlendingAggregator.aggregate(
+            perc_data, 0, percentiles, weights, 3)
+        self.assertArrayEqual(result, expected)
+
+
+class Test_interp_along_last_axis(IrisTest):
+    """Test the interp_along_last_axis method"""
+    def test_matches_np_interp(self):
+        """Test that the result for each point exactly matches np.interp,
+           including values outside the data points, values equal to
+           repeated data points, and NaN values."""
+        xp_values = np.array([[0., 1., 1., 2.],
+                              [0.5, 0.5, 0.5, 3.],
+                              [-1., 0., 2., 2.]])
+        fp_values = np.array([[0., 10., 20., 30.],
+                              [5., 5., 6., 9.],
+                              [1., 2., 3., 3.]])
+        x_values = np.array([-1., 0., 0.3, 1., 1.5, 2., 2.5, np.nan])
+        result = PercentileBlendingAggregator.interp_along_last_axis(
+            x_values, xp_values, fp_values)
+        self.assertEqual(result.shape, (3, 8))
+        for index in range(3):
+            expected = np.interp(
+                x_values, xp_values[index], fp_values[index])
+            self.assertArrayEqual(result[index], expected)
+
+    def test_broadcast(self):
+        """Test that the leading dimensions of the arrays are broadcast."""
+        xp_values = np.array([[0., 1., 2.], [0., 2., 4.]])
+        fp_values = np.array([0., 50., 100.])
+        x_values = np.array([[0.5, 1.5]])
+        result = PercentileBlendingAggregator.interp_along_last_axis(
+            x_values, xp_values, fp_values)
+        self.assertArrayAlmostEqual(result, [[25., 75.], [12.5, 37.5]])
+
+
+class Test_blend_percentiles_at_points(IrisTest):
+    """Test the blend_percentiles_at_points method"""
+    def test_matches_blend_percentiles(self):
+        """Test that the result at each point exactly matches
+           blend_percentiles."""
+        weights = np.array([0.38872692, 0.33041788, 0.2808552])
+        percentiles = np.array([0., 10., 20., 30., 40., 50.,
+                                60., 70., 80., 90., 100.])
+        perc_values = np.stack([PERCENTILE_VALUES, PERCENTILE_VALUES[::-1],
+                                PERCENTILE_VALUES + 1.])
+        result = PercentileBlendingAggregator.blend_percentiles_at_points(
+            perc_values, percentiles, weights)
+        self.assertEqual(result.shape, (3, 11))
+        for index in range(3):
+            expected = PercentileBlendingAggregator.blend_percentiles(
+                perc_values[index], percentiles, weights)
+            self.assertArrayEqual(result[index], expected)
+
+    def test_only_one_point_to_blend(self):
+        """Test case where there is only one point in the coordinate we are
+           blending over."""
+        weights = np.array([1.0])
+        percentiles = np.array([20.0, 50.0, 80.0])
+        perc_values = np.array([[[5.0, 6.0, 7.0]], [[1.0, 2.0, 4.0]]])
+        result = PercentileBlendingAggregator.blend_percentiles_at_points(
+            perc_values, percentiles, weights)
+        self.assertArrayAlmostEqual(result, perc_values[:, 0])
+
+
 class Test_blend_percentiles(IrisTest):
     """Test the blend_percentiles method"""
     def test_blend_percentiles(self):
@@ -266,5 +391,6 @@ class Test_blend_percentiles(IrisTest):
         expected_result = np.array([5.0, 6.0, 7.0])
         self.assertArrayAlmostEqual(result, expected_result)
 
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Unit tests for the weighted_blend.PercentileBlendingPool class."""
+
+
+import unittest
+
+from iris.tests import IrisTest
+import numpy as np
+
+from improver.weighted_blend import (
+    PercentileBlendingAggregator, PercentileBlendingPool)
+
+
+class Test__repr__(IrisTest):
+    """Test the repr method."""
+
+    def test_basic(self):
+        """Test that the __repr__ returns the expected string."""
+        result = str(PercentileBlendingPool(2))
+        msg = '<PercentileBlendingPool: workers: 2>'
+        self.assertEqual(result, msg)
+
+
+class Test_blend(IrisTest):
+    """Test the blend method."""
+
+    def setUp(self):
+        """Set up a pool, and percentile data with points in the last two
+           dimensions."""
+        self.blend_pool = PercentileBlendingPool(2)
+        self.percentiles = np.array([0., 50., 100.])
+        self.weights = np.array([0.4, 0.6])
+        self.data = np.sort(
+            np.random.RandomState(0).rand(2, 3, 5, 2), axis=1).astype(
+                np.float32)
+        self.tiles = [(0, 4), (4, 8), (8, 12)]
+
+    def tearDown(self):
+        """Close the pool."""
+        self.blend_pool.close()
+
+    def expected(self, data, weights):
+        """Blend all the points of the data at once."""
+        data = data.reshape(data.shape[:2] + (-1,))
+        return PercentileBlendingAggregator.blend_percentiles_at_points(
+            np.moveaxis(data, -1, 0), self.percentiles, weights).T
+
+    def test_basic(self):
+        """Test that each tile is blended and written into the result,
+           which has the points flattened."""
+        result = self.blend_pool.blend(
+            self.data, self.percentiles, self.weights, self.tiles)
+        self.assertEqual(result.shape, (3, 10))
+        self.assertArrayEqual(result, self.expected(self.data, self.weights))
+
+    def test_shared_data_type(self):
+        """Test that the data is shared in its own data type."""
+        self.blend_pool.blend(
+            self.data, self.percentiles, self.weights, self.tiles)
+        self.assertEqual(
+            [dtype for _, _, dtype in self.blend_pool.shared_arrays],
+            [np.float32, np.float64, np.float64])
+
+    def test_weights_at_points(self):
+        """Test that weights that vary at each point are used."""
+        weights = np.random.RandomState(1).rand(10, 2)
+        result = self.blend_pool.blend(
+            self.data, self.percentiles, weights, self.tiles)
+        self.assertArrayEqual(result, self.expected(self.data, weights))
+
+    def test_reuse(self):
+        """Test that the same processes blend further data, and that the
+           earlier result is not overwritten."""
+        first = self.blend_pool.blend(
+            self.data, self.percentiles, self.weights, self.tiles)
+        pool = self.blend_pool.pool
+        data = self.data[:, :, ::-1]
+        second = self.blend_pool.blend(
+            data, self.percentiles, self.weights, self.tiles)
+        self.assertIs(self.blend_pool.pool, pool)
+        self.assertArrayEqual(first, self.expected(self.data, self.weights))
+        self.assertArrayEqual(second, self.expected(data, self.weights))
+
+    def test_different_shape(self):
+        """Test that an exception is raised if further data has a
+           different shape."""
+        self.blend_pool.blend(
+            self.data, self.percentiles, self.weights, self.tiles)
+        msg = 'must keep the same shapes and data types'
+        with self.assertRaisesRegexp(ValueError, msg):
+            self.blend_pool.blend(
+                self.data[:, :, :4], self.percentiles, self.weights,
+                self.tiles)
+
+
+class Test_close(IrisTest):
+    """Test the close method."""
+
+    def test_basic(self):
+        """Test that the processes are ended and the shared memory is
+           released."""
+        blend_pool = PercentileBlendingPool(2)
+        data = np.sort(np.random.RandomState(0).rand(2, 3, 4), axis=1)
+        blend_pool.blend(data, np.array([0., 50., 100.]),
+                         np.array([0.4, 0.6]), [(0, 2), (2, 4)])
+        blend_pool.close()
+        self.assertIsNone(blend_pool.pool)
+        self.assertIsNone(blend_pool.shared_arrays)
+
+    def test_not_started(self):
+        """Test that a pool that has not blended any data can be closed."""
+        blend_pool = PercentileBlendingPool(2)
+        blend_pool.close()
+        self.assertIsNone(blend_pool.pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
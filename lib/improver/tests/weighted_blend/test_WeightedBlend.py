@@ -42,6 +42,7 @@ from iris.tests import IrisTest
 from iris.exceptions import CoordinateNotFoundError
 import numpy as np
 
+import improver.weighted_blend
 from improver.weighted_blend import WeightedBlend
 from improver.tests.weighted_blend.test_PercentileBlendingAggregator import (
     percentile_cube, BLENDED_PERCENTILE_DATA1, BLENDED_PERCENTILE_DATA2)
@@ -65,9 +66,27 @@ class Test__repr__(IrisTest):
     def test_basic(self):
         """Test that the __repr__ returns the expected string."""
         result = str(WeightedBlend('time'))
-        msg = '<WeightedBlend: coord = time>'
+        msg = '<WeightedBlend: coord = time, workers = 1>'
         self.assertEqual(result, msg)
 
+    def test_workers(self):
+        """Test that the __repr__ includes the number of workers."""
+        result = str(WeightedBlend('time', workers=4))
+        msg = '<WeightedBlend: coord = time, workers = 4>'
+        self.assertEqual(result, msg)
+
+
+class Test__init__(IrisTest):
+
+    """Test the init method."""
+
+    def test_fails_workers(self):
+        """Test it raises a Value Error if the number of workers is less
+           than 1."""
+        msg = 'The number of workers must be at least 1'
+        with self.assertRaisesRegexp(ValueError, msg):
+            WeightedBlend('time', workers=0)
+
 
 class Test_process(IrisTest):
 
@@ -171,6 +190,17 @@ class Test_process(IrisTest):
         with self.assertRaisesRegexp(ValueError, msg):
             plugin.process(self.cube, weights)
 
+    def test_fails_spatial_weights_shape(self):
+        """Test it raises a Value Error if spatially varying weights do not
+           match the shape of the coord and the y and x coords."""
+        coord = "time"
+        plugin = WeightedBlend(coord)
+        weights = np.ones((2, 2, 3))
+        msg = ('The weights array must match the shape ' +
+               'of the coordinate in the input cube')
+        with self.assertRaisesRegexp(ValueError, msg):
+            plugin.process(self.cube, weights)
+
     def test_coord_adjust_set(self):
         """Test it works with coord adjust set."""
         coord = "time"
@@ -225,6 +255,29 @@ class Test_process(IrisTest):
         expected_result_array = np.ones((2, 2))*1.2
         self.assertArrayAlmostEqual(result.data, expected_result_array)
 
+    def test_weights_spatially_varying(self):
+        """Test it works with weights that vary at each grid point."""
+        coord = "time"
+        plugin = WeightedBlend(coord)
+        weights = np.array([[[0.2, 0.5], [1.0, 0.0]],
+                            [[0.8, 0.5], [0.0, 1.0]]])
+        result = plugin.process(self.cube, weights)
+        expected_result_array = np.array([[1.8, 1.5], [1.0, 2.0]])
+        self.assertArrayAlmostEqual(result.data, expected_result_array)
+
+    def test_weights_spatially_varying_dims_reordered(self):
+        """Test it works with weights that vary at each grid point, when the
+           coord is not the leading dimension of the cube."""
+        coord = "time"
+        plugin = WeightedBlend(coord)
+        cube = self.cube.copy()
+        cube.transpose([2, 0, 1])
+        weights = np.array([[[0.2, 0.5], [1.0, 0.0]],
+                            [[0.8, 0.5], [0.0, 1.0]]])
+        result = plugin.process(cube, weights)
+        expected_result_array = np.array([[1.8, 1.0], [1.5, 2.0]])
+        self.assertArrayAlmostEqual(result.data, expected_result_array)
+
     def test_percentiles_weights_equal_none(self):
         """Test it works for percentiles with weights set to None."""
         coord = "time"
@@ -248,6 +301,49 @@ class Test_process(IrisTest):
                                            (6, 2, 2))
         self.assertArrayAlmostEqual(result.data, expected_result_array)
 
+    def test_percentiles_spatially_varying_weights(self):
+        """Test it works for percentiles with weights that vary at each
+           grid point, when they are all the same as [0.8, 0.2]."""
+        coord = "time"
+        plugin = WeightedBlend(coord)
+        weights = np.ones((2, 2, 2))
+        weights[0] = 0.8
+        weights[1] = 0.2
+        perc_cube = percentile_cube()
+        result = plugin.process(perc_cube, weights)
+        expected_result_array = np.reshape(BLENDED_PERCENTILE_DATA2,
+                                           (6, 2, 2))
+        self.assertArrayAlmostEqual(result.data, expected_result_array)
+
+    def test_percentiles_workers(self):
+        """Test it gives the same result for percentiles when the points are
+           blended in parallel."""
+        coord = "time"
+        weights = [0.8, 0.2]
+        perc_cube = percentile_cube()
+        chunk_size = improver.weighted_blend.PERCENTILE_BLEND_CHUNK_SIZE
+        improver.weighted_blend.PERCENTILE_BLEND_CHUNK_SIZE = 1
+        try:
+            result = WeightedBlend(coord, workers=2).process(
+                perc_cube, weights)
+        finally:
+            improver.weighted_blend.PERCENTILE_BLEND_CHUNK_SIZE = chunk_size
+        expected = WeightedBlend(coord).process(perc_cube, weights)
+        self.assertArrayEqual(result.data, expected.data)
+
+    def test_percentiles_coord_before_percentiles(self):
+        """Test it works for percentiles when the coord comes before the
+           percentile dimension in the cube."""
+        coord = "time"
+        plugin = WeightedBlend(coord)
+        weights = [0.8, 0.2]
+        perc_cube = percentile_cube()
+        perc_cube.transpose([1, 2, 0, 3])
+        result = plugin.process(perc_cube, weights)
+        expected_result_array = np.moveaxis(
+            np.reshape(BLENDED_PERCENTILE_DATA2, (6, 2, 2)), 0, 1)
+        self.assertArrayAlmostEqual(result.data, expected_result_array)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# (C) British Crown Copyright 2017 Met Office.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+"""Unit tests for the weighted_blend.WeightedMeanAggregator."""
+
+
+import unittest
+
+from iris.tests import IrisTest
+import numpy as np
+
+from improver.weighted_blend import WeightedMeanAggregator
+
+
+class Test__repr__(IrisTest):
+
+    """Test the repr method."""
+
+    def test_basic(self):
+        """Test that the __repr__ returns the expected string."""
+        result = str(WeightedMeanAggregator())
+        msg = '<WeightedMeanAggregator>'
+        self.assertEqual(result, msg)
+
+
+class Test_aggregate(IrisTest):
+
+    """Test the aggregate method."""
+
+    def setUp(self):
+        """Create data to blend along the last axis, with shape
+           (y, x, coord)."""
+        self.data = np.random.RandomState(0).rand(2, 3, 4)
+
+    def test_basic(self):
+        """Test the weighted mean with weights that only vary along the
+           axis."""
+        weights = np.array([0.1, 0.2, 0.3, 0.4])
+        result = WeightedMeanAggregator.aggregate(self.data, -1, weights)
+        expected = np.average(self.data, axis=-1, weights=weights)
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_weights_not_normalised(self):
+        """Test that the weights do not need to add up to one."""
+        weights = np.array([1.0, 2.0, 3.0, 4.0])
+        result = WeightedMeanAggregator.aggregate(self.data, -1, weights)
+        expected = np.average(self.data, axis=-1, weights=weights)
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_spatial_weights(self):
+        """Test the weighted mean with weights that vary along the axis and
+           the other dimensions."""
+        weights = np.random.RandomState(1).rand(2, 3, 4)
+        result = WeightedMeanAggregator.aggregate(self.data, 2, weights)
+        expected = np.average(self.data, axis=-1, weights=weights)
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_broadcast_weights(self):
+        """Test the weighted mean with weights that only vary along some of
+           the dimensions."""
+        weights = np.random.RandomState(1).rand(1, 3, 4)
+        result = WeightedMeanAggregator.aggregate(self.data, -1, weights)
+        expected = np.average(self.data, axis=-1,
+                              weights=np.broadcast_to(weights, (2, 3, 4)))
+        self.assertArrayAlmostEqual(result, expected)
+
+    def test_masked_data(self):
+        """Test that masked points are left out of the mean, and that the
+           result is masked where all the points are masked."""
+        data = np.ma.masked_less(self.data, 0.5)
+        data[0, 0] = np.ma.masked
+        weights = np.random.RandomState(1).rand(2, 3, 4)
+        result = WeightedMeanAggregator.aggregate(data, -1, weights)
+        expected = np.ma.average(data, axis=-1, weights=weights)
+        self.assertArrayAlmostEqual(result, expected)
+        self.assertArrayEqual(result.mask, expected.mask)
+        self.assertTrue(result.mask[0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
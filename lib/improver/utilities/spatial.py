@@ -30,16 +30,201 @@
 # POSSIBILITY OF SUCH DAMAGE.
 """ Provides support utilities."""
 
+from collections import namedtuple, OrderedDict
 import copy
+import threading
+
+from cf_units import Unit
 from iris.coords import CellMethod, DimCoord
 from iris.cube import Cube, CubeList
 from iris.exceptions import CoordinateNotFoundError
 import numpy as np
-import scipy.ndimage
+
+from improver.utilities.cube_checker import check_for_x_and_y_axes
 
 # Maximum radius of the neighbourhood width in grid cells.
 MAX_DISTANCE_IN_GRID_CELLS = 500
 
+# Maximum number of grids for which a GridSpec is cached.
+GRID_SPEC_CACHE_SIZE = 32
+
+
+class GridSpec(namedtuple(
+        "GridSpec",
+        ["x_coord_name", "y_coord_name", "x_axis", "y_axis",
+         "x_units", "y_units", "x_increment", "y_increment",
+         "x_uniform", "y_uniform", "x_mean_resolution", "y_mean_resolution",
+         "x_extent", "y_extent", "x_circular", "y_circular"])):
+
+    """
+    An immutable description of the x and y axes of a grid, which is
+    derived once from the coordinates of a cube and cached, so that the
+    coordinates do not need to be inspected again for each call and each
+    slice processed on the same grid.
+
+    The spacings and extents are in the units of the coordinates.
+
+    Attributes
+    ----------
+    x_coord_name, y_coord_name : string
+        Names of the x and y coordinates.
+    x_axis, y_axis : integer or None
+        Indices of the x and y dimensions of the cube, or None if the
+        coordinate does not describe a single dimension.
+    x_units, y_units : string
+        Units of the x and y coordinates.
+    x_increment, y_increment : float
+        Difference between the first two points of the x and y
+        coordinates, or NaN if a coordinate has fewer than two points.
+    x_uniform, y_uniform : boolean
+        True if the increments between the points of the x and y
+        coordinates are uniform.
+    x_mean_resolution, y_mean_resolution : float
+        Mean width of the grid cells along x and y, from the bounds if
+        available, otherwise from the points.
+    x_extent, y_extent : float
+        Difference between the maximum and minimum points along x and y.
+    x_circular, y_circular : boolean
+        True if the x and y coordinates are circular.
+    """
+
+    __slots__ = ()
+
+    _cache = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _describe_axis(cube, coord):
+        """
+        Derive the properties of one axis of the grid.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube containing the coordinate.
+        coord : iris.coords.Coord
+            The x or y coordinate of the cube.
+
+        Returns
+        -------
+        tuple
+            The name, dimension, units, increment, uniformity, mean
+            resolution, extent and circularity of the axis.
+        """
+        points = coord.points
+        coord_dims = cube.coord_dims(coord)
+        axis = coord_dims[0] if len(coord_dims) == 1 else None
+        if len(points) > 1:
+            increments = np.diff(points)
+            increment = float(increments[0])
+            uniform = bool(np.isclose(np.sum(np.diff(increments)), 0))
+        else:
+            increments = np.array([np.nan])
+            increment = np.nan
+            uniform = True
+        if coord.bounds is not None:
+            mean_resolution = float(np.diff(coord.bounds).mean())
+        else:
+            mean_resolution = float(increments.mean())
+        extent = float(points.max() - points.min())
+        circular = bool(getattr(coord, "circular", False))
+        return (coord.name(), axis, str(coord.units), increment, uniform,
+                mean_resolution, extent, circular)
+
+    @classmethod
+    def from_cube(cls, cube):
+        """
+        Get the GridSpec describing the x and y axes of a cube. The GridSpec
+        is cached using a fingerprint of the x and y coordinates, so that it
+        is only derived once for each grid.
+
+        Parameters
+        ----------
+        cube : Iris.cube.Cube
+            Cube with x and y coordinates.
+
+        Returns
+        -------
+        GridSpec
+            Description of the x and y axes of the cube.
+
+        Raises
+        ------
+        ValueError : If the cube does not have x and y coordinates.
+        """
+        check_for_x_and_y_axes(cube)
+        coords = [cube.coord(axis="x"), cube.coord(axis="y")]
+        key = tuple(
+            (coord.name(), str(coord.units), cube.coord_dims(coord),
+             coord.points.dtype.str, coord.points.shape,
+             coord.points.tobytes(),
+             None if coord.bounds is None else coord.bounds.tobytes(),
+             getattr(coord, "circular", False))
+            for coord in coords)
+        with cls._lock:
+            try:
+                grid_spec = cls._cache.pop(key)
+            except KeyError:
+                grid_spec = None
+            else:
+                cls._cache[key] = grid_spec
+        if grid_spec is None:
+            x_description, y_description = [
+                cls._describe_axis(cube, coord) for coord in coords]
+            grid_spec = cls(*[value for pair in zip(
+                x_description, y_description) for value in pair])
+            with cls._lock:
+                cls._cache[key] = grid_spec
+                while len(cls._cache) > GRID_SPEC_CACHE_SIZE:
+                    # Discard the least recently used grid.
+                    cls._cache.popitem(last=False)
+        return grid_spec
+
+    @classmethod
+    def cache_clear(cls):
+        """Remove all grids from the cache."""
+        with cls._lock:
+            cls._cache.clear()
+
+    def uniform_increment(self, axis):
+        """
+        Get the increment between the points along the x or y axis, if the
+        increments are uniform.
+
+        Parameters
+        ----------
+        axis : string
+            The axis of the increment. Either 'x' or 'y'.
+
+        Returns
+        -------
+        float or None
+            The increment in the units of the coordinate, or None if the
+            increments are not uniform.
+        """
+        if axis == "x":
+            return self.x_increment if self.x_uniform else None
+        return self.y_increment if self.y_uniform else None
+
+    def in_metres(self, value, axis):
+        """
+        Convert a spacing or extent along the x or y axis into metres.
+
+        Parameters
+        ----------
+        value : float
+            Spacing or extent in the units of the coordinate.
+        axis : string
+            The axis of the spacing or extent. Either 'x' or 'y'.
+
+        Returns
+        -------
+        float
+            Spacing or extent in metres.
+        """
+        units = self.x_units if axis == "x" else self.y_units
+        return Unit(units).convert(value, "metres")
+
 
 def convert_distance_into_number_of_grid_cells(
         cube, distance, max_distance_in_grid_cells):
@@ -69,21 +254,22 @@ def convert_distance_into_number_of_grid_cells(
 
     """
     try:
-        x_coord = cube.coord("projection_x_coordinate").copy()
-        y_coord = cube.coord("projection_y_coordinate").copy()
-    except CoordinateNotFoundError:
+        grid_spec = GridSpec.from_cube(cube)
+    except ValueError:
+        grid_spec = None
+    if (grid_spec is None or
+            grid_spec.x_coord_name != "projection_x_coordinate" or
+            grid_spec.y_coord_name != "projection_y_coordinate"):
         raise ValueError("Invalid grid: projection_x/y coords required")
-    x_coord.convert_units("metres")
-    y_coord.convert_units("metres")
     max_distance_of_domain = np.sqrt(
-        (x_coord.points.max() - x_coord.points.min())**2 +
-        (y_coord.points.max() - y_coord.points.min())**2)
+        grid_spec.in_metres(grid_spec.x_extent, "x")**2 +
+        grid_spec.in_metres(grid_spec.y_extent, "y")**2)
     if distance > max_distance_of_domain:
         raise ValueError(
             ("Distance of {0}m exceeds max domain distance of {1}m".format(
                  distance, max_distance_of_domain)))
-    d_north_metres = y_coord.points[1] - y_coord.points[0]
-    d_east_metres = x_coord.points[1] - x_coord.points[0]
+    d_north_metres = grid_spec.in_metres(grid_spec.y_increment, "y")
+    d_east_metres = grid_spec.in_metres(grid_spec.x_increment, "x")
     grid_cells_y = int(distance / abs(d_north_metres))
     grid_cells_x = int(distance / abs(d_east_metres))
     if grid_cells_x == 0 or grid_cells_y == 0:
@@ -226,7 +412,7 @@ class OccurrenceWithinVicinity(object):
 
     """Calculate whether a phenomenon occurs within the specified distance."""
 
-    def __init__(self, distance):
+    def __init__(self, distance, vicinity_shape="square"):
         """
         Initialise the class.
 
@@ -234,9 +420,22 @@ class OccurrenceWithinVicinity(object):
             distance : float
                 Distance in metres used to define the vicinity within which to
                 search for an occurrence.
+            vicinity_shape : str
+                Shape of the vicinity. Options: 'square', 'circular'.
+                Optional, defaults to 'square'.
+
+        Raises:
+            ValueError: If the vicinity shape is not supported.
 
         """
         self.distance = distance
+        shapes = ["square", "circular"]
+        if vicinity_shape not in shapes:
+            msg = ("The vicinity_shape requested: {} is not a supported "
+                   "shape. Please choose from: {}".format(
+                       vicinity_shape, shapes))
+            raise ValueError(msg)
+        self.vicinity_shape = vicinity_shape
 
     def __repr__(self):
         """Represent the configured plugin instance as a string."""
@@ -267,6 +466,112 @@ class OccurrenceWithinVicinity(object):
             slices_over_coord = CubeList([cube])
         return slices_over_coord
 
+    @staticmethod
+    def running_maximum(data, axis, half_width):
+        """
+        Calculate the maximum within a window centred on each point along
+        one axis of an array, using the van Herk/Gil-Werman algorithm, so
+        that the cost does not depend upon the size of the window.
+
+        The array is split into blocks with the length of the window. The
+        maximum within a window is the maximum of the cumulative maximum
+        from the start of the window to the end of its first block, and the
+        cumulative maximum from the start of the following block to the end
+        of the window. Points beyond the edge of the array are excluded from
+        the window.
+
+        Args:
+            data : numpy.ndarray
+                Array for which to calculate the running maximum.
+            axis : integer
+                Axis along which to calculate the running maximum.
+            half_width : integer
+                Number of points either side of the central point within the
+                window.
+
+        Returns:
+            result : numpy.ndarray
+                Array with the same shape and type as the data, containing
+                the maximum within the window centred on each point.
+        """
+        data = np.moveaxis(np.asarray(data), axis, -1)
+        if half_width == 0:
+            return np.moveaxis(data.copy(), -1, axis)
+        if np.issubdtype(data.dtype, np.floating):
+            fill_value = -np.inf
+        elif data.dtype == np.bool_:
+            fill_value = False
+        else:
+            fill_value = np.iinfo(data.dtype).min
+        size = 2 * half_width + 1
+        num_points = data.shape[-1]
+        num_blocks = -(-(num_points + 2 * half_width) // size)
+        padded = np.full(data.shape[:-1] + (num_blocks * size,), fill_value,
+                         dtype=data.dtype)
+        padded[..., half_width:half_width + num_points] = data
+        blocks = np.reshape(padded, data.shape[:-1] + (num_blocks, size))
+        forward = np.reshape(
+            np.maximum.accumulate(blocks, axis=-1), padded.shape)
+        backward = np.reshape(
+            np.maximum.accumulate(blocks[..., ::-1], axis=-1)[..., ::-1],
+            padded.shape)
+        result = np.maximum(backward[..., :num_points],
+                            forward[..., size - 1:size - 1 + num_points])
+        return np.moveaxis(result, -1, axis)
+
+    def vicinity_maximum(self, data, y_axis, x_axis, grid_cells):
+        """
+        Calculate the maximum within the vicinity of each point, considering
+        only the x and y axes, so that any number of other dimensions can be
+        processed at once.
+
+        A square vicinity is found from a running maximum along each axis in
+        turn. A circular vicinity is the union of the rectangles that fit
+        within the circle, one for each distinct half-width of the rows of
+        the circle, so the cost scales with the radius rather than the area
+        of the vicinity.
+
+        Args:
+            data : numpy.ndarray
+                Array for which to calculate the vicinity maximum.
+            y_axis : integer
+                Index of the y axis of the array.
+            x_axis : integer
+                Index of the x axis of the array.
+            grid_cells : integer
+                Number of grid cells from the central point to the edge of
+                the vicinity.
+
+        Returns:
+            result : numpy.ndarray
+                Array containing the maximum within the vicinity of each
+                point.
+        """
+        if self.vicinity_shape == "square":
+            return self.running_maximum(
+                self.running_maximum(data, y_axis, grid_cells),
+                x_axis, grid_cells)
+        # Find the half-width of the row of the circle at each row offset,
+        # using the same criterion as the unweighted circular neighbourhood.
+        row_offsets = np.arange(grid_cells + 1)
+        half_widths = np.floor(
+            np.sqrt(grid_cells**2 - row_offsets**2)).astype(int)
+        result = None
+        for row_offset, half_width in zip(row_offsets, half_widths):
+            # A rectangle is only required if it is not contained within
+            # the rectangle for the next row offset.
+            if (row_offset < grid_cells and
+                    half_widths[row_offset + 1] == half_width):
+                continue
+            rectangle_maximum = self.running_maximum(
+                self.running_maximum(data, x_axis, half_width),
+                y_axis, row_offset)
+            if result is None:
+                result = rectangle_maximum
+            else:
+                result = np.maximum(result, rectangle_maximum)
+        return result
+
     def maximum_within_vicinity(self, cube):
         """
         Find grid points where a phenomenon occurs within a defined distance.
@@ -275,6 +580,9 @@ class OccurrenceWithinVicinity(object):
         For non-binary fields, if the vicinity of two occurrences overlap,
         the maximum value within the vicinity is chosen.
 
+        Only the x and y axes are considered, so a cube with any number of
+        other dimensions, such as realization and time, is processed at once.
+
         Args:
             cube : Iris.cube.Cube
                 Thresholded cube.
@@ -291,22 +599,43 @@ class OccurrenceWithinVicinity(object):
         _, grid_cell_y = (
             convert_distance_into_number_of_grid_cells(
                 cube, self.distance, MAX_DISTANCE_IN_GRID_CELLS))
-
-        # Convert the number of grid points (e.g. grid_cell_y) represented
-        # by self.distance, e.g. where grid_cell_y=1 is an increment to
-        # a central point, into grid_cells which is the total number of points
-        # within the defined vicinity along the y axis e.g grid_cells=3.
-        grid_cells = (2 * grid_cell_y) + 1
+        grid_spec = GridSpec.from_cube(cube)
+        y_axis, x_axis = grid_spec.y_axis, grid_spec.x_axis
 
         max_cube = cube.copy()
-        max_cube.data = (
-            scipy.ndimage.filters.maximum_filter(cube.data, size=grid_cells))
+        max_cube.data = self.vicinity_maximum(
+            cube.data, y_axis, x_axis, grid_cell_y)
         return max_cube
 
+    @staticmethod
+    def demote_length_one_dimensions(cube):
+        """
+        Demote realization and time dimensions of length one to scalar
+        coordinates, as given by slicing over these coordinates and merging
+        the slices.
+
+        Args:
+            cube : Iris.cube.Cube
+                Cube which may have realization and time dimensions of
+                length one.
+
+        Returns:
+            cube : Iris.cube.Cube
+                Cube where realization and time dimensions of length one
+                have been demoted to scalar coordinates.
+
+        """
+        for coord_name in ["realization", "time"]:
+            if (cube.coords(coord_name, dim_coords=True) and
+                    len(cube.coord(coord_name).points) == 1):
+                dim, = cube.coord_dims(coord_name)
+                cube = cube[(slice(None),) * dim + (0,)]
+        return cube
+
     def process(self, cube):
         """
-        Ensure that the cube passed to the maximum_within_vicinity method is
-        2d and subsequently merged back together.
+        Find the maximum within the vicinity of each point, for all of the
+        realizations and times within the cube at once.
 
         Args:
             cube : Iris.cube.Cube
@@ -315,16 +644,9 @@ class OccurrenceWithinVicinity(object):
         Returns:
             Iris.cube.Cube
                 Cube containing the occurrences within a vicinity for each
-                xy 2d slice, which have been merged back together.
+                xy 2d slice. Realization and time dimensions of length one
+                are demoted to scalar coordinates.
 
         """
-        slices_over_realization = (
-            self.find_slices_over_coordinate(cube, "realization"))
-
-        max_cubes = CubeList([])
-        for realization_slice in slices_over_realization:
-            slices_over_time = (
-                self.find_slices_over_coordinate(realization_slice, "time"))
-            for time_slice in slices_over_time:
-                max_cubes.append(self.maximum_within_vicinity(time_slice))
-        return max_cubes.merge_cube()
+        max_cube = self.maximum_within_vicinity(cube)
+        return self.demote_length_one_dimensions(max_cube)
@@ -31,9 +31,67 @@
 """Module containing thresholding classes."""
 
 
+import copy
+
+import iris
 import numpy as np
 
 
+def create_cube_with_thresholds(thresholds, template_cube, cube_data,
+                                below_thresh_ok=False):
+    """
+    Create a cube of probabilities with a threshold coordinate based on a
+    template cube. The resulting cube will have an extra threshold
+    coordinate as the zeroth dimension compared with the template cube.
+
+    Args:
+        thresholds : List
+            The thresholds. There should be the same number of thresholds
+            as the first dimension of cube_data.
+        template_cube : iris.cube.Cube
+            Cube containing the field that has been thresholded, from which
+            the coordinates and metadata are copied. The units of the
+            thresholds are the units of this cube.
+        cube_data : numpy.ndarray
+            Data to insert into the new cube. The shape of the cube_data,
+            excluding the dimension associated with the threshold
+            coordinate, should be the same as the shape of template_cube.
+        below_thresh_ok : boolean
+            True if the data are the probabilities of being *below* each
+            threshold, False if the data are the probabilities of being
+            *above* each threshold.
+
+    Returns:
+        result : iris.cube.Cube
+            Cube with a threshold coordinate as the zeroth dimension
+            coordinate, in addition to the coordinates and metadata from
+            the template cube. The cube is renamed to be the probability of
+            the template cube diagnostic, with units of 1.
+
+    """
+    threshold_coord = iris.coords.DimCoord(
+        thresholds, long_name="threshold", units=template_cube.units)
+
+    metadata_dict = copy.deepcopy(template_cube.metadata._asdict())
+    result = iris.cube.Cube(cube_data, **metadata_dict)
+    result.rename("probability_of_{}".format(template_cube.name()))
+    result.units = "1"
+    result.attributes["relative_to_threshold"] = (
+        "below" if below_thresh_ok else "above")
+    result.add_dim_coord(threshold_coord, 0)
+
+    # The dimensions of the coordinates from the template cube are
+    # incremented by one, as the threshold coordinate has been added as
+    # the zeroth dimension.
+    for coord in template_cube.dim_coords:
+        dim, = template_cube.coord_dims(coord)
+        result.add_dim_coord(coord.copy(), dim+1)
+    for coord in template_cube.aux_coords:
+        dims = tuple([dim+1 for dim in template_cube.coord_dims(coord)])
+        result.add_aux_coord(coord.copy(), dims)
+    return result
+
+
 class BasicThreshold(object):
 
     """Apply a threshold truth criterion to a cube.
@@ -41,34 +99,53 @@ class BasicThreshold(object):
     Calculate the threshold truth value based on a linear membership function
     around the threshold.
 
-    Can operate on multiple time sequences within a cube.
+    Can operate on multiple time sequences within a cube, and can apply
+    multiple thresholds at once.
 
     """
 
     def __init__(self, threshold, fuzzy_factor=None,
-                 below_thresh_ok=False):
+                 below_thresh_ok=False, compact_dtype=False):
         """Set up for processing an in-or-out of threshold binary field.
 
         Args:
-            threshold : float
-                The threshold point for 'significant' datapoints.
+            threshold : float or list of float
+                The threshold point for 'significant' datapoints. If a list
+                of thresholds is supplied, all of the thresholds are applied
+                at once, and the output cube has a leading threshold
+                coordinate, with the thresholds in ascending order.
             fuzzy_factor : float
                 Percentage above or below threshold for fuzzy membership value.
                 If None, no fuzzy_factor is applied.
             below_thresh_ok : boolean
                 True to count points as significant if *below* the threshold,
                 False to count points as significant if *above* the threshold.
+            compact_dtype : boolean
+                If True, the truth values are uint8 if no fuzzy_factor is
+                applied, and float32 if a fuzzy_factor is applied.
+                If False, the truth values are float64.
 
         Raises:
             ValueError: If a threshold of 0.0 is requested.
+            ValueError: If a list of thresholds is requested, which is empty
+                        or contains repeated thresholds.
             ValueError: If the fuzzy_factor is not greater than 0 and less
                         than 1.
 
         """
-        if threshold == 0.0:
+        thresholds = np.atleast_1d(threshold)
+        if np.any(thresholds == 0.0):
             raise ValueError(
                 "Invalid threshold: zero not allowed")
-        self.threshold = threshold
+        if thresholds.size == 0 or (
+                np.unique(thresholds).size != thresholds.size):
+            raise ValueError(
+                "Invalid threshold list: thresholds must be unique and at "
+                "least one threshold is required: {}".format(threshold))
+        if np.ndim(threshold) == 0:
+            self.threshold = threshold
+        else:
+            self.threshold = sorted(threshold)
         if fuzzy_factor is not None:
             if not 0 < fuzzy_factor < 1:
                 raise ValueError(
@@ -76,13 +153,50 @@ class BasicThreshold(object):
                         fuzzy_factor))
         self.fuzzy_factor = fuzzy_factor
         self.below_thresh_ok = below_thresh_ok
+        self.compact_dtype = compact_dtype
 
     def __str__(self):
         """Represent the configured plugin instance as a string."""
         return (
             '<BasicThreshold: threshold {}, fuzzy factor {}' +
-            'below_thresh_ok: {}>'
-        ).format(self.threshold, self.fuzzy_factor, self.below_thresh_ok)
+            'below_thresh_ok: {}, compact_dtype: {}>'
+        ).format(self.threshold, self.fuzzy_factor, self.below_thresh_ok,
+                 self.compact_dtype)
+
+    def calculate_truth_values(self, data):
+        """Calculate the truth values of the data for every threshold at
+        once, by broadcasting the thresholds against the data.
+
+        Args:
+            data : numpy.ndarray
+                Data to threshold.
+
+        Returns:
+            truth_value : numpy.ndarray
+                Array with the thresholds as the leading axis followed by
+                the axes of the data, containing values between 0 and 1 to
+                indicate whether each threshold has been exceeded or not.
+
+        """
+        thresholds = np.reshape(
+            np.atleast_1d(self.threshold).astype(np.float64),
+            (-1,) + (1,) * np.ndim(data))
+        if self.fuzzy_factor is None:
+            truth_value = data > thresholds
+            if self.below_thresh_ok:
+                truth_value = np.logical_not(truth_value)
+            dtype = np.uint8 if self.compact_dtype else np.float64
+        else:
+            lower_threshold = thresholds * self.fuzzy_factor
+            truth_value = (
+                (data - lower_threshold) /
+                ((thresholds * (2. - self.fuzzy_factor)) - lower_threshold)
+            )
+            truth_value = np.clip(truth_value, 0., 1.)
+            if self.below_thresh_ok:
+                truth_value = 1. - truth_value
+            dtype = np.float32 if self.compact_dtype else np.float64
+        return truth_value.astype(dtype)
 
     def process(self, cube):
         """Convert each point to a truth value based on threshold. The truth
@@ -97,7 +211,10 @@ class BasicThreshold(object):
             cube : iris.cube.Cube
                 Cube after a threshold has been applied. The data within this
                 cube will contain values between 0 and 1 to indicate whether
-                a given threshold has been exceeded or not.
+                a given threshold has been exceeded or not. If a list of
+                thresholds was supplied, this is a new cube of probabilities
+                with a leading threshold coordinate, created using
+                create_cube_with_thresholds.
 
         Raises:
             ValueError: if a np.nan value is detected within the input cube.
@@ -105,16 +222,10 @@ class BasicThreshold(object):
         """
         if np.isnan(cube.data).any():
             raise ValueError("Error: NaN detected in input cube data")
-        if self.fuzzy_factor is None:
-            truth_value = cube.data > self.threshold
-        else:
-            lower_threshold = self.threshold * self.fuzzy_factor
-            truth_value = (
-                (cube.data - lower_threshold) /
-                ((self.threshold * (2. - self.fuzzy_factor)) - lower_threshold)
-            )
-        truth_value = np.clip(truth_value, 0., 1.)
-        if self.below_thresh_ok:
-            truth_value = 1. - truth_value
-        cube.data = truth_value
-        return cube
+        truth_value = self.calculate_truth_values(cube.data)
+        if np.ndim(self.threshold) == 0:
+            cube.data = truth_value[0]
+            return cube
+        return create_cube_with_thresholds(
+            np.atleast_1d(self.threshold), cube, truth_value,
+            below_thresh_ok=self.below_thresh_ok)
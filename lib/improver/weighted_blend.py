@@ -29,12 +29,199 @@
 # ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 """Module containing Weighted Blend classes."""
+from multiprocessing import Pool
+from multiprocessing.sharedctypes import RawArray
 import warnings
 
 import numpy as np
 import iris
 from iris.analysis import Aggregator
 
+from improver.weights import WeightsUtilities
+
+# Number of grid points blended at once by the percentile blending
+# aggregator, which limits the size of the intermediate arrays.
+PERCENTILE_BLEND_CHUNK_SIZE = 10000
+
+# The arrays shared with the processes blending percentiles in parallel,
+# set up by _init_blend_worker in each process of a PercentileBlendingPool.
+# The arrays are held for the lifetime of the processes, which end when the
+# pool is closed.
+_SHARED_ARRAYS = {}
+
+
+def _share_array(shape, dtype):
+    """Create an array in shared memory, which can be given to the
+       processes of a pool when the pool is started.
+
+    Args:
+        shape : tuple
+            The shape of the array.
+        dtype : np.dtype
+            The data type of the array.
+
+    Returns:
+        (shared, shape, dtype) : tuple
+            The shared memory holding the array, and the shape and data
+            type of the array.
+    """
+    dtype = np.dtype(dtype)
+    num_bytes = int(np.prod(shape, dtype=int)) * dtype.itemsize
+    # Shared memory cannot be empty.
+    shared = RawArray('b', max(num_bytes, 1))
+    return shared, tuple(shape), dtype
+
+
+def _shared_array_view(shared_array):
+    """Create a numpy array that views an array in shared memory.
+
+    Args:
+        shared_array : tuple
+            The shared memory, shape and data type of the array, as
+            returned by _share_array.
+
+    Returns:
+        array : np.array
+            Array using the shared memory as its data.
+    """
+    shared, shape, dtype = shared_array
+    return np.frombuffer(shared, dtype=dtype,
+                         count=int(np.prod(shape, dtype=int))).reshape(shape)
+
+
+def _init_blend_worker(data, weights, result):
+    """Set up a worker process to blend tiles of percentile data.
+
+    Args:
+        data, weights, result : tuples
+            The shared memory, shape and data type of the data to blend,
+            the weights and the array to hold the result, as returned by
+            _share_array.
+    """
+    for name, shared_array in [('data', data), ('weights', weights),
+                               ('result', result)]:
+        _SHARED_ARRAYS[name] = _shared_array_view(shared_array)
+
+
+def _blend_tile(tile):
+    """Blend the percentiles of a tile of the points shared with a worker
+       process, writing the blended percentiles into the shared result.
+
+    Args:
+        tile : tuple
+            The start and stop index of the points in the tile, and the
+            percentiles of the data.
+    """
+    start, stop, percentiles = tile
+    weights = _SHARED_ARRAYS['weights']
+    if weights.ndim > 1:
+        weights = weights[start:stop]
+    _SHARED_ARRAYS['result'][:, start:stop] = (
+        PercentileBlendingAggregator.blend_percentiles_at_points(
+            np.moveaxis(_SHARED_ARRAYS['data'][:, :, start:stop], -1, 0),
+            percentiles, weights)).T
+
+
+class PercentileBlendingPool(object):
+    """A pool of processes that blend tiles of the points of percentile
+       data in parallel, for the PercentileBlendingAggregator.
+
+       The data, weights and result are held in shared memory, in their
+       own data types, which the processes are given when the pool is
+       started, so no cube or array is pickled for each tile. The pool is
+       started when data is first blended, and can blend further data with
+       the same shapes and data types without starting new processes. The
+       pool must be closed to end the processes and release the shared
+       memory.
+    """
+
+    def __init__(self, workers):
+        """Set up a pool of processes.
+
+        Args:
+            workers : integer
+                The number of processes used to blend the tiles.
+        """
+        self.workers = workers
+        self.pool = None
+        self.shared_arrays = None
+
+    def __repr__(self):
+        """Represent the configured plugin instance as a string."""
+        result = ('<PercentileBlendingPool: workers: {}>')
+        return result.format(self.workers)
+
+    def blend(self, data, percentiles, weights, tiles):
+        """ Blend tiles of the points of percentile data. The data and
+            weights are copied into shared memory once, and each process
+            writes its tiles into a shared result.
+
+        Args:
+            data : np.array
+                    Array containing the percentile values to blend, with
+                    shape: (length of coord to blend, num of percentiles,
+                    ...), where the trailing dimensions are flattened into
+                    the points.
+            percentiles: np.array
+                    Array of percentile values e.g
+                    [0, 20.0, 50.0, 70.0, 100.0],
+                    same size as the percentile dimension of data.
+            weights: np.array
+                    Array of weights, same size as the coord to blend, or
+                    the weights at each point with shape: (num of points,
+                    length of coord to blend)
+            tiles : list of tuples
+                    The start and stop index of the points in each tile.
+
+        Returns:
+            result : np.array
+                    containing the weighted percentile blend data
+                    across the chosen coord, with shape:
+                    (num of percentiles, num of points)
+
+        Raises:
+            ValueError : If the shape or data type of the data or weights
+                         differs from the data previously blended by the
+                         pool.
+        """
+        weights = np.asarray(weights)
+        data_shape = data.shape[:2] + (
+            int(np.prod(data.shape[2:], dtype=int)),)
+        specs = [(data_shape, data.dtype),
+                 (weights.shape, weights.dtype),
+                 (data_shape[1:], np.dtype(np.float64))]
+        if self.pool is None:
+            self.shared_arrays = [
+                _share_array(shape, dtype) for shape, dtype in specs]
+            self.pool = Pool(self.workers, _init_blend_worker,
+                             tuple(self.shared_arrays))
+        elif specs != [(shape, dtype)
+                       for _, shape, dtype in self.shared_arrays]:
+            msg = ('The data and weights blended by a '
+                   'PercentileBlendingPool must keep the same shapes and '
+                   'data types. Expected: {}, got: {}'.format(
+                       [(shape, dtype)
+                        for _, shape, dtype in self.shared_arrays], specs))
+            raise ValueError(msg)
+        shared_data, shared_weights, shared_result = [
+            _shared_array_view(shared_array)
+            for shared_array in self.shared_arrays]
+        # Copy the data straight into shared memory, flattening the points
+        # as it is copied.
+        shared_data.reshape(data.shape)[...] = data
+        shared_weights[...] = weights
+        self.pool.map(_blend_tile, [(start, stop, percentiles)
+                                    for start, stop in tiles])
+        return shared_result.copy()
+
+    def close(self):
+        """End the processes of the pool, and release the shared memory."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        self.pool = None
+        self.shared_arrays = None
+
 
 class PercentileBlendingAggregator(object):
     """Class for the percentile blending aggregator
@@ -77,7 +264,8 @@ class PercentileBlendingAggregator(object):
         return result
 
     @staticmethod
-    def aggregate(data, axis, arr_percent, arr_weights, perc_dim):
+    def aggregate(data, axis, arr_percent, arr_weights, perc_dim,
+                  blend_pool=None):
         """ Blend percentile aggregate function to blend percentile data
             along a given axis of a cube.
 
@@ -92,9 +280,18 @@ class PercentileBlendingAggregator(object):
                      [0, 20.0, 50.0, 70.0, 100.0],
                      same size as the percentile dimension of data.
             arr_weights: np.array
-                     Array of weights, same size as the axis dimension of data.
+                     Array of weights, either the same size as the axis
+                     dimension of data, or with the same number of
+                     dimensions as data so that it can be broadcast
+                     against data with a size of one along the percentile
+                     dimension.
             perc_dim : integer
                      The index of the percentile coordinate
+            blend_pool : PercentileBlendingPool
+                     A pool of processes used to blend tiles of the points
+                     in parallel. The result is the same as when the points
+                     are blended in a single process.
+                     Default is None, to blend in a single process.
             (Note percent and weights have special meaning in Aggregator
              hence the rename.)
 
@@ -116,18 +313,37 @@ class PercentileBlendingAggregator(object):
         input_shape = [data.shape[0],
                        data.shape[1],
                        np.prod(shape, dtype=int)]
-        # Flatten the data that is not percentile or coord data
-        data = data.reshape(input_shape)
-        # Create the resulting data array, which is the shape of the original
-        # data without dimension we are collapsing over
-        result = np.zeros(input_shape[1:])
-        # Loop over the flattened data, i.e. across all the data points in
-        # each slice of the coordinate we are collapsing over, finding the
-        # blended percentile values at each point.
-        for i in range(data.shape[-1]):
-            result[:, i] = (
-                PercentileBlendingAggregator.blend_percentiles(
-                    data[:, :, i], arr_percent, arr_weights))
+        # Flatten spatially varying weights in the same way, giving the
+        # weights at each point with shape (num of points, length of coord).
+        arr_weights = np.asarray(arr_weights)
+        if arr_weights.ndim > 1:
+            arr_weights = np.moveaxis(arr_weights, [perc_dim, axis], [1, 0])
+            arr_weights = np.broadcast_to(
+                arr_weights, (input_shape[0], 1) + shape).reshape(
+                    input_shape[0], input_shape[2]).T
+        # Split the flattened data points into tiles, which each have all
+        # their points blended at once.
+        tiles = [(start, start + PERCENTILE_BLEND_CHUNK_SIZE)
+                 for start in range(0, input_shape[2],
+                                    PERCENTILE_BLEND_CHUNK_SIZE)]
+        if blend_pool is not None and len(tiles) > 1:
+            # The pool flattens the data as it copies it into shared
+            # memory.
+            result = blend_pool.blend(data, arr_percent, arr_weights, tiles)
+        else:
+            # Flatten the data that is not percentile or coord data
+            data = data.reshape(input_shape)
+            # Create the resulting data array, which is the shape of the
+            # original data without dimension we are collapsing over
+            result = np.zeros(input_shape[1:])
+            for start, stop in tiles:
+                weights = arr_weights
+                if arr_weights.ndim > 1:
+                    weights = arr_weights[start:stop]
+                result[:, start:stop] = (
+                    PercentileBlendingAggregator.blend_percentiles_at_points(
+                        np.moveaxis(data[:, :, start:stop], -1, 0),
+                        arr_percent, weights)).T
         # Reshape the data and put the percentile dimension
         # back in the right place
         shape = arr_percent.shape + shape
@@ -207,11 +423,214 @@ class PercentileBlendingAggregator(object):
                                       combined_perc_thres_data)
         return new_combined_perc
 
+    @staticmethod
+    def interp_along_last_axis(x_values, xp_values, fp_values):
+        """ Linear interpolation along the last axis of arrays of points,
+            giving the same result as calling np.interp for each point.
+
+        The interval containing each value is found by counting the points
+        at or below the value, which matches the search used by np.interp
+        for increasing xp values, including repeated values. The value is
+        then calculated using the same operations as np.interp.
+
+        Args:
+            x_values : np.array
+                    Array of the x-coordinates at which to interpolate, with
+                    shape (..., number of values).
+            xp_values : np.array
+                    Array of the increasing x-coordinates of the data
+                    points, with shape (..., number of data points).
+            fp_values : np.array
+                    Array of the y-coordinates of the data points, with the
+                    same shape as xp_values.
+            The leading dimensions of the arrays must be broadcastable.
+
+        Returns:
+            result : np.array
+                    Array of the interpolated values, with the broadcast
+                    leading shape and the last dimension of x_values.
+        """
+        x_values = np.asarray(x_values, dtype=np.float64)
+        xp_values = np.asarray(xp_values, dtype=np.float64)
+        fp_values = np.asarray(fp_values, dtype=np.float64)
+        num_points = xp_values.shape[-1]
+        leading_shape = np.broadcast(
+            x_values[..., 0], xp_values[..., 0], fp_values[..., 0]).shape
+        x_values = np.broadcast_to(
+            x_values, leading_shape + x_values.shape[-1:])
+        xp_values = np.broadcast_to(
+            xp_values, leading_shape + (num_points,))
+        fp_values = np.broadcast_to(
+            fp_values, leading_shape + (num_points,))
+
+        # Index of the last data point at or below each value, which is -1
+        # below the first data point.
+        index = np.full(x_values.shape, -1, dtype=np.intp)
+        for point in range(num_points):
+            index += xp_values[..., point:point+1] <= x_values
+        lower = np.clip(index, 0, max(num_points - 2, 0))
+        upper = np.minimum(lower + 1, num_points - 1)
+        x_lower = np.take_along_axis(xp_values, lower, axis=-1)
+        x_upper = np.take_along_axis(xp_values, upper, axis=-1)
+        y_lower = np.take_along_axis(fp_values, lower, axis=-1)
+        y_upper = np.take_along_axis(fp_values, upper, axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slope = (y_upper - y_lower) / (x_upper - x_lower)
+            result = slope*(x_values - x_lower) + y_lower
+            # As for np.interp, recalculate from the upper data point if the
+            # result is not a number, and use the lower value if the values
+            # at both data points are equal.
+            invalid = np.isnan(result)
+            result[invalid] = (slope*(x_values - x_upper) + y_upper)[invalid]
+            invalid = np.isnan(result) & (y_lower == y_upper)
+            result[invalid] = y_lower[invalid]
+        exact = x_values == x_lower
+        result[exact] = y_lower[exact]
+        result = np.where(index >= num_points - 1,
+                          fp_values[..., -1:], result)
+        result = np.where(index < 0, fp_values[..., :1], result)
+        return np.where(np.isnan(x_values), x_values, result)
+
+    @staticmethod
+    def blend_percentiles_at_points(perc_values, percentiles, weights):
+        """ Blend percentiles function, to calculate the weighted blend across
+            a given axis of percentile data for many grid points at once.
+            The result at each point is the same as the result of
+            blend_percentiles for that point.
+
+        Args:
+            perc_values : np.array
+                    Array containing the percentile values to blend, with
+                    shape: (num of points, length of coord to blend,
+                    num of percentiles)
+            percentiles: np.array
+                    Array of percentile values e.g
+                    [0, 20.0, 50.0, 70.0, 100.0],
+                    same size as the percentile dimension of data.
+            weights: np.array
+                    Array of weights, same size as the axis dimension of data,
+                    that we will blend over, or the weights at each point
+                    with shape: (num of points, length of coord to blend)
+
+        Returns:
+            result : np.array
+                    containing the weighted percentile blend data
+                    across the chosen coord, with shape:
+                    (num of points, num of percentiles)
+        """
+        interp = PercentileBlendingAggregator.interp_along_last_axis
+        perc_values = np.asarray(perc_values, dtype=np.float64)
+        num_points, num, num_percentiles = perc_values.shape
+        weights = np.broadcast_to(weights, (num_points, num))
+        # Create an array to store the weighted blending pdf at every point.
+        combined_pdf = np.zeros(perc_values.shape)
+        # Find the probability at each threshold in the pdf of each of the
+        # other points in the axis we are blending over, for all grid points
+        # at once, and add the probabilities multiplied by the correct
+        # weight to the running total in the same order as
+        # blend_percentiles.
+        for i in range(0, num):
+            for j in range(0, num):
+                if i == j:
+                    recalc_values_in_pdf = percentiles
+                else:
+                    recalc_values_in_pdf = interp(perc_values[:, i],
+                                                  perc_values[:, j],
+                                                  percentiles)
+                combined_pdf[:, i] += recalc_values_in_pdf*weights[:, j:j+1]
+
+        # Combine and sort the threshold values and the blended probability
+        # values for all the points we are blending, at each grid point.
+        combined_perc_thres_data = np.sort(
+            perc_values.reshape(num_points, -1), axis=-1)
+        combined_perc_values = np.sort(
+            combined_pdf.reshape(num_points, -1), axis=-1)
+
+        # Find the percentile values from this combined data by interpolating
+        # back from probability values to the original percentiles.
+        return interp(percentiles, combined_perc_values,
+                      combined_perc_thres_data)
+
+
+class WeightedMeanAggregator(object):
+    """Class for the weighted mean aggregator
+
+       The weighted mean is calculated by contracting the data with the
+       weights using np.einsum, over only the dimensions that the weights
+       vary along. This means that weights that vary along the coordinate
+       being blended, or along the coordinate and the spatial dimensions,
+       are never broadcast to the full shape of the data.
+    """
+
+    def __init__(self):
+        """Initialise class."""
+        pass
+
+    def __repr__(self):
+        """Represent the configured plugin instance as a string."""
+        result = ('<WeightedMeanAggregator>')
+        return result
+
+    @staticmethod
+    def aggregate(data, axis, arr_weights):
+        """ Weighted mean aggregate function to blend data along a given
+            axis of a cube.
+
+        Args:
+            data : np.array
+                   Array containing the data to blend. Masked points are
+                   left out of the mean.
+            axis : integer
+                   The index of the coordinate dimension in the cube. This
+                   dimension will be aggregated over.
+            arr_weights: np.array
+                     Array of weights, either the same size as the axis
+                     dimension of data, or with the same number of
+                     dimensions as data so that it can be broadcast
+                     against data.
+            (Note weights has special meaning in Aggregator hence the
+             rename.)
+
+        Returns:
+            result : np.array
+                     containing the weighted mean across the chosen coord.
+                     The dimension associated with axis has been collapsed,
+                     and the rest of the dimensions remain.
+        """
+        # Iris aggregators support indexing from the end of the array.
+        if axis < 0:
+            axis += data.ndim
+        arr_weights = np.asarray(arr_weights, dtype=np.float64)
+        if arr_weights.ndim == 1:
+            shape = [1] * data.ndim
+            shape[axis] = arr_weights.size
+            arr_weights = arr_weights.reshape(shape)
+        # Drop the dimensions that the weights do not vary along, and
+        # label the remaining dimensions of the weights to match the data.
+        letters = [chr(ord('a') + dim) for dim in range(data.ndim)]
+        weights_dims = [dim for dim in range(data.ndim)
+                        if dim == axis or arr_weights.shape[dim] > 1]
+        weights = arr_weights.reshape(
+            [arr_weights.shape[dim] for dim in weights_dims])
+        subscripts = '{0},{1}->{2}'.format(
+            ''.join(letters),
+            ''.join(letters[dim] for dim in weights_dims),
+            ''.join(letters[:axis] + letters[axis+1:]))
+
+        if np.ma.is_masked(data):
+            total = np.einsum(subscripts, np.ma.filled(data, 0), weights)
+            weights_total = np.einsum(
+                subscripts, ~np.ma.getmaskarray(data), weights)
+            return np.ma.divide(total, weights_total)
+        weights = weights / weights.sum(axis=weights_dims.index(axis),
+                                        keepdims=True)
+        return np.einsum(subscripts, np.ma.getdata(data), weights)
+
 
 class WeightedBlend(object):
     """Apply a Weighted blend to a cube."""
 
-    def __init__(self, coord, coord_adjust=None):
+    def __init__(self, coord, coord_adjust=None, workers=1):
         """Set up for a Weighted Blending plugin
 
         Args:
@@ -223,14 +642,58 @@ class WeightedBlend(object):
                            cycle averaging the follow function would
                            adjust the time coordinates.
             e.g. coord_adjust = lambda pnts: pnts[len(pnts)/2]
+            workers : integer
+                     The number of processes used to blend tiles of the
+                     grid points of percentile data in parallel. The
+                     processes are started once for each call to process.
+                     The output is the same as when blending in a single
+                     process. Default is 1.
+
+        Raises:
+            ValueError : If the number of workers is less than 1.
         """
         self.coord = coord
         self.coord_adjust = coord_adjust
+        self.workers = int(workers)
+        if self.workers < 1:
+            msg = ("The number of workers must be at least 1. "
+                   "Requested: {}".format(workers))
+            raise ValueError(msg)
 
     def __repr__(self):
         """Represent the configured plugin instance as a string."""
         return (
-            '<WeightedBlend: coord = {0:s}>').format(self.coord)
+            '<WeightedBlend: coord = {0:s}, workers = {1:d}>').format(
+                self.coord, self.workers)
+
+    def _unrolled_weights(self, cube, weights):
+        """Arrange the weights so that they can be broadcast against the
+           cube data once the coord has been moved to the last dimension,
+           as it is by cube.collapsed, without expanding the weights to the
+           shape of the cube.
+
+        Args:
+            cube : iris.cube.Cube
+                   Cube to blend across the coord.
+            weights : np.array
+                   Weights with shape (length of coord,) or (length of
+                   coord, length of y coord, length of x coord).
+
+        Returns:
+            weights : np.array
+                   Weights with the same number of dimensions as the cube,
+                   of size one along the dimensions they do not vary along.
+        """
+        coord_dim, = cube.coord_dims(self.coord)
+        dims = [coord_dim]
+        if weights.ndim > 1:
+            dims += [cube.coord_dims(cube.coord(axis=axis))[0]
+                     for axis in ['y', 'x']]
+        weights = np.transpose(weights, np.argsort(dims))
+        shape = [1] * cube.ndim
+        for dim, size in zip(sorted(dims), weights.shape):
+            shape[dim] = size
+        return np.moveaxis(weights.reshape(shape), coord_dim, -1)
 
     def process(self, cube, weights=None):
         """Calculate weighted blend across the chosen coord, for either
@@ -243,7 +706,10 @@ class WeightedBlend(object):
             cube : iris.cube.Cube
                    Cube to blend across the coord.
             weights: Optional list or np.array of weights
-                     or None (equivalent to equal weights).
+                     or None (equivalent to equal weights). The weights
+                     are either the same shape as the coord, or vary in
+                     space with shape (length of coord, length of y
+                     coord, length of x coord).
 
         Returns:
             result : iris.cube.Cube
@@ -259,7 +725,9 @@ class WeightedBlend(object):
             ValueError : If there are more than one percentile coords
                            in the cube.
             ValueError : If the weights shape do not match the dimension
-                           of the coord we are blending over.
+                           of the coord we are blending over, or the
+                           dimensions of that coord and the y and x
+                           coords.
         Warns:
             Warning : If trying to blend across a scalar coordinate with only
                         one value. Returns the original cube in this case.
@@ -298,13 +766,18 @@ class WeightedBlend(object):
 
         # check weights array matches coordinate shape if not None
         if weights is not None:
-            if np.array(weights).shape != cube.coord(self.coord).points.shape:
+            weights = np.array(weights)
+            coord_shape = cube.coord(self.coord).points.shape
+            if weights.ndim > 1:
+                coord_shape += tuple(len(cube.coord(axis=axis).points)
+                                     for axis in ['y', 'x'])
+            if weights.shape != coord_shape:
                 msg = ('The weights array must match the shape '
                        'of the coordinate in the input cube; '
                        'weight shape is '
-                       '{0:s}'.format(np.array(weights).shape) +
+                       '{0}'.format(weights.shape) +
                        ', cube shape is '
-                       '{0:s}'.format(cube.coord(self.coord).points.shape))
+                       '{0}'.format(coord_shape))
                 raise ValueError(msg)
 
         # If coord to blend over is a scalar_coord warn
@@ -321,32 +794,47 @@ class WeightedBlend(object):
         elif perc_coord is not None:
             percentiles = np.array(perc_coord.points, dtype=float)
             perc_dim, = cube.coord_dims(perc_coord.name())
+            # The aggregator is given the data with the coord moved to the
+            # last dimension, so find where the percentile dimension is.
+            if perc_dim > coord_dim[0]:
+                perc_dim -= 1
             # Set equal weights if none are provided
             if weights is None:
                 num = len(cube.coord(self.coord).points)
                 weights = np.ones(num) / float(num)
+            elif weights.ndim > 1:
+                weights = self._unrolled_weights(cube, weights)
             # Set up aggregator
             PERCENTILE_BLEND = (Aggregator('percentile_blend',
                                 PercentileBlendingAggregator.aggregate))
 
-            result = cube.collapsed(self.coord,
-                                    PERCENTILE_BLEND,
-                                    arr_percent=percentiles,
-                                    arr_weights=weights,
-                                    perc_dim=perc_dim)
+            blend_pool = None
+            if self.workers > 1:
+                blend_pool = PercentileBlendingPool(self.workers)
+            try:
+                result = cube.collapsed(self.coord,
+                                        PERCENTILE_BLEND,
+                                        arr_percent=percentiles,
+                                        arr_weights=weights,
+                                        perc_dim=perc_dim,
+                                        blend_pool=blend_pool)
+            finally:
+                if blend_pool is not None:
+                    blend_pool.close()
 
         # Else do a simple weighted average
+        # Equal weights are used as default.
+        elif weights is None:
+            result = cube.collapsed(self.coord, iris.analysis.MEAN)
+
+        # Else calculate the weighted average, without broadcasting the
+        # weights to the shape of the cube.
         else:
-            # Equal weights are used as default.
-            weights_array = None
-            # Else broadcast the weights to be used by the aggregator.
-            if weights is not None:
-                weights_array = iris.util.broadcast_to_shape(np.array(weights),
-                                                             cube.shape,
-                                                             coord_dim)
-            # Calculate the weighted average.
-            result = cube.collapsed(self.coord,
-                                    iris.analysis.MEAN, weights=weights_array)
+            WEIGHTED_MEAN = Aggregator('mean',
+                                       WeightedMeanAggregator.aggregate)
+            result = cube.collapsed(
+                self.coord, WEIGHTED_MEAN,
+                arr_weights=self._unrolled_weights(cube, weights))
 
         # If set adjust values of collapsed coordinates.
         if self.coord_adjust is not None:
@@ -357,3 +845,299 @@ class WeightedBlend(object):
                                           dtype=crd.points.dtype)
 
         return result
+
+
+class IncrementalWeightedBlend(object):
+    """Apply a weighted blend to inputs that are added one at a time.
+
+    Each input is a cube for a single point of the coordinate being
+    blended over, for example one model or one forecast cycle. Running
+    weighted sums are kept as the inputs arrive, so the inputs do not
+    need to be held together in one cube. For percentile data, the
+    running sums are of the blended probability at the percentile values
+    of all the inputs added so far, which is the combined pdf used by the
+    PercentileBlendingAggregator.
+
+    The weights of the inputs expected but never added are redistributed
+    between the inputs that were added when the blend is finalised, using
+    WeightsUtilities.redistribute_weights. Both redistribution methods
+    scale the weights of the inputs present and add a constant to them, so
+    the blend can be finalised from the weighted and the unweighted
+    running sums.
+    """
+
+    def __init__(self, coord, coord_adjust=None,
+                 wts_redistrib_method='evenly'):
+        """Set up for an incremental Weighted Blending plugin
+
+        Args:
+            coord : string
+                     The name of the coordinate that the inputs are
+                     blended over. Each input must have a single point of
+                     this coordinate.
+            coord_adjust : Function to apply to the coordinate after
+                           blending to correct the values, as for
+                           WeightedBlend.
+            wts_redistrib_method : string
+                     The method used to redistribute the weights of
+                     expected inputs that were not added, either
+                     'evenly' or 'proportional'. Default is 'evenly'.
+        """
+        self.coord = coord
+        self.coord_adjust = coord_adjust
+        self.wts_redistrib_method = wts_redistrib_method
+        self.template = None
+        self.weights = []
+        self.coord_values = {}
+        self.percentiles = None
+        self.perc_dim = None
+        self.thresholds = []
+        self.weighted_pdfs = []
+        self.unweighted_pdfs = []
+        self.weighted_sum = None
+        self.unweighted_sum = None
+
+    def __repr__(self):
+        """Represent the configured plugin instance as a string."""
+        return ('<IncrementalWeightedBlend: coord = {0:s}, '
+                'wts_redistrib_method = {1:s}, '
+                'number of inputs = {2:d}>').format(
+                    self.coord, self.wts_redistrib_method,
+                    len(self.weights))
+
+    def _find_percentile_dim(self, cube):
+        """Find the percentile dimension of an input cube, if it has one.
+
+        Args:
+            cube : iris.cube.Cube
+                   The input cube.
+
+        Returns:
+            perc_dim : int or None
+                   The percentile dimension of the cube, or None if the
+                   cube does not have a percentile coordinate.
+
+        Raises:
+            ValueError : If there is more than one percentile coord in the
+                           cube.
+            ValueError : If the percentile coord is not a dimension coord
+                           with at least two points.
+        """
+        perc_coords = [coord for coord in cube.coords()
+                       if coord.name().find('percentile') >= 0]
+        if not perc_coords:
+            return None
+        if len(perc_coords) > 1:
+            msg = ('There should only be one percentile coord '
+                   'on the cube.')
+            raise ValueError(msg)
+        perc_dim = cube.coord_dims(perc_coords[0])
+        if len(perc_dim) != 1 or len(perc_coords[0].points) < 2:
+            msg = ('The percentile coord must be a dimension of the cube '
+                   'with at least 2 percentiles.')
+            raise ValueError(msg)
+        return perc_dim[0]
+
+    def _percentile_data(self, cube):
+        """Return the data of a percentile cube with the percentiles along
+           the last axis and the other dimensions flattened."""
+        data = np.moveaxis(cube.data, self.perc_dim, -1)
+        return data.reshape(-1, data.shape[-1]).astype(np.float64)
+
+    def _add_percentiles(self, thresholds, weight):
+        """Add the percentile values of an input to the running probability
+           sums of the combined pdf.
+
+        The probability of each percentile value in the pdf of each other
+        input is found by interpolating that input's own percentiles, as
+        in PercentileBlendingAggregator.blend_percentiles. Inputs that
+        share percentile values therefore give the same sums whatever order
+        they are added in.
+
+        Args:
+            thresholds : np.array
+                   The percentile values of the input, with shape
+                   (number of points, number of percentiles).
+            weight : float
+                   The weight of the input.
+        """
+        interp = PercentileBlendingAggregator.interp_along_last_axis
+        weighted_pdf = np.broadcast_to(
+            self.percentiles*weight, thresholds.shape).copy()
+        unweighted_pdf = np.broadcast_to(
+            self.percentiles, thresholds.shape).copy()
+        for index, (previous, previous_weight) in enumerate(
+                zip(self.thresholds, self.weights)):
+            # The probability of the new values in the pdf of the input
+            # already added, and of its values in the pdf of the new input.
+            recalc_values_in_pdf = interp(thresholds, previous,
+                                          self.percentiles)
+            weighted_pdf += recalc_values_in_pdf*previous_weight
+            unweighted_pdf += recalc_values_in_pdf
+            recalc_values_in_pdf = interp(previous, thresholds,
+                                          self.percentiles)
+            self.weighted_pdfs[index] += recalc_values_in_pdf*weight
+            self.unweighted_pdfs[index] += recalc_values_in_pdf
+        self.thresholds.append(thresholds)
+        self.weighted_pdfs.append(weighted_pdf)
+        self.unweighted_pdfs.append(unweighted_pdf)
+
+    def add(self, cube, weight):
+        """Add an input to the blend.
+
+        Args:
+            cube : iris.cube.Cube
+                   Cube for a single point of the coordinate being blended
+                   over. The coordinate may be a scalar coordinate or a
+                   dimension of length one.
+            weight : float
+                   The weight of this input. The weights of all the
+                   inputs expected, including any that are never added,
+                   should add up to one.
+
+        Raises:
+            ValueError : If the first argument not a cube.
+            ValueError : If the coord has more than one point in the cube.
+            ValueError : If the cube does not match the inputs already
+                           added.
+            ValueError : If the weight is negative.
+        """
+        if not isinstance(cube, iris.cube.Cube):
+            msg = ('The first argument must be an instance of '
+                   'iris.cube.Cube but is'
+                   ' {}.'.format(type(cube)))
+            raise ValueError(msg)
+        if len(cube.coord(self.coord).points) != 1:
+            msg = ('Each input must have a single point of the coord {0:s}, '
+                   'but has {1:d}.'.format(
+                       self.coord, len(cube.coord(self.coord).points)))
+            raise ValueError(msg)
+        if cube.coord_dims(self.coord):
+            cube = next(cube.slices_over(self.coord))
+        if weight < 0.0:
+            msg = 'Weights must be positive, but weight is {}'.format(weight)
+            raise ValueError(msg)
+
+        if self.template is None:
+            self.template = cube
+            self.perc_dim = self._find_percentile_dim(cube)
+            if self.perc_dim is not None:
+                self.percentiles = np.array(
+                    cube.coord(dimensions=self.perc_dim).points,
+                    dtype=np.float64)
+            self.coord_values = {
+                coord.name(): [] for coord in cube.coords(dimensions=[])}
+        elif (cube.shape != self.template.shape or
+              self._find_percentile_dim(cube) != self.perc_dim or
+              (self.perc_dim is not None and not np.array_equal(
+                  cube.coord(dimensions=self.perc_dim).points,
+                  self.percentiles))):
+            msg = ('The input does not match the inputs already added. '
+                   'Input shape is {0}, expected shape is {1}.'.format(
+                       cube.shape, self.template.shape))
+            raise ValueError(msg)
+
+        for name, values in self.coord_values.items():
+            coord = cube.coord(name)
+            values.append((coord.points[0],
+                           None if coord.bounds is None else coord.bounds[0]))
+
+        if self.perc_dim is not None:
+            self._add_percentiles(self._percentile_data(cube), weight)
+        elif self.weighted_sum is None:
+            self.weighted_sum = cube.data*np.float64(weight)
+            self.unweighted_sum = cube.data.astype(np.float64)
+        else:
+            self.weighted_sum += cube.data*np.float64(weight)
+            self.unweighted_sum += cube.data
+        self.weights.append(weight)
+
+    def _weight_adjustment(self):
+        """Find how the weights of the inputs added are adjusted for the
+           weights of any expected inputs that were not added.
+
+        Returns:
+            (scale, offset) : tuple of floats
+                   The redistributed weight of each input added is
+                   scale * weight + offset.
+        """
+        weights = np.array(self.weights, dtype=np.float64)
+        missing_weight = max(1.0 - weights.sum(), 0.0)
+        redistributed_weights = WeightsUtilities.redistribute_weights(
+            np.append(weights, missing_weight),
+            np.append(np.ones(len(weights)), 0.0),
+            method=self.wts_redistrib_method)
+        lowest, highest = np.argmin(weights), np.argmax(weights)
+        if weights[highest] == weights[lowest]:
+            return 0.0, redistributed_weights[lowest]
+        scale = ((redistributed_weights[highest] -
+                  redistributed_weights[lowest]) /
+                 (weights[highest] - weights[lowest]))
+        offset = redistributed_weights[lowest] - scale*weights[lowest]
+        return scale, offset
+
+    def _blended_coords(self):
+        """Return the scalar coords that vary between the inputs added,
+           and the coord blended over, collapsed over all the inputs."""
+        coords = []
+        for name, values in self.coord_values.items():
+            points = np.array([value[0] for value in values])
+            if name != self.coord and np.all(points == points[0]):
+                continue
+            coord = self.template.coord(name)
+            bounds = None
+            if coord.bounds is not None:
+                bounds = np.array([value[1] for value in values])
+            order = np.argsort(points, kind='mergesort')
+            if bounds is not None:
+                bounds = bounds[order]
+            new_coord = iris.coords.AuxCoord.from_coord(coord).copy(
+                points=points[order], bounds=bounds).collapsed()
+            if isinstance(coord, iris.coords.DimCoord):
+                new_coord = iris.coords.DimCoord.from_coord(new_coord)
+            if self.coord_adjust is not None:
+                new_coord.points = np.array(self.coord_adjust(points),
+                                            dtype=new_coord.points.dtype)
+            coords.append(new_coord)
+        return coords
+
+    def process(self):
+        """Finalise the blend of the inputs added so far.
+
+        Returns:
+            result : iris.cube.Cube
+                     containing the weighted blend of the inputs.
+
+        Raises:
+            ValueError : If no inputs have been added.
+        """
+        if self.template is None:
+            msg = 'No inputs have been added to the blend.'
+            raise ValueError(msg)
+        scale, offset = self._weight_adjustment()
+
+        if self.perc_dim is not None:
+            combined_pdf = np.sort(
+                scale*np.concatenate(self.weighted_pdfs, axis=-1) +
+                offset*np.concatenate(self.unweighted_pdfs, axis=-1),
+                axis=-1)
+            thresholds = np.sort(np.concatenate(self.thresholds, axis=-1),
+                                 axis=-1)
+            data = PercentileBlendingAggregator.interp_along_last_axis(
+                self.percentiles, combined_pdf, thresholds)
+            shape = list(self.template.shape)
+            shape.append(shape.pop(self.perc_dim))
+            data = np.moveaxis(data.reshape(shape), -1, self.perc_dim)
+            cell_method = 'percentile_blend'
+        else:
+            data = scale*self.weighted_sum + offset*self.unweighted_sum
+            cell_method = 'mean'
+        if self.template.dtype.kind == 'f':
+            data = data.astype(self.template.dtype)
+
+        result = self.template.copy(data=data)
+        for coord in self._blended_coords():
+            result.replace_coord(coord)
+        result.add_cell_method(
+            iris.coords.CellMethod(cell_method, coords=self.coord))
+        return result
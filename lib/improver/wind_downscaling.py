@@ -40,6 +40,7 @@ from iris.exceptions import CoordinateNotFoundError
 import numpy as np
 
 from improver.constants import RMDI
+from improver.utilities.spatial import GridSpec
 
 
 # Scale parameter to determine reference height
@@ -730,25 +731,20 @@ class RoughnessCorrection(object):
             average grid resolution.
 
         """
-        x_name, y_name, _, _ = self.find_coord_names(a_cube)
+        grid_spec = GridSpec.from_cube(a_cube)
         [exp_xname, exp_yname] = ["projection_x_coordinate",
                                   "projection_y_coordinate"]
         exp_unit = Unit("m")
-        if (x_name != exp_xname) or (y_name != exp_yname):
+        if ((grid_spec.x_coord_name != exp_xname) or
+                (grid_spec.y_coord_name != exp_yname)):
             raise ValueError("cannot currently calculate resolution")
 
-        if (a_cube.coord(x_name).bounds is None and
-                a_cube.coord(y_name).bounds is None):
-            xres = (np.diff(a_cube.coord(x_name).points)).mean()
-            yres = (np.diff(a_cube.coord(y_name).points)).mean()
-        else:
-            xres = (np.diff(a_cube.coord(x_name).bounds)).mean()
-            yres = (np.diff(a_cube.coord(y_name).bounds)).mean()
         if (
-                (a_cube.coord(x_name).units != exp_unit) or
-                (a_cube.coord(y_name).units != exp_unit)):
+                (Unit(grid_spec.x_units) != exp_unit) or
+                (Unit(grid_spec.y_units) != exp_unit)):
             raise ValueError("cube axis have units different from m.")
-        return (xres + yres) / 2.0
+        return (grid_spec.x_mean_resolution +
+                grid_spec.y_mean_resolution) / 2.0
 
     @staticmethod
     def check_ancils(a_over_s_cube, sigma_cube, z0_cube, pp_oro_cube,
@@ -36,7 +36,10 @@
 usage: improver-nbhood [-h]
                        [--radius RADIUS | --radii-by-lead-time \
 RADII_BY_LEAD_TIME LEAD_TIME_IN_HOURS]
-                       [--ens_factor ENS_FACTOR]
+                       [--ens_factor ENS_FACTOR] [--workers WORKERS]
+                       [--input_mask_filepath INPUT_MASK_FILE]
+                       [--percentiles PERCENTILES [PERCENTILES ...]]
+                       [--streaming]
                        NEIGHBOURHOOD_METHOD INPUT_FILE OUTPUT_FILE
 __TEXT__
   [[ "$output" =~ "$expected" ]]
@@ -35,7 +35,10 @@
   read -d '' expected <<'__HELP__' || true
 usage: improver-nbhood [-h]
                        [--radius RADIUS | --radii-by-lead-time RADII_BY_LEAD_TIME LEAD_TIME_IN_HOURS]
-                       [--ens_factor ENS_FACTOR]
+                       [--ens_factor ENS_FACTOR] [--workers WORKERS]
+                       [--input_mask_filepath INPUT_MASK_FILE]
+                       [--percentiles PERCENTILES [PERCENTILES ...]]
+                       [--streaming]
                        NEIGHBOURHOOD_METHOD INPUT_FILE OUTPUT_FILE
 
 Apply the requested neighbourhood method via the NeighbourhoodProcessing
@@ -67,6 +70,28 @@ optional arguments:
                         this essentially conserves ensemble members if every
                         grid square is considered to be the equivalent of an
                         ensemble member.Optional, defaults to 1.0.
+  --workers WORKERS     The number of threads used to process realizations and
+                        lead times in parallel. Optional, defaults to 1.
+  --input_mask_filepath INPUT_MASK_FILE
+                        A path to a NetCDF file containing a single mask cube,
+                        such as a land-sea mask or a topographic band mask,
+                        with only x and y dimensions. Only points where the
+                        mask is non-zero are included within the
+                        neighbourhood, and the output is masked elsewhere.
+                        Only available for the square neighbourhood method.
+  --percentiles PERCENTILES [PERCENTILES ...]
+                        Calculate these percentiles of the field within the
+                        neighbourhood of each point, rather than the
+                        neighbourhood mean, e.g. --percentiles 10 50 90.
+                        Requires --radius, and cannot be used with
+                        --input_mask_filepath.
+  --streaming           Read, neighbourhood process and write one x-y slice of
+                        the input at a time, so that the memory required does
+                        not depend on the number of realizations and lead
+                        times. The number of slices processed at once is set
+                        by --workers. The output is held in a temporary file
+                        next to OUTPUT_FILE until it is saved. Cannot be used
+                        with --percentiles.
 __HELP__
   [[ "$output" == "$expected" ]]
 }
@@ -41,6 +41,7 @@ usage: improver-weighted-blending [-h] [--coord_exp_val COORD_EXPECTED_VALUES]
                                   [--cval NON_LINEAR_FACTOR]
                                   [--coord_adj COORD_ADJUSTMENT_FUNCTION]
                                   [--wts_redistrib_method METHOD_TO_REDISTRIBUTE_WEIGHTS]
+                                  [--workers WORKERS]
                                   WEIGHTS_CALCULATION_METHOD
                                   COORDINATE_TO_AVERAGE_OVER INPUT_FILE
                                   OUTPUT_FILE
@@ -81,6 +82,9 @@ optional arguments:
                         redistribute weights evenly between the forecasts that
                         are available. "proportional": redistribute weights
                         using the original weighting function.
+  --workers WORKERS     The number of processes used to blend tiles of the
+                        grid points of percentile data in parallel. Optional,
+                        defaults to 1.
 
 linear weights options:
   Options for the linear weights calculation in ChooseDefaultWeightsLinear